@@ -0,0 +1,528 @@
+"""main.py 中下载与抖音解析函数的协程版本，供 FastAPI 与 Telegram Bot 在事件循环中直接调用。
+
+基于 httpx.AsyncClient（每个事件循环共享一个连接池），下载内容经有界缓冲区分块写盘，
+不占用线程，也不会阻塞事件循环。缓存、文件引用计数与同步版本共用。
+"""
+import asyncio
+import os
+import subprocess
+import weakref
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Tuple
+
+import main
+from douyin_resolver import HedgedResolver, ResolverBackend
+from ffmpeg_pool import get_ffmpeg_pool
+from inflight import AsyncSingleFlight
+from media_cache import MediaFetch
+from metrics import RETRIES_TOTAL, record_bytes, time_stage
+from progress import report_progress
+
+if TYPE_CHECKING:
+    # httpx 在首次下载时才导入，缩短 Web 与 Vercel 的冷启动
+    import httpx
+
+
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "32"))
+ASYNC_HTTP_MAX_KEEPALIVE = int(os.getenv("ASYNC_HTTP_MAX_KEEPALIVE", "16"))
+# 网络分块先合并到缓冲区，攒满后再写盘；单个下载的内存占用不超过 缓冲区 + 一个分块
+DOWNLOAD_BUFFER_BYTES = int(os.getenv("DOWNLOAD_BUFFER_BYTES", str(256 * 1024)))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[Optional[str], Optional[str]], httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+_RESOLVE_FLIGHTS = AsyncSingleFlight()
+_DOWNLOAD_FLIGHTS = AsyncSingleFlight()
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """返回当前事件循环共享的 AsyncClient；代理设置变化时使用对应的新连接池。"""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    proxies = main._get_system_proxies()
+    key = (proxies.get("http"), proxies.get("https"))
+    per_loop = _clients.setdefault(loop, {})
+    client = per_loop.get(key)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=ASYNC_HTTP_MAX_KEEPALIVE,
+        )
+        client = httpx.AsyncClient(
+            mounts={
+                "http://": httpx.AsyncHTTPTransport(proxy=proxies.get("http"), limits=limits),
+                "https://": httpx.AsyncHTTPTransport(proxy=proxies.get("https"), limits=limits),
+            },
+            timeout=httpx.Timeout(60, connect=15),
+            follow_redirects=True,
+        )
+        per_loop[key] = client
+    return client
+
+
+async def aclose_async_clients() -> None:
+    """关闭当前事件循环创建的所有 AsyncClient（应用关闭时调用）。"""
+    per_loop = _clients.pop(asyncio.get_running_loop(), {})
+    for client in per_loop.values():
+        await client.aclose()
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
+
+
+async def _write_stream(
+    response: "httpx.Response",
+    dest_path: str,
+    buffer_size: int = DOWNLOAD_BUFFER_BYTES,
+) -> int:
+    """把响应体流式写入 dest_path 并打印下载进度，返回写入的字节数。
+
+    打开、写入与关闭文件都在线程中执行，慢速磁盘不会阻塞事件循环。
+    """
+    total = int(response.headers.get("content-length", 0) or 0)
+    downloaded = 0
+    last_pct = -5
+    buffer = bytearray()
+    f = await asyncio.to_thread(open, dest_path, "wb")
+    try:
+        async for chunk in response.aiter_bytes(STREAM_CHUNK_BYTES):
+            if not chunk:
+                continue
+            buffer += chunk
+            downloaded += len(chunk)
+            if len(buffer) >= buffer_size:
+                # 换用新缓冲区，线程写盘期间不会与后续分块冲突
+                data, buffer = buffer, bytearray()
+                await asyncio.to_thread(f.write, data)
+            if total > 0:
+                pct = int(downloaded * 100 / total)
+                if pct >= last_pct + 5:
+                    last_pct = pct
+                    report_progress(f"下载进度：{pct}%", stage="download", percent=pct)
+        if buffer:
+            await asyncio.to_thread(f.write, buffer)
+    finally:
+        await asyncio.to_thread(f.close)
+    record_bytes("download", downloaded)
+    return downloaded
+
+
+async def _coalesced_download(key, download: Callable[[], Awaitable[str]], lease: bool) -> str:
+    def _acquire(path: str, callers: int) -> None:
+        main.FILE_LEASES.acquire(path, callers)
+
+    path, shared = await _DOWNLOAD_FLIGHTS.do(key, download, on_complete=_acquire, on_abandon=main.release_file)
+    if shared:
+        report_progress("已复用进行中的相同下载任务", stage="download")
+    if not lease:
+        main.FILE_LEASES.release(path)
+    return path
+
+
+async def _cached_media_download(cache_key: str, fetch: Callable[[dict], Awaitable[MediaFetch]]) -> str:
+    """main._cached_media_download 的协程版本，共用同一份媒体缓存。
+
+    缓存索引的读写与淘汰时的文件删除在线程中执行。
+    """
+    entry, validators = await asyncio.to_thread(main._lookup_media, cache_key)
+    if validators is None:
+        return entry.path
+    result = await fetch(validators)
+    return await asyncio.to_thread(main._store_media_fetch, cache_key, entry, result)
+
+
+# ---------------------------------------------------------------------------
+# 下载
+# ---------------------------------------------------------------------------
+
+async def async_download_audio_from_direct_url(
+    audio_url: str,
+    output_dir: str = "./data",
+    preferred_ext: str = "m4a",
+    filename_stem: Optional[str] = None,
+    lease: bool = False,
+    cache_key: Optional[str] = None,
+) -> str:
+    """download_audio_from_direct_url 的协程版本，参数与返回值相同。"""
+    cache_key = cache_key or f"audio:{main.canonicalize_url(audio_url)}"
+    key = ("audio", cache_key, os.path.abspath(output_dir))
+    return await _coalesced_download(
+        key,
+        lambda: _cached_media_download(
+            cache_key,
+            lambda validators: _download_audio_file(audio_url, output_dir, preferred_ext, filename_stem, validators),
+        ),
+        lease,
+    )
+
+
+async def _download_audio_file(
+    audio_url: str,
+    output_dir: str,
+    preferred_ext: str,
+    filename_stem: Optional[str],
+    validators: Optional[dict] = None,
+) -> MediaFetch:
+    os.makedirs(output_dir, exist_ok=True)
+    out_path = main._direct_audio_path(audio_url, output_dir, preferred_ext, filename_stem)
+    # 先写入临时文件再原子替换，其他任务不会读到下载了一半的文件
+    part_path = out_path + ".part"
+
+    try:
+        report_progress(f"开始下载音频：{audio_url}", stage="download")
+        with time_stage("download"):
+            async with get_async_client().stream("GET", audio_url, timeout=60, headers=validators) as r:
+                # httpx 把 304 当作重定向类响应，raise_for_status 会抛出异常，需先判断
+                if r.status_code == 304:
+                    return MediaFetch(not_modified=True)
+                r.raise_for_status()
+                fetch = MediaFetch(out_path, r.headers.get("etag"), r.headers.get("last-modified"))
+                await _write_stream(r, part_path)
+        os.replace(part_path, out_path)
+    except asyncio.CancelledError:
+        _remove_quietly(part_path)
+        raise
+    except Exception as e:
+        _remove_quietly(part_path)
+        raise RuntimeError(f"下载音频失败：{e}")
+
+    return fetch
+
+
+async def async_download_video_and_extract_audio(
+    video_url: str,
+    output_dir: str = "./data",
+    preferred_audio_codec: str = "m4a",
+    lease: bool = False,
+) -> str:
+    """download_video_and_extract_audio 的协程版本，参数与返回值相同。"""
+    cache_key = f"video:{main.canonicalize_url(video_url)}:{preferred_audio_codec}"
+    key = ("video", cache_key, os.path.abspath(output_dir))
+    return await _coalesced_download(
+        key,
+        lambda: _cached_media_download(
+            cache_key,
+            lambda validators: _download_video_and_extract_audio(
+                video_url, output_dir, preferred_audio_codec, validators
+            ),
+        ),
+        lease,
+    )
+
+
+async def _download_video_and_extract_audio(
+    video_url: str,
+    output_dir: str,
+    preferred_audio_codec: str,
+    validators: Optional[dict] = None,
+) -> MediaFetch:
+    import httpx
+    from media_manifest import detect_manifest_type
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # HLS/DASH 清单：只下载码率最低的音频轨分片
+    if detect_manifest_type(video_url):
+        return MediaFetch(await async_download_manifest_audio(video_url, output_dir, preferred_audio_codec))
+
+    name, is_audio_file, temp_video_path, audio_path = main._video_download_paths(
+        video_url, output_dir, preferred_audio_codec
+    )
+    try:
+        if is_audio_file:
+            report_progress(f"开始下载音频文件：{video_url}", stage="download")
+        else:
+            report_progress(f"开始下载视频文件：{video_url}", stage="download")
+
+        with time_stage("download"):
+            async with get_async_client().stream("GET", video_url, headers=validators) as response:
+                if response.status_code == 304:
+                    return MediaFetch(not_modified=True)
+                response.raise_for_status()
+                # URL 没有扩展名但服务器返回的是清单
+                manifest_type = detect_manifest_type(video_url, response.headers.get("content-type"))
+                fetch = MediaFetch(etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"))
+                if not manifest_type:
+                    await _write_stream(response, temp_video_path)
+        if manifest_type:
+            return MediaFetch(
+                await async_download_manifest_audio(
+                    video_url, output_dir, preferred_audio_codec, manifest_type=manifest_type
+                )
+            )
+
+        # 如果是音频文件，跳过转换步骤
+        if is_audio_file:
+            os.replace(temp_video_path, audio_path)
+            report_progress("音频文件下载完成，跳过格式转换", stage="extract")
+            fetch.path = audio_path
+            return fetch
+
+        report_progress("视频下载完成，开始提取音频...", stage="extract")
+        try:
+            await _ffmpeg_extract_audio(temp_video_path, audio_path, main._get_ffmpeg_audio_codec(preferred_audio_codec))
+            report_progress("音频提取完成", stage="extract")
+        except subprocess.CalledProcessError as e:
+            report_progress(f"ffmpeg提取音频失败：{e.stderr}", kind="warning", stage="extract")
+            # 尝试使用mp3格式作为备选
+            if preferred_audio_codec == "mp3":
+                raise RuntimeError(f"音频提取失败：{e.stderr}")
+            report_progress("尝试使用mp3格式重新提取...", stage="extract")
+            RETRIES_TOTAL.inc(operation="extract_mp3")
+            audio_path = main._media_path(output_dir, f"{name}.mp3")
+            try:
+                await _ffmpeg_extract_audio(temp_video_path, audio_path, main._get_ffmpeg_audio_codec("mp3"))
+                report_progress("音频提取完成（mp3格式）", stage="extract")
+            except subprocess.CalledProcessError as e2:
+                raise RuntimeError(f"音频提取失败：{e2.stderr}")
+        except FileNotFoundError:
+            raise RuntimeError("未找到ffmpeg，请确保已安装ffmpeg并添加到系统PATH中")
+
+        fetch.path = audio_path
+        return fetch
+
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"下载文件失败：{e}")
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"处理文件失败：{e}")
+    finally:
+        # 清理临时文件（音频文件成功时已被替换为最终文件）
+        _remove_quietly(temp_video_path)
+
+
+async def async_download_manifest_audio(
+    manifest_url: str,
+    output_dir: str = "./data",
+    preferred_audio_codec: str = "m4a",
+    max_workers: Optional[int] = None,
+    manifest_type: Optional[str] = None,
+) -> str:
+    """download_manifest_audio 的协程版本：分片在事件循环中并发下载，不占用线程。"""
+    from urllib.parse import urlparse
+    from media_manifest import (
+        DEFAULT_SEGMENT_WORKERS,
+        async_download_segments,
+        async_resolve_manifest_plan,
+        make_async_http_fetchers,
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max_workers or DEFAULT_SEGMENT_WORKERS
+    fetch_text, fetch_segment = make_async_http_fetchers(get_async_client())
+
+    report_progress(f"解析媒体清单：{manifest_url}", stage="resolve")
+    try:
+        plan = await async_resolve_manifest_plan(manifest_url, fetch_text, manifest_type=manifest_type)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"获取媒体清单失败：{e}") from e
+
+    track_kind = "纯音频轨" if plan.audio_only else "最低码率变体"
+    bitrate = f"，约 {plan.bandwidth // 1000} kbps" if plan.bandwidth else ""
+    report_progress(f"已选择{track_kind}{bitrate}，共 {len(plan.segments)} 个分片", stage="resolve")
+
+    name = os.path.splitext(os.path.basename(urlparse(manifest_url).path))[0] or "stream"
+    stem = f"{name}_{main._url_digest(manifest_url)}"
+    concat_path = main._media_path(output_dir, f"{stem}_segments.{plan.container}")
+    last_pct = {"pct": -5}
+
+    def _on_progress(done: int, total: int) -> None:
+        pct = int(done * 100 / max(total, 1))
+        if pct >= last_pct["pct"] + 5:
+            last_pct["pct"] = pct
+            report_progress(f"下载进度：{pct}%", stage="download", percent=pct)
+
+    try:
+        await async_download_segments(plan, concat_path, fetch_segment, max_workers=workers, on_progress=_on_progress)
+
+        # ADTS/MP3 分片拼接后即是可直接转写的音频文件
+        if plan.container in {"aac", "mp3"}:
+            audio_path = main._media_path(output_dir, f"{stem}.{plan.container}")
+            os.replace(concat_path, audio_path)
+            report_progress("分片下载完成，跳过格式转换", stage="extract")
+            return audio_path
+
+        report_progress("分片下载完成，开始提取音频...", stage="extract")
+        audio_path = main._media_path(output_dir, f"{stem}.{preferred_audio_codec}")
+        try:
+            # 纯音频轨优先直接复制音频流，失败时再转码
+            if plan.audio_only:
+                try:
+                    await _ffmpeg_extract_audio(concat_path, audio_path, "copy")
+                    report_progress("音频提取完成", stage="extract")
+                    return audio_path
+                except subprocess.CalledProcessError:
+                    pass
+            await _ffmpeg_extract_audio(concat_path, audio_path, main._get_ffmpeg_audio_codec(preferred_audio_codec))
+            report_progress("音频提取完成", stage="extract")
+            return audio_path
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"音频提取失败：{e.stderr}")
+        except FileNotFoundError:
+            raise RuntimeError("未找到ffmpeg，请确保已安装ffmpeg并添加到系统PATH中")
+    finally:
+        _remove_quietly(concat_path)
+
+
+async def _ffmpeg_extract_audio(input_path: str, output_path: str, ffmpeg_codec: str) -> None:
+    """在共享转码池中异步运行 ffmpeg；失败时与同步版本一样抛出 CalledProcessError。
+
+    与同步版本一样先输出到临时文件再原子替换。
+    """
+    part_path = main._part_path(output_path)
+    try:
+        with time_stage("extract"):
+            await get_ffmpeg_pool().arun(main._ffmpeg_extract_args(input_path, part_path, ffmpeg_codec))
+        os.replace(part_path, output_path)
+    finally:
+        _remove_quietly(part_path)
+
+
+# ---------------------------------------------------------------------------
+# 抖音解析
+# ---------------------------------------------------------------------------
+
+async def _cached_resolve(namespace: str, key: str, resolve: Callable[[], Awaitable[dict]], ttl_for=None) -> dict:
+    """main._cached_resolve 的协程版本，与同步版本共用同一份解析缓存；写缓存（落盘）在线程中执行。"""
+    cache = main.get_douyin_cache()
+    cache_key = f"{namespace}:{key}"
+
+    value = main._cache_lookup(cache, cache_key)
+    if value is not None:
+        return value
+
+    async def _leader() -> dict:
+        cached = main._cache_lookup(cache, cache_key)
+        if cached is not None:
+            return cached
+        try:
+            result = await resolve()
+        except Exception as e:
+            await asyncio.to_thread(cache.put_error, cache_key, str(e))
+            raise
+        await asyncio.to_thread(cache.put, cache_key, result, ttl_for(result) if ttl_for else None)
+        return result
+
+    value, _ = await _RESOLVE_FLIGHTS.do(cache_key, _leader)
+    return value
+
+
+async def _request_json(method: str, url: str, timeout: float, **kwargs):
+    resp = await get_async_client().request(method, url, timeout=timeout, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _request_downcats(share_text: str):
+    try:
+        report_progress("请求 downcats 接口...", stage="resolve")
+        j = await _request_json(
+            "POST",
+            main.DOWNCATS_API_URL,
+            timeout=30,
+            headers=main.DOWNCATS_HEADERS,
+            json=main._downcats_payload(share_text),
+        )
+    except Exception as e:
+        raise RuntimeError(f"downcats 接口请求失败：{e}")
+    return main._parse_downcats_response(j)
+
+
+async def _request_aweme_id(short_url: str) -> str:
+    try:
+        data = await _request_json("GET", main._douyin_wtf_aweme_api(short_url), timeout=15)
+    except Exception as e:
+        raise RuntimeError(f"请求 aweme_id 失败：{e}")
+    return main._parse_aweme_id_response(data)
+
+
+async def _request_douyin_audio_info(aweme_id: str) -> dict:
+    try:
+        j = await _request_json("GET", main._douyin_wtf_video_api(aweme_id), timeout=20)
+    except Exception as e:
+        raise RuntimeError(f"请求音频信息失败：{e}")
+    return main._parse_douyin_audio_info(j)
+
+
+async def async_resolve_douyin_aweme_id(short_or_share_text: str) -> str:
+    """resolve_douyin_aweme_id 的协程版本。"""
+    short_url = short_or_share_text.strip()
+    if not short_url.startswith("http"):
+        extracted = main._extract_first_url(short_or_share_text)
+        if not extracted:
+            raise RuntimeError("未在输入中找到有效的抖音短链 URL")
+        short_url = extracted
+
+    async def _resolve() -> dict:
+        return {"aweme_id": await _request_aweme_id(short_url)}
+
+    value = await _cached_resolve(
+        "aweme_id",
+        main.canonicalize_url(short_url),
+        _resolve,
+        ttl_for=lambda _: main.AWEME_ID_CACHE_TTL_SECONDS,
+    )
+    return str(value["aweme_id"])
+
+
+async def _fetch_douyin_audio_info(aweme_id: str) -> dict:
+    return await _cached_resolve(
+        "audio_url",
+        str(aweme_id),
+        lambda: _request_douyin_audio_info(aweme_id),
+        ttl_for=lambda v: main._signed_url_ttl(v["audio_url"], main.get_douyin_cache().ttl_seconds),
+    )
+
+
+async def _resolve_via_downcats(share_text: str) -> dict:
+    mp3_url, title, _ = await _request_downcats(share_text)
+    return main._normalize_douyin_resolution(share_text, mp3_url, title)
+
+
+async def _resolve_via_douyin_wtf(share_text: str) -> dict:
+    info = await _fetch_douyin_audio_info(await async_resolve_douyin_aweme_id(share_text))
+    return main._normalize_douyin_resolution(share_text, info["audio_url"], info.get("title"))
+
+
+_douyin_resolver: Optional[HedgedResolver] = None
+
+
+def get_async_douyin_resolver() -> HedgedResolver:
+    """返回协程版本使用的抖音解析器：后端与 main.get_douyin_resolver 相同，并共用其健康度与熔断状态。"""
+    global _douyin_resolver
+    if _douyin_resolver is None:
+        _douyin_resolver = HedgedResolver(
+            [
+                ResolverBackend("downcats", main._resolve_via_downcats, _resolve_via_downcats),
+                ResolverBackend("douyin.wtf", main._resolve_via_douyin_wtf, _resolve_via_douyin_wtf),
+            ],
+            health=main.get_douyin_resolver().health,
+        )
+    return _douyin_resolver
+
+
+async def async_resolve_douyin_audio(share_text: str):
+    """resolve_douyin_audio 的协程版本，返回 (mp3_url, title, tiktok_id)。"""
+    async def _resolve() -> dict:
+        with time_stage("resolve"):
+            value, backend = await get_async_douyin_resolver().aresolve(share_text)
+        report_progress(f"抖音解析完成（{backend}）", stage="resolve")
+        return value
+
+    value = await _cached_resolve(
+        "douyin",
+        main._douyin_cache_key(share_text),
+        _resolve,
+        ttl_for=lambda v: main._signed_url_ttl(v["mp3_url"], main.get_douyin_cache().ttl_seconds),
+    )
+    return value["mp3_url"], value.get("title"), value.get("tiktok_id")
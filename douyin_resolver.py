@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from metrics import RETRIES_TOTAL
+
+
+DEFAULT_HEDGE_DELAY_SECONDS = float(os.getenv("DOUYIN_HEDGE_DELAY_SECONDS", "2.0"))
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN_SECONDS = 30.0
+EWMA_ALPHA = 0.3
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class BackendHealth:
+    """记录单个解析后端的延迟/错误率（EWMA），并实现熔断器。
+
+    连续失败 failure_threshold 次后熔断（open）；冷却 cooldown_seconds 后进入半开状态，
+    只放行一个探测请求，成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown_seconds: float = DEFAULT_COOLDOWN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.latency_ewma: Optional[float] = None
+        self.error_rate_ewma = 0.0
+        self.consecutive_failures = 0
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.successes = 0
+        self.failures = 0
+
+    def _update_latency(self, latency: float) -> None:
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.successes += 1
+            self._update_latency(latency)
+            self.error_rate_ewma *= 1 - EWMA_ALPHA
+            self.consecutive_failures = 0
+            self.state = CIRCUIT_CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self, latency: float) -> None:
+        with self._lock:
+            self.failures += 1
+            self._update_latency(latency)
+            self.error_rate_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate_ewma
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = CIRCUIT_OPEN
+                self.opened_at = self._clock()
+
+    def try_acquire(self) -> bool:
+        """判断当前是否允许向该后端发请求；半开状态下只放行一个探测请求。"""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_OPEN:
+                if self._clock() - self.opened_at < self.cooldown_seconds:
+                    return False
+                self.state = CIRCUIT_HALF_OPEN
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def score(self) -> float:
+        """分数越低越健康：延迟按错误率加权，未知延迟视为 1 秒。"""
+        with self._lock:
+            latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+            return latency * (1 + 4 * self.error_rate_ewma)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "latency_ewma": self.latency_ewma,
+                "error_rate_ewma": round(self.error_rate_ewma, 4),
+                "consecutive_failures": self.consecutive_failures,
+                "successes": self.successes,
+                "failures": self.failures,
+            }
+
+
+@dataclass
+class ResolverBackend:
+    name: str
+    resolve: Callable[[str], Any]
+    # 协程版本，供 HedgedResolver.aresolve 在事件循环中使用
+    aresolve: Optional[Callable[[str], Awaitable[Any]]] = None
+
+
+class HedgedResolver:
+    """按健康度排序调用多个等价后端：先请求最健康的一个，若在 hedge_delay 内
+    未返回（或已失败）则并行启动下一个，取最先成功的结果。
+
+    落后的请求不会被中断，其结果仍会计入后端健康度。
+    传入 health 时与其他解析器共用同一组健康度记录（如同步与协程版本的解析器）。
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[ResolverBackend],
+        hedge_delay: float = DEFAULT_HEDGE_DELAY_SECONDS,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown_seconds: float = DEFAULT_COOLDOWN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        health: Optional[Dict[str, BackendHealth]] = None,
+    ):
+        if not backends:
+            raise ValueError("至少需要一个解析后端")
+        self.backends = list(backends)
+        self.hedge_delay = hedge_delay
+        self._clock = clock
+        self.health: Dict[str, BackendHealth] = health if health is not None else {}
+        for backend in self.backends:
+            if backend.name not in self.health:
+                self.health[backend.name] = BackendHealth(backend.name, failure_threshold, cooldown_seconds, clock)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(4, len(self.backends) * 4),
+            thread_name_prefix="resolver",
+        )
+        # 落后的协程请求在后台跑完，这里保留引用防止被回收
+        self._background: Set["asyncio.Task[Any]"] = set()
+
+    def ranked_backends(self) -> List[ResolverBackend]:
+        return sorted(self.backends, key=lambda b: self.health[b.name].score())
+
+    def _run(self, backend: ResolverBackend, arg: str) -> Any:
+        health = self.health[backend.name]
+        start = self._clock()
+        try:
+            result = backend.resolve(arg)
+        except Exception:
+            health.record_failure(self._clock() - start)
+            raise
+        health.record_success(self._clock() - start)
+        return result
+
+    async def _arun(self, backend: ResolverBackend, arg: str) -> Any:
+        health = self.health[backend.name]
+        start = self._clock()
+        try:
+            result = await backend.aresolve(arg)
+        except Exception:
+            health.record_failure(self._clock() - start)
+            raise
+        health.record_success(self._clock() - start)
+        return result
+
+    def _next_backend(self, remaining: List[ResolverBackend], errors: List[str]) -> Optional[ResolverBackend]:
+        # 熔断中的后端在启动时才检查，避免占用半开探测名额却不发请求
+        while remaining:
+            backend = remaining.pop(0)
+            if self.health[backend.name].try_acquire():
+                return backend
+            errors.append(f"{backend.name}: 已熔断")
+        return None
+
+    def _first_backend(self, remaining: List[ResolverBackend], errors: List[str]) -> ResolverBackend:
+        healthiest = remaining[0]
+        backend = self._next_backend(remaining, errors)
+        if backend is None:
+            # 全部熔断时不直接拒绝，仍尝试最健康的后端，避免长时间不可用
+            errors.clear()
+            backend = healthiest
+        return backend
+
+    def resolve(self, arg: str) -> Tuple[Any, str]:
+        """返回 (结果, 胜出的后端名)。所有后端都失败时抛出 RuntimeError。"""
+        remaining = self.ranked_backends()
+        pending: Dict[Future, ResolverBackend] = {}
+        errors: List[str] = []
+
+        def _launch(backend: Optional[ResolverBackend]) -> None:
+            if backend is not None:
+                # 在调用方的上下文中运行，进度回调等 contextvars 随之传递
+                ctx = contextvars.copy_context()
+                pending[self._executor.submit(ctx.run, self._run, backend, arg)] = backend
+
+        _launch(self._first_backend(remaining, errors))
+
+        while pending:
+            timeout = self.hedge_delay if remaining else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 主后端超过对冲延迟仍未返回，并行启动下一个
+                RETRIES_TOTAL.inc(operation="resolve_hedge")
+                _launch(self._next_backend(remaining, errors))
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    return future.result(), backend.name
+                except Exception as exc:
+                    errors.append(f"{backend.name}: {exc}")
+                    # 失败后立即启动下一个，不必等到对冲延迟
+                    if remaining:
+                        RETRIES_TOTAL.inc(operation="resolve_failover")
+                    _launch(self._next_backend(remaining, errors))
+
+        raise RuntimeError("所有抖音解析接口均失败：" + "；".join(errors))
+
+    async def aresolve(self, arg: str) -> Tuple[Any, str]:
+        """resolve 的协程版本，在当前事件循环中并发请求各后端的 aresolve，不占用线程。"""
+        remaining = [b for b in self.ranked_backends() if b.aresolve is not None]
+        if not remaining:
+            raise RuntimeError("没有可用的异步解析后端")
+        pending: Dict["asyncio.Task[Any]", ResolverBackend] = {}
+        errors: List[str] = []
+
+        def _launch(backend: Optional[ResolverBackend]) -> None:
+            if backend is not None:
+                pending[asyncio.ensure_future(self._arun(backend, arg))] = backend
+
+        _launch(self._first_backend(remaining, errors))
+
+        try:
+            while pending:
+                timeout = self.hedge_delay if remaining else None
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    RETRIES_TOTAL.inc(operation="resolve_hedge")
+                    _launch(self._next_backend(remaining, errors))
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        return task.result(), backend.name
+                    except Exception as exc:
+                        errors.append(f"{backend.name}: {exc}")
+                        if remaining:
+                            RETRIES_TOTAL.inc(operation="resolve_failover")
+                        _launch(self._next_backend(remaining, errors))
+        finally:
+            # 与同步版本一致：落后的请求不中断，结果仍计入健康度
+            for task in pending:
+                self._background.add(task)
+                task.add_done_callback(self._discard_background)
+
+        raise RuntimeError("所有抖音解析接口均失败：" + "；".join(errors))
+
+    def _discard_background(self, task: "asyncio.Task[Any]") -> None:
+        self._background.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    def health_snapshot(self) -> List[Dict[str, Any]]:
+        return [self.health[b.name].snapshot() for b in self.backends]
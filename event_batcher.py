@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+# 转写线程产生的事件最多攒这么久（毫秒）再发布；设为 0 时逐条发布（用于对比）
+DEFAULT_FLUSH_SECONDS = float(os.getenv("JOB_EVENT_FLUSH_MS", "50")) / 1000
+# 待发布的转写文本达到这么多字节时立即发布
+DEFAULT_FLUSH_BYTES = int(os.getenv("JOB_EVENT_FLUSH_BYTES", "4096"))
+
+Event = Dict[str, Any]
+
+
+def batch_frame(events: List[Event]) -> Event:
+    """把一次发布的多条事件合并成一帧：单条事件原样返回，多条时包装为 batch 事件。"""
+    if len(events) == 1:
+        return events[0]
+    return {"type": "batch", "data": events}
+
+
+def iter_frame(event: Event) -> List[Event]:
+    """展开 batch 帧，返回其中的事件列表。"""
+    if event.get("type") == "batch":
+        return list(event.get("data") or [])
+    return [event]
+
+
+class DeliveryStats:
+    """事件投递统计：收到的事件数、发布的帧数，以及事件循环延迟（由 monitor_loop_lag 采样）。"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.events = 0
+        self.frames = 0
+        self.frames_per_second = 0.0
+        self.loop_lag_ms = 0.0
+        self.max_loop_lag_ms = 0.0
+        self._last_sample = (clock(), 0)
+
+    def record(self, events: int, frames: int) -> None:
+        with self._lock:
+            self.events += events
+            self.frames += frames
+
+    def sample(self, lag_seconds: float) -> None:
+        now = self._clock()
+        with self._lock:
+            last_time, last_frames = self._last_sample
+            if now > last_time:
+                self.frames_per_second = (self.frames - last_frames) / (now - last_time)
+            self._last_sample = (now, self.frames)
+            self.loop_lag_ms = lag_seconds * 1000
+            self.max_loop_lag_ms = max(self.max_loop_lag_ms, self.loop_lag_ms)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "events": self.events,
+                "frames": self.frames,
+                "frames_per_second": round(self.frames_per_second, 2),
+                "loop_lag_ms": round(self.loop_lag_ms, 2),
+                "max_loop_lag_ms": round(self.max_loop_lag_ms, 2),
+            }
+
+
+delivery_stats = DeliveryStats()
+
+
+async def monitor_loop_lag(stats: DeliveryStats = delivery_stats, interval: float = 1.0) -> None:
+    """定期测量事件循环的调度延迟（实际唤醒时间与预期之差），直到任务被取消。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        stats.sample(max(0.0, loop.time() - expected))
+
+
+class EventBatcher:
+    """把转写线程产生的事件攒批后交给 publish 一次发布。
+
+    相邻的 chunk 事件合并为一条，状态事件保持原有顺序；距第一条待发布事件超过 flush_seconds，
+    或待发布文本达到 flush_bytes 时，由后台线程把这一批交给 publish（参数为事件列表，
+    可用 batch_frame 合并成一帧）。add 可在任意线程调用且不会阻塞在发布上；
+    close 会发布剩余事件，之后的事件直接同步发布。
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[List[Event]], None],
+        flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+        flush_bytes: int = DEFAULT_FLUSH_BYTES,
+        stats: Optional[DeliveryStats] = delivery_stats,
+        clock=time.monotonic,
+    ):
+        self._publish = publish
+        self.flush_seconds = flush_seconds
+        self.flush_bytes = flush_bytes
+        self._stats = stats
+        self._clock = clock
+        self._cond = threading.Condition()
+        # 保证各批次按产生顺序发布
+        self._deliver_lock = threading.Lock()
+        self._pending: List[Event] = []
+        self._pending_bytes = 0
+        self._deadline = 0.0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, event: Event) -> None:
+        if self.flush_seconds <= 0:
+            self._deliver([event])
+            return
+        with self._cond:
+            if self._closed:
+                direct = True
+            else:
+                direct = False
+                self._append(event)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="event-batcher", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        if direct:
+            self._deliver([event])
+
+    def _append(self, event: Event) -> None:
+        if self._stats is not None:
+            self._stats.record(1, 0)
+        if not self._pending:
+            self._deadline = self._clock() + self.flush_seconds
+        if event.get("type") == "chunk":
+            data = event.get("data") or ""
+            self._pending_bytes += len(data.encode("utf-8"))
+            last = self._pending[-1] if self._pending else None
+            if last is not None and last.get("type") == "chunk":
+                self._pending[-1] = {**last, "data": (last.get("data") or "") + data}
+                return
+        self._pending.append(dict(event))
+
+    def _ready(self) -> bool:
+        return self._closed or self._pending_bytes >= self.flush_bytes or self._clock() >= self._deadline
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                while not self._ready():
+                    self._cond.wait(max(0.0, self._deadline - self._clock()))
+            self.flush()
+
+    def flush(self) -> None:
+        """立即发布所有待发布事件。"""
+        with self._deliver_lock:
+            with self._cond:
+                events, self._pending, self._pending_bytes = self._pending, [], 0
+            if events:
+                self._deliver(events, counted=True)
+
+    def _deliver(self, events: List[Event], counted: bool = False) -> None:
+        if self._stats is not None:
+            self._stats.record(0 if counted else len(events), 1)
+        try:
+            self._publish(events)
+        except Exception:
+            # 发布失败不影响转写本身
+            pass
+
+    def close(self) -> None:
+        """发布剩余事件并停止后台线程。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
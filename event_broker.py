@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+
+# 订阅方轮询其他进程写入事件的间隔（秒）；本进程发布的事件会立即唤醒订阅方
+DEFAULT_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "0.05"))
+DEFAULT_RETENTION_SECONDS = float(os.getenv("JOB_EVENTS_RETENTION_HOURS", "24")) * 3600
+# 单次读取的事件条数上限
+READ_BATCH = 500
+# 任务结束事件，订阅方收到后停止
+TERMINAL_EVENT_TYPES = ("done", "error")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    event TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_job_events_created ON job_events(created_at);
+"""
+
+
+class EventBroker:
+    """基于 SQLite 的跨进程任务事件分发：事件按任务追加并分配递增序号，任意进程都可以订阅。
+
+    多个 uvicorn worker 共用同一个数据库文件（WAL 模式）。其他进程发布的事件靠轮询发现，
+    延迟不超过 poll_seconds；同一进程内发布的事件会立即唤醒订阅方。db_path 为 None 时只在进程内有效。
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+        clock=time.time,
+    ):
+        self.db_path = db_path
+        self.poll_seconds = poll_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(
+            db_path or ":memory:",
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._waiters_lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> int:
+        """追加事件并返回其序号（从 1 开始）；可在任意线程调用。"""
+        return self._append(job_id, event, replace=False)
+
+    def reset(self, job_id: str, event: Dict[str, Any]) -> int:
+        """删除任务已有的事件并追加 event 作为新的起点，返回其序号。
+
+        序号在原有基础上继续递增，带 since 断线重连的订阅方不会漏掉之后的事件。
+        """
+        return self._append(job_id, event, replace=True)
+
+    def _append(self, job_id: str, event: Dict[str, Any], replace: bool) -> int:
+        payload = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                seq = row[0] + 1
+                if replace:
+                    self._conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                self._conn.execute(
+                    "INSERT INTO job_events (job_id, seq, created_at, event) VALUES (?, ?, ?, ?)",
+                    (job_id, seq, self._clock(), payload),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._wake(job_id)
+        return seq
+
+    def read(self, job_id: str, after_seq: int = 0, limit: int = READ_BATCH) -> List[Tuple[int, Dict[str, Any]]]:
+        """读取序号大于 after_seq 的事件。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after_seq, limit),
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def last_seq(self, job_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return row[0]
+
+    def prune(self, max_age_seconds: float = DEFAULT_RETENTION_SECONDS) -> int:
+        """删除早于 max_age_seconds 的事件，返回删除条数。"""
+        cutoff = self._clock() - max_age_seconds
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM job_events WHERE created_at < ?", (cutoff,))
+        return cursor.rowcount
+
+    def _wake(self, job_id: str) -> None:
+        with self._waiters_lock:
+            waiters = list(self._waiters.get(job_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    async def subscribe(self, job_id: str, after_seq: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """按序产出 (seq, event)，直到任务结束事件（done / error）为止。"""
+        entry = (asyncio.get_running_loop(), asyncio.Event())
+        with self._waiters_lock:
+            self._waiters.setdefault(job_id, set()).add(entry)
+        seq = after_seq
+        try:
+            while True:
+                entry[1].clear()
+                batch = self.read(job_id, seq)
+                for seq, event in batch:
+                    yield seq, event
+                    if event.get("type") in TERMINAL_EVENT_TYPES:
+                        return
+                if len(batch) == READ_BATCH:
+                    continue
+                try:
+                    await asyncio.wait_for(entry[1].wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._waiters_lock:
+                waiters = self._waiters.get(job_id)
+                if waiters is not None:
+                    waiters.discard(entry)
+                    if not waiters:
+                        del self._waiters[job_id]
@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from event_batcher import iter_frame
+from event_broker import TERMINAL_EVENT_TYPES, EventBroker
+
+
+DEFAULT_CAPACITY = int(os.getenv("JOB_EVENT_LOG_CAPACITY", "500"))
+
+Event = Dict[str, Any]
+
+
+class JobEventLog:
+    """单个任务的有界事件环形缓冲区，外加被挤出缓冲区的事件压缩成的快照。
+
+    快照记录到 compacted_seq 为止的完整转写文本与最后一条状态，因此任意 since 都能精确续传：
+    since 落在缓冲区之前时先给出快照，再回放缓冲区中更新的事件。所有订阅方共用同一个缓冲区，
+    各自只保存读到的序号。需在同一个事件循环内使用。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self._events: Deque[Tuple[int, Event]] = deque()
+        self.last_seq = 0
+        self.compacted_seq = 0
+        self._compacted_parts: List[str] = []
+        self._compacted_status: Optional[Event] = None
+        self.finished = False
+        self._signal = asyncio.Event()
+
+    def append(self, seq: int, event: Event) -> None:
+        if seq <= self.last_seq:
+            return
+        if len(self._events) >= self.capacity:
+            self._compact(*self._events.popleft())
+        self._events.append((seq, event))
+        self.last_seq = seq
+        if event.get("type") in TERMINAL_EVENT_TYPES:
+            self.finished = True
+        self._wake()
+
+    def close(self) -> None:
+        """事件来源已结束（或出错），唤醒等待中的订阅方让其退出。"""
+        self.finished = True
+        self._wake()
+
+    def _wake(self) -> None:
+        # 换一个新的 Event，已唤醒的订阅方下次等待新 Event，不需要逐个清除
+        signal, self._signal = self._signal, asyncio.Event()
+        signal.set()
+
+    def _compact(self, seq: int, frame: Event) -> None:
+        for event in iter_frame(frame):
+            if event.get("type") == "chunk":
+                self._compacted_parts.append(event.get("data") or "")
+            elif event.get("type") == "snapshot":
+                # 任务重新开始时发布的快照会替换此前的全部输出
+                self._compacted_parts = [(event.get("data") or {}).get("transcript") or ""]
+            elif event.get("type") in ("status", "queue"):
+                self._compacted_status = event
+        self.compacted_seq = seq
+
+    def snapshot(self) -> Event:
+        transcript = "".join(self._compacted_parts)
+        # 合并为单个分片，后续快照直接复用
+        self._compacted_parts = [transcript] if transcript else []
+        return {
+            "type": "snapshot",
+            "seq": self.compacted_seq,
+            "data": {"transcript": transcript, "status": self._compacted_status},
+        }
+
+    def read(self, since: int) -> Tuple[Optional[Event], List[Tuple[int, Event]], asyncio.Event]:
+        """返回 (快照或 None, since 之后的事件, 用于等待新事件的 Event)。"""
+        snapshot = None
+        if since < self.compacted_seq:
+            snapshot = self.snapshot()
+            since = self.compacted_seq
+        # 缓冲区内序号连续，可直接按偏移切片
+        first_seq = self._events[0][0] if self._events else self.last_seq + 1
+        start = max(0, since - first_seq + 1)
+        return snapshot, list(itertools.islice(self._events, start, None)), self._signal
+
+
+class EventLogHub:
+    """本进程内的任务事件日志：每个有订阅方的任务只有一个从 EventBroker 拉取事件的任务，
+    任意数量的 WebSocket 共享同一份环形缓冲区；最后一个订阅方离开后释放缓冲区。"""
+
+    def __init__(self, broker: EventBroker, capacity: int = DEFAULT_CAPACITY):
+        self.broker = broker
+        self.capacity = capacity
+        self._logs: Dict[str, JobEventLog] = {}
+        self._tailers: Dict[str, "asyncio.Task[None]"] = {}
+        self._refs: Dict[str, int] = {}
+
+    def _acquire(self, job_id: str) -> JobEventLog:
+        log = self._logs.get(job_id)
+        if log is None:
+            log = JobEventLog(self.capacity)
+            self._logs[job_id] = log
+            self._tailers[job_id] = asyncio.get_running_loop().create_task(self._tail(job_id, log))
+        self._refs[job_id] = self._refs.get(job_id, 0) + 1
+        return log
+
+    def _release(self, job_id: str) -> None:
+        self._refs[job_id] -= 1
+        if self._refs[job_id] > 0:
+            return
+        del self._refs[job_id]
+        self._logs.pop(job_id, None)
+        tailer = self._tailers.pop(job_id, None)
+        if tailer is not None and not tailer.done():
+            tailer.cancel()
+
+    async def _tail(self, job_id: str, log: JobEventLog) -> None:
+        try:
+            async for seq, event in self.broker.subscribe(job_id, after_seq=log.last_seq):
+                log.append(seq, event)
+        finally:
+            log.close()
+
+    async def subscribe(self, job_id: str, since: int = 0) -> AsyncIterator[Event]:
+        """产出 seq 大于 since 的事件（带 seq 字段），必要时先给出快照；任务结束后停止。"""
+        log = self._acquire(job_id)
+        cursor = since
+        try:
+            while True:
+                snapshot, events, signal = log.read(cursor)
+                if snapshot is not None:
+                    cursor = snapshot["seq"]
+                    yield snapshot
+                for seq, event in events:
+                    cursor = seq
+                    yield {**event, "seq": seq}
+                    if event.get("type") in TERMINAL_EVENT_TYPES:
+                        return
+                if log.finished and cursor >= log.last_seq:
+                    return
+                await signal.wait()
+        finally:
+            self._release(job_id)
+
+    def subscriber_count(self, job_id: str) -> int:
+        return self._refs.get(job_id, 0)
@@ -2,14 +2,16 @@ import os
 import sys
 import uuid
 import asyncio
-import io
+import functools
+import tempfile
 import time
-from dataclasses import dataclass, field
-from typing import Optional, Dict, Any, Callable
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Callable, List, Set
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from fastapi.templating import Jinja2Templates
 
 
@@ -21,17 +23,83 @@ if ROOT_DIR not in sys.path:
 from main import (  # noqa: E402
     transcribe_audio_streaming,
     transcribe_youtube_url_streaming,
-    download_video_and_extract_audio,
-    fetch_douyin_mp3_via_tiksave,
-    download_audio_from_direct_url,
+    canonicalize_url,
+    douyin_media_cache_key,
+    fetch_cached_media,
+    release_file,
+    ProgressEvent,
+    ProgressReporter,
+    progress_reporter,
     set_proxies,
+    set_cache_dir,
+    set_file_catalog,
+    get_douyin_resolver,
     cleanup_old_files,
     start_cleanup_timer,
 )
+from async_download import (  # noqa: E402
+    aclose_async_clients,
+    async_download_audio_from_direct_url,
+    async_download_video_and_extract_audio,
+    async_resolve_douyin_audio,
+)
+from event_batcher import EventBatcher, batch_frame, delivery_stats, monitor_loop_lag  # noqa: E402
+from event_broker import EventBroker  # noqa: E402
+from event_log import EventLogHub  # noqa: E402
+from ffmpeg_pool import get_ffmpeg_pool  # noqa: E402
+from file_catalog import DEFAULT_PAGE_SIZE, FileCatalog  # noqa: E402
+from job_batches import (  # noqa: E402
+    MAX_BATCH_ITEMS,
+    SOURCE_FIELDS,
+    BatchItem,
+    BatchStore,
+    clamp_concurrency,
+    count_statuses,
+    parse_sources,
+    run_batch,
+    write_batch_zip,
+)
+from idempotency import IdempotencyConflictError, IdempotencyIndex, request_fingerprint  # noqa: E402
+from job_checkpoint import (  # noqa: E402
+    DEFAULT_BUDGET_SECONDS as CHECKPOINT_BUDGET_SECONDS,
+    LEASE_MARGIN_SECONDS,
+    Checkpoint,
+    CheckpointBusyError,
+    SegmentedTranscription,
+    advance,
+    claim,
+    load_checkpoint_store,
+    new_token,
+)
+from job_retention import JobTable  # noqa: E402
+from job_scheduler import JobScheduler, QueueFullError  # noqa: E402
+from job_store import JobStore  # noqa: E402
+from job_timeline import JobTimeline, begin_timeline, get_timeline_log  # noqa: E402
+from lazy_imports import warm_imports  # noqa: E402
+from job_stream import STREAM_HEADERS, STREAM_MEDIA_TYPES, choose_stream_format, encode_event, stream_events  # noqa: E402
+from metrics import (  # noqa: E402
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    DEDUPED_TOTAL,
+    REGISTRY,
+    job_finished,
+    job_started,
+    register_service_gauges,
+    time_stage,
+)
+from transcript_delivery import transcript_response, write_transcript  # noqa: E402
+from upload_stream import (  # noqa: E402
+    DEFAULT_MAX_UPLOAD_BYTES,
+    StoredUpload,
+    UploadTooLargeError,
+    content_length_exceeds,
+    store_stream,
+)
 
 
 DATA_DIR = os.path.join(ROOT_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
+# 抖音解析缓存、媒体缓存索引与任务时间线日志放在数据目录下
+set_cache_dir(os.path.join(DATA_DIR, "cache"))
 
 # 默认清理间隔24小时
 DEFAULT_CLEANUP_HOURS = 24.0
@@ -50,12 +118,39 @@ class JobState:
     message: str = ""
     transcript: str = ""
     output_filename: Optional[str] = None
-    queue: "asyncio.Queue[Dict[str, Any]]" = field(default_factory=asyncio.Queue)
+    # 流式请求的客户端断开后置位，转写线程在下一个片段处停止
+    cancelled: bool = False
 
 
-jobs: Dict[str, JobState] = {}
+# 已结束的任务按 TTL 与数量、字节上限淘汰，只保留摘要；完整记录在任务存储中
+jobs: JobTable[JobState] = JobTable()
 jobs_lock = asyncio.Lock()
 
+# 任务状态与转写进度持久化到 SQLite，重启或多 worker 部署时仍可查询
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH") or os.path.join(DATA_DIR, "cache", "jobs.sqlite3")
+job_store = JobStore(JOB_STORE_PATH)
+# 任务事件写入同一数据库，任意 worker 上的 WebSocket 都能订阅
+event_broker = EventBroker(JOB_STORE_PATH)
+# 同一任务的多个 WebSocket 共享一份有界事件缓冲区，支持 ?since= 续传
+event_logs = EventLogHub(event_broker)
+# data 目录的文件索引：新文件写入分片子目录，/api/files 直接查询索引
+file_catalog = FileCatalog(DATA_DIR, JOB_STORE_PATH)
+# 下载的媒体文件同样按文件名分片存放并登记到索引
+set_file_catalog(file_catalog)
+# 运行中任务的事件先攒批再发布：相邻转写片段合并，状态与片段合并为一帧
+event_batchers: Dict[str, EventBatcher] = {}
+# 批量提交的批次状态与结果清单；运行中批次的调度协程
+batch_store = BatchStore(JOB_STORE_PATH)
+batch_tasks: Set["asyncio.Task[None]"] = set()
+# 流式请求断开后判断是否取消任务的协程
+cancel_tasks: Set["asyncio.Task[None]"] = set()
+# Idempotency-Key 与请求指纹 -> 任务编号，重复提交复用进行中或刚完成的任务
+idempotency = IdempotencyIndex(JOB_STORE_PATH)
+# 可续传任务的检查点（/api/transcribe/resumable），默认保存在本地目录，可用 CHECKPOINT_STORE 换成共享存储
+checkpoint_store = load_checkpoint_store(os.getenv("CHECKPOINT_DIR") or os.path.join(DATA_DIR, "cache", "checkpoints"))
+# 上传音频大小上限（字节），由 MAX_UPLOAD_MB 配置
+MAX_UPLOAD_BYTES = DEFAULT_MAX_UPLOAD_BYTES
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -66,6 +161,18 @@ async def startup_event():
         start_cleanup_timer(DATA_DIR, cleanup_hours)
         print(f"FastAPI: 已启动定时清理任务，每 {cleanup_hours} 小时清理一次", file=sys.stderr)
 
+    # 恢复上次运行中断的任务，清理过期的任务事件
+    _requeue_interrupted_jobs()
+    for batch_id in batch_store.mark_interrupted():
+        event_broker.publish(batch_id, {"type": "error", "data": "服务重启导致批次中断，未完成的条目不再提交"})
+    event_broker.prune()
+    checkpoint_store.prune()
+    file_catalog.start_scan_timer()
+    # 采样事件循环延迟，供 /api/stats 查看事件投递的开销
+    app.state.loop_lag_task = asyncio.create_task(monitor_loop_lag())
+    # 后台预先导入 google-genai 与 httpx，首个任务不必等待导入
+    warm_imports()
+
     app.state.telegram_bot_app = None
     token = os.getenv("ENV_BOT_TOKEN", "").strip()
     if not token:
@@ -84,6 +191,17 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    app.state.loop_lag_task.cancel()
+    for task in list(batch_tasks):
+        task.cancel()
+    await scheduler.aclose()
+    await aclose_async_clients()
+    event_broker.close()
+    job_store.close()
+    batch_store.close()
+    idempotency.close()
+    file_catalog.close()
+
     telegram_app = getattr(app.state, "telegram_bot_app", None)
     if telegram_app is None:
         return
@@ -97,99 +215,132 @@ async def shutdown_event():
         print(f"FastAPI: Telegram bot 停止失败: {exc}", file=sys.stderr)
 
 
+def _publish_events(job_id: str, events: List[Dict[str, Any]]) -> None:
+    """把一批事件作为一帧发布，其中的转写片段同时写入任务存储。"""
+    text = "".join(e.get("data") or "" for e in events if e.get("type") == "chunk")
+    if text:
+        job_store.append_transcript(job_id, text)
+    event_broker.publish(job_id, batch_frame(events))
+
+
+def _emit(job_id: str, event: Dict[str, Any]) -> None:
+    """发布任务事件，可在任意线程调用；任务运行期间交给批处理器合并发布。"""
+    batcher = event_batchers.get(job_id)
+    if batcher is not None:
+        batcher.add(event)
+    else:
+        _publish_events(job_id, [event])
+
+
+async def _flush_events(job_id: str) -> None:
+    """发布该任务尚在缓冲区中的事件并停止批处理（在结束事件之前调用）。"""
+    batcher = event_batchers.pop(job_id, None)
+    if batcher is not None:
+        await asyncio.to_thread(batcher.close)
+
+
 async def publish(job_id: str, event: Dict[str, Any]) -> None:
-    async with jobs_lock:
-        job = jobs.get(job_id)
-    if job is None:
-        return
-    await job.queue.put(event)
+    _emit(job_id, event)
 
 
-def _make_chunk_callback(job_id: str, job: JobState) -> Callable[[str], None]:
-    loop = asyncio.get_event_loop()
+def _publish_queue_position(job_id: str, stage: str, position: int) -> None:
+    _emit(job_id, {"type": "queue", "data": {"stage": stage, "position": position}})
 
-    def on_chunk(delta: str) -> None:
-        job.transcript += delta
+
+# 限制同时下载与转写的任务数，排队数超过上限时返回 429
+scheduler = JobScheduler(on_position=_publish_queue_position)
+# /metrics 采集时读取调度器、任务表与事件投递的实时状态
+register_service_gauges(
+    scheduler.stats, jobs.usage, delivery_stats.snapshot, ffmpeg_stats=lambda: get_ffmpeg_pool().stats()
+)
+
+
+def _requeue_interrupted_jobs() -> None:
+    """重新提交上次运行中断的任务；依赖表单凭据的任务无法恢复，直接标记为失败。"""
+    for record in job_store.claim_interrupted():
+        if record.has_credentials:
+            job_store.set_status(record.job_id, "error", message="服务重启导致任务中断，请重新提交")
+            continue
+        params = record.params
+        jobs[record.job_id] = JobState(status="pending")
+        # 已保存的转写分片已随 claim 清空；事件也从空快照重新开始，重放时不会重复输出
+        event_broker.reset(record.job_id, {"type": "snapshot", "data": {"transcript": ""}})
         try:
-            asyncio.run_coroutine_threadsafe(
-                publish(job_id, {"type": "chunk", "data": delta}),
-                loop,
+            scheduler.submit(
+                record.job_id,
+                functools.partial(
+                    _run_task,
+                    job_id=record.job_id,
+                    source_type=record.source_type,
+                    api_key=None,
+                    auth_mode=params.get("auth_mode"),
+                    model_name=params.get("model_name") or "gemini-2.5-flash",
+                    language_hint=params.get("language_hint"),
+                    vertex_json=None,
+                    vertex_project=params.get("vertex_project"),
+                    vertex_location=params.get("vertex_location"),
+                    youtube_url=params.get("youtube_url"),
+                    video_url=params.get("video_url"),
+                    douyin_text=params.get("douyin_text"),
+                    proxy=params.get("proxy"),
+                    proxy_http=params.get("proxy_http"),
+                    proxy_https=params.get("proxy_https"),
+                    local_audio_path=params.get("audio_path"),
+                ),
             )
-        except Exception:
-            pass
+        except QueueFullError:
+            jobs.pop(record.job_id, None)
+            job_store.set_status(record.job_id, "error", message="任务队列已满，无法恢复中断的任务")
+            continue
+        print(f"FastAPI: 已重新排队中断的任务 {record.job_id}", file=sys.stderr)
 
-    return on_chunk
 
+async def _replay_from_store(websocket: WebSocket, job_id: str) -> None:
+    """任务事件已被清理时，按任务存储中的转写文本与最终状态回放结果。"""
+    record = job_store.get(job_id)
+    if record is None:
+        return
+    text = job_store.transcript(job_id)
+    if text:
+        await websocket.send_json({"type": "chunk", "data": text})
+    if record.status == "done":
+        await websocket.send_json({"type": "done", "data": {"output_filename": record.output_filename}})
+    else:
+        await websocket.send_json({"type": "error", "data": record.message})
 
-class _WSStderr(io.TextIOBase):
-    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop):
-        self.job_id = job_id
-        self._buffer = ""
-        self._loop = loop
-
-    def write(self, s: str) -> int:  # type: ignore[override]
-        if not isinstance(s, str):
-            s = str(s)
-        self._buffer += s
-        # Flush on newline or when buffer grows
-        while "\n" in self._buffer:
-            line, self._buffer = self._buffer.split("\n", 1)
-            text = line.strip()
-            if text:
-                try:
-                    asyncio.run_coroutine_threadsafe(
-                        publish(self.job_id, {"type": "status", "data": text}),
-                        self._loop,
-                    )
-                except Exception:
-                    pass
-        # If progress like 'xx%' without newline, occasionally push
-        if any(token in self._buffer for token in ["%", "✓", "...", "…"]):
-            text = self._buffer.strip()
-            if text:
-                try:
-                    asyncio.run_coroutine_threadsafe(
-                        publish(self.job_id, {"type": "status", "data": text}),
-                        self._loop,
-                    )
-                except Exception:
-                    pass
-                self._buffer = ""
-        return len(s)
 
-    def flush(self) -> None:  # type: ignore[override]
-        if self._buffer.strip():
-            try:
-                asyncio.run_coroutine_threadsafe(
-                    publish(self.job_id, {"type": "status", "data": self._buffer.strip()}),
-                    self._loop,
-                )
-            except Exception:
-                pass
-        self._buffer = ""
+def _make_chunk_callback(job_id: str, job: JobState) -> Callable[[str], None]:
+    def on_chunk(delta: str) -> None:
+        if job.cancelled:
+            raise RuntimeError("任务已取消")
+        job.transcript += delta
+        # 与状态事件进入同一个批处理缓冲区，保持发生顺序
+        _emit(job_id, {"type": "chunk", "data": delta})
 
+    return on_chunk
 
-class _capture_stderr:
-    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop):
-        self.job_id = job_id
-        self._loop = loop
-        self._old = None
 
-    def __enter__(self):
-        self._old = sys.stderr
-        sys.stderr = _WSStderr(self.job_id, self._loop)  # type: ignore[assignment]
-        return sys.stderr
+def _job_reporter(job_id: str) -> ProgressReporter:
+    """把本任务上下文中的进度事件发布到任务事件流；reporter 可在任意线程调用。"""
+    def report(event: ProgressEvent) -> None:
+        payload: Dict[str, Any] = {"type": "status", "data": event.message, "kind": event.kind}
+        if event.stage:
+            payload["stage"] = event.stage
+        if event.percent is not None:
+            payload["percent"] = event.percent
+        _emit(job_id, payload)
+
+    return report
 
-    def __exit__(self, exc_type, exc, tb):
-        try:
-            if hasattr(sys.stderr, "flush"):
-                try:
-                    sys.stderr.flush()
-                except Exception:
-                    pass
-        finally:
-            if self._old is not None:
-                sys.stderr = self._old
+
+async def _finish_timeline(job_id: str, timeline: JobTimeline, status: str) -> None:
+    """结束任务时间线：追加到时间线日志，并在 done / error 之前推送 timeline 事件。"""
+    record = timeline.finish(status)
+    try:
+        await asyncio.to_thread(get_timeline_log().append, record)
+    except OSError as e:
+        print(f"写入时间线日志失败: {e}", file=sys.stderr)
+    await publish(job_id, {"type": "timeline", "data": record})
 
 
 async def _run_task(
@@ -202,65 +353,67 @@ async def _run_task(
     vertex_json: Optional[str],
     vertex_project: Optional[str],
     vertex_location: Optional[str],
-    uploaded_file: Optional[UploadFile],
     youtube_url: Optional[str],
     video_url: Optional[str],
     douyin_text: Optional[str],
     proxy: Optional[str],
     proxy_http: Optional[str],
     proxy_https: Optional[str],
+    local_audio_path: Optional[str] = None,
 ) -> None:
     async with jobs_lock:
         job = jobs.get(job_id)
     if job is None:
         return
-
+    job.status = "running"
+    job_store.set_status(job_id, "running")
+    event_batchers[job_id] = EventBatcher(functools.partial(_publish_events, job_id))
+    started = job_started("web")
+    # 各阶段耗时记入本任务的时间线，结束时作为 timeline 事件推送
+    timeline = begin_timeline(job_id, "web")
+
+    # 与其他任务共享的下载文件在本任务结束前保持引用，避免被清理
+    leased_path: Optional[str] = None
     try:
         await publish(job_id, {"type": "status", "data": "初始化任务"})
 
         # Respect proxy configuration (or keep existing env if none provided)
         set_proxies(proxy, proxy_http, proxy_https)
 
-        # Capture progress lines printed to stderr by underlying utilities
-        loop = asyncio.get_running_loop()
-        with _capture_stderr(job_id, loop):
+        # 下载、转码与转写函数的进度事件只发往本任务（contextvars 隔离并发任务）
+        with progress_reporter(_job_reporter(job_id)):
             # Determine audio source
             audio_path: Optional[str] = None
             file_base_name: Optional[str] = None
             transcript: str = ""
 
             if source_type == "audio":
-                if uploaded_file is None:
+                # 上传文件在提交请求时已写入磁盘，服务重启后重新排队的任务同样使用该文件
+                if local_audio_path and os.path.isfile(local_audio_path):
+                    audio_path = local_audio_path
+                else:
                     raise RuntimeError("未接收到上传的音频文件")
-                await publish(job_id, {"type": "status", "data": "保存上传文件"})
-                # Save to DATA_DIR with a unique name preserving extension
-                name, ext = os.path.splitext(uploaded_file.filename or f"upload_{job_id}.m4a")
-                safe_ext = ext if ext else ".m4a"
-                target = os.path.join(DATA_DIR, f"{name}_{job_id}{safe_ext}")
-                content = await uploaded_file.read()
-                with open(target, "wb") as f:
-                    f.write(content)
-                audio_path = target
 
             elif source_type == "youtube":
                 if not youtube_url:
                     raise RuntimeError("缺少 YouTube 链接")
-                await publish(job_id, {"type": "status", "data": "开始转写（YouTube 直连）"})
-                # Stream transcript directly from YouTube URL without downloading
-                chunk_cb = _make_chunk_callback(job_id, job)
-                transcript = await asyncio.to_thread(
-                    transcribe_youtube_url_streaming,
-                    api_key,
-                    youtube_url,
-                    model_name,
-                    language_hint,
-                    None,
-                    chunk_cb,
-                    auth_mode,
-                    vertex_json,
-                    vertex_project,
-                    vertex_location,
-                )
+                async with scheduler.stage(job_id, "transcribe"):
+                    await publish(job_id, {"type": "status", "data": "开始转写（YouTube 直连）"})
+                    # Stream transcript directly from YouTube URL without downloading
+                    chunk_cb = _make_chunk_callback(job_id, job)
+                    transcript = await asyncio.to_thread(
+                        transcribe_youtube_url_streaming,
+                        api_key,
+                        youtube_url,
+                        model_name,
+                        language_hint,
+                        None,
+                        chunk_cb,
+                        auth_mode,
+                        vertex_json,
+                        vertex_project,
+                        vertex_location,
+                    )
                 # Derive a filename from YouTube video id
                 try:
                     from urllib.parse import urlparse, parse_qs
@@ -279,23 +432,32 @@ async def _run_task(
             elif source_type == "video_url":
                 if not video_url:
                     raise RuntimeError("缺少视频直链 URL")
-                await publish(job_id, {"type": "status", "data": "下载视频并提取音频"})
-                audio_path = await asyncio.to_thread(download_video_and_extract_audio, video_url, DATA_DIR)
+                async with scheduler.stage(job_id, "download"):
+                    await publish(job_id, {"type": "status", "data": "下载视频并提取音频"})
+                    audio_path = await async_download_video_and_extract_audio(video_url, DATA_DIR, lease=True)
+                leased_path = audio_path
 
             elif source_type == "douyin":
                 if not douyin_text:
                     raise RuntimeError("缺少抖音分享口令或短链")
-                await publish(job_id, {"type": "status", "data": "解析抖音直链"})
-                mp3_url, title, tiktok_id = fetch_douyin_mp3_via_tiksave(douyin_text)
-                stem = f"douyin_{tiktok_id}" if tiktok_id else f"douyin_{int(asyncio.get_event_loop().time()*1000):.0f}"
-                await publish(job_id, {"type": "status", "data": "下载抖音音频"})
-                audio_path = await asyncio.to_thread(
-                    download_audio_from_direct_url,
-                    mp3_url,
-                    DATA_DIR,
-                    "mp3",
-                    stem,
-                )
+                media_key = douyin_media_cache_key(douyin_text)
+                audio_path = fetch_cached_media(media_key, lease=True)
+                if audio_path is None:
+                    async with scheduler.stage(job_id, "download"):
+                        await publish(job_id, {"type": "status", "data": "解析抖音直链"})
+                        mp3_url, title, tiktok_id = await async_resolve_douyin_audio(douyin_text)
+                        # 没有作品 ID 时按直链哈希命名
+                        stem = f"douyin_{tiktok_id}" if tiktok_id else None
+                        await publish(job_id, {"type": "status", "data": "下载抖音音频"})
+                        audio_path = await async_download_audio_from_direct_url(
+                            mp3_url,
+                            DATA_DIR,
+                            "mp3",
+                            stem,
+                            lease=True,
+                            cache_key=media_key,
+                        )
+                leased_path = audio_path
 
             else:
                 raise RuntimeError(f"未知的来源类型：{source_type}")
@@ -304,39 +466,62 @@ async def _run_task(
             if source_type != "youtube":
                 if not audio_path or not os.path.isfile(audio_path):
                     raise RuntimeError("音频文件不存在或下载失败")
-                await publish(job_id, {"type": "status", "data": "开始转写"})
-                chunk_cb = _make_chunk_callback(job_id, job)
-                transcript = await asyncio.to_thread(
-                    transcribe_audio_streaming,
-                    api_key,
-                    audio_path,
-                    model_name,
-                    language_hint,
-                    None,
-                    chunk_cb,
-                    auth_mode,
-                    vertex_json,
-                    vertex_project,
-                    vertex_location,
-                )
+                async with scheduler.stage(job_id, "transcribe"):
+                    await publish(job_id, {"type": "status", "data": "开始转写"})
+                    chunk_cb = _make_chunk_callback(job_id, job)
+                    transcript = await asyncio.to_thread(
+                        transcribe_audio_streaming,
+                        api_key,
+                        audio_path,
+                        model_name,
+                        language_hint,
+                        None,
+                        chunk_cb,
+                        auth_mode,
+                        vertex_json,
+                        vertex_project,
+                        vertex_location,
+                    )
 
         # Persist transcript similar to main.py
         if file_base_name:
             base_name = file_base_name
         else:
             base_name = os.path.splitext(os.path.basename(audio_path))[0]
-        out_path = os.path.join(DATA_DIR, base_name + ".txt")
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write(transcript)
+        out_path = file_catalog.shard_path(base_name + ".txt")
+        # 同时生成 gzip / zstd 预压缩副本，下载时按 Accept-Encoding 直接返回
+        with time_stage("save"):
+            await asyncio.to_thread(write_transcript, out_path, transcript)
+        file_catalog.record(out_path, owner=job_id)
 
+        await _flush_events(job_id)
         job.status = "done"
         job.output_filename = os.path.basename(out_path)
+        job_store.set_status(job_id, "done", output_filename=job.output_filename)
+        await _finish_timeline(job_id, timeline, "done")
         await publish(job_id, {"type": "done", "data": {"output_filename": job.output_filename}})
 
     except Exception as e:
+        await _flush_events(job_id)
         job.status = "error"
         job.message = str(e)
+        job_store.set_status(job_id, "error", message=job.message)
+        await _finish_timeline(job_id, timeline, "error")
         await publish(job_id, {"type": "error", "data": job.message})
+    finally:
+        await _flush_events(job_id)
+        release_file(leased_path)
+        job_finished("web", "ok" if job.status == "done" else "error", started)
+        jobs.finish(job_id)
+
+
+@app.middleware("http")
+async def reject_oversized_upload(request: Request, call_next):
+    """请求体声明的长度超过上传上限时，在解析表单之前直接返回 413。"""
+    if request.method == "POST" and request.url.path == "/api/transcribe":
+        if content_length_exceeds(request.headers.get("content-length")):
+            return JSONResponse({"error": str(UploadTooLargeError(MAX_UPLOAD_BYTES))}, status_code=413)
+    return await call_next(request)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -349,6 +534,89 @@ async def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+async def _store_upload(file: UploadFile, job_id: str) -> StoredUpload:
+    """上传文件按块写入分片目录，同时计算哈希并识别格式，不把整个文件读入内存。"""
+    name, ext = os.path.splitext(os.path.basename(file.filename or "") or f"upload_{job_id}")
+    stem = f"{name}_{job_id}"
+    upload = await asyncio.to_thread(store_stream, file.file, file_catalog.shard_dir(stem), stem, ext)
+    file_catalog.record(upload.path, owner=job_id)
+    return upload
+
+
+def _discard_upload(upload: StoredUpload) -> None:
+    try:
+        os.remove(upload.path)
+    except OSError:
+        pass
+    file_catalog.remove(os.path.basename(upload.path))
+
+
+async def _read_vertex_json(vertex_json_file: Optional[UploadFile]) -> Optional[str]:
+    if vertex_json_file is None:
+        return None
+    raw = await vertex_json_file.read()
+    return raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else str(raw)
+
+
+async def _submit_job(
+    job_id: str,
+    source_type: str,
+    settings: Dict[str, Any],
+    api_key: Optional[str],
+    vertex_json: Optional[str],
+    youtube_url: Optional[str] = None,
+    video_url: Optional[str] = None,
+    douyin_text: Optional[str] = None,
+    upload: Optional[StoredUpload] = None,
+) -> "asyncio.Task[None]":
+    """登记任务并交给调度器；队列已满时撤销登记并抛出 QueueFullError。
+
+    settings 为模型、语言、Vertex 项目与代理等共用设置（即 _run_task 的同名参数）。
+    """
+    job = JobState(status="pending", message="")
+    async with jobs_lock:
+        jobs.evict_expired()
+        jobs[job_id] = job
+
+    # 凭据不落盘；带表单凭据的任务在服务重启后无法自动恢复
+    job_store.create(
+        job_id,
+        source_type,
+        params={
+            **settings,
+            "youtube_url": youtube_url,
+            "video_url": video_url,
+            "douyin_text": douyin_text,
+            "audio_path": upload.path if upload else None,
+            "upload_size": upload.size if upload else None,
+            "upload_sha256": upload.sha256 if upload else None,
+            "upload_format": upload.detected_format if upload else None,
+        },
+        has_credentials=bool(api_key or vertex_json),
+    )
+
+    try:
+        return scheduler.submit(
+            job_id,
+            lambda: _run_task(
+                job_id=job_id,
+                source_type=source_type,
+                api_key=api_key,
+                vertex_json=vertex_json,
+                youtube_url=youtube_url,
+                video_url=video_url,
+                douyin_text=douyin_text,
+                local_audio_path=upload.path if upload else None,
+                **settings,
+            ),
+        )
+    except QueueFullError:
+        async with jobs_lock:
+            jobs.pop(job_id, None)
+        job_store.delete(job_id)
+        raise
+
+
 @app.post("/api/transcribe")
 async def api_transcribe(
     request: Request,
@@ -367,60 +635,318 @@ async def api_transcribe(
     douyin_text: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
     vertex_json_file: Optional[UploadFile] = File(None),
+    stream: Optional[str] = Form(None),
 ):
+    # stream=sse / ndjson（或对应的 Accept 头）时在本次请求内运行任务并流式返回事件，
+    # 不依赖 WebSocket 与跨请求状态，适用于 Vercel 等无服务器部署
+    try:
+        stream_format = choose_stream_format(stream, request.headers.get("accept"))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
     job_id = uuid.uuid4().hex
-    job = JobState(status="pending", message="")
-    async with jobs_lock:
-        jobs[job_id] = job
 
-    vertex_json = None
-    if vertex_json_file is not None:
-        raw = await vertex_json_file.read()
-        vertex_json = raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else str(raw)
+    upload: Optional[StoredUpload] = None
+    if source_type == "audio" and file is not None:
+        try:
+            upload = await _store_upload(file, job_id)
+        except UploadTooLargeError as e:
+            return JSONResponse({"error": str(e)}, status_code=413)
+
+    vertex_json = await _read_vertex_json(vertex_json_file)
+    settings = {
+        "auth_mode": auth_mode,
+        "model_name": model_name,
+        "language_hint": language_hint,
+        "vertex_project": vertex_project,
+        "vertex_location": vertex_location,
+        "proxy": proxy,
+        "proxy_http": proxy_http,
+        "proxy_https": proxy_https,
+    }
+
+    # 重试、双击或断线重连重复提交时挂到已有任务上，不再启动新的流水线
+    fingerprint = request_fingerprint(
+        source_type,
+        _source_identity(source_type, youtube_url, video_url, douyin_text, upload),
+        settings,
+        credentials=api_key or vertex_json,
+    )
+    try:
+        existing = idempotency.claim(
+            job_id,
+            fingerprint,
+            request.headers.get("idempotency-key"),
+            is_reusable=_job_reusable,
+        )
+    except ValueError as e:
+        if upload is not None:
+            _discard_upload(upload)
+        status_code = 422 if isinstance(e, IdempotencyConflictError) else 400
+        return JSONResponse({"error": str(e)}, status_code=status_code)
+    if existing is not None:
+        if upload is not None:
+            _discard_upload(upload)
+        DEDUPED_TOTAL.inc()
+        return _attach_response(request, existing, stream_format)
 
-    # Spawn background task
-    asyncio.create_task(
-        _run_task(
-            job_id=job_id,
-            source_type=source_type,
-            api_key=api_key,
-            auth_mode=auth_mode,
-            model_name=model_name,
-            language_hint=language_hint,
-            vertex_json=vertex_json,
-            vertex_project=vertex_project,
-            vertex_location=vertex_location,
-            uploaded_file=file,
+    try:
+        task = await _submit_job(
+            job_id,
+            source_type,
+            settings,
+            api_key,
+            vertex_json,
             youtube_url=youtube_url,
             video_url=video_url,
             douyin_text=douyin_text,
-            proxy=proxy,
-            proxy_http=proxy_http,
-            proxy_https=proxy_https,
+            upload=upload,
+        )
+    except QueueFullError as e:
+        idempotency.forget(job_id)
+        if upload is not None:
+            _discard_upload(upload)
+        return JSONResponse(
+            {"error": str(e), "retry_after": e.retry_after},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
         )
-    )
 
+    if stream_format is not None:
+        return StreamingResponse(
+            _stream_job(request, job_id, task, stream_format),
+            media_type=STREAM_MEDIA_TYPES[stream_format],
+            headers={**STREAM_HEADERS, "X-Job-Id": job_id},
+        )
     return JSONResponse({"job_id": job_id})
 
 
+def _source_identity(
+    source_type: str,
+    youtube_url: Optional[str],
+    video_url: Optional[str],
+    douyin_text: Optional[str],
+    upload: Optional[StoredUpload],
+) -> str:
+    """用于请求指纹的来源：上传文件按内容哈希，链接与分享口令按规范化后的地址。"""
+    if upload is not None:
+        return f"sha256:{upload.sha256}"
+    if source_type == "douyin":
+        return douyin_media_cache_key(douyin_text or "")
+    return canonicalize_url((youtube_url if source_type == "youtube" else video_url) or "")
+
+
+def _job_reusable(job_id: str) -> bool:
+    """进行中或已成功的任务可以复用；失败、取消或已清理的任务不复用。"""
+    job = jobs.get(job_id)
+    if job is not None and job.cancelled:
+        return False
+    record = job_store.get(job_id)
+    return record is not None and record.status != "error"
+
+
+def _attach_response(request: Request, job_id: str, stream_format: Optional[str]) -> Response:
+    """重复请求的响应：返回已有任务的编号，流式请求则跟踪已有任务的事件（断开时不取消该任务）。"""
+    record = job_store.get(job_id)
+    replayable = record is not None and not (record.finished and event_broker.last_seq(job_id) == 0)
+    if stream_format is not None and replayable:
+        return StreamingResponse(
+            stream_events(event_logs.subscribe(job_id), stream_format, request.is_disconnected),
+            media_type=STREAM_MEDIA_TYPES[stream_format],
+            headers={**STREAM_HEADERS, "X-Job-Id": job_id, "X-Deduplicated": "1"},
+        )
+    return JSONResponse({"job_id": job_id, "deduplicated": True}, headers={"X-Deduplicated": "1"})
+
+
+async def _stream_job(request: Request, job_id: str, task: "asyncio.Task[None]", fmt: str):
+    """跟踪本次请求提交的任务并编码为 SSE / NDJSON；客户端提前断开且没有其它订阅方时取消任务。"""
+    stream = stream_events(event_logs.subscribe(job_id), fmt, request.is_disconnected)
+    try:
+        async for data in stream:
+            yield data
+    finally:
+        if not task.done():
+            # 请求断开时本协程可能正被取消，取消与否交给独立的任务判断
+            cancel_task = asyncio.get_running_loop().create_task(_cancel_unless_watched(job_id, task, stream))
+            cancel_tasks.add(cancel_task)
+            cancel_task.add_done_callback(cancel_tasks.discard)
+
+
+async def _cancel_unless_watched(job_id: str, task: "asyncio.Task[None]", stream) -> None:
+    """先关闭断开请求的事件流（释放其订阅），仍有重复请求或 WebSocket 订阅该任务时不取消；
+    取消后发布 error 结束事件，其它 worker 上的订阅方也随之结束。"""
+    try:
+        await stream.aclose()
+    except RuntimeError:
+        pass
+    if task.done() or event_logs.subscriber_count(job_id) > 0:
+        return
+    job = jobs.get(job_id)
+    if job is not None:
+        job.cancelled = True
+    task.cancel()
+    await asyncio.wait([task])
+    record = job_store.get(job_id)
+    if record is not None and not record.finished:
+        message = "客户端已断开，任务已取消"
+        job_store.set_status(job_id, "error", message=message)
+        await publish(job_id, {"type": "error", "data": message})
+
+
+@app.post("/api/transcribe/resumable")
+async def api_transcribe_resumable(
+    continuation: Optional[str] = Form(None),
+    budget_seconds: Optional[float] = Form(None),
+    source_type: Optional[str] = Form(None),
+    api_key: Optional[str] = Form(None),
+    auth_mode: str = Form("gemini_api_key"),
+    model_name: str = Form("gemini-2.5-flash"),
+    language_hint: Optional[str] = Form(None),
+    vertex_project: Optional[str] = Form(None),
+    vertex_location: Optional[str] = Form(None),
+    proxy: Optional[str] = Form(None),
+    proxy_http: Optional[str] = Form(None),
+    proxy_https: Optional[str] = Form(None),
+    youtube_url: Optional[str] = Form(None),
+    video_url: Optional[str] = Form(None),
+    douyin_text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    vertex_json_file: Optional[UploadFile] = File(None),
+):
+    """可续传的转写：本次调用在时间预算内推进任务，未完成时返回 continuation 令牌，带上令牌再次调用即从断点继续。
+
+    来源与模型设置只在首次调用时使用；凭据不随检查点保存，每次调用都需重新提供（或使用环境变量）。
+    """
+    budget = max(1.0, min(budget_seconds or CHECKPOINT_BUDGET_SECONDS, CHECKPOINT_BUDGET_SECONDS))
+    vertex_json = await _read_vertex_json(vertex_json_file)
+
+    if continuation:
+        try:
+            checkpoint = claim(checkpoint_store, continuation, budget + LEASE_MARGIN_SECONDS)
+        except CheckpointBusyError as e:
+            return JSONResponse(
+                {"error": str(e), "retry_after": e.retry_after},
+                status_code=409,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        if checkpoint is None:
+            return JSONResponse({"error": "续传令牌无效或已过期"}, status_code=404)
+        token = continuation
+    else:
+        source_field = {"youtube": youtube_url, "video_url": video_url, "douyin": douyin_text}
+        if source_type == "audio":
+            if file is None:
+                return JSONResponse({"error": "未接收到上传的音频文件"}, status_code=400)
+        elif source_type not in source_field:
+            return JSONResponse({"error": f"未知的来源类型：{source_type}"}, status_code=400)
+        elif not (source_field[source_type] or "").strip():
+            return JSONResponse({"error": "缺少来源链接或分享口令"}, status_code=400)
+
+        job_id = uuid.uuid4().hex
+        upload: Optional[StoredUpload] = None
+        if source_type == "audio":
+            try:
+                upload = await _store_upload(file, job_id)
+            except UploadTooLargeError as e:
+                return JSONResponse({"error": str(e)}, status_code=413)
+        params = {
+            "auth_mode": auth_mode,
+            "model_name": model_name,
+            "language_hint": language_hint,
+            "vertex_project": vertex_project,
+            "vertex_location": vertex_location,
+            "proxy": proxy,
+            "proxy_http": proxy_http,
+            "proxy_https": proxy_https,
+            "youtube_url": youtube_url,
+            "video_url": video_url,
+            "douyin_text": douyin_text,
+        }
+        checkpoint = Checkpoint(job_id, source_type, params=params, audio_path=upload.path if upload else None)
+        checkpoint.lease_until = time.time() + budget + LEASE_MARGIN_SECONDS
+        token = new_token()
+        # resumable 不属于活动状态，不会被启动时的中断任务恢复逻辑重新排队
+        job_store.create(
+            job_id,
+            source_type,
+            params={**params, "audio_path": checkpoint.audio_path, "resumable": True},
+            has_credentials=bool(api_key or vertex_json),
+        )
+        job_store.set_status(job_id, "resumable", message="等待续传")
+        checkpoint_store.save(token, checkpoint)
+
+    job_id = checkpoint.job_id
+    before = len(checkpoint.transcript)
+    error: Optional[str] = None
+    if not checkpoint.finished:
+        params = checkpoint.params
+        set_proxies(params.get("proxy"), params.get("proxy_http"), params.get("proxy_https"))
+        pipeline = SegmentedTranscription(
+            DATA_DIR,
+            file_catalog.shard_path,
+            on_output=lambda path: file_catalog.record(path, owner=job_id),
+            on_segment=lambda text, start: job_store.append_transcript(job_id, text, at=start),
+            api_key=api_key,
+            vertex_json=vertex_json,
+        )
+        try:
+            # 进度以响应中的 progress 返回，不逐条推送
+            with progress_reporter(lambda event: None):
+                await advance(checkpoint, pipeline, lambda cp: checkpoint_store.save(token, cp), budget)
+        except Exception as e:
+            error = str(e)
+
+        if checkpoint.stage == "done":
+            job_store.set_status(job_id, "done", output_filename=checkpoint.output_filename)
+        elif checkpoint.stage == "error":
+            job_store.set_status(job_id, "error", message=checkpoint.message)
+        else:
+            percent = checkpoint.progress()["percent"]
+            job_store.set_status(
+                job_id,
+                "resumable",
+                message=f"等待续传（已完成 {percent}%）" if percent is not None else "等待续传",
+            )
+
+    body: Dict[str, Any] = {
+        "job_id": job_id,
+        "status": "running" if not checkpoint.finished else checkpoint.stage,
+        "progress": checkpoint.progress(),
+        # 本次调用新增的转写文本
+        "transcript": checkpoint.transcript[before:],
+    }
+    if checkpoint.stage == "done":
+        body["output_filename"] = checkpoint.output_filename
+        return JSONResponse(body)
+    if checkpoint.stage == "error":
+        body["error"] = checkpoint.message
+        return JSONResponse(body, status_code=500)
+    body["continuation"] = token
+    if error is not None:
+        # 本步失败但仍可重试：检查点停在该步之前
+        body["error"] = error
+        return JSONResponse(body, status_code=503, headers={"Retry-After": "1"})
+    return JSONResponse(body, status_code=202)
+
+
 @app.websocket("/ws/{job_id}")
-async def ws_progress(websocket: WebSocket, job_id: str):
+async def ws_progress(websocket: WebSocket, job_id: str, since: int = 0):
     await websocket.accept()
     try:
-        async with jobs_lock:
-            job = jobs.get(job_id)
-        if job is None:
+        record = job_store.get(job_id)
+        if record is None:
             await websocket.send_json({"type": "error", "data": "任务不存在"})
             await websocket.close()
             return
+        if record.finished and since == 0 and event_broker.last_seq(job_id) == 0:
+            # 事件已过期清理，直接从任务存储回放结果
+            await _replay_from_store(websocket, job_id)
+            await websocket.close()
+            return
 
-        # Send initial state
-        if job.transcript:
-            await websocket.send_json({"type": "chunk", "data": job.transcript})
-
-        while True:
-            event = await job.queue.get()
+        async for event in event_logs.subscribe(job_id, since):
             await websocket.send_json(event)
+        await websocket.close()
 
     except WebSocketDisconnect:
         return
@@ -436,15 +962,202 @@ async def ws_progress(websocket: WebSocket, job_id: str):
                 pass
 
 
+@app.post("/api/batches")
+async def api_create_batch(
+    sources: Optional[str] = Form(None),
+    files: Optional[List[UploadFile]] = File(None),
+    concurrency: Optional[int] = Form(None),
+    api_key: Optional[str] = Form(None),
+    auth_mode: str = Form("gemini_api_key"),
+    model_name: str = Form("gemini-2.5-flash"),
+    language_hint: Optional[str] = Form(None),
+    vertex_project: Optional[str] = Form(None),
+    vertex_location: Optional[str] = Form(None),
+    proxy: Optional[str] = Form(None),
+    proxy_http: Optional[str] = Form(None),
+    proxy_https: Optional[str] = Form(None),
+    vertex_json_file: Optional[UploadFile] = File(None),
+):
+    """批量提交：sources 为 JSON 数组或每行一条链接/分享口令，files 为音频文件，所有条目共用同一组设置。
+
+    条目按批次并发上限逐个提交给调度器；进度通过 /api/batches/{batch_id}/events 汇总推送。
+    """
+    try:
+        parsed = parse_sources(sources)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    total = len(parsed) + len(files or [])
+    if total == 0:
+        return JSONResponse({"error": "没有可提交的来源"}, status_code=400)
+    if total > MAX_BATCH_ITEMS:
+        return JSONResponse({"error": f"单个批次最多 {MAX_BATCH_ITEMS} 个来源"}, status_code=400)
+
+    batch_id = uuid.uuid4().hex
+    items = [
+        BatchItem(index, source_type, source, uuid.uuid4().hex)
+        for index, (source_type, source) in enumerate(parsed)
+    ]
+    uploads: Dict[int, StoredUpload] = {}
+    for file in files or []:
+        filename = os.path.basename(file.filename or "") or f"upload_{len(items)}"
+        item = BatchItem(len(items), "audio", filename, uuid.uuid4().hex)
+        try:
+            uploads[item.index] = await _store_upload(file, item.job_id)
+        except UploadTooLargeError as e:
+            for upload in uploads.values():
+                _discard_upload(upload)
+            return JSONResponse({"error": f"{item.source}：{e}"}, status_code=413)
+        items.append(item)
+
+    vertex_json = await _read_vertex_json(vertex_json_file)
+    settings = {
+        "auth_mode": auth_mode,
+        "model_name": model_name,
+        "language_hint": language_hint,
+        "vertex_project": vertex_project,
+        "vertex_location": vertex_location,
+        "proxy": proxy,
+        "proxy_http": proxy_http,
+        "proxy_https": proxy_https,
+    }
+    concurrency = clamp_concurrency(concurrency)
+    batch_store.create(batch_id, items, concurrency)
+
+    async def submit(item: BatchItem) -> "asyncio.Task[None]":
+        source = {SOURCE_FIELDS[item.source_type]: item.source} if item.source_type in SOURCE_FIELDS else {}
+        return await _submit_job(
+            item.job_id, item.source_type, settings, api_key, vertex_json, upload=uploads.get(item.index), **source
+        )
+
+    task = asyncio.create_task(_run_batch(batch_id, items, concurrency, submit))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+    return JSONResponse({
+        "batch_id": batch_id,
+        "total": len(items),
+        "concurrency": concurrency,
+        "items": [item.to_dict() for item in items],
+    })
+
+
+async def _run_batch(batch_id: str, items: List[BatchItem], concurrency: int, submit) -> None:
+    def on_update(item: BatchItem) -> None:
+        batch_store.update_item(batch_id, item)
+        event_broker.publish(batch_id, {"type": "item", "data": {**item.to_dict(), "counts": count_statuses(items)}})
+
+    def outcome(job_id: str):
+        record = job_store.get(job_id)
+        if record is None:
+            return "error", "任务不存在", None
+        return ("done" if record.status == "done" else "error"), record.message, record.output_filename
+
+    try:
+        await run_batch(items, concurrency, submit, outcome, on_update)
+    except Exception as e:
+        print(f"批次 {batch_id} 运行失败: {e}", file=sys.stderr)
+    counts = count_statuses(items)
+    status = "done" if counts["error"] == 0 else ("error" if counts["done"] == 0 else "partial")
+    batch_store.set_status(batch_id, status)
+    event_broker.publish(batch_id, {"type": "done", "data": batch_store.manifest(batch_id)})
+
+
+@app.get("/api/batches/{batch_id}")
+async def api_batch_manifest(batch_id: str):
+    """批次的结果清单：整体状态、各状态条目数与每个条目的任务编号、结果文件。"""
+    manifest = batch_store.manifest(batch_id)
+    if manifest is None:
+        return JSONResponse({"error": "批次不存在"}, status_code=404)
+    return JSONResponse(manifest)
+
+
+@app.get("/api/batches/{batch_id}/events")
+async def api_batch_events(request: Request, batch_id: str, since: int = 0, format: Optional[str] = None):
+    """以 SSE（默认）或 NDJSON 推送批次内各条目的状态变化，最后一条为带清单的 done 事件；支持 ?since= 续传。"""
+    try:
+        fmt = choose_stream_format(format, request.headers.get("accept")) or "sse"
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    manifest = batch_store.manifest(batch_id)
+    if manifest is None:
+        return JSONResponse({"error": "批次不存在"}, status_code=404)
+    if manifest["status"] != "running" and event_broker.last_seq(batch_id) == 0:
+        # 事件已过期清理，直接返回清单
+        return Response(
+            encode_event({"type": "done", "data": manifest}, fmt),
+            media_type=STREAM_MEDIA_TYPES[fmt],
+            headers=STREAM_HEADERS,
+        )
+    return StreamingResponse(
+        stream_events(event_logs.subscribe(batch_id, since), fmt, request.is_disconnected),
+        media_type=STREAM_MEDIA_TYPES[fmt],
+        headers=STREAM_HEADERS,
+    )
+
+
+@app.get("/api/batches/{batch_id}/download")
+async def api_batch_download(batch_id: str):
+    """打包下载批次中已完成条目的转写结果（附 manifest.json）。"""
+    manifest = batch_store.manifest(batch_id)
+    if manifest is None:
+        return JSONResponse({"error": "批次不存在"}, status_code=404)
+    fd, zip_path = tempfile.mkstemp(prefix=f"batch_{batch_id}_", suffix=".zip")
+    os.close(fd)
+    await asyncio.to_thread(write_batch_zip, manifest, file_catalog.lookup, zip_path)
+    return FileResponse(
+        zip_path,
+        media_type="application/zip",
+        filename=f"batch_{batch_id}.zip",
+        background=BackgroundTask(os.remove, zip_path),
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+async def api_job_status(job_id: str):
+    record = job_store.get(job_id)
+    if record is None:
+        return JSONResponse({"error": "任务不存在"}, status_code=404)
+    return JSONResponse({
+        "job_id": record.job_id,
+        "status": record.status,
+        "message": record.message,
+        "source_type": record.source_type,
+        "output_filename": record.output_filename,
+        "transcript_length": record.transcript_length,
+        "attempts": record.attempts,
+        "created_at": record.created_at,
+        "updated_at": record.updated_at,
+    })
+
+
+@app.get("/api/stats")
+async def api_stats():
+    """任务调度、事件投递（帧数、帧率、事件循环延迟）、内存任务表、ffmpeg 转码池（并发与排队等待）
+    与抖音解析接口（延迟、错误率与熔断状态）统计。"""
+    return JSONResponse({
+        "scheduler": scheduler.stats(),
+        "delivery": delivery_stats.snapshot(),
+        "jobs": jobs.usage(),
+        "ffmpeg": get_ffmpeg_pool().stats(),
+        "douyin_resolver": get_douyin_resolver().health_snapshot(),
+    })
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标（阶段耗时、字节数、Token、重试与运行中的任务）。"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/download/{filename}")
-async def download_result(filename: str):
+async def download_result(filename: str, request: Request):
     # Security: only serve files from DATA_DIR and disallow path traversal
     if os.path.sep in filename or os.path.altsep and os.path.altsep in filename:
         return JSONResponse({"error": "非法文件名"}, status_code=400)
-    path = os.path.join(DATA_DIR, filename)
+    path = file_catalog.lookup(filename) or os.path.join(DATA_DIR, filename)
     if not os.path.isfile(path):
         return JSONResponse({"error": "文件不存在"}, status_code=404)
-    return FileResponse(path, filename=filename, media_type="text/plain; charset=utf-8")
+    # 支持 ETag 条件请求、断点续传与预压缩副本；计算 ETag 要读取整个文件，放到线程中执行
+    return await asyncio.to_thread(transcript_response, path, filename, request.headers)
 
 
 @app.post("/api/cleanup")
@@ -453,37 +1166,43 @@ async def api_cleanup(max_age_hours: Optional[float] = None):
     try:
         age_hours = max_age_hours or DEFAULT_CLEANUP_HOURS
         cleanup_old_files(DATA_DIR, age_hours)
+        await asyncio.to_thread(file_catalog.scan)
         return JSONResponse({"status": "success", "message": f"已清理超过 {age_hours} 小时的文件"})
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
 
 @app.get("/api/files")
-async def api_list_files():
-    """列出data目录中的文件"""
+async def api_list_files(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    kind: Optional[str] = None,
+    owner: Optional[str] = None,
+    max_age_hours: Optional[float] = None,
+    sort: str = "modified",
+    order: str = "desc",
+):
+    """按文件索引分页列出data目录中的文件（可按类型、任务、时间过滤）"""
     try:
-        import glob
-        pattern = os.path.join(DATA_DIR, "*")
-        files = glob.glob(pattern)
-        
-        file_list = []
-        for file_path in files:
-            if os.path.isfile(file_path):
-                stat = os.stat(file_path)
-                file_list.append({
-                    "name": os.path.basename(file_path),
-                    "size": stat.st_size,
-                    "modified": stat.st_mtime,
-                    "age_hours": (time.time() - stat.st_mtime) / 3600
-                })
-        
-        # 按修改时间排序，最新的在前
-        file_list.sort(key=lambda x: x["modified"], reverse=True)
-        
-        return JSONResponse({
-            "status": "success", 
-            "files": file_list,
-            "total_count": len(file_list)
-        })
+        entries, next_cursor, total = await asyncio.to_thread(
+            file_catalog.list,
+            kind=kind,
+            owner=owner,
+            max_age_seconds=max_age_hours * 3600 if max_age_hours is not None else None,
+            sort=sort,
+            descending=order.lower() != "asc",
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+    now = time.time()
+    return JSONResponse({
+        "status": "success",
+        "files": [entry.to_dict(now) for entry in entries],
+        "total_count": total,
+        "next_cursor": next_cursor,
+    })
@@ -1,6 +1,6 @@
 import argparse
+import importlib.util
 import os
-from importlib.machinery import SourceFileLoader
 
 import uvicorn
 
@@ -52,7 +52,9 @@ def main() -> None:
         return
 
     app_path = os.path.join(os.path.dirname(__file__), "app.py")
-    module = SourceFileLoader("audiototxt_fastapi_app", app_path).load_module()
+    spec = importlib.util.spec_from_file_location("audiototxt_fastapi_app", app_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
     uvicorn.run(
         module.app,
         host=args.host,
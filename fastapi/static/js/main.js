@@ -158,6 +158,14 @@ form.addEventListener("submit", async (e) => {
       method: "POST",
       body: formData,
     });
+    if (resp.status === 429) {
+      const retryAfter = resp.headers.get("Retry-After");
+      appendStatus(
+        "任务队列已满，请" + (retryAfter ? ` ${retryAfter} 秒后` : "稍后") + "重试"
+      );
+      setRunning(false);
+      return;
+    }
     if (!resp.ok) {
       appendStatus("提交任务失败");
       setRunning(false);
@@ -165,26 +173,56 @@ form.addEventListener("submit", async (e) => {
     }
     const data = await resp.json();
     const jobId = data.job_id;
-    appendStatus("任务已创建：" + jobId);
-
-    ws = new WebSocket(
-      (location.protocol === "https:" ? "wss://" : "ws://") +
-        location.host +
-        "/ws/" +
-        jobId
+    appendStatus(
+      (data.deduplicated ? "已有相同的任务，继续跟踪：" : "任务已创建：") + jobId
     );
-    ws.onopen = () => appendStatus("已连接至进度通道");
-    ws.onmessage = (ev) => {
-      try {
-        const m = JSON.parse(ev.data);
-        if (m.type === "status") {
-          appendStatus(m.data);
+
+    // 记录已收到的最大事件序号，断线重连时用 ?since= 精确续传
+    let lastSeq = 0;
+    let finished = false;
+    let stopped = false;
+    let reconnectAttempts = 0;
+
+    const connect = () => {
+      ws = new WebSocket(
+        (location.protocol === "https:" ? "wss://" : "ws://") +
+          location.host +
+          "/ws/" +
+          jobId +
+          (lastSeq ? "?since=" + lastSeq : "")
+      );
+      ws.onopen = () => {
+        reconnectAttempts = 0;
+        appendStatus("已连接至进度通道");
+      };
+      const handleEvent = (m) => {
+        if (m.type === "batch") {
+          // 服务端把同一时间窗内的多条事件合并为一帧
+          (m.data || []).forEach(handleEvent);
+        } else if (m.type === "status") {
+          appendStatus((m.kind === "warning" ? "警告：" : "") + m.data);
+        } else if (m.type === "queue") {
+          const stageName = m.data.stage === "download" ? "下载" : "转写";
+          appendStatus(`排队等待${stageName}：第 ${m.data.position} 位`);
+        } else if (m.type === "snapshot") {
+          // 断线期间的事件已被压缩：用快照中的全文替换当前输出
+          outputPre.value = "";
+          appendOutput((m.data && m.data.transcript) || "");
         } else if (m.type === "chunk") {
           appendOutput(m.data);
+        } else if (m.type === "timeline") {
+          const stages = ((m.data && m.data.stages) || [])
+            .map((s) => `${s.stage} ${(s.duration_ms / 1000).toFixed(1)}s`)
+            .join(" · ");
+          if (stages) {
+            appendStatus("阶段耗时：" + stages);
+          }
         } else if (m.type === "error") {
+          finished = true;
           appendStatus("错误：" + m.data);
           setRunning(false);
         } else if (m.type === "done") {
+          finished = true;
           // 在清除计时器前计算总用时
           const elapsedMs = taskStartTimestampMs
             ? Date.now() - taskStartTimestampMs
@@ -201,15 +239,33 @@ form.addEventListener("submit", async (e) => {
             downloadLink.textContent = "下载：" + m.data.output_filename;
           }
         }
-      } catch (e) {
-        console.error(e);
-      }
-    };
-    ws.onclose = () => {
-      appendStatus("通道已关闭");
-      setRunning(false);
+      };
+      ws.onmessage = (ev) => {
+        try {
+          const m = JSON.parse(ev.data);
+          if (typeof m.seq === "number") {
+            lastSeq = m.seq;
+          }
+          handleEvent(m);
+        } catch (e) {
+          console.error(e);
+        }
+      };
+      ws.onclose = () => {
+        if (!finished && !stopped && reconnectAttempts < 5) {
+          reconnectAttempts += 1;
+          appendStatus("通道断开，正在重连...");
+          setTimeout(connect, 1000 * reconnectAttempts);
+          return;
+        }
+        appendStatus("通道已关闭");
+        setRunning(false);
+      };
     };
+    connect();
+
     stopBtn.onclick = () => {
+      stopped = true;
       try {
         ws && ws.close();
       } catch (e) {}
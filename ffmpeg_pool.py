@@ -0,0 +1,235 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+from metrics import FFMPEG_QUEUE_WAIT_SECONDS
+from progress import report_progress
+
+
+def _default_workers() -> int:
+    # ffmpeg 转码是 CPU 密集型：默认只用一半核心，留给事件循环和其他任务
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+DEFAULT_MAX_WORKERS = int(os.getenv("FFMPEG_MAX_WORKERS", "0")) or _default_workers()
+DEFAULT_THREADS = int(os.getenv("FFMPEG_THREADS", "0"))
+DEFAULT_NICE = int(os.getenv("FFMPEG_NICE", "0"))
+# ionice 调度类：idle / best-effort；为空表示不设置
+DEFAULT_IONICE = os.getenv("FFMPEG_IONICE", "").strip() or None
+# 排队超过该时间时打印提示
+QUEUE_WAIT_NOTICE_SECONDS = 1.0
+
+_IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+
+class _Waiter:
+    __slots__ = ("notify", "granted")
+
+    def __init__(self, notify: Callable[[], None]) -> None:
+        self.notify = notify
+        self.granted = False
+
+
+class _Slots:
+    """线程与协程共用的先进先出计数信号量：协程等待时不占用线程，也不阻塞事件循环。"""
+
+    def __init__(self, limit: int) -> None:
+        self._lock = threading.Lock()
+        self._free = limit
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(_Waiter(event.set))
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _wake() -> None:
+            if not future.done():
+                future.set_result(None)
+
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return
+            waiter = _Waiter(lambda: loop.call_soon_threadsafe(_wake))
+            self._waiters.append(waiter)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            # 名额已经转交给本协程，取消时要还回去
+            if granted:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        waiter.notify()
+
+
+class FFmpegPool:
+    """限制同时运行的 ffmpeg 进程数，并为每个进程设置 -threads 与可选的 nice/ionice。
+
+    run() 供线程调用，arun() 供协程调用，两者共用同一组名额；超出并发上限的任务按提交顺序排队。
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        threads: int = DEFAULT_THREADS,
+        nice: int = DEFAULT_NICE,
+        ionice: Optional[str] = DEFAULT_IONICE,
+        ffmpeg_binary: str = "ffmpeg",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_workers = max(1, int(max_workers))
+        # 未指定时按核心数平均分给每个并发进程
+        self.threads = threads if threads > 0 else max(1, (os.cpu_count() or 1) // self.max_workers)
+        self.nice = nice
+        self.ionice = ionice
+        self.ffmpeg_binary = ffmpeg_binary
+        self._clock = clock
+        self._slots = _Slots(self.max_workers)
+        self._stats_lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_count = 0
+
+    def build_command(self, args: Sequence[str]) -> List[str]:
+        """拼出完整命令；args 为 ffmpeg 参数，最后一个参数必须是输出文件。"""
+        if not args:
+            raise ValueError("ffmpeg 参数不能为空")
+        prefix: List[str] = []
+        if self.ionice and self.ionice in _IONICE_CLASSES and shutil.which("ionice"):
+            prefix += ["ionice", "-c", _IONICE_CLASSES[self.ionice]]
+        if self.nice and shutil.which("nice"):
+            prefix += ["nice", "-n", str(self.nice)]
+        # -threads 作为输出选项放在输出文件之前
+        return prefix + [
+            self.ffmpeg_binary,
+            "-hide_banner",
+            "-nostdin",
+            *args[:-1],
+            "-threads", str(self.threads),
+            args[-1],
+        ]
+
+    def _record_wait(self, waited: float) -> None:
+        with self._stats_lock:
+            self._wait_count += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._running += 1
+        FFMPEG_QUEUE_WAIT_SECONDS.observe(waited)
+        if waited >= QUEUE_WAIT_NOTICE_SECONDS:
+            report_progress(f"转码排队 {waited:.1f} 秒后开始", stage="extract")
+
+    def _record_done(self, ok: bool) -> None:
+        with self._stats_lock:
+            self._running -= 1
+            if ok:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def run(self, args: Sequence[str]) -> "subprocess.CompletedProcess[str]":
+        """在名额内同步运行 ffmpeg；失败时抛出 CalledProcessError，找不到 ffmpeg 时抛出 FileNotFoundError。"""
+        cmd = self.build_command(args)
+        queued_at = self._clock()
+        self._slots.acquire()
+        self._record_wait(self._clock() - queued_at)
+        ok = False
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            ok = True
+            return result
+        finally:
+            self._record_done(ok)
+            self._slots.release()
+
+    async def arun(self, args: Sequence[str]) -> "subprocess.CompletedProcess[str]":
+        """run 的协程版本：排队与等待进程结束都不阻塞事件循环，取消时结束 ffmpeg 进程。"""
+        cmd = self.build_command(args)
+        queued_at = self._clock()
+        await self._slots.aacquire()
+        self._record_wait(self._clock() - queued_at)
+        ok = False
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout_b, stderr_b = await proc.communicate()
+            except asyncio.CancelledError:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                raise
+            stdout = stdout_b.decode(errors="replace")
+            stderr = stderr_b.decode(errors="replace")
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+            ok = True
+            return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        finally:
+            self._record_done(ok)
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_workers": self.max_workers,
+                "threads_per_process": self.threads,
+                "running": self._running,
+                "waiting": self._slots.waiting,
+                "completed": self._completed,
+                "failed": self._failed,
+                "queue_wait_count": self._wait_count,
+                "queue_wait_seconds_total": round(self._wait_total, 3),
+                "queue_wait_seconds_max": round(self._wait_max, 3),
+            }
+
+
+_pool: Optional[FFmpegPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ffmpeg_pool() -> FFmpegPool:
+    """返回进程内共享的 ffmpeg 转码池。"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = FFmpegPool()
+        return _pool
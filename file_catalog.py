@@ -0,0 +1,296 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 定期全量扫描数据目录、与索引对账的间隔（秒）；0 表示只在启动时扫描
+DEFAULT_SCAN_SECONDS = float(os.getenv("FILE_CATALOG_SCAN_SECONDS", "300"))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# 分片目录名：文件名 SHA-1 的前两位十六进制，共 256 个子目录
+SHARD_DIR_PATTERN = re.compile(r"^[0-9a-f]{2}$")
+
+_KIND_BY_EXT = {
+    ".txt": "transcript",
+    **{ext: "audio" for ext in (".mp3", ".m4a", ".wav", ".flac", ".ogg", ".oga", ".opus", ".aac", ".amr", ".wma")},
+    **{ext: "video" for ext in (".mp4", ".mkv", ".webm", ".mov", ".avi", ".flv")},
+}
+_SORT_COLUMNS = {"modified": "mtime", "name": "name", "size": "size"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    rel_path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime, name);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files(size, name);
+CREATE INDEX IF NOT EXISTS idx_files_kind ON files(kind, mtime);
+CREATE INDEX IF NOT EXISTS idx_files_owner ON files(owner, mtime);
+"""
+
+
+def file_kind(name: str) -> str:
+    return _KIND_BY_EXT.get(os.path.splitext(name)[1].lower(), "other")
+
+
+def shard_name(name: str) -> str:
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:2]
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    name: str
+    rel_path: str
+    kind: str
+    size: int
+    mtime: float
+    owner: Optional[str] = None
+
+    def to_dict(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "size": self.size,
+            "modified": self.mtime,
+            "age_hours": (now - self.mtime) / 3600,
+            "owner": self.owner,
+        }
+
+
+def _encode_cursor(value: Any, name: str) -> str:
+    raw = json.dumps([value, name], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, name = json.loads(raw.decode("utf-8"))
+    except Exception as exc:
+        raise ValueError("无效的分页游标") from exc
+    return value, str(name)
+
+
+class FileCatalog:
+    """数据目录的文件元数据索引（SQLite）：写入与删除时更新，并定期扫描目录对账。
+
+    新文件按文件名哈希放入 root 下的两级分片目录（如 data/3f/xxx.txt），避免单个目录无限增长；
+    根目录下的历史文件同样会被索引。列表查询按索引排序并用游标分页，不再遍历整个目录。
+    root 下的 cache 等非分片子目录不在索引范围内。
+    """
+
+    def __init__(self, root: str, db_path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(
+            db_path or ":memory:",
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.row_factory = sqlite3.Row
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._scan_thread: Optional[threading.Thread] = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def shard_dir(self, key: str) -> str:
+        """返回 key 对应的分片目录（会创建目录）。"""
+        directory = os.path.join(self.root, shard_name(key))
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def shard_path(self, name: str) -> str:
+        """返回新文件应写入的分片路径。"""
+        return os.path.join(self.shard_dir(name), name)
+
+    def record(self, path: str, owner: Optional[str] = None) -> Optional[CatalogEntry]:
+        """登记（或更新）一个数据目录内的文件；文件不存在时从索引中删除。"""
+        path = os.path.abspath(path)
+        name = os.path.basename(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.remove(name)
+            return None
+        entry = CatalogEntry(
+            name=name,
+            rel_path=os.path.relpath(path, self.root),
+            kind=file_kind(name),
+            size=st.st_size,
+            mtime=st.st_mtime,
+            owner=owner,
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO files (name, rel_path, kind, size, mtime, owner) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET rel_path = excluded.rel_path, size = excluded.size,"
+                " mtime = excluded.mtime, owner = COALESCE(excluded.owner, files.owner)",
+                (entry.name, entry.rel_path, entry.kind, entry.size, entry.mtime, owner),
+            )
+        return entry
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+
+    def lookup(self, name: str) -> Optional[str]:
+        """按文件名返回文件的绝对路径；不在索引中时返回 None。"""
+        with self._lock:
+            row = self._conn.execute("SELECT rel_path FROM files WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return os.path.join(self.root, row["rel_path"])
+
+    def _walk(self) -> Dict[str, Tuple[str, int, float]]:
+        found: Dict[str, Tuple[str, int, float]] = {}
+
+        def visit(directory: str, prefix: str) -> None:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                return
+            for item in entries:
+                # 跳过临时文件与转写结果的预压缩副本
+                if item.name.startswith(".") or item.name.endswith((".part", ".txt.gz", ".txt.zst")):
+                    continue
+                try:
+                    if item.is_file():
+                        st = item.stat()
+                        found[item.name] = (prefix + item.name, st.st_size, st.st_mtime)
+                    elif not prefix and item.is_dir() and SHARD_DIR_PATTERN.match(item.name):
+                        visit(item.path, item.name + os.sep)
+                except OSError:
+                    continue
+
+        visit(self.root, "")
+        return found
+
+    def scan(self) -> Dict[str, int]:
+        """扫描数据目录并与索引对账，返回新增、更新与删除的条数。
+
+        遍历目录时不持有锁，期间 record() 登记的条目不在遍历结果中：删除前重新检查文件是否存在，
+        也不用遍历时读到的旧信息覆盖更新的记录。
+        """
+        found = self._walk()
+        added = updated = removed = 0
+        with self._lock:
+            rows = self._conn.execute("SELECT name, rel_path, size, mtime FROM files").fetchall()
+            known = {row["name"]: (row["rel_path"], row["size"], row["mtime"]) for row in rows}
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name in known.keys() - found.keys():
+                    if os.path.isfile(os.path.join(self.root, known[name][0])):
+                        continue
+                    self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+                    removed += 1
+                for name, (rel_path, size, mtime) in found.items():
+                    current = known.get(name)
+                    if current == (rel_path, size, mtime) or (current is not None and current[2] > mtime):
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO files (name, rel_path, kind, size, mtime) VALUES (?, ?, ?, ?, ?)"
+                        " ON CONFLICT(name) DO UPDATE SET rel_path = excluded.rel_path,"
+                        " size = excluded.size, mtime = excluded.mtime",
+                        (name, rel_path, file_kind(name), size, mtime),
+                    )
+                    if current is None:
+                        added += 1
+                    else:
+                        updated += 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"added": added, "updated": updated, "removed": removed}
+
+    def start_scan_timer(self, interval_seconds: float = DEFAULT_SCAN_SECONDS) -> None:
+        """立即扫描一次，之后每隔 interval_seconds 秒在后台线程中对账。"""
+        if self._scan_thread is not None:
+            return
+
+        def scan_loop():
+            while True:
+                try:
+                    self.scan()
+                except Exception as e:
+                    print(f"文件索引扫描失败: {e}", file=sys.stderr)
+                if interval_seconds <= 0:
+                    return
+                time.sleep(interval_seconds)
+
+        self._scan_thread = threading.Thread(target=scan_loop, name="file-catalog-scan", daemon=True)
+        self._scan_thread.start()
+
+    def list(
+        self,
+        kind: Optional[str] = None,
+        owner: Optional[str] = None,
+        max_age_seconds: Optional[float] = None,
+        sort: str = "modified",
+        descending: bool = True,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> Tuple[List[CatalogEntry], Optional[str], int]:
+        """按条件分页列出文件，返回 (本页条目, 下一页游标或 None, 符合条件的总数)。"""
+        column = _SORT_COLUMNS.get(sort)
+        if column is None:
+            raise ValueError(f"不支持的排序字段：{sort}（可选 {' / '.join(_SORT_COLUMNS)}）")
+        limit = max(1, min(MAX_PAGE_SIZE, int(limit)))
+        where: List[str] = []
+        params: List[Any] = []
+        if kind:
+            where.append("kind = ?")
+            params.append(kind)
+        if owner:
+            where.append("owner = ?")
+            params.append(owner)
+        if max_age_seconds is not None:
+            where.append("mtime >= ?")
+            params.append((time.time() if now is None else now) - max_age_seconds)
+        filter_sql = " AND ".join(where) or "1"
+        filter_params = list(params)
+
+        if cursor:
+            value, name = _decode_cursor(cursor)
+            op = "<" if descending else ">"
+            where.append(f"({column} {op} ? OR ({column} = ? AND name {op} ?))")
+            params.extend([value, value, name])
+        direction = "DESC" if descending else "ASC"
+        page_sql = (
+            f"SELECT * FROM files WHERE {' AND '.join(where) or '1'}"
+            f" ORDER BY {column} {direction}, name {direction} LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(page_sql, (*params, limit + 1)).fetchall()
+            total = self._conn.execute(f"SELECT COUNT(*) FROM files WHERE {filter_sql}", filter_params).fetchone()[0]
+        entries = [CatalogEntry(**dict(row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = entries[-1]
+            next_cursor = _encode_cursor(getattr(last, column), last.name)
+        return entries, next_cursor, total
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+# 相同来源与设置的请求在该时间窗内（秒）复用已有任务；0 表示只按 Idempotency-Key 去重
+DEFAULT_DEDUPE_WINDOW_SECONDS = float(os.getenv("DEDUPE_WINDOW_SECONDS", "600"))
+# Idempotency-Key 的保留时长（秒）
+DEFAULT_KEY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+MAX_KEY_LENGTH = 255
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_idempotency_job ON idempotency_keys(job_id);
+CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at);
+"""
+
+
+class IdempotencyConflictError(ValueError):
+    """同一个 Idempotency-Key 被用于内容不同的请求。"""
+
+
+def _digest(value: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest() if value else None
+
+
+def request_fingerprint(
+    source_type: str,
+    source: str,
+    settings: Dict[str, Any],
+    credentials: Optional[str] = None,
+) -> str:
+    """请求指纹：来源类型、规范化后的来源（链接或上传文件的 sha256）与影响结果的设置。
+
+    代理不影响转写结果，不参与计算；凭据只以哈希参与，使不同用户的请求互不复用。
+    """
+    payload = {
+        "source_type": source_type,
+        "source": source,
+        "settings": {k: v for k, v in sorted(settings.items()) if not k.startswith("proxy") and v},
+        "credentials": _digest(credentials),
+    }
+    return hashlib.sha256(
+        json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+class IdempotencyIndex:
+    """Idempotency-Key 与请求指纹到任务编号的映射（SQLite），与任务存储共用同一个数据库文件。
+
+    登记与查找在同一个写事务中完成，并发的重复请求（包括不同 worker 上的）只会创建一个任务。
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        window_seconds: float = DEFAULT_DEDUPE_WINDOW_SECONDS,
+        key_ttl_seconds: float = DEFAULT_KEY_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        self.window_seconds = window_seconds
+        self.key_ttl_seconds = key_ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            db_path or ":memory:",
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.row_factory = sqlite3.Row
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _find(self, key: str, ttl: float, now: float) -> Optional[sqlite3.Row]:
+        return self._conn.execute(
+            "SELECT fingerprint, job_id FROM idempotency_keys WHERE key = ? AND created_at > ?",
+            (key, now - ttl),
+        ).fetchone()
+
+    def claim(
+        self,
+        job_id: str,
+        fingerprint: str,
+        idempotency_key: Optional[str] = None,
+        is_reusable: Callable[[str], bool] = lambda _job_id: True,
+    ) -> Optional[str]:
+        """为新任务 job_id 登记请求；已有可复用的相同请求时返回已有任务的编号（本次的 key 也指向它）。
+
+        先按 Idempotency-Key 查找（同一个 key 对应的指纹不同时抛出 IdempotencyConflictError），
+        再按指纹查找时间窗内的任务。is_reusable(job_id) 为 False（如任务已失败）的记录会被新任务覆盖。
+        """
+        if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key 长度不能超过 {MAX_KEY_LENGTH}")
+        entries = [(f"fp:{fingerprint}", self.window_seconds)] if self.window_seconds > 0 else []
+        if idempotency_key:
+            # key 由客户端生成，与指纹中的凭据哈希无关，这里只保证 key 对应的请求内容一致
+            entries.insert(0, (f"key:{idempotency_key}", self.key_ttl_seconds))
+        if not entries:
+            return None
+
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                found = []
+                for key, ttl in entries:
+                    row = self._find(key, ttl, now)
+                    if row is not None and row["fingerprint"] != fingerprint:
+                        raise IdempotencyConflictError("该 Idempotency-Key 已用于内容不同的请求")
+                    found.append((key, row["job_id"] if row is not None else None))
+                existing = next((j for _key, j in found if j is not None and is_reusable(j)), None)
+                target = existing or job_id
+                # 未登记（或指向不可复用任务）的 key 与指纹改为指向本次使用的任务
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, job_id, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(key, fingerprint, target, now) for key, j in found if j != target],
+                )
+                if existing is None:
+                    self._conn.execute(
+                        "DELETE FROM idempotency_keys WHERE created_at <= ?",
+                        (now - max(self.window_seconds, self.key_ttl_seconds),),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return existing
+
+    def forget(self, job_id: str) -> None:
+        """撤销任务的登记（如任务未能提交），之后的相同请求会创建新任务。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency_keys WHERE job_id = ?", (job_id,))
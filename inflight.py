@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """同一 key 的并发调用只真正执行一次，其余调用阻塞等待并共享结果（或异常）。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        on_complete: Optional[Callable[[Any, int], None]] = None,
+    ) -> Tuple[Any, bool]:
+        """执行 fn 或加入已在进行的同 key 调用，返回 (结果, 是否为共享结果)。
+
+        on_complete(result, callers) 在唤醒等待者之前、持锁状态下调用一次，
+        callers 为共享这次结果的调用方总数，可用于原子地为每个调用方登记引用。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if call.error is None and on_complete is not None:
+                    on_complete(call.result, call.waiters + 1)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
+
+
+class _AsyncCall:
+    __slots__ = ("task", "callers", "completed")
+
+    def __init__(self, task: "asyncio.Task[Any]") -> None:
+        self.task = task
+        self.callers = 0
+        self.completed = False
+
+
+class AsyncSingleFlight:
+    """SingleFlight 的 asyncio 版本：同一事件循环内同 key 的并发协程只执行一次 fn()。
+
+    共享的执行放在独立 Task 中，某个调用方被取消不会中断其他调用方仍在等待的执行。
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Tuple[int, Hashable], _AsyncCall] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        on_complete: Optional[Callable[[Any, int], None]] = None,
+        on_abandon: Optional[Callable[[Any], None]] = None,
+    ) -> Tuple[Any, bool]:
+        """执行 fn 或加入已在进行的同 key 调用，返回 (结果, 是否为共享结果)。
+
+        on_complete(result, callers) 在任何调用方拿到结果之前调用一次；已计入 callers
+        的调用方若在拿到结果前被取消，会为其调用 on_abandon(result)，用于归还引用。
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        call = self._calls.get(call_key)
+        leader = call is None
+        if leader:
+            call = _AsyncCall(loop.create_task(fn()))
+            self._calls[call_key] = call
+            # 先于 shield 注册，保证回调在唤醒调用方之前执行
+            call.task.add_done_callback(lambda task: self._finish(call_key, call, on_complete))
+        call.callers += 1
+
+        try:
+            result = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.completed:
+                if on_abandon is not None:
+                    on_abandon(call.task.result())
+            else:
+                call.callers -= 1
+            raise
+        return result, not leader
+
+    def _finish(
+        self,
+        call_key: Tuple[int, Hashable],
+        call: _AsyncCall,
+        on_complete: Optional[Callable[[Any, int], None]],
+    ) -> None:
+        if self._calls.get(call_key) is call:
+            del self._calls[call_key]
+        task = call.task
+        # 读取异常，避免所有调用方都已取消时出现 "exception was never retrieved"
+        if task.cancelled() or task.exception() is not None:
+            return
+        if on_complete is not None:
+            on_complete(task.result(), call.callers)
+        call.completed = True
+
+    def in_flight(self, key: Hashable) -> bool:
+        try:
+            loop_id = id(asyncio.get_running_loop())
+        except RuntimeError:
+            return False
+        return (loop_id, key) in self._calls
+
+
+class FileLeases:
+    """对正在被任务使用的文件做引用计数，清理逻辑据此跳过这些文件。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def acquire(self, path: str, count: int = 1) -> None:
+        key = self._normalize(path)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def release(self, path: str) -> None:
+        key = self._normalize(path)
+        with self._lock:
+            remaining = self._counts.get(key, 0) - 1
+            if remaining > 0:
+                self._counts[key] = remaining
+            else:
+                self._counts.pop(key, None)
+
+    def is_leased(self, path: str) -> bool:
+        with self._lock:
+            return self._counts.get(self._normalize(path), 0) > 0
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            return self._counts.get(self._normalize(path), 0)
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from job_scheduler import QueueFullError
+from job_store import _pid_alive
+
+
+# 单个批次默认同时运行的任务数（仍受全局调度器各阶段并发数限制）及其上限
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+MAX_BATCH_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+MAX_BATCH_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+# 调度队列已满时，等待 Retry-After（不超过该秒数）后重新提交
+MAX_RETRY_WAIT_SECONDS = 5.0
+
+SOURCE_TYPES = ("youtube", "video_url", "douyin", "audio")
+# 来源类型 -> 提交任务时携带来源的参数名
+SOURCE_FIELDS = {"youtube": "youtube_url", "video_url": "video_url", "douyin": "douyin_text"}
+ITEM_STATUSES = ("pending", "running", "done", "error")
+_URL_RE = re.compile(r"https?://\S+", re.I)
+_YOUTUBE_RE = re.compile(r"(?:youtube\.com|youtu\.be)/", re.I)
+_DOUYIN_RE = re.compile(r"douyin\.com", re.I)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    concurrency INTEGER NOT NULL,
+    owner_pid INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_items (
+    batch_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    source_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    output_filename TEXT,
+    PRIMARY KEY (batch_id, idx)
+);
+"""
+
+
+@dataclass
+class BatchItem:
+    index: int
+    source_type: str
+    # 链接或分享口令；上传的音频为原始文件名
+    source: str
+    job_id: str
+    status: str = "pending"
+    message: str = ""
+    output_filename: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "source_type": self.source_type,
+            "source": self.source,
+            "job_id": self.job_id,
+            "status": self.status,
+            "message": self.message,
+            "output_filename": self.output_filename,
+        }
+
+
+def detect_source_type(text: str) -> str:
+    """按内容判断来源类型：YouTube 链接、抖音分享口令/链接，其余链接按视频直链处理。"""
+    if _YOUTUBE_RE.search(text):
+        return "youtube"
+    if _DOUYIN_RE.search(text):
+        return "douyin"
+    if _URL_RE.search(text):
+        return "video_url"
+    raise ValueError(f"无法识别的来源：{text[:50]}")
+
+
+def parse_sources(raw: Optional[str]) -> List[Tuple[str, str]]:
+    """解析批量来源，返回 [(来源类型, 链接或口令)]。
+
+    raw 可以是 JSON 数组（元素为字符串，或 {"source_type": ..., "source": ...}），也可以每行一条。
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    if raw.startswith("["):
+        try:
+            entries = json.loads(raw)
+        except ValueError as exc:
+            raise ValueError("sources 不是有效的 JSON 数组") from exc
+    else:
+        entries = [line.strip() for line in raw.splitlines() if line.strip()]
+
+    parsed: List[Tuple[str, str]] = []
+    for entry in entries:
+        if isinstance(entry, str):
+            source = entry.strip()
+            source_type = detect_source_type(source)
+        elif isinstance(entry, dict):
+            source = str(entry.get("source") or "").strip()
+            source_type = entry.get("source_type") or detect_source_type(source)
+        else:
+            raise ValueError("sources 的元素必须是字符串或对象")
+        if not source:
+            raise ValueError("来源不能为空")
+        if source_type not in SOURCE_TYPES or source_type == "audio":
+            raise ValueError(f"不支持的来源类型：{source_type}（音频请作为 files 上传）")
+        parsed.append((source_type, source))
+    return parsed
+
+
+def clamp_concurrency(value: Optional[int]) -> int:
+    if value is None:
+        value = DEFAULT_BATCH_CONCURRENCY
+    return max(1, min(MAX_BATCH_CONCURRENCY, int(value)))
+
+
+def count_statuses(items: List[BatchItem]) -> Dict[str, int]:
+    counts = {status: 0 for status in ITEM_STATUSES}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    return counts
+
+
+async def run_batch(
+    items: List[BatchItem],
+    concurrency: int,
+    submit: Callable[[BatchItem], Awaitable["asyncio.Task[None]"]],
+    outcome: Callable[[str], Tuple[str, str, Optional[str]]],
+    on_update: Callable[[BatchItem], None],
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+) -> None:
+    """把批次中的条目提交给调度器，同时运行的条目不超过 concurrency。
+
+    submit(item) 登记并提交任务，返回任务的 Task；调度队列已满（QueueFullError）时等待后重试。
+    任务结束后用 outcome(job_id) 取得 (状态, 消息, 输出文件名)。每次条目状态变化都会调用 on_update。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_item(item: BatchItem) -> None:
+        async with semaphore:
+            while True:
+                try:
+                    task = await submit(item)
+                    break
+                except QueueFullError as exc:
+                    await sleep(min(exc.retry_after, MAX_RETRY_WAIT_SECONDS))
+                except Exception as exc:
+                    item.status, item.message = "error", str(exc)
+                    on_update(item)
+                    return
+            item.status = "running"
+            on_update(item)
+            try:
+                await task
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            item.status, item.message, item.output_filename = outcome(item.job_id)
+            on_update(item)
+
+    await asyncio.gather(*(run_item(item) for item in items))
+
+
+class BatchStore:
+    """批次及其条目的状态（SQLite），用于查询结果清单；与任务存储共用同一个数据库文件。"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            db_path or ":memory:",
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.row_factory = sqlite3.Row
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create(self, batch_id: str, items: List[BatchItem], concurrency: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO batches (batch_id, status, concurrency, owner_pid, created_at, updated_at)"
+                    " VALUES (?, 'running', ?, ?, ?, ?)",
+                    (batch_id, concurrency, os.getpid(), now, now),
+                )
+                self._conn.executemany(
+                    "INSERT INTO batch_items (batch_id, idx, source_type, source, job_id, status)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(batch_id, i.index, i.source_type, i.source, i.job_id, i.status) for i in items],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_item(self, batch_id: str, item: BatchItem) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_items SET status = ?, message = ?, output_filename = ?"
+                " WHERE batch_id = ? AND idx = ?",
+                (item.status, item.message, item.output_filename, batch_id, item.index),
+            )
+            self._conn.execute("UPDATE batches SET updated_at = ? WHERE batch_id = ?", (time.time(), batch_id))
+
+    def set_status(self, batch_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batches SET status = ?, updated_at = ? WHERE batch_id = ?",
+                (status, time.time(), batch_id),
+            )
+
+    def mark_interrupted(self) -> List[str]:
+        """把上次运行时未完成的批次标记为 interrupted 并返回其编号（服务重启后不再继续提交剩余条目）。
+
+        只处理所属进程已退出（或就是当前进程）的批次，其他 worker 仍在运行的批次不受影响。
+        """
+        pid = os.getpid()
+        interrupted: List[str] = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT batch_id, owner_pid FROM batches WHERE status = 'running'"
+                ).fetchall()
+                now = time.time()
+                for row in rows:
+                    owner = row["owner_pid"]
+                    if owner != pid and _pid_alive(owner):
+                        continue
+                    self._conn.execute(
+                        "UPDATE batches SET status = 'interrupted', updated_at = ? WHERE batch_id = ?",
+                        (now, row["batch_id"]),
+                    )
+                    interrupted.append(row["batch_id"])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return interrupted
+
+    def manifest(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """批次的结果清单：状态、各状态条目数与每个条目的结果。"""
+        with self._lock:
+            batch = self._conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+            if batch is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT * FROM batch_items WHERE batch_id = ? ORDER BY idx", (batch_id,)
+            ).fetchall()
+        items = [
+            BatchItem(
+                index=row["idx"],
+                source_type=row["source_type"],
+                source=row["source"],
+                job_id=row["job_id"],
+                status=row["status"],
+                message=row["message"],
+                output_filename=row["output_filename"],
+            )
+            for row in rows
+        ]
+        return {
+            "batch_id": batch_id,
+            "status": batch["status"],
+            "concurrency": batch["concurrency"],
+            "created_at": batch["created_at"],
+            "updated_at": batch["updated_at"],
+            "total": len(items),
+            "counts": count_statuses(items),
+            "items": [item.to_dict() for item in items],
+        }
+
+
+def write_batch_zip(manifest: Dict[str, Any], resolve: Callable[[str], Optional[str]], target: str) -> int:
+    """把清单（manifest.json）与已完成条目的转写结果打包为 zip，返回打包的结果文件数。
+
+    压缩包内的文件名带条目序号前缀，避免不同来源的同名结果互相覆盖。
+    """
+    written = 0
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        for item in manifest["items"]:
+            name = item.get("output_filename")
+            if item.get("status") != "done" or not name:
+                continue
+            path = resolve(name)
+            if not path or not os.path.isfile(path):
+                continue
+            zf.write(path, arcname=f"{item['index']:04d}_{name}")
+            written += 1
+    return written
@@ -0,0 +1,527 @@
+"""可续传的分段转写：在限时调用（如 Vercel 的 60 秒上限）内尽量推进任务，把进度保存为检查点并返回续传令牌，
+下一次调用凭令牌从断点继续，直到完成。
+
+任务按步骤推进：获取音频 -> 按时长逐段转写 -> 写出结果，每一步完成后都保存检查点；
+调用在某一步中途被平台终止时，下次从该步重新开始。
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import re
+import secrets
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import time_stage
+
+
+# 单次调用推进任务的时间预算（秒），应小于平台的调用时长上限并留出返回响应的余量
+DEFAULT_BUDGET_SECONDS = float(os.getenv("CHECKPOINT_BUDGET_SECONDS", "45"))
+# 每段音频的时长（秒）；单段的转写耗时需明显小于时间预算
+DEFAULT_SEGMENT_SECONDS = float(os.getenv("CHECKPOINT_SEGMENT_SECONDS", "300"))
+MIN_SEGMENT_SECONDS = 30.0
+# 剩余时长不足该秒数时并入当前段，避免末尾产生过短的分段
+MIN_TAIL_SECONDS = 5.0
+# 检查点的保留时长（小时）
+DEFAULT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", "24"))
+# 自定义检查点存储：「模块:工厂函数」，工厂函数无参数、返回 CheckpointStore；为空时使用本地目录
+CHECKPOINT_STORE = os.getenv("CHECKPOINT_STORE", "").strip()
+# 占用检查点的时长比时间预算多出的余量（秒），覆盖返回响应与平台的调度延迟
+LEASE_MARGIN_SECONDS = 15.0
+# 尚无耗时记录的步骤按该秒数估计
+DEFAULT_STEP_ESTIMATE_SECONDS = 15.0
+# 同一步骤连续失败的次数上限，超过后任务标记为失败
+MAX_STEP_FAILURES = 3
+# 本地检查点锁文件超过该秒数仍未删除时视为持有者已退出
+STALE_LOCK_SECONDS = 30.0
+
+_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,128}$")
+
+
+@dataclass
+class Checkpoint:
+    job_id: str
+    source_type: str
+    # 来源与模型设置；凭据不保存，每次续传时重新提供
+    params: Dict[str, Any] = field(default_factory=dict)
+    # fetch / transcribe / finish / done / error
+    stage: str = "fetch"
+    audio_path: Optional[str] = None
+    base_name: Optional[str] = None
+    # 音频总时长（秒）；获取音频后由 ffprobe 探测
+    duration: Optional[float] = None
+    # 已转写到的位置（秒）与每段的时长
+    offset: float = 0.0
+    segment_seconds: float = DEFAULT_SEGMENT_SECONDS
+    transcript: str = ""
+    output_filename: Optional[str] = None
+    message: str = ""
+    # 各阶段单步耗时的估计（秒），用于判断剩余预算是否够执行下一步
+    estimates: Dict[str, float] = field(default_factory=dict)
+    failures: int = 0
+    # 正在执行的阶段；加载时仍有值说明上次调用在该步中途被终止
+    running_stage: Optional[str] = None
+    lease_until: float = 0.0
+    invocations: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in ("done", "error")
+
+    def progress(self) -> Dict[str, Any]:
+        percent = None
+        if self.stage == "done":
+            percent = 100.0
+        elif self.duration:
+            percent = round(min(self.offset / self.duration, 1.0) * 100, 1)
+        return {
+            "stage": self.stage,
+            "offset_seconds": round(self.offset, 1),
+            "duration_seconds": round(self.duration, 1) if self.duration is not None else None,
+            "percent": percent,
+            "invocations": self.invocations,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Checkpoint":
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+def new_token() -> str:
+    """续传令牌：不可猜测的随机串，持有者即可推进对应任务。"""
+    return secrets.token_urlsafe(24)
+
+
+def valid_token(token: Optional[str]) -> bool:
+    return bool(token) and bool(_TOKEN_RE.match(token))
+
+
+class CheckpointStore:
+    """检查点存储接口。换用对象存储、Redis 等共享存储时实现 load / save / delete，
+    并用存储自身的条件写入（如 Redis WATCH、对象存储的条件 PUT）实现 compare_and_swap。"""
+
+    _cas_lock = threading.Lock()
+
+    def load(self, token: str) -> Optional[Checkpoint]:
+        raise NotImplementedError
+
+    def save(self, token: str, checkpoint: Checkpoint) -> None:
+        raise NotImplementedError
+
+    def delete(self, token: str) -> None:
+        raise NotImplementedError
+
+    def compare_and_swap(self, token: str, checkpoint: Checkpoint, expected_lease_until: float) -> bool:
+        """仅当已保存检查点的 lease_until 仍等于 expected_lease_until 时保存 checkpoint，返回是否保存。
+
+        默认实现只在本进程内互斥；多个进程或实例共用存储时必须覆盖为原子操作。
+        """
+        with self._cas_lock:
+            current = self.load(token)
+            if current is None or current.lease_until != expected_lease_until:
+                return False
+            self.save(token, checkpoint)
+            return True
+
+    def prune(self, max_age_seconds: float) -> int:
+        return 0
+
+
+class LocalCheckpointStore(CheckpointStore):
+    """检查点保存为本地目录中的 JSON 文件（先写临时文件再改名）。
+
+    无服务器平台的本地磁盘只在同一实例内可见，续传请求落到其它实例时令牌失效，此时需换用共享存储。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, token: str) -> str:
+        if not valid_token(token):
+            raise ValueError("续传令牌格式无效")
+        return os.path.join(self.root, f"{token}.json")
+
+    def load(self, token: str) -> Optional[Checkpoint]:
+        try:
+            with open(self._path(token), "r", encoding="utf-8") as f:
+                return Checkpoint.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, token: str, checkpoint: Checkpoint) -> None:
+        path = self._path(token)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, token: str) -> None:
+        try:
+            os.remove(self._path(token))
+        except (OSError, ValueError):
+            pass
+
+    def compare_and_swap(self, token: str, checkpoint: Checkpoint, expected_lease_until: float) -> bool:
+        """以 O_EXCL 创建的锁文件在多个进程之间互斥；锁被占用时直接返回 False。"""
+        lock_path = self._path(token) + ".lock"
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # 持有者在删除锁文件前被终止：锁文件过期后清除，本次仍按占用处理
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            return False
+        try:
+            os.close(fd)
+            current = self.load(token)
+            if current is None or current.lease_until != expected_lease_until:
+                return False
+            self.save(token, checkpoint)
+            return True
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def prune(self, max_age_seconds: float = DEFAULT_TTL_HOURS * 3600) -> int:
+        """删除超过保留时长未更新的检查点，返回删除的数量。"""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return 0
+        for name in names:
+            if name.endswith(".lock"):
+                # 锁文件由 compare_and_swap 自行清理
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+def load_checkpoint_store(default_root: str, spec: str = CHECKPOINT_STORE) -> CheckpointStore:
+    """按 CHECKPOINT_STORE 创建检查点存储；未配置时使用 default_root 目录下的本地存储。"""
+    if not spec:
+        return LocalCheckpointStore(default_root)
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise RuntimeError(f"CHECKPOINT_STORE 格式应为「模块:工厂函数」：{spec}")
+    store = getattr(importlib.import_module(module_name), attr)()
+    if not isinstance(store, CheckpointStore):
+        raise RuntimeError(f"{spec} 返回的不是 CheckpointStore")
+    return store
+
+
+class CheckpointBusyError(RuntimeError):
+    """另一次调用正在推进同一个任务。"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("该任务正在被另一次调用推进，请稍后再试")
+        self.retry_after = retry_after
+
+
+class FatalStepError(RuntimeError):
+    """重试也无法成功的步骤错误（如缺少 ffprobe），任务直接标记为失败。"""
+
+
+def claim(store: CheckpointStore, token: str, lease_seconds: float) -> Optional[Checkpoint]:
+    """取出检查点并占用 lease_seconds 秒，避免同一令牌的两次调用同时推进；令牌不存在时返回 None。
+
+    占用通过 store.compare_and_swap 写入，并发的调用中只有一个能成功，其余抛出 CheckpointBusyError；
+    调用中途被终止时占用到期后自动释放。
+    """
+    checkpoint = store.load(token)
+    if checkpoint is None:
+        return None
+    if checkpoint.finished:
+        return checkpoint
+    now = time.time()
+    if checkpoint.lease_until > now:
+        raise CheckpointBusyError(max(1, int(checkpoint.lease_until - now + 0.999)))
+    expected = checkpoint.lease_until
+    checkpoint.lease_until = now + lease_seconds
+    if not store.compare_and_swap(token, checkpoint, expected):
+        raise CheckpointBusyError(1)
+    return checkpoint
+
+
+async def advance(
+    checkpoint: Checkpoint,
+    step: Callable[[Checkpoint], Awaitable[None]],
+    save: Callable[[Checkpoint], None],
+    budget_seconds: float = DEFAULT_BUDGET_SECONDS,
+    clock: Callable[[], float] = time.monotonic,
+) -> int:
+    """在 budget_seconds 内反复执行 step(checkpoint)，每步前后调用 save(checkpoint)；返回本次完成的步数。
+
+    下一步的预计耗时超过剩余预算时停止，但每次调用至少执行一步，保证任务总能推进。
+    step 应在成功结束时才修改检查点；抛出异常时检查点保持该步之前的状态，
+    连续失败 MAX_STEP_FAILURES 次（FatalStepError 为 1 次）后任务标记为 error，异常继续向上抛出。
+    """
+    deadline = clock() + budget_seconds
+    checkpoint.invocations += 1
+    if checkpoint.running_stage is not None:
+        # 上次调用在该步中途被终止：单步耗时超出了预算，按整个预算估计；转写则缩短之后的分段
+        checkpoint.estimates[checkpoint.running_stage] = budget_seconds
+        if checkpoint.running_stage == "transcribe" and checkpoint.segment_seconds > MIN_SEGMENT_SECONDS:
+            checkpoint.segment_seconds = max(MIN_SEGMENT_SECONDS, checkpoint.segment_seconds / 2)
+        else:
+            # 无法再拆小的步骤（如下载）每次都会被终止，同样计入失败次数，避免无限续传
+            checkpoint.failures += 1
+            checkpoint.message = f"{checkpoint.running_stage} 步骤多次超出单次调用的时长上限"
+            if checkpoint.failures >= MAX_STEP_FAILURES:
+                checkpoint.stage = "error"
+        checkpoint.running_stage = None
+
+    steps = 0
+    try:
+        while not checkpoint.finished:
+            stage = checkpoint.stage
+            estimate = checkpoint.estimates.get(stage, DEFAULT_STEP_ESTIMATE_SECONDS)
+            if steps and clock() + estimate > deadline:
+                break
+            checkpoint.running_stage = stage
+            save(checkpoint)
+            started = clock()
+            try:
+                await step(checkpoint)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                checkpoint.running_stage = None
+                checkpoint.failures += 1
+                checkpoint.message = str(exc)
+                if checkpoint.failures >= MAX_STEP_FAILURES or isinstance(exc, FatalStepError):
+                    checkpoint.stage = "error"
+                raise
+            elapsed = clock() - started
+            # 新耗时直接生效，旧估计逐步衰减，偶发的慢步骤不会长期压低每次调用的步数
+            checkpoint.estimates[stage] = round(max(elapsed, checkpoint.estimates.get(stage, 0.0) * 0.5), 3)
+            checkpoint.running_stage = None
+            checkpoint.failures = 0
+            checkpoint.message = ""
+            steps += 1
+            checkpoint.updated_at = time.time()
+            save(checkpoint)
+    finally:
+        checkpoint.lease_until = 0.0
+        checkpoint.updated_at = time.time()
+        save(checkpoint)
+    return steps
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """用 ffprobe 读取音频时长（秒）；ffprobe 不可用或无法解析时返回 None。"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True,
+            text=True,
+            timeout=30,
+            check=True,
+        )
+        duration = float(result.stdout.strip())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+    return duration if duration > 0 else None
+
+
+def next_segment(checkpoint: Checkpoint) -> Optional[float]:
+    """下一段的时长（秒）；为 None 表示整段音频一次转写。"""
+    if checkpoint.duration is None:
+        return None
+    remaining = checkpoint.duration - checkpoint.offset
+    if checkpoint.offset == 0 and remaining <= checkpoint.segment_seconds + MIN_TAIL_SECONDS:
+        return None
+    if remaining - checkpoint.segment_seconds < MIN_TAIL_SECONDS:
+        return remaining
+    return checkpoint.segment_seconds
+
+
+async def extract_segment(audio_path: str, start: float, length: float, output_path: str) -> str:
+    """用 ffmpeg 截取 [start, start + length) 的音频（直接复制音频流，不重新编码）。"""
+    from ffmpeg_pool import get_ffmpeg_pool
+
+    with time_stage("segment"):
+        await get_ffmpeg_pool().arun([
+            "-ss", f"{start:.3f}",
+            "-t", f"{length:.3f}",
+            "-i", audio_path,
+            "-vn",
+            "-c", "copy",
+            "-y",
+            output_path,
+        ])
+    return output_path
+
+
+_FFPROBE_REQUIRED = "可续传任务需要 ffprobe 读取音频时长：请安装 ffmpeg（含 ffprobe），并确认音频文件可以被解析"
+
+
+class SegmentedTranscription:
+    """检查点各阶段的实际工作：获取音频、逐段转写、写出结果。
+
+    output_path(name) 返回结果文件应写入的路径，on_output(path) 在结果写出后调用（如登记到文件索引）；
+    on_segment(text, start) 在每段转写完成后以追加到全文的文本（含段间空行）及其在全文中的起始偏移调用，
+    此时检查点尚未保存，调用被终止后该段会重新转写，接收方应按 start 去重。api_key / vertex_json 为本次调用提供的凭据。
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        output_path: Callable[[str], str],
+        on_output: Callable[[str], None] = lambda path: None,
+        on_segment: Callable[[str, int], None] = lambda text, start: None,
+        api_key: Optional[str] = None,
+        vertex_json: Optional[str] = None,
+    ):
+        self.data_dir = data_dir
+        self.output_path = output_path
+        self.on_output = on_output
+        self.on_segment = on_segment
+        self.api_key = api_key
+        self.vertex_json = vertex_json
+
+    async def __call__(self, checkpoint: Checkpoint) -> None:
+        if checkpoint.stage == "fetch":
+            await self._fetch(checkpoint)
+        elif checkpoint.stage == "transcribe":
+            await self._transcribe(checkpoint)
+        elif checkpoint.stage == "finish":
+            await self._finish(checkpoint)
+        else:
+            raise RuntimeError(f"未知的检查点阶段：{checkpoint.stage}")
+
+    async def _fetch(self, checkpoint: Checkpoint) -> None:
+        import main
+        from async_download import (
+            async_download_audio_from_direct_url,
+            async_download_video_and_extract_audio,
+            async_resolve_douyin_audio,
+        )
+
+        # 分段依赖音频时长，没有 ffprobe 时在下载前就失败
+        if shutil.which("ffprobe") is None:
+            raise FatalStepError(_FFPROBE_REQUIRED)
+
+        params = checkpoint.params
+        base_name: Optional[str] = None
+        if checkpoint.source_type == "audio":
+            audio_path = checkpoint.audio_path
+            if not audio_path or not os.path.isfile(audio_path):
+                raise RuntimeError("上传的音频已不存在，请重新提交")
+        elif checkpoint.source_type == "youtube":
+            # 分段转写需要本地音频，YouTube 不走直连而是先下载音轨
+            audio_path = await asyncio.to_thread(main.download_audio_from_youtube, params["youtube_url"], self.data_dir)
+            base_name = main._youtube_output_stem(params["youtube_url"])
+        elif checkpoint.source_type == "video_url":
+            audio_path = await async_download_video_and_extract_audio(params["video_url"], self.data_dir)
+        elif checkpoint.source_type == "douyin":
+            media_key = main.douyin_media_cache_key(params["douyin_text"])
+            audio_path = main.fetch_cached_media(media_key)
+            if audio_path is None:
+                mp3_url, _title, tiktok_id = await async_resolve_douyin_audio(params["douyin_text"])
+                stem = f"douyin_{tiktok_id}" if tiktok_id else None
+                audio_path = await async_download_audio_from_direct_url(
+                    mp3_url, self.data_dir, "mp3", stem, cache_key=media_key
+                )
+        else:
+            raise RuntimeError(f"未知的来源类型：{checkpoint.source_type}")
+
+        duration = await asyncio.to_thread(probe_duration, audio_path)
+        if duration is None:
+            raise FatalStepError(_FFPROBE_REQUIRED)
+        checkpoint.audio_path = audio_path
+        checkpoint.base_name = base_name or os.path.splitext(os.path.basename(audio_path))[0]
+        checkpoint.duration = duration
+        checkpoint.stage = "transcribe"
+
+    async def _transcribe(self, checkpoint: Checkpoint) -> None:
+        import main
+
+        if not checkpoint.audio_path or not os.path.isfile(checkpoint.audio_path):
+            if checkpoint.source_type == "audio":
+                raise RuntimeError("上传的音频已不存在，请重新提交")
+            # 续传落到了没有该音频文件的实例（或文件已被清理）：重新获取音频
+            checkpoint.stage = "fetch"
+            return
+
+        length = next_segment(checkpoint)
+        segment_path = checkpoint.audio_path
+        if length is not None:
+            ext = os.path.splitext(checkpoint.audio_path)[1] or ".mp3"
+            segment_path = os.path.join(
+                tempfile.gettempdir(),
+                f"audiototxt_{checkpoint.job_id}_{int(checkpoint.offset * 1000)}{ext}",
+            )
+            await extract_segment(checkpoint.audio_path, checkpoint.offset, length, segment_path)
+
+        params = checkpoint.params
+        try:
+            text = await asyncio.to_thread(
+                main.transcribe_audio_streaming,
+                self.api_key,
+                segment_path,
+                params.get("model_name") or "gemini-2.5-flash",
+                params.get("language_hint"),
+                None,
+                lambda delta: None,
+                params.get("auth_mode"),
+                self.vertex_json,
+                params.get("vertex_project"),
+                params.get("vertex_location"),
+            )
+        finally:
+            if segment_path != checkpoint.audio_path:
+                try:
+                    os.remove(segment_path)
+                except OSError:
+                    pass
+
+        text = text.strip()
+        if text:
+            piece = f"\n\n{text}" if checkpoint.transcript else text
+            start = len(checkpoint.transcript)
+            checkpoint.transcript += piece
+            self.on_segment(piece, start)
+        if length is None:
+            checkpoint.offset = checkpoint.duration or 0.0
+            checkpoint.stage = "finish"
+        else:
+            checkpoint.offset += length
+            if checkpoint.offset >= checkpoint.duration:
+                checkpoint.stage = "finish"
+
+    async def _finish(self, checkpoint: Checkpoint) -> None:
+        from transcript_delivery import write_transcript
+
+        out_path = self.output_path(f"{checkpoint.base_name}.txt")
+        with time_stage("save"):
+            await asyncio.to_thread(write_transcript, out_path, checkpoint.transcript)
+        self.on_output(out_path)
+        checkpoint.output_filename = os.path.basename(out_path)
+        checkpoint.stage = "done"
@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Generic, Iterator, Optional, TypeVar
+
+
+# 已结束任务在内存中保留的时间（自最后一次访问起，分钟）
+DEFAULT_TTL_SECONDS = float(os.getenv("JOB_RETENTION_MINUTES", "60")) * 60
+# 内存中保留的已结束任务数量与总大小上限，超出时按最近最少使用淘汰
+DEFAULT_MAX_FINISHED = int(os.getenv("JOB_RETENTION_MAX_JOBS", "200"))
+DEFAULT_MAX_BYTES = int(float(os.getenv("JOB_RETENTION_MAX_MB", "64")) * 1024 * 1024)
+# 淘汰后保留的摘要条数上限
+DEFAULT_MAX_SUMMARIES = int(os.getenv("JOB_RETENTION_MAX_SUMMARIES", "10000"))
+
+# 单个任务对象除文本字段外的大致开销（字节）
+_JOB_OVERHEAD_BYTES = 512
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class JobSummary:
+    """任务被淘汰后保留的摘要，不含转写文本。"""
+    status: str
+    message: str
+    output_filename: Optional[str]
+    transcript_length: int
+    finished_at: float
+
+
+def estimate_job_bytes(job: Any) -> int:
+    """估算任务对象占用的内存：固定开销加上各字符串字段的大小。"""
+    size = _JOB_OVERHEAD_BYTES
+    for name in ("transcript", "message", "output_filename", "status"):
+        value = getattr(job, name, None)
+        if isinstance(value, str):
+            size += sys.getsizeof(value)
+    return size
+
+
+class JobTable(Generic[T]):
+    """内存中的任务表：运行中的任务常驻，已结束的任务按 TTL、数量与字节上限（LRU）淘汰。
+
+    用法与 dict 相同；任务结束时调用 finish(job_id)，之后才会参与淘汰。
+    被淘汰的任务只保留 JobSummary（可通过 summary() 查询），摘要条数同样有上限。线程安全。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_finished: int = DEFAULT_MAX_FINISHED,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_summaries: int = DEFAULT_MAX_SUMMARIES,
+        clock=time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_finished = max(0, int(max_finished))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_summaries = max(0, int(max_summaries))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._active: Dict[str, T] = {}
+        # job_id -> (任务, 估算字节数, 最后访问时间)，按最后访问时间排序
+        self._finished: "OrderedDict[str, tuple]" = OrderedDict()
+        self._finished_bytes = 0
+        self._summaries: "OrderedDict[str, JobSummary]" = OrderedDict()
+        self.evicted = 0
+
+    def __setitem__(self, job_id: str, job: T) -> None:
+        with self._lock:
+            self._discard(job_id)
+            self._active[job_id] = job
+
+    def __contains__(self, job_id: object) -> bool:
+        with self._lock:
+            return job_id in self._active or job_id in self._finished
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._active) + len(self._finished)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._active) + list(self._finished))
+
+    def get(self, job_id: str, default: Optional[T] = None) -> Optional[T]:
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is not None:
+                return job
+            entry = self._finished.get(job_id)
+            if entry is None:
+                return default
+            self._finished[job_id] = (entry[0], entry[1], self._clock())
+            self._finished.move_to_end(job_id)
+            return entry[0]
+
+    def pop(self, job_id: str, default: Optional[T] = None) -> Optional[T]:
+        with self._lock:
+            job = self._discard(job_id)
+        return job if job is not None else default
+
+    def _discard(self, job_id: str) -> Optional[T]:
+        job = self._active.pop(job_id, None)
+        entry = self._finished.pop(job_id, None)
+        if entry is not None:
+            self._finished_bytes -= entry[1]
+            job = entry[0]
+        self._summaries.pop(job_id, None)
+        return job
+
+    def finish(self, job_id: str) -> None:
+        """标记任务已结束，此后按保留策略淘汰。"""
+        with self._lock:
+            job = self._active.pop(job_id, None)
+            if job is None:
+                return
+            size = estimate_job_bytes(job)
+            self._finished[job_id] = (job, size, self._clock())
+            self._finished_bytes += size
+            self._evict()
+
+    def evict_expired(self) -> int:
+        """淘汰超过 TTL 的已结束任务，返回淘汰数量。"""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        evicted = 0
+        cutoff = self._clock() - self.ttl_seconds
+        while self._finished:
+            job_id, (job, size, last_access) = next(iter(self._finished.items()))
+            over_budget = len(self._finished) > self.max_finished or self._finished_bytes > self.max_bytes
+            if not over_budget and last_access > cutoff:
+                break
+            del self._finished[job_id]
+            self._finished_bytes -= size
+            self._summarize(job_id, job)
+            evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def _summarize(self, job_id: str, job: T) -> None:
+        if self.max_summaries <= 0:
+            return
+        transcript = getattr(job, "transcript", "") or ""
+        self._summaries[job_id] = JobSummary(
+            status=getattr(job, "status", ""),
+            message=getattr(job, "message", "") or "",
+            output_filename=getattr(job, "output_filename", None),
+            transcript_length=len(transcript),
+            finished_at=time.time(),
+        )
+        while len(self._summaries) > self.max_summaries:
+            self._summaries.popitem(last=False)
+
+    def summary(self, job_id: str) -> Optional[JobSummary]:
+        with self._lock:
+            return self._summaries.get(job_id)
+
+    def usage(self) -> Dict[str, int]:
+        """当前任务表的条目数与估算内存占用（字节）。"""
+        with self._lock:
+            active_bytes = sum(estimate_job_bytes(job) for job in self._active.values())
+            summary_bytes = len(self._summaries) * _JOB_OVERHEAD_BYTES // 2
+            return {
+                "active": len(self._active),
+                "finished": len(self._finished),
+                "summaries": len(self._summaries),
+                "evicted": self.evicted,
+                "active_bytes": active_bytes,
+                "finished_bytes": self._finished_bytes,
+                "summary_bytes": summary_bytes,
+                "total_bytes": active_bytes + self._finished_bytes + summary_bytes,
+            }
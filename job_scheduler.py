@@ -0,0 +1,175 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from job_timeline import current_timeline
+
+
+DEFAULT_MAX_QUEUE = int(os.getenv("JOB_QUEUE_MAX", "50"))
+DEFAULT_DOWNLOAD_WORKERS = int(os.getenv("JOB_DOWNLOAD_WORKERS", "4"))
+DEFAULT_TRANSCRIBE_WORKERS = int(os.getenv("JOB_TRANSCRIBE_WORKERS", "2"))
+# 还没有完成过任务时，用于估算 Retry-After 的单个任务耗时
+INITIAL_JOB_SECONDS = 30.0
+MAX_RETRY_AFTER_SECONDS = 600
+# 任务耗时滑动平均的权重
+_EWMA_ALPHA = 0.2
+
+PositionCallback = Callable[[str, str, int], None]
+
+
+class QueueFullError(RuntimeError):
+    """排队任务数已达上限；retry_after 为建议的重试间隔（秒）。"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("任务队列已满，请稍后重试")
+        self.retry_after = retry_after
+
+
+class _StageGate:
+    """单个阶段的先进先出并发闸门；排队顺序变化时通过 notify 通知每个等待任务的位置（从 1 开始）。"""
+
+    def __init__(self, name: str, workers: int, notify: PositionCallback):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.running = 0
+        self._waiters: Deque[Tuple[str, "asyncio.Future[None]"]] = deque()
+        self._notify = notify
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, job_id: str) -> None:
+        if self.running < self.workers and not self._waiters:
+            self.running += 1
+            return
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        entry = (job_id, future)
+        self._waiters.append(entry)
+        self._notify(job_id, self.name, len(self._waiters))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经转交给本任务，取消时交给下一个
+                self.release()
+            else:
+                self._waiters.remove(entry)
+                self._announce()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, future = self._waiters.popleft()
+            if not future.done():
+                # 名额直接转交，running 不变
+                future.set_result(None)
+                self._announce()
+                return
+        self.running -= 1
+
+    def _announce(self) -> None:
+        for position, (job_id, _) in enumerate(self._waiters, 1):
+            self._notify(job_id, self.name, position)
+
+
+class JobScheduler:
+    """转写任务调度器：限制排队任务数，并按阶段（下载、转写）限制同时运行的任务数。
+
+    submit() 在排队数达到 max_queue 时抛出 QueueFullError；任务内部用 stage() 进入各阶段，
+    在某阶段排队时通过 on_position(job_id, stage, position) 报告排队位置。需在事件循环内使用。
+    """
+
+    def __init__(
+        self,
+        stages: Optional[Dict[str, int]] = None,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        on_position: Optional[PositionCallback] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if stages is None:
+            stages = {"download": DEFAULT_DOWNLOAD_WORKERS, "transcribe": DEFAULT_TRANSCRIBE_WORKERS}
+        self.max_queue = max(1, int(max_queue))
+        self.on_position = on_position
+        self._gates = {name: _StageGate(name, workers, self._report) for name, workers in stages.items()}
+        self._clock = clock
+        self._active = 0
+        self._holding = 0
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._avg_job_seconds = INITIAL_JOB_SECONDS
+
+    def _report(self, job_id: str, stage: str, position: int) -> None:
+        if self.on_position is not None:
+            try:
+                self.on_position(job_id, stage, position)
+            except Exception:
+                pass
+
+    @property
+    def queued(self) -> int:
+        """已接收但当前不在任何阶段内运行的任务数。"""
+        return self._active - self._holding
+
+    def retry_after(self) -> int:
+        """按平均任务耗时与最窄阶段的并发数估算排到新任务所需的秒数。"""
+        workers = min((gate.workers for gate in self._gates.values()), default=1)
+        estimate = self._avg_job_seconds * (self.queued + 1) / workers
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(estimate)))
+
+    def submit(self, job_id: str, fn: Callable[[], Awaitable[None]]) -> "asyncio.Task[None]":
+        """接收任务并在后台运行 fn()；队列已满时抛出 QueueFullError，fn 不会被调用。"""
+        if self.queued >= self.max_queue:
+            raise QueueFullError(self.retry_after())
+        self._active += 1
+        task = asyncio.get_running_loop().create_task(self._run(fn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, fn: Callable[[], Awaitable[None]]) -> None:
+        started = self._clock()
+        try:
+            await fn()
+        finally:
+            self._active -= 1
+            elapsed = self._clock() - started
+            self._avg_job_seconds += _EWMA_ALPHA * (elapsed - self._avg_job_seconds)
+
+    @asynccontextmanager
+    async def stage(self, job_id: str, name: str) -> AsyncIterator[None]:
+        """占用阶段 name 的一个名额；名额已满时排队等待（等待时间记入任务时间线的 queue_<name>）。"""
+        gate = self._gates[name]
+        queued_at = time.perf_counter()
+        await gate.acquire(job_id)
+        timeline = current_timeline()
+        if timeline is not None:
+            timeline.record_stage(f"queue_{name}", queued_at, time.perf_counter())
+        self._holding += 1
+        try:
+            yield
+        finally:
+            self._holding -= 1
+            gate.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "active": self._active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "stages": {
+                name: {"workers": gate.workers, "running": gate.running, "waiting": gate.waiting}
+                for name, gate in self._gates.items()
+            },
+        }
+
+    async def aclose(self) -> None:
+        """取消并等待所有未完成的任务（应用关闭时调用）。"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,293 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+# 服务重启后自动重新排队的次数上限，超过后标记为失败
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# 尚未结束的任务状态
+ACTIVE_STATUSES = ("pending", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    source_type TEXT NOT NULL DEFAULT '',
+    params TEXT NOT NULL DEFAULT '{}',
+    has_credentials INTEGER NOT NULL DEFAULT 0,
+    output_filename TEXT,
+    transcript_length INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    owner_pid INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, updated_at);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL,
+    start_offset INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (job_id, start_offset)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class JobRecord:
+    job_id: str
+    status: str
+    message: str = ""
+    source_type: str = ""
+    params: Dict[str, Any] = field(default_factory=dict)
+    has_credentials: bool = False
+    output_filename: Optional[str] = None
+    transcript_length: int = 0
+    attempts: int = 1
+    owner_pid: int = 0
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE_STATUSES
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobStore:
+    """转写任务的 SQLite 存储（WAL 模式）：保存状态、参数、转写文本分片与输出文件名。
+
+    同一数据库可被多个进程（如多个 uvicorn worker）共享；db_path 为 None 时只保存在内存中。
+    转写文本按字符偏移分片保存，transcript(job_id, since) 可只读取某个偏移之后的内容。
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        clock=time.time,
+    ):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._lock = threading.Lock()
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(
+            db_path or ":memory:",
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.row_factory = sqlite3.Row
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # WAL 模式下 NORMAL 已能保证崩溃后数据库一致，只可能丢失最后几次提交
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> JobRecord:
+        data = dict(row)
+        data["params"] = json.loads(data.get("params") or "{}")
+        data["has_credentials"] = bool(data.get("has_credentials"))
+        return JobRecord(**data)
+
+    def create(
+        self,
+        job_id: str,
+        source_type: str,
+        params: Optional[Dict[str, Any]] = None,
+        has_credentials: bool = False,
+    ) -> JobRecord:
+        """登记新任务。params 会原样写入数据库，不要放入 API Key 等凭据。"""
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, source_type, params, has_credentials, owner_pid,"
+                " created_at, updated_at) VALUES (?, 'pending', ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    source_type,
+                    json.dumps(params or {}, ensure_ascii=False),
+                    int(has_credentials),
+                    os.getpid(),
+                    now,
+                    now,
+                ),
+            )
+        return self.get(job_id)  # type: ignore[return-value]
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def list_by_status(self, *statuses: str, limit: int = 100) -> List[JobRecord]:
+        if not statuses:
+            return []
+        placeholders = ",".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY updated_at DESC LIMIT ?",
+                (*statuses, limit),
+            ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def update_params(self, job_id: str, **params: Any) -> None:
+        """合并更新任务参数（如上传文件保存后的本地路径）。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT params FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is not None:
+                    merged = json.loads(row["params"] or "{}")
+                    merged.update(params)
+                    self._conn.execute(
+                        "UPDATE jobs SET params = ?, updated_at = ? WHERE job_id = ?",
+                        (json.dumps(merged, ensure_ascii=False), self._clock(), job_id),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def set_status(
+        self,
+        job_id: str,
+        status: str,
+        message: Optional[str] = None,
+        output_filename: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, message = COALESCE(?, message),"
+                " output_filename = COALESCE(?, output_filename), updated_at = ? WHERE job_id = ?",
+                (status, message, output_filename, self._clock(), job_id),
+            )
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def append_transcript(self, job_id: str, text: str, at: Optional[int] = None) -> int:
+        """追加一段转写文本，返回该段的起始偏移。
+
+        给出 at 时只在当前文本长度恰好为 at 时追加，否则视为已追加过并返回 -1，重复调用不会重复写入。
+        """
+        if not text:
+            return -1
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT transcript_length FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    return -1
+                offset = row["transcript_length"]
+                if at is not None and at != offset:
+                    self._conn.execute("ROLLBACK")
+                    return -1
+                self._conn.execute(
+                    "INSERT INTO job_chunks (job_id, start_offset, text) VALUES (?, ?, ?)",
+                    (job_id, offset, text),
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET transcript_length = ?, updated_at = ? WHERE job_id = ?",
+                    (offset + len(text), self._clock(), job_id),
+                )
+                self._conn.execute("COMMIT")
+                return offset
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def transcript(self, job_id: str, since: int = 0) -> str:
+        """返回从字符偏移 since 开始的转写文本。"""
+        with self._lock:
+            # 先定位包含 since 的分片，再按主键顺序读取
+            row = self._conn.execute(
+                "SELECT MAX(start_offset) AS start FROM job_chunks WHERE job_id = ? AND start_offset <= ?",
+                (job_id, since),
+            ).fetchone()
+            start = row["start"] if row is not None and row["start"] is not None else since
+            rows = self._conn.execute(
+                "SELECT start_offset, text FROM job_chunks WHERE job_id = ? AND start_offset >= ?"
+                " ORDER BY start_offset",
+                (job_id, start),
+            ).fetchall()
+        if not rows:
+            return ""
+        text = "".join(r["text"] for r in rows)
+        return text[max(0, since - rows[0]["start_offset"]):]
+
+    def claim_interrupted(self) -> List[JobRecord]:
+        """认领上次运行中断的任务（所属进程已退出或就是当前进程）。
+
+        转写进度清零、状态重置为 pending 后返回，由调用方重新提交；
+        重试次数已达上限的任务直接标记为失败，不会返回。多个进程同时调用时每个任务只会被认领一次。
+        """
+        pid = os.getpid()
+        claimed: List[str] = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT job_id, owner_pid, attempts FROM jobs WHERE status IN (?, ?)",
+                    ACTIVE_STATUSES,
+                ).fetchall()
+                now = self._clock()
+                for row in rows:
+                    owner = row["owner_pid"]
+                    if owner != pid and _pid_alive(owner):
+                        continue
+                    if row["attempts"] >= self.max_attempts:
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'error', message = ?, updated_at = ? WHERE job_id = ?",
+                            ("任务多次中断，已停止重试", now, row["job_id"]),
+                        )
+                        continue
+                    self._conn.execute("DELETE FROM job_chunks WHERE job_id = ?", (row["job_id"],))
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'pending', message = '', transcript_length = 0,"
+                        " attempts = attempts + 1, owner_pid = ?, updated_at = ? WHERE job_id = ?",
+                        (pid, now, row["job_id"]),
+                    )
+                    claimed.append(row["job_id"])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [record for record in (self.get(job_id) for job_id in claimed) if record is not None]
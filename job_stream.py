@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from event_batcher import iter_frame
+
+
+# 单请求流式输出在没有事件时发送心跳的间隔（秒），避免代理或平台因空闲断开连接
+DEFAULT_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+STREAM_MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+# 禁止代理缓冲与缓存，保证事件实时送达
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+Event = Dict[str, Any]
+
+
+def choose_stream_format(requested: Optional[str], accept: Optional[str] = None) -> Optional[str]:
+    """根据 stream 参数或 Accept 头选择流式格式（sse / ndjson），都未指定时返回 None。"""
+    value = (requested or "").strip().lower()
+    if value in STREAM_MEDIA_TYPES:
+        return value
+    if value:
+        raise ValueError(f"不支持的流式格式：{requested}（可选 sse / ndjson）")
+    accept = (accept or "").lower()
+    for fmt, media_type in STREAM_MEDIA_TYPES.items():
+        if media_type in accept:
+            return fmt
+    return None
+
+
+def encode_event(event: Event, fmt: str) -> bytes:
+    """把一个事件编码为 SSE 消息或一行 NDJSON。"""
+    payload = json.dumps(event, ensure_ascii=False)
+    if fmt == "ndjson":
+        return (payload + "\n").encode("utf-8")
+    lines = []
+    if "seq" in event:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"event: {event.get('type', 'message')}")
+    lines.append(f"data: {payload}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def encode_heartbeat(fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return b'{"type": "heartbeat"}\n'
+    # SSE 注释行，客户端会忽略
+    return b": keep-alive\n\n"
+
+
+async def stream_events(
+    events: AsyncIterator[Event],
+    fmt: str,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    heartbeat_seconds: float = DEFAULT_HEARTBEAT_SECONDS,
+) -> AsyncIterator[bytes]:
+    """把事件流编码为 SSE / NDJSON 字节流：batch 帧展开为单个事件（沿用帧的 seq），
+    空闲 heartbeat_seconds 秒发送一次心跳；检测到客户端断开时停止。"""
+    queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for event in events:
+                await queue.put(event)
+        finally:
+            queue.put_nowait(None)
+
+    pump_task = asyncio.get_running_loop().create_task(pump())
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                yield encode_heartbeat(fmt)
+                continue
+            if frame is None:
+                break
+            for event in iter_frame(frame):
+                if "seq" in frame:
+                    event = {**event, "seq": frame["seq"]}
+                yield encode_event(event, fmt)
+        # 事件源异常结束时抛出原异常
+        await pump_task
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+            try:
+                await pump_task
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,253 @@
+"""任务各阶段耗时的时间线：记录到 JSONL 日志，并可汇总为每个阶段的 p50 / p95 / p99。
+
+用法：python job_timeline.py [日志路径] [--last N]
+"""
+
+import argparse
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 时间线日志路径（JSONL，每个任务一行）；设为空字符串表示不记录
+DEFAULT_TIMELINE_PATH = os.getenv(
+    "JOB_TIMELINE_PATH",
+    os.path.join(ROOT_DIR, "data", "cache", "job_timeline.jsonl"),
+)
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class StageSpan:
+    name: str
+    start: float
+    end: float
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+class JobTimeline:
+    """单个任务的阶段时间线。各阶段的起止时间使用单调时钟，可在多个线程中并发记录。"""
+
+    def __init__(
+        self,
+        job_id: str,
+        source: str,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.job_id = job_id
+        self.source = source
+        self._clock = clock
+        self.started = clock()
+        self.started_at = time.time()
+        self.spans: List[StageSpan] = []
+        self.bytes: Dict[str, int] = {}
+        self.chars = 0
+        self._lock = threading.Lock()
+        self._record: Optional[Dict[str, Any]] = None
+        self._token: Optional[contextvars.Token] = None
+
+    def record_stage(self, name: str, start: float, end: float) -> None:
+        with self._lock:
+            self.spans.append(StageSpan(name, start, end))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record_stage(name, start, self._clock())
+
+    def add_bytes(self, direction: str, amount: int) -> None:
+        with self._lock:
+            self.bytes[direction] = self.bytes.get(direction, 0) + amount
+
+    def add_chars(self, amount: int) -> None:
+        with self._lock:
+            self.chars += amount
+
+    def finish(self, status: str) -> Dict[str, Any]:
+        """结束时间线并返回可序列化的记录；重复调用返回第一次的结果。"""
+        with self._lock:
+            if self._record is not None:
+                return self._record
+            total = self._clock() - self.started
+            spans = sorted(self.spans, key=lambda span: span.start)
+            stages = [
+                {
+                    "stage": span.name,
+                    "start_ms": round((span.start - self.started) * 1000, 1),
+                    "duration_ms": round(span.seconds * 1000, 1),
+                }
+                for span in spans
+            ]
+            ttft = next((span.seconds for span in spans if span.name == "ttft"), None)
+            generate = sum(span.seconds for span in spans if span.name == "generate")
+            self._record = {
+                "job_id": self.job_id,
+                "source": self.source,
+                "status": status,
+                "started_at": round(self.started_at, 3),
+                "total_ms": round(total * 1000, 1),
+                "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+                "chars": self.chars,
+                "chars_per_second": round(self.chars / generate, 1) if generate > 0 else None,
+                "bytes": dict(self.bytes),
+                "stages": stages,
+            }
+            return self._record
+
+
+_current: "contextvars.ContextVar[Optional[JobTimeline]]" = contextvars.ContextVar("job_timeline", default=None)
+
+
+def current_timeline() -> Optional[JobTimeline]:
+    return _current.get()
+
+
+def begin_timeline(job_id: str, source: str) -> JobTimeline:
+    """在当前上下文中启用时间线；asyncio.to_thread 与之后新建的任务会继承它。
+
+    之后应在同一上下文中调用 end_timeline 恢复；每个任务独占的 asyncio.Task 中可以省略。
+    """
+    timeline = JobTimeline(job_id, source)
+    timeline._token = _current.set(timeline)
+    return timeline
+
+
+def end_timeline(timeline: JobTimeline) -> None:
+    _current.reset(timeline._token)
+
+
+@contextmanager
+def job_timeline(job_id: str, source: str) -> Iterator[JobTimeline]:
+    """在代码块内启用时间线，结束后恢复原来的上下文。"""
+    timeline = begin_timeline(job_id, source)
+    try:
+        yield timeline
+    finally:
+        end_timeline(timeline)
+
+
+def format_timeline(record: Dict[str, Any]) -> str:
+    """单行摘要，例如：总耗时 12.3s | resolve 0.8s · download 2.1s · ttft 3.0s · generate 8.9s"""
+    parts = [f"{stage['stage']} {stage['duration_ms'] / 1000:.1f}s" for stage in record["stages"]]
+    summary = f"总耗时 {record['total_ms'] / 1000:.1f}s"
+    if parts:
+        summary += " | " + " · ".join(parts)
+    if record.get("chars_per_second"):
+        summary += f" | {record['chars']} 字（{record['chars_per_second']} 字/秒）"
+    return summary
+
+
+class TimelineLog:
+    """追加写入时间线记录的 JSONL 文件；路径为空时不记录。"""
+
+    def __init__(self, path: str = DEFAULT_TIMELINE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def read(self, last: Optional[int] = None) -> List[Dict[str, Any]]:
+        """读取记录（last 指定时只取最后 N 条），跳过无法解析的行。"""
+        if not self.path or not os.path.isfile(self.path):
+            return []
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records[-last:] if last else records
+
+
+_log: Optional[TimelineLog] = None
+_log_lock = threading.Lock()
+
+
+def get_timeline_log() -> TimelineLog:
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = TimelineLog()
+    return _log
+
+
+def set_timeline_path(path: str) -> None:
+    """更换进程内共享的时间线日志路径（空字符串表示不记录）。"""
+    global _log
+    with _log_lock:
+        _log = TimelineLog(path)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数，values 需已排序且非空。"""
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def aggregate(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """按阶段汇总耗时（毫秒），返回 阶段 -> {count, p50, p95, p99}。同一任务内同名阶段的耗时相加。"""
+    samples: Dict[str, List[float]] = {}
+    for record in records:
+        per_job: Dict[str, float] = {}
+        for stage in record.get("stages", []):
+            per_job[stage["stage"]] = per_job.get(stage["stage"], 0.0) + stage["duration_ms"]
+        per_job["total"] = record.get("total_ms", 0.0)
+        for name, value in per_job.items():
+            samples.setdefault(name, []).append(value)
+    summary: Dict[str, Dict[str, float]] = {}
+    for name, values in samples.items():
+        values.sort()
+        summary[name] = {"count": len(values)}
+        for pct in PERCENTILES:
+            summary[name][f"p{pct}"] = round(percentile(values, pct), 1)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="汇总任务时间线日志中各阶段耗时的 p50 / p95 / p99（毫秒）")
+    parser.add_argument("path", nargs="?", default=DEFAULT_TIMELINE_PATH, help="时间线日志路径")
+    parser.add_argument("--last", type=int, default=None, help="只统计最后 N 个任务")
+    parser.add_argument("--source", default=None, help="只统计指定来源（web / bot / cli）")
+    args = parser.parse_args(argv)
+
+    records = TimelineLog(args.path).read(args.last)
+    if args.source:
+        records = [r for r in records if r.get("source") == args.source]
+    if not records:
+        print(f"没有可统计的记录：{args.path}", file=sys.stderr)
+        sys.exit(1)
+
+    summary = aggregate(records)
+    print(f"{'stage':<18}{'count':>8}" + "".join(f"{'p' + str(p):>12}" for p in PERCENTILES))
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]["p50"]):
+        print(f"{name:<18}{stats['count']:>8}" + "".join(f"{stats['p' + str(p)]:>12.1f}" for p in PERCENTILES))
+
+
+if __name__ == "__main__":
+    main()
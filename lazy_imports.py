@@ -0,0 +1,193 @@
+"""重型依赖的延迟导入：不导入模块的可用性检查、后台预热，以及基于 `python -X importtime` 的导入耗时预算。
+
+用法：python lazy_imports.py [模块名或 .py 路径 ...] [--top N]
+"""
+
+import argparse
+import importlib
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 只在首次使用时导入的重型依赖：各入口模块加载时都不应导入它们
+HEAVY_MODULES = ("google.genai", "google.oauth2", "yt_dlp", "requests")
+# 服务启动后在后台预热的模块（转写必然用到 google.genai，下载用到 httpx）
+DEFAULT_WARM_MODULES = ("google.genai", "httpx")
+# 设为 0 关闭后台预热（例如只查询任务状态的无服务器实例）
+WARM_IMPORTS = os.getenv("WARM_IMPORTS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# 各入口的导入耗时预算（毫秒，不含解释器自身启动的导入）；慢速 CI 可用 IMPORT_BUDGET_SCALE 放宽
+IMPORT_BUDGETS_MS: Dict[str, float] = {
+    "main": 400,
+    "async_download": 500,
+    "telegram_bot": 1500,
+    "api/index.py": 2500,
+}
+IMPORT_BUDGET_SCALE = float(os.getenv("IMPORT_BUDGET_SCALE", "1"))
+# 单元测试默认只检查重型依赖；设为 1 时同时检查耗时预算（耗时受机器负载影响，CI 中建议单独运行 python lazy_imports.py）
+IMPORT_BUDGET_CHECK = os.getenv("IMPORT_BUDGET_CHECK", "").strip().lower() in ("1", "true", "yes", "on")
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def module_available(name: str) -> bool:
+    """检查模块是否已安装，不执行模块本身（父包仍会被导入）。"""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+_warm_lock = threading.Lock()
+_warmed: Set[str] = set()
+
+
+def warm_imports(modules: Sequence[str] = DEFAULT_WARM_MODULES) -> Optional[threading.Thread]:
+    """在后台线程中预先导入模块，首个任务不再承担导入耗时。
+
+    每个模块只预热一次；全部已预热或 WARM_IMPORTS=0 时返回 None。未安装的模块留到首次使用时再报错。
+    """
+    if not WARM_IMPORTS:
+        return None
+    with _warm_lock:
+        pending = [name for name in modules if name not in _warmed and name not in sys.modules]
+        _warmed.update(pending)
+    if not pending:
+        return None
+
+    def run() -> None:
+        for name in pending:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=run, name="warm-imports", daemon=True)
+    thread.start()
+    return thread
+
+
+@dataclass
+class ImportRecord:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    target: str
+    # 解释器启动之后新增的导入总耗时（毫秒）
+    total_ms: float
+    records: List[ImportRecord] = field(default_factory=list)
+
+    @property
+    def heavy_modules(self) -> List[str]:
+        loaded = {record.name for record in self.records}
+        return [name for name in HEAVY_MODULES if name in loaded]
+
+    def slowest(self, top: int = 10) -> List[ImportRecord]:
+        return sorted(self.records, key=lambda record: -record.self_us)[:top]
+
+
+def parse_importtime(text: str) -> List[ImportRecord]:
+    """解析 -X importtime 的输出（stderr），忽略表头与其它行。"""
+    records = []
+    for line in text.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            records.append(
+                ImportRecord(
+                    name=match.group(4),
+                    self_us=int(match.group(1)),
+                    cumulative_us=int(match.group(2)),
+                    depth=(len(match.group(3)) - 1) // 2,
+                )
+            )
+    return records
+
+
+def _run_importtime(statement: str, env: Optional[Dict[str, str]], cwd: Optional[str]) -> List[ImportRecord]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=cwd or ROOT_DIR,
+        env={**os.environ, **(env or {})},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"导入失败：{statement}\n{tail[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def profile_imports(
+    target: str,
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+) -> ImportProfile:
+    """在子进程中导入 target（模块名，或以 .py 结尾的文件路径）并统计导入耗时。"""
+    if target.endswith(".py"):
+        path = os.path.join(cwd or ROOT_DIR, target)
+        statement = f"import runpy; runpy.run_path({path!r}, run_name='_import_profile')"
+    else:
+        statement = f"import {target}"
+    baseline = {record.name for record in _run_importtime("pass", env, cwd)}
+    records = [record for record in _run_importtime(statement, env, cwd) if record.name not in baseline]
+    total_us = sum(record.cumulative_us for record in records if record.depth == 0)
+    return ImportProfile(target=target, total_ms=round(total_us / 1000, 1), records=records)
+
+
+def check_budget(profile: ImportProfile, budget_ms: Optional[float] = None, timed: bool = True) -> List[str]:
+    """返回超出预算的问题列表：导入了重型依赖，或（timed 为 True 时）总耗时超过预算。"""
+    if budget_ms is None:
+        budget_ms = IMPORT_BUDGETS_MS.get(profile.target)
+    problems = []
+    if profile.heavy_modules:
+        problems.append(f"{profile.target} 加载时导入了重型依赖：{', '.join(profile.heavy_modules)}")
+    if timed and budget_ms is not None and profile.total_ms > budget_ms * IMPORT_BUDGET_SCALE:
+        problems.append(f"{profile.target} 导入耗时 {profile.total_ms:.0f}ms，超出预算 {budget_ms * IMPORT_BUDGET_SCALE:.0f}ms")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="统计各入口的导入耗时并检查预算（python -X importtime）")
+    parser.add_argument("targets", nargs="*", help="模块名或 .py 路径，默认检查全部入口")
+    parser.add_argument("--top", type=int, default=8, help="列出自身耗时最长的 N 个模块")
+    args = parser.parse_args(argv)
+
+    problems: List[str] = []
+    for target in args.targets or list(IMPORT_BUDGETS_MS):
+        try:
+            profile = profile_imports(target)
+        except RuntimeError as exc:
+            print(str(exc), file=sys.stderr)
+            problems.append(f"{target} 无法导入")
+            continue
+        budget = IMPORT_BUDGETS_MS.get(target)
+        budget_text = f" / 预算 {budget * IMPORT_BUDGET_SCALE:.0f}ms" if budget is not None else ""
+        print(f"{target}: {profile.total_ms:.1f}ms{budget_text}")
+        for record in profile.slowest(args.top):
+            print(f"  {record.name:<48}{record.self_us / 1000:>10.1f}ms")
+        problems.extend(check_budget(profile, budget))
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
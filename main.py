@@ -9,6 +9,23 @@ import glob
 from dataclasses import dataclass
 from typing import Optional
 
+from inflight import FileLeases, SingleFlight
+from douyin_resolver import HedgedResolver, ResolverBackend
+from ffmpeg_pool import get_ffmpeg_pool
+from file_catalog import FileCatalog
+from media_cache import MediaCache, MediaFetch
+from job_timeline import current_timeline, format_timeline, get_timeline_log, job_timeline, set_timeline_path
+from lazy_imports import module_available, warm_imports
+from metrics import ACTIVE_STREAMS, RETRIES_TOTAL, TOKENS_TOTAL, observe_stage, record_bytes, time_stage
+from progress import (  # noqa: F401
+    ProgressEvent,
+    ProgressReporter,
+    bind_context,
+    progress_reporter,
+    report_progress,
+)
+from resolver_cache import ResolverCache
+
 try:
     from dotenv import load_dotenv
 except Exception:  # pragma: no cover - optional dependency fallback
@@ -206,10 +223,11 @@ def build_genai_client(auth_config: GeminiAuthConfig):
 
 
 def ensure_package() -> None:
-    """Ensure google-genai is available; otherwise, guide the user."""
-    try:
-        from google import genai  # noqa: F401
-    except Exception:  # pragma: no cover - runtime guidance only
+    """Ensure google-genai is available; otherwise, guide the user.
+
+    只检查是否已安装，不导入（导入约需 1 秒，改为在后台预热）。
+    """
+    if not module_available("google.genai"):  # pragma: no cover - runtime guidance only
         print(
             "未检测到 google-genai 包。请先安装依赖：\n"
             "  pip install -r requirements.txt\n"
@@ -221,67 +239,87 @@ def ensure_package() -> None:
 
 
 def wait_for_file_active(client, file_obj, timeout_seconds: int = 120) -> None:
-    """Poll until uploaded file becomes ACTIVE or timeout. 输出简单进度到 stderr。"""
+    """Poll until uploaded file becomes ACTIVE or timeout. 通过 report_progress 报告进度。"""
     start_ts = time.time()
     sleep_seconds = 1.0
-    try:
-        print("等待文件处理", end="", file=sys.stderr, flush=True)
-    except Exception:
-        pass
+    report_progress("等待文件处理...", stage="transcribe")
     while True:
         file_obj = client.files.get(name=file_obj.name)
         state = getattr(file_obj, "state", None)
         state_name = getattr(state, "name", state)
         if state_name == "ACTIVE":
-            try:
-                print(" ✓", file=sys.stderr, flush=True)
-            except Exception:
-                pass
+            report_progress("文件处理完成 ✓", stage="transcribe")
             return
         if state_name == "FAILED" or (time.time() - start_ts) > timeout_seconds:
-            try:
-                print(file=sys.stderr)
-            except Exception:
-                pass
             raise RuntimeError(f"文件处理失败或超时，state={state_name}")
         time.sleep(sleep_seconds)
         # Exponential backoff, cap to 5s
         sleep_seconds = min(sleep_seconds * 1.5, 5.0)
+
+
+def _chunk_text(chunk) -> Optional[str]:
+    text_piece = getattr(chunk, "text", None)
+    if not text_piece:
         try:
-            print(".", end="", file=sys.stderr, flush=True)
+            candidates = getattr(chunk, "candidates", [])
+            if candidates and candidates[0].content and candidates[0].content.parts:
+                text_piece = "".join(
+                    part.text
+                    for part in candidates[0].content.parts
+                    if hasattr(part, "text")
+                )
         except Exception:
-            pass
+            text_piece = None
+    return text_piece
+
+
+def _record_usage(usage) -> None:
+    if usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, attr, None)
+        if count:
+            TOKENS_TOTAL.inc(count, kind=kind)
 
 
 def _collect_stream_text(response_stream, on_chunk=None) -> str:
-    """Collect streamed Gemini text while emitting only new deltas."""
+    """Collect streamed Gemini text while emitting only new deltas.
+
+    Also records time-to-first-token, generation time and token usage metrics.
+    """
     emitted_text = ""
     full_parts = []
-    for chunk in response_stream:
-        text_piece = getattr(chunk, "text", None)
-        if not text_piece:
-            try:
-                candidates = getattr(chunk, "candidates", [])
-                if candidates and candidates[0].content and candidates[0].content.parts:
-                    text_piece = "".join(
-                        part.text
-                        for part in candidates[0].content.parts
-                        if hasattr(part, "text")
-                    )
-            except Exception:
-                text_piece = None
-        if text_piece:
-            if emitted_text and text_piece.startswith(emitted_text):
-                delta = text_piece[len(emitted_text):]
-            else:
-                delta = text_piece
-            if delta:
-                if on_chunk:
-                    on_chunk(delta)
+    started = time.perf_counter()
+    first_token_at: Optional[float] = None
+    usage = None
+    ACTIVE_STREAMS.inc()
+    try:
+        for chunk in response_stream:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            text_piece = _chunk_text(chunk)
+            if text_piece:
+                if emitted_text and text_piece.startswith(emitted_text):
+                    delta = text_piece[len(emitted_text):]
                 else:
-                    print(delta, end="", flush=True)
-                full_parts.append(delta)
-                emitted_text += delta
+                    delta = text_piece
+                if delta:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        observe_stage("ttft", started, first_token_at)
+                    if on_chunk:
+                        on_chunk(delta)
+                    else:
+                        print(delta, end="", flush=True)
+                    full_parts.append(delta)
+                    emitted_text += delta
+    finally:
+        ACTIVE_STREAMS.dec()
+        observe_stage("generate", started, time.perf_counter())
+        timeline = current_timeline()
+        if timeline is not None:
+            timeline.add_chars(len(emitted_text))
+        # usage_metadata 在流的最后一个分片中给出累计值
+        _record_usage(usage)
 
     return "".join(full_parts).strip()
 
@@ -310,9 +348,10 @@ def _build_generate_content_config(types, media_resolution: Optional[str] = None
     except Exception:
         if "media_resolution" not in kwargs:
             raise
-        print(
+        report_progress(
             "当前 google-genai 版本不支持 media_resolution，已忽略该参数。",
-            file=sys.stderr,
+            kind="warning",
+            stage="transcribe",
         )
         kwargs.pop("media_resolution", None)
         return types.GenerateContentConfig(**kwargs)
@@ -341,7 +380,7 @@ def _youtube_output_stem(youtube_url: str) -> str:
                 return f"youtube_{safe_vid}"
     except Exception:
         pass
-    return f"youtube_{int(time.time())}"
+    return f"youtube_{_url_digest(youtube_url)}"
 
 
 def transcribe_audio_streaming(
@@ -377,7 +416,7 @@ def transcribe_audio_streaming(
 
     # 读取音频文件并构建 inline bytes 输入
     try:
-        print(f"读取音频：{os.path.basename(audio_path)}", file=sys.stderr)
+        report_progress(f"读取音频：{os.path.basename(audio_path)}", stage="transcribe")
         with open(audio_path, 'rb') as audio_file:
             audio_data = audio_file.read()
 
@@ -403,10 +442,12 @@ def transcribe_audio_streaming(
     )
 
     content_data = types.Part.from_bytes(data=audio_data, mime_type=mime_type)
+    # 音频以 inline bytes 随请求发送，上传耗时计入首字延迟（ttft）
+    record_bytes("upload", len(audio_data))
     config = _build_generate_content_config(types)
 
     try:
-        print("开始转写...", file=sys.stderr)
+        report_progress("开始转写...", stage="transcribe")
     except Exception:
         pass
     
@@ -419,7 +460,7 @@ def transcribe_audio_streaming(
 
         transcript = _collect_stream_text(response_stream, on_chunk=on_chunk)
         try:
-            print(f"转写完成（约 {len(transcript)} 字符）", file=sys.stderr)
+            report_progress(f"转写完成（约 {len(transcript)} 字符）", stage="transcribe")
         except Exception:
             pass
         return transcript
@@ -463,7 +504,7 @@ def transcribe_youtube_url_streaming(
     config = _build_generate_content_config(types, media_resolution=media_resolution)
 
     try:
-        print("开始转写 YouTube（Gemini 直连）...", file=sys.stderr)
+        report_progress("开始转写 YouTube（Gemini 直连）...", stage="transcribe")
         response_stream = client.models.generate_content_stream(
             model=model_name,
             contents=[full_prompt, video_part],
@@ -471,7 +512,7 @@ def transcribe_youtube_url_streaming(
         )
         transcript = _collect_stream_text(response_stream, on_chunk=on_chunk)
         try:
-            print(f"转写完成（约 {len(transcript)} 字符）", file=sys.stderr)
+            report_progress(f"转写完成（约 {len(transcript)} 字符）", stage="transcribe")
         except Exception:
             pass
         return transcript
@@ -484,21 +525,148 @@ def transcribe_youtube_url_streaming(
             pass
 
 
+# YouTube 回退下载：语音识别不需要高码率，优先选不超过该码率（kbps）的音轨
+YTDLP_MAX_AUDIO_ABR = int(os.getenv("YTDLP_MAX_AUDIO_ABR", "64"))
+YTDLP_CONCURRENT_FRAGMENTS = int(os.getenv("YTDLP_CONCURRENT_FRAGMENTS", "4"))
+# 可直接交给 Gemini 转写的音频扩展名，下载到这些格式时不做后处理
+TRANSCRIBE_READY_EXTENSIONS = {'.mp3', '.m4a', '.wav', '.flac', '.ogg', '.aac', '.opus'}
+# 音频编码 -> 无损转封装时使用的扩展名
+_COPYABLE_AUDIO_CODECS = (("opus", ".opus"), ("mp4a", ".m4a"), ("vorbis", ".ogg"), ("mp3", ".mp3"))
+
+
+def youtube_audio_format(max_abr: int = YTDLP_MAX_AUDIO_ABR) -> str:
+    """yt-dlp 格式选择：码率上限内的 m4a 音轨 > 码率上限内的任意音轨 > 不低于 32k 的最低码率音轨。"""
+    return (
+        f"bestaudio[ext=m4a][abr<={max_abr}]"
+        f"/bestaudio[abr<={max_abr}]"
+        "/worstaudio[abr>=32]"
+        "/worstaudio"
+        "/bestaudio/best"
+    )
+
+
+class _SharedYoutubeDL:
+    """跨任务复用的 YoutubeDL 实例；YoutubeDL 不是线程安全的，同一实例的下载串行执行。"""
+
+    def __init__(self) -> None:
+        self.ydl = None
+        self.lock = threading.Lock()
+        self.progress_hook = None
+
+    def _dispatch(self, d) -> None:
+        hook = self.progress_hook
+        if hook is not None:
+            hook(d)
+
+
+_youtube_dl_instances: dict = {}
+_youtube_dl_lock = threading.Lock()
+
+
+def _get_shared_youtube_dl(output_dir: str, cookies_path: Optional[str]) -> _SharedYoutubeDL:
+    import yt_dlp  # type: ignore
+
+    key = (os.path.abspath(output_dir), cookies_path)
+    with _youtube_dl_lock:
+        shared = _youtube_dl_instances.get(key)
+        if shared is None:
+            shared = _SharedYoutubeDL()
+            opts = {
+                "format": youtube_audio_format(),
+                "noplaylist": True,
+                "outtmpl": os.path.join(output_dir, "%(title)s [%(id)s].%(ext)s"),
+                "noprogress": True,
+                "quiet": True,
+                "no_warnings": True,
+                "overwrites": False,
+                "concurrent_fragment_downloads": YTDLP_CONCURRENT_FRAGMENTS,
+                # 分块请求可以避开 YouTube 对单个长连接的限速
+                "http_chunk_size": 10 * 1024 * 1024,
+                "progress_hooks": [shared._dispatch],
+            }
+            if cookies_path:
+                report_progress(f"使用 cookies 文件：{cookies_path}", stage="download")
+                opts["cookiefile"] = cookies_path
+            shared.ydl = yt_dlp.YoutubeDL(opts)
+            _youtube_dl_instances[key] = shared
+        return shared
+
+
+def _ydl_downloaded_path(ydl_obj, info_dict, output_dir: str) -> str:
+    requested = info_dict.get("requested_downloads")
+    if isinstance(requested, list) and requested:
+        for item in requested:
+            fp = item.get("filepath") or item.get("_filename")
+            if fp and os.path.exists(fp):
+                return fp
+    fp = info_dict.get("filepath") or info_dict.get("_filename")
+    if fp and os.path.exists(fp):
+        return fp
+    try:
+        prepared = ydl_obj.prepare_filename(info_dict)
+        if prepared and os.path.exists(prepared):
+            return prepared
+    except Exception:
+        pass
+    vid = info_dict.get("id")
+    if vid:
+        for name in os.listdir(output_dir):
+            if f"[{vid}]" in name:
+                candidate = os.path.join(output_dir, name)
+                if os.path.isfile(candidate):
+                    return candidate
+    raise RuntimeError("未能确定下载的音频文件路径")
+
+
+def _ensure_transcribable_audio(path: str, acodec: Optional[str], preferred_audio_codec: str) -> str:
+    """下载格式可直接转写时原样返回；否则优先无损转封装，失败再转码为 preferred_audio_codec。"""
+    import subprocess
+
+    stem, ext = os.path.splitext(path)
+    if ext.lower() in TRANSCRIBE_READY_EXTENSIONS:
+        report_progress("音频格式可直接转写，跳过后处理", stage="extract")
+        return path
+
+    copy_ext = next(
+        (target for prefix, target in _COPYABLE_AUDIO_CODECS if (acodec or "").lower().startswith(prefix)),
+        None,
+    )
+    try:
+        if copy_ext:
+            try:
+                _ffmpeg_extract_audio(path, stem + copy_ext, "copy")
+                report_progress("音频转封装完成", stage="extract")
+                return stem + copy_ext
+            except subprocess.CalledProcessError:
+                pass
+        out_path = f"{stem}.{preferred_audio_codec}"
+        _ffmpeg_extract_audio(path, out_path, _get_ffmpeg_audio_codec(preferred_audio_codec))
+        report_progress("音频转码完成", stage="extract")
+        return out_path
+    except subprocess.CalledProcessError as e:
+        report_progress(f"音频转码失败，将使用原始音频格式。\n{e.stderr or ''}".strip(), kind="warning", stage="extract")
+        return path
+    except FileNotFoundError:
+        report_progress("未找到 ffmpeg，将使用原始音频格式。", kind="warning", stage="extract")
+        return path
+
+
 def download_audio_from_youtube(
     youtube_url: str,
     output_dir: str = "./data",
     preferred_audio_codec: str = "m4a",
     cookies_path: Optional[str] = None,
 ) -> str:
-    """使用 yt-dlp 下载 YouTube 音频并返回本地文件路径。
+    """使用 yt-dlp 下载 YouTube 音频并返回本地文件路径（--youtube 直连转写失败时的回退路径）。
 
-    优先尝试提取为指定编码（默认 m4a，需要本机可用的 ffmpeg）。
-    若转码失败（可能未安装 ffmpeg），则回退为原始音频格式。
+    选择满足语音识别需要的最低码率音轨，并发下载分片；下载格式可直接转写时不做后处理，
+    否则先尝试无损转封装，再转码为 preferred_audio_codec（需要本机可用的 ffmpeg）。
+    同一输出目录与 cookies 的下载复用同一个 YoutubeDL 实例。
     """
     os.makedirs(output_dir, exist_ok=True)
 
     try:
-        import yt_dlp  # type: ignore
+        import yt_dlp  # type: ignore  # noqa: F401
     except Exception:
         print(
             "未检测到 yt-dlp 包。请先安装依赖：\n  pip install -r requirements.txt",
@@ -506,16 +674,6 @@ def download_audio_from_youtube(
         )
         sys.exit(2)
 
-    base_opts = {
-        "format": "bestaudio/best",
-        "noplaylist": True,
-        "outtmpl": os.path.join(output_dir, "%(title)s [%(id)s].%(ext)s"),
-        "noprogress": True,
-        "quiet": True,
-        "no_warnings": True,
-        "overwrites": False,
-    }
-
     last_pct_holder = {"pct": -5}
 
     def _progress_hook(d):
@@ -528,154 +686,196 @@ def download_audio_from_youtube(
                     pct = int(downloaded * 100 / max(total, 1))
                     if pct >= last_pct_holder["pct"] + 5:
                         last_pct_holder["pct"] = pct
-                        print(f"下载进度：{pct}%", file=sys.stderr)
+                        report_progress(f"下载进度：{pct}%", stage="download", percent=pct)
             elif status == "finished":
-                print("下载完成，开始后处理...", file=sys.stderr)
+                report_progress("下载完成", stage="download")
         except Exception:
             pass
 
-    def _extract_path_with_ydl(ydl_obj, info_dict) -> str:
-        requested = info_dict.get("requested_downloads")
-        if isinstance(requested, list) and requested:
-            for item in requested:
-                fp = item.get("filepath") or item.get("_filename")
-                if fp and os.path.exists(fp):
-                    return fp
-        fp = info_dict.get("filepath") or info_dict.get("_filename")
-        if fp and os.path.exists(fp):
-            return fp
-        try:
-            prepared = ydl_obj.prepare_filename(info_dict)
-            if prepared and os.path.exists(prepared):
-                return prepared
-        except Exception:
-            pass
-        vid = info_dict.get("id")
-        if vid:
-            for name in os.listdir(output_dir):
-                if f"[{vid}]" in name:
-                    candidate = os.path.join(output_dir, name)
-                    if os.path.isfile(candidate):
-                        return candidate
-        raise RuntimeError("未能确定下载的音频文件路径")
-
-    try:
-        opts = dict(base_opts)
-        if cookies_path:
-            print(f"使用 cookies 文件：{cookies_path}", file=sys.stderr)
-            opts["cookiefile"] = cookies_path
-        opts["progress_hooks"] = [_progress_hook]
-        opts["postprocessors"] = [
-            {
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": preferred_audio_codec,
-                "preferredquality": "0",
-            }
-        ]
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(youtube_url, download=True)
-            return _extract_path_with_ydl(ydl, info)
-    except Exception as e:
+    shared = _get_shared_youtube_dl(output_dir, cookies_path)
+    with shared.lock:
+        shared.progress_hook = _progress_hook
         try:
-            from yt_dlp.utils import PostProcessingError  # type: ignore
-        except Exception:
-            PostProcessingError = Exception  # type: ignore
-        if isinstance(e, PostProcessingError):
-            print(
-                "音频转码失败（可能未安装 ffmpeg），将使用原始音频格式。",
-                file=sys.stderr,
-            )
-        else:
-            print(f"转码失败：{e}，尝试以原始格式下载。", file=sys.stderr)
-
+            info = shared.ydl.extract_info(youtube_url, download=True)
+            path = _ydl_downloaded_path(shared.ydl, info, output_dir)
+        except Exception as e:
+            raise RuntimeError(f"下载失败：{e}") from e
+        finally:
+            shared.progress_hook = None
+
+    # yt-dlp 按标题命名文件，下载完成后再移入分片目录
+    sharded = _media_path(output_dir, os.path.basename(path))
+    if os.path.abspath(sharded) != os.path.abspath(path):
+        os.replace(path, sharded)
+        path = sharded
+
+    abr = info.get("abr")
+    report_progress(
+        f"已下载音轨：{info.get('format_id') or '未知'}"
+        + (f"，约 {int(abr)} kbps" if abr else ""),
+        stage="download",
+    )
+    audio_path = _ensure_transcribable_audio(path, info.get("acodec"), preferred_audio_codec)
+    if audio_path != path:
         try:
-            opts = dict(base_opts)
-            if cookies_path:
-                print(f"使用 cookies 文件：{cookies_path}", file=sys.stderr)
-                opts["cookiefile"] = cookies_path
-            opts["progress_hooks"] = [_progress_hook]
-            opts.pop("postprocessors", None)
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(youtube_url, download=True)
-                return _extract_path_with_ydl(ydl, info)
-        except Exception as e2:
-            raise RuntimeError(f"下载失败：{e2}") from e
+            os.remove(path)
+        except OSError:
+            pass
+    _record_media(audio_path)
+    return audio_path
 
 def download_video_and_extract_audio(
     video_url: str,
     output_dir: str = "./data",
     preferred_audio_codec: str = "m4a",
+    lease: bool = False,
 ) -> str:
-    """从视频直链下载视频，使用ffmpeg提取音频并返回本地音频文件路径。
-    如果文件本身就是音频格式，则跳过音频提取步骤。
-    
-    Args:
-        video_url: 视频直链URL
-        output_dir: 输出目录，默认为./data
-        preferred_audio_codec: 首选音频编码，默认为m4a
-        
-    Returns:
-        str: 提取的音频文件路径
-        
-    Raises:
-        RuntimeError: 下载或音频提取失败时抛出
+    """从视频直链下载视频并提取音频，返回本地音频文件路径。
+
+    同一 URL 的并发调用只下载一次并共享结果文件，结果写入媒体缓存；lease=True 时
+    返回的文件已为调用方登记引用，使用完毕后需调用 release_file(path)。
+    """
+    cache_key = f"video:{canonicalize_url(video_url)}:{preferred_audio_codec}"
+    key = ("video", cache_key, os.path.abspath(output_dir))
+    return _coalesced_download(
+        key,
+        lambda: _cached_media_download(
+            cache_key,
+            lambda validators: _download_video_and_extract_audio(
+                video_url, output_dir, preferred_audio_codec, validators
+            ),
+        ),
+        lease,
+    )
+
+
+# 支持的音频格式列表
+AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.wav', '.flac', '.ogg', '.aac', '.opus', '.wma'}
+
+
+def _url_digest(url: str) -> str:
+    """规范化 URL 的短哈希，拼进本地文件名，避免不同 URL 的同名文件互相覆盖。"""
+    import hashlib
+
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest()[:12]
+
+
+def _part_path(path: str) -> str:
+    """path 对应的临时写入路径；保留扩展名，ffmpeg 依据扩展名选择封装格式。"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+
+def _video_download_paths(video_url: str, output_dir: str, preferred_audio_codec: str):
+    """根据视频直链推导本地文件路径，返回 (name, 是否音频文件, 临时下载路径, 最终音频路径)。
+
+    文件名带上 URL 哈希，不同站点上同名的文件不会落到同一路径。
+    音频文件的临时下载路径是最终路径加 .part，下载完成后原子替换。
     """
-    import requests
-    import subprocess
-    import tempfile
     from urllib.parse import urlparse
-    
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 支持的音频格式列表
-    AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.wav', '.flac', '.ogg', '.aac', '.opus', '.wma'}
-    
-    # 从URL中提取文件名，如果没有则使用时间戳
+
+    # 从URL中提取文件名，如果没有则使用 video
     parsed_url = urlparse(video_url)
     url_path = parsed_url.path
+    digest = _url_digest(video_url)
     if url_path and '.' in url_path:
         # 尝试从URL路径中提取文件名
         original_filename = os.path.basename(url_path)
         name, ext = os.path.splitext(original_filename)
-        if not name:
-            name = f"video_{int(time.time())}"
+        name = f"{name or 'video'}_{digest}"
     else:
-        name = f"video_{int(time.time())}"
+        name = f"video_{digest}"
         ext = ".mp4"  # 默认扩展名
     
     # 检查是否是音频文件
     is_audio_file = ext.lower() in AUDIO_EXTENSIONS
     
-    # 临时视频文件路径
-    temp_video_path = os.path.join(output_dir, f"{name}_temp{ext}")
     # 最终音频文件路径
     if is_audio_file:
         # 如果是音频文件，直接使用原始扩展名
-        audio_path = os.path.join(output_dir, f"{name}{ext}")
+        audio_path = _media_path(output_dir, f"{name}{ext}")
+        temp_video_path = _part_path(audio_path)
     else:
         # 如果是视频文件，使用指定的音频编码
-        audio_path = os.path.join(output_dir, f"{name}.{preferred_audio_codec}")
+        audio_path = _media_path(output_dir, f"{name}.{preferred_audio_codec}")
+        temp_video_path = _media_path(output_dir, f"{name}_temp{ext}")
+    return name, is_audio_file, temp_video_path, audio_path
+
+
+def _download_video_and_extract_audio(
+    video_url: str,
+    output_dir: str = "./data",
+    preferred_audio_codec: str = "m4a",
+    validators: Optional[dict] = None,
+) -> MediaFetch:
+    """从视频直链下载视频，使用ffmpeg提取音频并返回本地音频文件路径。
+    如果文件本身就是音频格式，则跳过音频提取步骤。
+    
+    Args:
+        video_url: 视频直链URL
+        output_dir: 输出目录，默认为./data
+        preferred_audio_codec: 首选音频编码，默认为m4a
+        validators: 条件请求头（If-None-Match 等），服务器返回 304 时不再下载
+        
+    Returns:
+        MediaFetch: 提取的音频文件路径及源文件的 ETag/Last-Modified
+        
+    Raises:
+        RuntimeError: 下载或音频提取失败时抛出
+    """
+    import requests
+    import subprocess
+    
+    os.makedirs(output_dir, exist_ok=True)
+
+    from media_manifest import detect_manifest_type
+
+    # HLS/DASH 清单：只下载码率最低的音频轨分片
+    if detect_manifest_type(video_url):
+        return MediaFetch(download_manifest_audio(video_url, output_dir, preferred_audio_codec))
+    
+    name, is_audio_file, temp_video_path, audio_path = _video_download_paths(
+        video_url, output_dir, preferred_audio_codec
+    )
     
     try:
         if is_audio_file:
-            print(f"开始下载音频文件：{video_url}", file=sys.stderr)
+            report_progress(f"开始下载音频文件：{video_url}", stage="download")
         else:
-            print(f"开始下载视频文件：{video_url}", file=sys.stderr)
+            report_progress(f"开始下载视频文件：{video_url}", stage="download")
         
         # 下载文件
         # 获取系统代理设置
         proxies = _get_system_proxies()
-        response = requests.get(video_url, stream=True, proxies=proxies if proxies else None)
+        started = time.perf_counter()
+        response = requests.get(
+            video_url,
+            stream=True,
+            headers=validators or None,
+            proxies=proxies if proxies else None,
+        )
+        if response.status_code == 304:
+            response.close()
+            return MediaFetch(not_modified=True)
         response.raise_for_status()
+
+        # URL 没有扩展名但服务器返回的是清单
+        manifest_type = detect_manifest_type(video_url, response.headers.get('content-type'))
+        if manifest_type:
+            response.close()
+            return MediaFetch(
+                download_manifest_audio(video_url, output_dir, preferred_audio_codec, manifest_type=manifest_type)
+            )
+        fetch = MediaFetch(
+            etag=response.headers.get('etag'),
+            last_modified=response.headers.get('last-modified'),
+        )
         
         total_size = int(response.headers.get('content-length', 0))
         downloaded_size = 0
         last_pct = -5
         
-        # 如果是音频文件，直接下载到最终路径；否则下载到临时路径
-        download_path = audio_path if is_audio_file else temp_video_path
-        
-        with open(download_path, 'wb') as f:
+        with open(temp_video_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
                 if chunk:
                     f.write(chunk)
@@ -686,52 +886,33 @@ def download_video_and_extract_audio(
                         pct = int(downloaded_size * 100 / total_size)
                         if pct >= last_pct + 5:
                             last_pct = pct
-                            print(f"下载进度：{pct}%", file=sys.stderr)
+                            report_progress(f"下载进度：{pct}%", stage="download", percent=pct)
+        record_bytes("download", downloaded_size)
+        observe_stage("download", started, time.perf_counter())
         
         # 如果是音频文件，跳过转换步骤
         if is_audio_file:
-            print("音频文件下载完成，跳过格式转换", file=sys.stderr)
-            return audio_path
+            os.replace(temp_video_path, audio_path)
+            report_progress("音频文件下载完成，跳过格式转换", stage="extract")
+            fetch.path = audio_path
+            return fetch
         
-        print("视频下载完成，开始提取音频...", file=sys.stderr)
+        report_progress("视频下载完成，开始提取音频...", stage="extract")
         
         # 使用ffmpeg提取音频
-        ffmpeg_codec = _get_ffmpeg_audio_codec(preferred_audio_codec)
-        ffmpeg_cmd = [
-            'ffmpeg',
-            '-i', temp_video_path,
-            '-vn',  # 不包含视频
-            '-acodec', ffmpeg_codec,
-            '-y',  # 覆盖输出文件
-            audio_path
-        ]
-        
         try:
-            result = subprocess.run(
-                ffmpeg_cmd,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            print("音频提取完成", file=sys.stderr)
+            _ffmpeg_extract_audio(temp_video_path, audio_path, _get_ffmpeg_audio_codec(preferred_audio_codec))
+            report_progress("音频提取完成", stage="extract")
         except subprocess.CalledProcessError as e:
-            print(f"ffmpeg提取音频失败：{e.stderr}", file=sys.stderr)
+            report_progress(f"ffmpeg提取音频失败：{e.stderr}", kind="warning", stage="extract")
             # 尝试使用mp3格式作为备选
             if preferred_audio_codec != "mp3":
-                print("尝试使用mp3格式重新提取...", file=sys.stderr)
-                audio_path = os.path.join(output_dir, f"{name}.mp3")
-                ffmpeg_codec = _get_ffmpeg_audio_codec("mp3")
-                ffmpeg_cmd = [
-                    'ffmpeg',
-                    '-i', temp_video_path,
-                    '-vn',  # 不包含视频
-                    '-acodec', ffmpeg_codec,
-                    '-y',  # 覆盖输出文件
-                    audio_path
-                ]
+                report_progress("尝试使用mp3格式重新提取...", stage="extract")
+                RETRIES_TOTAL.inc(operation="extract_mp3")
+                audio_path = _media_path(output_dir, f"{name}.mp3")
                 try:
-                    subprocess.run(ffmpeg_cmd, capture_output=True, text=True, check=True)
-                    print("音频提取完成（mp3格式）", file=sys.stderr)
+                    _ffmpeg_extract_audio(temp_video_path, audio_path, _get_ffmpeg_audio_codec("mp3"))
+                    report_progress("音频提取完成（mp3格式）", stage="extract")
                 except subprocess.CalledProcessError as e2:
                     raise RuntimeError(f"音频提取失败：{e2.stderr}")
             else:
@@ -739,20 +920,143 @@ def download_video_and_extract_audio(
         except FileNotFoundError:
             raise RuntimeError("未找到ffmpeg，请确保已安装ffmpeg并添加到系统PATH中")
         
-        return audio_path
+        fetch.path = audio_path
+        return fetch
         
     except requests.RequestException as e:
         raise RuntimeError(f"下载文件失败：{e}")
     except Exception as e:
         raise RuntimeError(f"处理文件失败：{e}")
     finally:
-        # 只有视频文件才需要清理临时文件，音频文件不需要
-        if not is_audio_file:
+        # 清理临时文件（音频文件成功时已被替换为最终文件）
+        try:
+            if os.path.exists(temp_video_path):
+                os.remove(temp_video_path)
+        except Exception:
+            pass
+
+
+def download_manifest_audio(
+    manifest_url: str,
+    output_dir: str = "./data",
+    preferred_audio_codec: str = "m4a",
+    max_workers: Optional[int] = None,
+    manifest_type: Optional[str] = None,
+) -> str:
+    """下载 HLS/DASH 清单中码率最低的音频轨（没有纯音频轨时取码率最低的变体）。
+
+    分片通过有界线程池并发下载并按顺序拼接，然后用 ffmpeg 封装为音频文件。
+    """
+    import subprocess
+    from urllib.parse import urlparse
+    from media_manifest import (
+        DEFAULT_SEGMENT_WORKERS,
+        download_segments,
+        make_http_fetchers,
+        new_http_session,
+        resolve_manifest_plan,
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max_workers or DEFAULT_SEGMENT_WORKERS
+    name = os.path.splitext(os.path.basename(urlparse(manifest_url).path))[0] or "stream"
+    stem = f"{name}_{_url_digest(manifest_url)}"
+
+    # 连接只在拉取清单与分片期间保持，提取音频前关闭
+    with new_http_session(pool_size=workers) as session:
+        fetch_text, fetch_segment = make_http_fetchers(session, _get_system_proxies())
+
+        report_progress(f"解析媒体清单：{manifest_url}", stage="resolve")
+        try:
+            plan = resolve_manifest_plan(manifest_url, fetch_text, manifest_type=manifest_type)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"获取媒体清单失败：{e}") from e
+
+        track_kind = "纯音频轨" if plan.audio_only else "最低码率变体"
+        bitrate = f"，约 {plan.bandwidth // 1000} kbps" if plan.bandwidth else ""
+        report_progress(f"已选择{track_kind}{bitrate}，共 {len(plan.segments)} 个分片", stage="resolve")
+
+        concat_path = _media_path(output_dir, f"{stem}_segments.{plan.container}")
+        last_pct = {"pct": -5}
+
+        def _on_progress(done: int, total: int) -> None:
+            pct = int(done * 100 / max(total, 1))
+            if pct >= last_pct["pct"] + 5:
+                last_pct["pct"] = pct
+                report_progress(f"下载进度：{pct}%", stage="download", percent=pct)
+
+        try:
+            download_segments(plan, concat_path, fetch_segment, max_workers=workers, on_progress=_on_progress)
+        except BaseException:
             try:
-                if os.path.exists(temp_video_path):
-                    os.remove(temp_video_path)
-            except Exception:
+                os.remove(concat_path)
+            except OSError:
                 pass
+            raise
+
+    try:
+        # ADTS/MP3 分片拼接后即是可直接转写的音频文件
+        if plan.container in {"aac", "mp3"}:
+            audio_path = _media_path(output_dir, f"{stem}.{plan.container}")
+            os.replace(concat_path, audio_path)
+            report_progress("分片下载完成，跳过格式转换", stage="extract")
+            return audio_path
+
+        report_progress("分片下载完成，开始提取音频...", stage="extract")
+        audio_path = _media_path(output_dir, f"{stem}.{preferred_audio_codec}")
+        try:
+            # 纯音频轨优先直接复制音频流，失败时再转码
+            if plan.audio_only:
+                try:
+                    _ffmpeg_extract_audio(concat_path, audio_path, "copy")
+                    report_progress("音频提取完成", stage="extract")
+                    return audio_path
+                except subprocess.CalledProcessError:
+                    pass
+            _ffmpeg_extract_audio(concat_path, audio_path, _get_ffmpeg_audio_codec(preferred_audio_codec))
+            report_progress("音频提取完成", stage="extract")
+            return audio_path
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"音频提取失败：{e.stderr}")
+        except FileNotFoundError:
+            raise RuntimeError("未找到ffmpeg，请确保已安装ffmpeg并添加到系统PATH中")
+    finally:
+        try:
+            if os.path.exists(concat_path):
+                os.remove(concat_path)
+        except Exception:
+            pass
+
+
+def _ffmpeg_extract_args(input_path: str, output_path: str, ffmpeg_codec: str) -> list:
+    return [
+        '-i', input_path,
+        '-vn',  # 不包含视频
+        '-acodec', ffmpeg_codec,
+        '-y',  # 覆盖输出文件
+        output_path
+    ]
+
+
+def _ffmpeg_extract_audio(input_path: str, output_path: str, ffmpeg_codec: str) -> None:
+    """调用 ffmpeg 丢弃视频轨并输出音频；ffmpeg_codec 为 copy 时直接复制音频流。
+
+    通过共享的转码池运行，同时运行的 ffmpeg 进程数受 FFMPEG_MAX_WORKERS 限制。
+    先输出到临时文件再原子替换，正在读取旧文件的任务不会看到写了一半的内容。
+    """
+    part_path = _part_path(output_path)
+    try:
+        with time_stage("extract"):
+            get_ffmpeg_pool().run(_ffmpeg_extract_args(input_path, part_path, ffmpeg_codec))
+        os.replace(part_path, output_path)
+    finally:
+        try:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        except OSError:
+            pass
 
 
 def _get_ffmpeg_audio_codec(codec_name: str) -> str:
@@ -769,6 +1073,155 @@ def _get_ffmpeg_audio_codec(codec_name: str) -> str:
     return codec_mapping.get(codec_name.lower(), "aac")  # 默认使用aac
 
 
+# 同一 URL 的并发解析/下载只真正执行一次；下载结果按调用方数量登记引用，
+# 避免文件在仍被其他任务使用时被清理任务删除。
+_RESOLVE_FLIGHTS = SingleFlight()
+_DOWNLOAD_FLIGHTS = SingleFlight()
+FILE_LEASES = FileLeases()
+
+
+def release_file(path: Optional[str]) -> None:
+    """释放 lease=True 下载时为调用方登记的文件引用。"""
+    if path:
+        FILE_LEASES.release(path)
+
+
+def _coalesced_download(key, download, lease: bool) -> str:
+    def _acquire(path: str, callers: int) -> None:
+        FILE_LEASES.acquire(path, callers)
+
+    path, shared = _DOWNLOAD_FLIGHTS.do(key, download, on_complete=_acquire)
+    if shared:
+        report_progress("已复用进行中的相同下载任务", stage="download")
+    if not lease:
+        FILE_LEASES.release(path)
+    return path
+
+
+MEDIA_CACHE_INDEX = os.getenv(
+    "MEDIA_CACHE_INDEX",
+    os.path.join(ROOT_DIR, "data", "cache", "media_index.json"),
+)
+
+_media_cache: Optional[MediaCache] = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    """返回进程内共享的媒体缓存；进行中的任务登记了引用的文件不会被淘汰。"""
+    global _media_cache
+    with _media_cache_lock:
+        if _media_cache is None:
+            _media_cache = MediaCache(MEDIA_CACHE_INDEX, is_pinned=FILE_LEASES.is_leased)
+        return _media_cache
+
+
+# Web 应用的文件索引：设置后，下载到其数据目录的媒体文件按文件名分片存放并登记到索引
+_file_catalog: Optional[FileCatalog] = None
+
+
+def set_file_catalog(catalog: Optional[FileCatalog]) -> None:
+    global _file_catalog
+    _file_catalog = catalog
+
+
+def _media_path(output_dir: str, filename: str) -> str:
+    """媒体文件的本地路径：output_dir 是文件索引的根目录时放入分片目录，否则直接放在 output_dir 下。"""
+    catalog = _file_catalog
+    if catalog is not None and os.path.abspath(output_dir) == catalog.root:
+        return catalog.shard_path(filename)
+    return os.path.join(output_dir, filename)
+
+
+def _catalog_for(path: str) -> Optional[FileCatalog]:
+    catalog = _file_catalog
+    if catalog is not None and os.path.abspath(path).startswith(catalog.root + os.sep):
+        return catalog
+    return None
+
+
+def _record_media(path: Optional[str]) -> None:
+    """下载或转码写出文件后登记到文件索引（不在索引根目录下的文件忽略）。"""
+    catalog = _catalog_for(path) if path else None
+    if catalog is not None:
+        catalog.record(path)
+
+
+def _cached_media_download(cache_key: str, fetch) -> str:
+    """先查媒体缓存：新鲜期内直接复用；否则带条件请求头调用 fetch(validators)，
+    304 时复用缓存文件，下载了新文件则写入缓存。"""
+    entry, validators = _lookup_media(cache_key)
+    if validators is None:
+        return entry.path
+    return _store_media_fetch(cache_key, entry, fetch(validators))
+
+
+def _lookup_media(cache_key: str):
+    """返回 (缓存条目, 条件请求头)；条目仍在新鲜期内时条件请求头为 None，表示无需请求。"""
+    cache = get_media_cache()
+    entry = cache.lookup(cache_key)
+    if entry is not None and cache.is_fresh(entry):
+        report_progress("命中媒体缓存，跳过下载", stage="download")
+        return entry, None
+    return entry, cache.validators(entry)
+
+
+def _store_media_fetch(cache_key: str, entry, result: MediaFetch) -> str:
+    cache = get_media_cache()
+    if result.not_modified:
+        if entry is None:
+            raise RuntimeError("服务器返回 304，但本地没有对应的缓存文件")
+        cache.mark_revalidated(cache_key)
+        report_progress("源文件未变化，复用媒体缓存", stage="download")
+        return entry.path
+    cache.put(cache_key, result.path, etag=result.etag, last_modified=result.last_modified)
+    _record_media(result.path)
+    return result.path
+
+
+def fetch_cached_media(cache_key: str, lease: bool = False) -> Optional[str]:
+    """媒体缓存中有新鲜期内的文件时返回其路径（lease=True 时同时登记引用），否则返回 None。
+
+    用于跳过下载前的解析步骤（例如抖音短链解析），完全不发网络请求。
+    """
+    cache = get_media_cache()
+    entry = cache.lookup(cache_key)
+    if entry is None or not cache.is_fresh(entry):
+        return None
+    if lease:
+        FILE_LEASES.acquire(entry.path)
+    report_progress("命中媒体缓存，跳过解析与下载", stage="resolve")
+    return entry.path
+
+
+def douyin_media_cache_key(share_text: str) -> str:
+    """抖音音频的媒体缓存 key：按分享链接而不是带签名的音频直链索引。"""
+    return f"douyin:{_douyin_cache_key(share_text)}"
+
+
+def canonicalize_url(url: str) -> str:
+    """规范化 URL 作为去重 key：小写协议与域名，去掉默认端口、片段和末尾斜杠，查询参数排序。"""
+    from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+    raw = (url or "").strip()
+    try:
+        parts = urlsplit(raw)
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return raw
+    if port is None or (scheme, port) in {("http", 80), ("https", 443)}:
+        netloc = host
+    else:
+        netloc = f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
 def _get_system_proxies() -> dict:
     """获取系统环境变量中的代理设置
     
@@ -804,13 +1257,19 @@ def cleanup_old_files(data_dir: str = "./data", max_age_hours: float = 24.0) ->
     max_age_seconds = max_age_hours * 3600
     
     try:
-        # 获取目录中的所有文件
-        pattern = os.path.join(data_dir, "*")
-        files = glob.glob(pattern)
+        # 获取目录及其分片子目录（两位十六进制目录名）中的所有文件
+        files = glob.glob(os.path.join(data_dir, "*"))
+        files += glob.glob(os.path.join(data_dir, "[0-9a-f][0-9a-f]", "*"))
         
         cleaned_count = 0
         for file_path in files:
             if os.path.isfile(file_path):
+                # 仍被进行中的任务使用的文件不清理
+                if FILE_LEASES.is_leased(file_path):
+                    continue
+                # 媒体缓存中的文件由缓存按容量淘汰
+                if get_media_cache().contains_path(file_path):
+                    continue
                 try:
                     # 获取文件修改时间
                     file_mtime = os.path.getmtime(file_path)
@@ -819,6 +1278,9 @@ def cleanup_old_files(data_dir: str = "./data", max_age_hours: float = 24.0) ->
                     # 如果文件超过指定时间，则删除
                     if file_age > max_age_seconds:
                         os.remove(file_path)
+                        catalog = _catalog_for(file_path)
+                        if catalog is not None:
+                            catalog.remove(os.path.basename(file_path))
                         cleaned_count += 1
                         print(f"已清理过期文件: {os.path.basename(file_path)}", file=sys.stderr)
                 except Exception as e:
@@ -868,11 +1330,97 @@ def _extract_first_url(text: str) -> Optional[str]:
     return candidates[0]
 
 
-def resolve_douyin_aweme_id(short_or_share_text: str) -> str:
-    """解析抖音分享口令/短链，调用开放接口换取 aweme_id。"""
-    import requests
-    from urllib.parse import quote
+DOUYIN_CACHE_FILE = os.getenv(
+    "DOUYIN_CACHE_FILE",
+    os.path.join(ROOT_DIR, "data", "cache", "douyin_resolve.json"),
+)
+# aweme_id 与短链的对应关系不会变化，可以缓存更久
+AWEME_ID_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+_douyin_cache: Optional[ResolverCache] = None
+_douyin_cache_lock = threading.Lock()
+
+
+def set_cache_dir(cache_dir: str) -> None:
+    """把未通过环境变量指定路径的缓存文件放到 cache_dir 下（如 Vercel 上只有 /tmp 可写），需在首次使用缓存前调用。"""
+    global DOUYIN_CACHE_FILE, MEDIA_CACHE_INDEX
+    if not os.getenv("DOUYIN_CACHE_FILE"):
+        DOUYIN_CACHE_FILE = os.path.join(cache_dir, "douyin_resolve.json")
+    if not os.getenv("MEDIA_CACHE_INDEX"):
+        MEDIA_CACHE_INDEX = os.path.join(cache_dir, "media_index.json")
+    # JOB_TIMELINE_PATH 设为空字符串表示不记录，只在完全未设置时改用 cache_dir
+    if os.getenv("JOB_TIMELINE_PATH") is None:
+        set_timeline_path(os.path.join(cache_dir, "job_timeline.jsonl"))
+
+
+def get_douyin_cache() -> ResolverCache:
+    """返回进程内共享的抖音解析缓存（首次使用时从磁盘加载）。"""
+    global _douyin_cache
+    with _douyin_cache_lock:
+        if _douyin_cache is None:
+            _douyin_cache = ResolverCache(DOUYIN_CACHE_FILE)
+        return _douyin_cache
 
+
+def _douyin_cache_key(share_text: str) -> str:
+    short_url = _extract_first_url(share_text)
+    return canonicalize_url(short_url) if short_url else share_text.strip()
+
+
+def _signed_url_ttl(url: str, default_ttl: float, margin_seconds: float = 60) -> float:
+    """带签名过期时间（x-expires / expires）的直链，缓存时间不超过签名有效期。"""
+    from urllib.parse import parse_qs, urlparse
+
+    query = parse_qs(urlparse(url).query)
+    for name in ("x-expires", "expires", "Expires"):
+        values = query.get(name)
+        if values and values[0].isdigit():
+            return max(min(default_ttl, int(values[0]) - time.time() - margin_seconds), 0.0)
+    return default_ttl
+
+
+def _cache_lookup(cache: ResolverCache, cache_key: str) -> Optional[dict]:
+    """命中正缓存时返回结果，命中负缓存时直接抛出缓存的错误，未命中返回 None。"""
+    entry = cache.get(cache_key)
+    if entry is None:
+        return None
+    if entry.is_negative:
+        raise RuntimeError(entry.error)
+    report_progress("命中抖音解析缓存", stage="resolve")
+    return entry.value
+
+
+def _cached_resolve(namespace: str, key: str, resolve, ttl_for=None) -> dict:
+    """先查解析缓存；未命中时合并同 key 的并发请求并调用 resolve()。
+
+    成功结果按 TTL 缓存，失败结果写入短期负缓存，避免短时间内重复打接口。
+    """
+    cache = get_douyin_cache()
+    cache_key = f"{namespace}:{key}"
+
+    value = _cache_lookup(cache, cache_key)
+    if value is not None:
+        return value
+
+    def _leader() -> dict:
+        # 可能刚有另一次解析完成并写入缓存
+        cached = _cache_lookup(cache, cache_key)
+        if cached is not None:
+            return cached
+        try:
+            result = resolve()
+        except Exception as e:
+            cache.put_error(cache_key, str(e))
+            raise
+        cache.put(cache_key, result, ttl_for(result) if ttl_for else None)
+        return result
+
+    value, _ = _RESOLVE_FLIGHTS.do(cache_key, _leader)
+    return value
+
+
+def resolve_douyin_aweme_id(short_or_share_text: str) -> str:
+    """解析抖音分享口令/短链，调用开放接口换取 aweme_id（结果带缓存）。"""
     short_url = short_or_share_text.strip()
     if not short_url.startswith("http"):
         extracted = _extract_first_url(short_or_share_text)
@@ -880,10 +1428,28 @@ def resolve_douyin_aweme_id(short_or_share_text: str) -> str:
             raise RuntimeError("未在输入中找到有效的抖音短链 URL")
         short_url = extracted
 
-    api = (
+    value = _cached_resolve(
+        "aweme_id",
+        canonicalize_url(short_url),
+        lambda: {"aweme_id": _request_aweme_id(short_url)},
+        ttl_for=lambda _: AWEME_ID_CACHE_TTL_SECONDS,
+    )
+    return str(value["aweme_id"])
+
+
+def _douyin_wtf_aweme_api(short_url: str) -> str:
+    from urllib.parse import quote
+
+    return (
         "https://douyin.wtf/api/douyin/web/get_aweme_id?url="
         + quote(short_url, safe="")
     )
+
+
+def _request_aweme_id(short_url: str) -> str:
+    import requests
+
+    api = _douyin_wtf_aweme_api(short_url)
     proxies = _get_system_proxies()
     try:
         resp = requests.get(api, timeout=15, proxies=proxies if proxies else None)
@@ -892,6 +1458,10 @@ def resolve_douyin_aweme_id(short_or_share_text: str) -> str:
     except Exception as e:
         raise RuntimeError(f"请求 aweme_id 失败：{e}")
 
+    return _parse_aweme_id_response(data)
+
+
+def _parse_aweme_id_response(data) -> str:
     if not isinstance(data, dict) or data.get("code") != 200:
         raise RuntimeError(f"接口返回异常：{data}")
     aweme_id = data.get("data")
@@ -901,10 +1471,23 @@ def resolve_douyin_aweme_id(short_or_share_text: str) -> str:
 
 
 def fetch_douyin_audio_url(aweme_id: str) -> str:
-    """根据 aweme_id 获取音频直链 URL。"""
+    """根据 aweme_id 获取音频直链 URL（结果带缓存）。"""
+    return str(_fetch_douyin_audio_info(aweme_id)["audio_url"])
+
+
+def _fetch_douyin_audio_info(aweme_id: str) -> dict:
+    return _cached_resolve(
+        "audio_url",
+        str(aweme_id),
+        lambda: _request_douyin_audio_info(aweme_id),
+        ttl_for=lambda v: _signed_url_ttl(v["audio_url"], get_douyin_cache().ttl_seconds),
+    )
+
+
+def _request_douyin_audio_info(aweme_id: str) -> dict:
     import requests
 
-    api = f"https://douyin.wtf/api/douyin/web/fetch_one_video?aweme_id={aweme_id}"
+    api = _douyin_wtf_video_api(aweme_id)
     proxies = _get_system_proxies()
     try:
         resp = requests.get(api, timeout=20, proxies=proxies if proxies else None)
@@ -913,12 +1496,19 @@ def fetch_douyin_audio_url(aweme_id: str) -> str:
     except Exception as e:
         raise RuntimeError(f"请求音频信息失败：{e}")
 
+    return _parse_douyin_audio_info(j)
+
+
+def _douyin_wtf_video_api(aweme_id: str) -> str:
+    return f"https://douyin.wtf/api/douyin/web/fetch_one_video?aweme_id={aweme_id}"
+
+
+def _parse_douyin_audio_info(j) -> dict:
+    """从 fetch_one_video 返回的 JSON 中提取音频直链与标题。"""
     try:
-        detail = (
-            j.get("data", {})
-            .get("aweme_detail", {})
-            .get("video", {})
-        )
+        aweme_detail = j.get("data", {}).get("aweme_detail", {})
+        title = aweme_detail.get("desc")
+        detail = aweme_detail.get("video", {})
         bit_rate_audio = detail.get("bit_rate_audio") or []
         # 优先第一个可用
         for item in bit_rate_audio:
@@ -926,55 +1516,140 @@ def fetch_douyin_audio_url(aweme_id: str) -> str:
             url_list = meta.get("url_list") or {}
             main_url = url_list.get("main_url") or url_list.get("backup_url_1")
             if main_url:
-                return main_url
+                return {"audio_url": main_url, "title": title}
         # 兜底：某些结构可能直接给 url_list 数组
         url_list = detail.get("play_addr", {}).get("url_list")
         if isinstance(url_list, list) and url_list:
-            return url_list[0]
+            return {"audio_url": url_list[0], "title": title}
     except Exception:
         pass
     raise RuntimeError("未能从返回数据中解析到音频直链")
 
 
-def fetch_douyin_mp3_via_tiksave(share_text: str):
-    """调用 downcats 接口，提取抖音音频直链及元信息。
+_douyin_resolver: Optional[HedgedResolver] = None
+_douyin_resolver_lock = threading.Lock()
+
+
+def get_douyin_resolver() -> HedgedResolver:
+    """返回进程内共享的抖音解析器（downcats 与 douyin.wtf 两个后端竞速）。"""
+    global _douyin_resolver
+    with _douyin_resolver_lock:
+        if _douyin_resolver is None:
+            _douyin_resolver = HedgedResolver(
+                [
+                    ResolverBackend("downcats", _resolve_via_downcats),
+                    ResolverBackend("douyin.wtf", _resolve_via_douyin_wtf),
+                ]
+            )
+        return _douyin_resolver
+
+
+def _douyin_id_from_text(share_text: str) -> Optional[str]:
+    match = re.search(r"douyin\.com/(?:video|note)/(\d+)|modal_id=(\d+)", share_text or "")
+    if not match:
+        return None
+    return match.group(1) or match.group(2)
+
+
+def _normalize_douyin_resolution(share_text: str, mp3_url: str, title: Optional[str]) -> dict:
+    # 视频 ID 只取自输入链接本身，保证无论哪个后端胜出，结果（及输出文件名）都一致
+    return {
+        "mp3_url": mp3_url,
+        "title": (title or "").strip() or None,
+        "tiktok_id": _douyin_id_from_text(share_text),
+    }
+
+
+def _resolve_via_downcats(share_text: str) -> dict:
+    mp3_url, title, _ = _request_downcats(share_text)
+    return _normalize_douyin_resolution(share_text, mp3_url, title)
+
+
+def _resolve_via_douyin_wtf(share_text: str) -> dict:
+    info = _fetch_douyin_audio_info(resolve_douyin_aweme_id(share_text))
+    return _normalize_douyin_resolution(share_text, info["audio_url"], info.get("title"))
+
+
+def resolve_douyin_audio(share_text: str):
+    """解析抖音分享口令/短链，返回 (mp3_url, title, tiktok_id)。
+
+    先查解析缓存；未命中时按健康度先请求最快的接口，超过对冲延迟仍未返回再并行请求另一个，
+    连续失败的接口会被熔断。
 
     Returns:
         (mp3_url, title, tiktok_id)
     """
-    import requests
-    import json
+    def _resolve() -> dict:
+        with time_stage("resolve"):
+            value, backend = get_douyin_resolver().resolve(share_text)
+        report_progress(f"抖音解析完成（{backend}）", stage="resolve")
+        return value
+
+    value = _cached_resolve(
+        "douyin",
+        _douyin_cache_key(share_text),
+        _resolve,
+        ttl_for=lambda v: _signed_url_ttl(v["mp3_url"], get_douyin_cache().ttl_seconds),
+    )
+    return value["mp3_url"], value.get("title"), value.get("tiktok_id")
 
-    url = "https://www.downcats.com/v1/extract/free/video"
-    proxies = _get_system_proxies()
 
-    headers = {
-        "Accept": "*/*",
-        "Accept-Language": "zh-CN,zh;q=0.9,en-US;q=0.8,en;q=0.7,zh-TW;q=0.6",
-        "Connection": "keep-alive",
-        "Content-Type": "application/json",
-        "Origin": "https://www.downcats.com",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin",
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/134.0.0.0 Safari/537.36"
-        ),
-    }
-    
-    payload = {
+def fetch_douyin_mp3_via_tiksave(share_text: str):
+    """调用 downcats 接口，提取抖音音频直链及元信息。
+
+    结果按规范化后的短链缓存（含短期负缓存），同一短链的并发请求合并为一次接口调用。
+
+    Returns:
+        (mp3_url, title, tiktok_id)
+    """
+    def _resolve() -> dict:
+        mp3_url, title, tiktok_id = _request_downcats(share_text)
+        return {"mp3_url": mp3_url, "title": title, "tiktok_id": tiktok_id}
+
+    value = _cached_resolve(
+        "downcats",
+        _douyin_cache_key(share_text),
+        _resolve,
+        ttl_for=lambda v: _signed_url_ttl(v["mp3_url"], get_douyin_cache().ttl_seconds),
+    )
+    return value["mp3_url"], value.get("title"), value.get("tiktok_id")
+
+
+DOWNCATS_API_URL = "https://www.downcats.com/v1/extract/free/video"
+DOWNCATS_HEADERS = {
+    "Accept": "*/*",
+    "Accept-Language": "zh-CN,zh;q=0.9,en-US;q=0.8,en;q=0.7,zh-TW;q=0.6",
+    "Connection": "keep-alive",
+    "Content-Type": "application/json",
+    "Origin": "https://www.downcats.com",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin",
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/134.0.0.0 Safari/537.36"
+    ),
+}
+
+
+def _downcats_payload(share_text: str) -> dict:
+    return {
         "text": share_text,
         "locale": "zh"
     }
 
+
+def _request_downcats(share_text: str):
+    import requests
+
+    proxies = _get_system_proxies()
     try:
-        print("请求 downcats 接口...", file=sys.stderr)
+        report_progress("请求 downcats 接口...", stage="resolve")
         resp = requests.post(
-            url,
-            headers=headers,
-            json=payload,
+            DOWNCATS_API_URL,
+            headers=DOWNCATS_HEADERS,
+            json=_downcats_payload(share_text),
             timeout=30,
             proxies=proxies if proxies else None
         )
@@ -983,6 +1658,11 @@ def fetch_douyin_mp3_via_tiksave(share_text: str):
     except Exception as e:
         raise RuntimeError(f"downcats 接口请求失败：{e}")
 
+    return _parse_downcats_response(j)
+
+
+def _parse_downcats_response(j):
+    """从 downcats 返回的 JSON 中提取 (mp3_url, title, tiktok_id)。"""
     if not isinstance(j, dict) or j.get("code") != "OK":
         raise RuntimeError(f"downcats 返回异常：{j}")
 
@@ -1009,13 +1689,34 @@ def download_audio_from_direct_url(
     output_dir: str = "./data",
     preferred_ext: str = "m4a",
     filename_stem: Optional[str] = None,
+    lease: bool = False,
+    cache_key: Optional[str] = None,
 ) -> str:
-    """下载音频直链到本地并返回文件路径。默认保存为 m4a。"""
-    import requests
-    from urllib.parse import urlparse
+    """下载音频直链到本地并返回文件路径。默认保存为 m4a。
 
-    os.makedirs(output_dir, exist_ok=True)
-    proxies = _get_system_proxies()
+    同一 URL 的并发下载合并为一次，所有调用方共享同一文件；lease=True 时
+    返回的文件已为调用方登记引用，使用完毕后需调用 release_file(path)。
+    结果写入媒体缓存，cache_key 默认为规范化后的 URL。
+    """
+    cache_key = cache_key or f"audio:{canonicalize_url(audio_url)}"
+    key = ("audio", cache_key, os.path.abspath(output_dir))
+    return _coalesced_download(
+        key,
+        lambda: _cached_media_download(
+            cache_key,
+            lambda validators: _download_audio_file(audio_url, output_dir, preferred_ext, filename_stem, validators),
+        ),
+        lease,
+    )
+
+
+def _direct_audio_path(
+    audio_url: str,
+    output_dir: str,
+    preferred_ext: str,
+    filename_stem: Optional[str],
+) -> str:
+    from urllib.parse import urlparse
 
     parsed = urlparse(audio_url)
     # 从 URL 推断扩展名
@@ -1027,33 +1728,86 @@ def download_audio_from_direct_url(
         ext = "." + preferred_ext.lstrip(".")
 
     if not filename_stem:
-        filename_stem = f"douyin_{int(time.time())}"
-    out_path = os.path.join(output_dir, filename_stem + ext)
+        filename_stem = f"douyin_{_url_digest(audio_url)}"
+    return _media_path(output_dir, filename_stem + ext)
+
+
+def _download_audio_file(
+    audio_url: str,
+    output_dir: str,
+    preferred_ext: str,
+    filename_stem: Optional[str],
+    validators: Optional[dict] = None,
+) -> MediaFetch:
+    import requests
+
+    os.makedirs(output_dir, exist_ok=True)
+    proxies = _get_system_proxies()
+
+    out_path = _direct_audio_path(audio_url, output_dir, preferred_ext, filename_stem)
+    # 先写入临时文件再原子替换，其他任务不会读到下载了一半的文件
+    part_path = out_path + ".part"
 
     try:
-        print(f"开始下载音频：{audio_url}", file=sys.stderr)
-        with requests.get(audio_url, stream=True, timeout=60, proxies=proxies if proxies else None) as r:
+        report_progress(f"开始下载音频：{audio_url}", stage="download")
+        started = time.perf_counter()
+        with requests.get(
+            audio_url,
+            stream=True,
+            timeout=60,
+            headers=validators or None,
+            proxies=proxies if proxies else None,
+        ) as r:
+            if r.status_code == 304:
+                return MediaFetch(not_modified=True)
             r.raise_for_status()
+            fetch = MediaFetch(out_path, r.headers.get("etag"), r.headers.get("last-modified"))
             total = int(r.headers.get("content-length", 0))
             downloaded = 0
             last_pct = -5
-            with open(out_path, "wb") as f:
+            with open(part_path, "wb") as f:
                 for chunk in r.iter_content(chunk_size=8192):
                     if not chunk:
                         continue
                     f.write(chunk)
+                    downloaded += len(chunk)
                     if total > 0:
-                        downloaded += len(chunk)
                         pct = int(downloaded * 100 / max(total, 1))
                         if pct >= last_pct + 5:
                             last_pct = pct
-                            print(f"下载进度：{pct}%", file=sys.stderr)
+                            report_progress(f"下载进度：{pct}%", stage="download", percent=pct)
+        os.replace(part_path, out_path)
+        record_bytes("download", downloaded)
+        observe_stage("download", started, time.perf_counter())
     except Exception as e:
+        try:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        except Exception:
+            pass
         raise RuntimeError(f"下载音频失败：{e}")
 
-    return out_path
+    return fetch
 
 def main() -> None:
+    # 记录本次运行各阶段的耗时，结束时输出摘要并追加到时间线日志
+    with job_timeline(f"cli-{int(time.time() * 1000)}", "cli") as timeline:
+        status = "error"
+        try:
+            _cli_main()
+            status = "ok"
+        finally:
+            record = timeline.finish(status)
+            # --help、参数错误等未进入任何阶段的运行不记录
+            if record["stages"]:
+                print(f"耗时：{format_timeline(record)}", file=sys.stderr)
+                try:
+                    get_timeline_log().append(record)
+                except OSError as e:
+                    print(f"写入时间线日志失败：{e}", file=sys.stderr)
+
+
+def _cli_main() -> None:
     parser = argparse.ArgumentParser(
         description="使用 Gemini 将音频转为文本（默认模型：gemini-2.5-flash）",
     )
@@ -1094,7 +1848,7 @@ def main() -> None:
     src_group.add_argument(
         "--youtube",
         dest="youtube_url",
-        help="YouTube 视频链接（通过 Gemini 直连转写，仅支持公开视频）",
+        help="YouTube 视频链接（通过 Gemini 直连转写，失败时回退为 yt-dlp 下载音频后转写）",
     )
     src_group.add_argument(
         "--video-url",
@@ -1141,7 +1895,7 @@ def main() -> None:
     parser.add_argument(
         "--cookies",
         dest="cookies_path",
-        help="兼容旧参数；YouTube 直连模式不会使用 cookies",
+        help="YouTube 直连转写失败、回退为 yt-dlp 下载音频时使用的 cookies 文件",
     )
     parser.add_argument(
         "--media-resolution",
@@ -1161,6 +1915,8 @@ def main() -> None:
 
     # Ensure dependency present
     ensure_package()
+    # 下载与抽取音频期间在后台导入 google-genai
+    warm_imports()
 
     # Configure proxies if provided
     set_proxies(args.proxy, args.proxy_http, args.proxy_https)
@@ -1210,18 +1966,20 @@ def main() -> None:
         data_dir = os.path.join(".", "data")
         os.makedirs(data_dir, exist_ok=True)
         try:
-            mp3_url, title, tiktok_id = fetch_douyin_mp3_via_tiksave(args.douyin_share_or_url)
-            print("获取到 MP3 直链，开始下载...", file=sys.stderr)
-            if tiktok_id:
-                filename_stem = f"douyin_{tiktok_id}"
-            else:
-                filename_stem = f"douyin_{int(time.time())}"
-            audio_path = download_audio_from_direct_url(
-                mp3_url,
-                output_dir=data_dir,
-                preferred_ext="mp3",
-                filename_stem=filename_stem,
-            )
+            media_key = douyin_media_cache_key(args.douyin_share_or_url)
+            audio_path = fetch_cached_media(media_key)
+            if audio_path is None:
+                mp3_url, title, tiktok_id = resolve_douyin_audio(args.douyin_share_or_url)
+                print("获取到 MP3 直链，开始下载...", file=sys.stderr)
+                # 没有作品 ID 时由 _direct_audio_path 按直链哈希命名
+                filename_stem = f"douyin_{tiktok_id}" if tiktok_id else None
+                audio_path = download_audio_from_direct_url(
+                    mp3_url,
+                    output_dir=data_dir,
+                    preferred_ext="mp3",
+                    filename_stem=filename_stem,
+                    cache_key=media_key,
+                )
         except Exception as e:
             print(f"处理抖音链接失败：{e}", file=sys.stderr)
             sys.exit(1)
@@ -1231,17 +1989,46 @@ def main() -> None:
     try:
         # Stream to stdout and capture full transcript
         if getattr(args, "youtube_url", None):
-            result = transcribe_youtube_url_streaming(
-                api_key=auth_config.api_key,
-                youtube_url=args.youtube_url,
-                model_name=args.model_name,
-                language_hint=args.language_hint,
-                auth_mode=auth_config.auth_mode,
-                vertex_json=auth_config.vertex_json,
-                vertex_project=auth_config.vertex_project,
-                vertex_location=auth_config.vertex_location,
-                media_resolution=args.media_resolution,
-            )
+            emitted = []
+
+            def print_chunk(delta: str) -> None:
+                emitted.append(delta)
+                print(delta, end="", flush=True)
+
+            try:
+                result = transcribe_youtube_url_streaming(
+                    api_key=auth_config.api_key,
+                    youtube_url=args.youtube_url,
+                    model_name=args.model_name,
+                    language_hint=args.language_hint,
+                    auth_mode=auth_config.auth_mode,
+                    vertex_json=auth_config.vertex_json,
+                    vertex_project=auth_config.vertex_project,
+                    vertex_location=auth_config.vertex_location,
+                    media_resolution=args.media_resolution,
+                    on_chunk=print_chunk,
+                )
+            except Exception as e:
+                if emitted:
+                    # 已输出部分转写文本，回退后会从头重新输出，不再回退
+                    raise
+                print(f"\nYouTube 直连转写失败：{e}，改为下载音频后转写...", file=sys.stderr)
+                RETRIES_TOTAL.inc(operation="youtube_download")
+                audio_path = download_audio_from_youtube(
+                    args.youtube_url,
+                    output_dir=os.path.join(".", "data"),
+                    cookies_path=args.cookies_path,
+                )
+                result = transcribe_audio_streaming(
+                    api_key=auth_config.api_key,
+                    audio_path=audio_path,
+                    model_name=args.model_name,
+                    language_hint=args.language_hint,
+                    auth_mode=auth_config.auth_mode,
+                    vertex_json=auth_config.vertex_json,
+                    vertex_project=auth_config.vertex_project,
+                    vertex_location=auth_config.vertex_location,
+                )
         else:
             if not audio_path:
                 raise RuntimeError("缺少音频文件路径")
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+
+
+DEFAULT_MAX_BYTES = int(float(os.getenv("MEDIA_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+DEFAULT_FRESH_SECONDS = float(os.getenv("MEDIA_CACHE_FRESH_SECONDS", str(24 * 3600)))
+# 刚写入或刚命中的条目在这段时间内不淘汰，避免调用方还没来得及登记引用就被删除
+EVICTION_GRACE_SECONDS = 60.0
+# 仅更新访问时间时，最多每隔这么久写一次索引
+ACCESS_SAVE_INTERVAL_SECONDS = 30.0
+
+
+@dataclass
+class MediaEntry:
+    path: str
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    validated_at: float = 0.0
+    last_access: float = 0.0
+
+
+@dataclass
+class MediaFetch:
+    """一次（条件）下载的结果：not_modified=True 表示服务器返回 304，缓存文件仍可用。"""
+    path: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+
+
+class MediaCache:
+    """已下载源音频的缓存：按 key（规范化 URL 等）索引本地文件，总大小超过 max_bytes 时按 LRU 淘汰。
+
+    新鲜期内的条目直接复用；过期后带 ETag/Last-Modified 做条件请求，304 时继续复用。
+    is_pinned(path) 为 True 的文件（进行中的任务正在使用）不会被淘汰。
+
+    索引是进程内维护的 JSON 文件，is_pinned 也只知道本进程的租约，
+    因此同一个索引文件只应由一个进程使用；多进程部署请为每个进程配置不同的索引路径与下载目录。
+    """
+
+    def __init__(
+        self,
+        index_path: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        fresh_seconds: float = DEFAULT_FRESH_SECONDS,
+        is_pinned: Optional[Callable[[str], bool]] = None,
+        clock=time.time,
+    ):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self._is_pinned = is_pinned or (lambda path: False)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, MediaEntry] = self._load()
+        self._last_save = 0.0
+
+    def _load(self) -> Dict[str, MediaEntry]:
+        if not self.index_path or not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = {}
+            for key, raw in (data.get("entries") or {}).items():
+                entry = MediaEntry(**raw)
+                if os.path.isfile(entry.path):
+                    entries[key] = entry
+            return entries
+        except Exception:
+            return {}
+
+    def _save_locked(self) -> None:
+        self._last_save = self._clock()
+        if not self.index_path:
+            return
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        payload = {"entries": {key: asdict(entry) for key, entry in self._entries.items()}}
+        try:
+            parent = os.path.dirname(self.index_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except Exception:
+            # 索引写盘失败不影响主流程
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def lookup(self, key: str) -> Optional[MediaEntry]:
+        """返回缓存条目并刷新其访问时间；文件已不存在时删除条目并返回 None。"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.isfile(entry.path):
+                del self._entries[key]
+                self._save_locked()
+                return None
+            entry.last_access = now
+            if now - self._last_save >= ACCESS_SAVE_INTERVAL_SECONDS:
+                self._save_locked()
+            return MediaEntry(**asdict(entry))
+
+    def is_fresh(self, entry: MediaEntry) -> bool:
+        return self._clock() - entry.validated_at < self.fresh_seconds
+
+    @staticmethod
+    def validators(entry: Optional[MediaEntry]) -> Dict[str, str]:
+        """条件请求头；条目没有校验信息时返回空字典（只能重新下载）。"""
+        headers: Dict[str, str] = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def mark_revalidated(self, key: str) -> None:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.validated_at = now
+                entry.last_access = now
+                self._save_locked()
+
+    def put(
+        self,
+        key: str,
+        path: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> MediaEntry:
+        now = self._clock()
+        entry = MediaEntry(
+            path=os.path.abspath(path),
+            size=os.path.getsize(path),
+            etag=etag,
+            last_modified=last_modified,
+            validated_at=now,
+            last_access=now,
+        )
+        target = self._normalize(entry.path)
+        with self._lock:
+            # 一个文件只归属一个 key：其他 key 指向同一路径时文件已被覆盖，旧条目作废
+            for other in [k for k, e in self._entries.items() if k != key and self._normalize(e.path) == target]:
+                del self._entries[other]
+            self._entries[key] = entry
+            self._evict_locked(now)
+            self._save_locked()
+        return entry
+
+    def invalidate(self, key: str, remove_file: bool = False) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            if remove_file:
+                self._remove_file_locked(entry.path)
+            self._save_locked()
+
+    def contains_path(self, path: str) -> bool:
+        target = self._normalize(path)
+        with self._lock:
+            return any(self._normalize(entry.path) == target for entry in self._entries.values())
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def _remove_file_locked(self, path: str) -> None:
+        # 其他条目仍指向同一文件时保留文件
+        target = self._normalize(path)
+        if any(self._normalize(entry.path) == target for entry in self._entries.values()):
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict_locked(self, now: float) -> None:
+        total = sum(entry.size for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k].last_access):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if now - entry.last_access < EVICTION_GRACE_SECONDS or self._is_pinned(entry.path):
+                continue
+            del self._entries[key]
+            total -= entry.size
+            self._remove_file_locked(entry.path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,679 @@
+import asyncio
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+
+MANIFEST_HLS = "hls"
+MANIFEST_DASH = "dash"
+DEFAULT_SEGMENT_WORKERS = int(os.getenv("MANIFEST_SEGMENT_WORKERS", "4"))
+
+HLS_CONTENT_TYPES = ("application/vnd.apple.mpegurl", "application/x-mpegurl", "audio/mpegurl")
+DASH_CONTENT_TYPES = ("application/dash+xml",)
+AUDIO_CODEC_PREFIXES = ("mp4a", "opus", "ac-3", "ec-3", "flac", "vorbis", "mp3", "alac")
+VIDEO_CODEC_PREFIXES = ("avc", "hvc", "hev", "vp8", "vp9", "vp09", "av01", "dvh", "mp4v")
+
+
+@dataclass
+class Segment:
+    url: str
+    # (start, end) 闭区间字节范围；None 表示整个资源
+    byte_range: Optional[Tuple[int, int]] = None
+
+
+@dataclass
+class SegmentPlan:
+    segments: List[Segment]
+    init_segment: Optional[Segment] = None
+    container: str = "ts"
+    audio_only: bool = False
+    bandwidth: int = 0
+
+
+@dataclass
+class Rendition:
+    uri: str
+    bandwidth: int = 0
+    codecs: str = ""
+    audio_only: bool = False
+    audio_group: Optional[str] = None
+    # DASH 清单自带分片信息，可直接得到下载计划；HLS 需要再拉取媒体播放列表
+    plan: Optional[SegmentPlan] = field(default=None, repr=False)
+
+
+def detect_manifest_type(url: str, content_type: Optional[str] = None) -> Optional[str]:
+    """根据 URL 扩展名或 Content-Type 判断是否为 HLS/DASH 清单。"""
+    path = (urlparse(url).path or "").lower()
+    if path.endswith(".m3u8") or path.endswith(".m3u"):
+        return MANIFEST_HLS
+    if path.endswith(".mpd"):
+        return MANIFEST_DASH
+    mime = (content_type or "").split(";", 1)[0].strip().lower()
+    if mime in HLS_CONTENT_TYPES:
+        return MANIFEST_HLS
+    if mime in DASH_CONTENT_TYPES:
+        return MANIFEST_DASH
+    return None
+
+
+def _codecs_are_audio_only(codecs: str) -> bool:
+    items = [c.strip().lower() for c in codecs.split(",") if c.strip()]
+    if not items:
+        return False
+    if any(c.startswith(VIDEO_CODEC_PREFIXES) for c in items):
+        return False
+    return all(c.startswith(AUDIO_CODEC_PREFIXES) for c in items)
+
+
+def _container_from_url(url: str, default: str = "ts") -> str:
+    ext = os.path.splitext(urlparse(url).path or "")[1].lower().lstrip(".")
+    if ext in {"m4s", "mp4", "m4a", "cmfa", "cmfv"}:
+        return "mp4"
+    if ext in {"ts", "aac", "mp3", "webm"}:
+        return ext
+    return default
+
+
+def select_rendition(renditions: List[Rendition]) -> Rendition:
+    """优先选择码率最低的纯音频轨；没有纯音频轨时选择码率最低的变体。"""
+    if not renditions:
+        raise RuntimeError("清单中没有可用的媒体轨")
+    audio = [r for r in renditions if r.audio_only]
+    pool = audio or renditions
+    # 码率未知（0）的排在已知码率之后
+    return min(pool, key=lambda r: (r.bandwidth <= 0, r.bandwidth))
+
+
+# ---------------------------------------------------------------------------
+# HLS
+# ---------------------------------------------------------------------------
+
+_HLS_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def _parse_hls_attributes(text: str) -> Dict[str, str]:
+    return {key: value.strip('"') for key, value in _HLS_ATTR_RE.findall(text)}
+
+
+def is_hls_master_playlist(text: str) -> bool:
+    return "#EXT-X-STREAM-INF" in text or "#EXT-X-MEDIA:" in text
+
+
+def parse_hls_master(text: str, base_url: str) -> List[Rendition]:
+    """解析 HLS 主播放列表，返回所有变体及独立音频轨。"""
+    variants: List[Rendition] = []
+    audio_media: List[Rendition] = []
+    pending_attrs: Optional[Dict[str, str]] = None
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            pending_attrs = _parse_hls_attributes(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA:"):
+            attrs = _parse_hls_attributes(line.split(":", 1)[1])
+            if attrs.get("TYPE") == "AUDIO" and attrs.get("URI"):
+                audio_media.append(
+                    Rendition(
+                        uri=urljoin(base_url, attrs["URI"]),
+                        audio_only=True,
+                        audio_group=attrs.get("GROUP-ID"),
+                    )
+                )
+        elif line.startswith("#"):
+            continue
+        elif pending_attrs is not None:
+            codecs = pending_attrs.get("CODECS", "")
+            variants.append(
+                Rendition(
+                    uri=urljoin(base_url, line),
+                    bandwidth=int(pending_attrs.get("BANDWIDTH", "0") or 0),
+                    codecs=codecs,
+                    audio_only=_codecs_are_audio_only(codecs) and "RESOLUTION" not in pending_attrs,
+                    audio_group=pending_attrs.get("AUDIO"),
+                )
+            )
+            pending_attrs = None
+
+    # EXT-X-MEDIA 本身不带码率，用引用该音频组的最低变体码率近似
+    for media in audio_media:
+        group_bandwidths = [
+            v.bandwidth for v in variants if v.audio_group == media.audio_group and v.bandwidth > 0
+        ]
+        media.bandwidth = min(group_bandwidths) if group_bandwidths else 0
+
+    return audio_media + variants
+
+
+def parse_hls_media_playlist(text: str, base_url: str) -> SegmentPlan:
+    """解析 HLS 媒体播放列表，返回按顺序排列的分片下载计划。"""
+    segments: List[Segment] = []
+    init_segment: Optional[Segment] = None
+    pending_range: Optional[Tuple[int, Optional[int]]] = None
+    last_range_end: Dict[str, int] = {}
+    is_vod = False
+
+    def _resolve_range(url: str, spec: Tuple[int, Optional[int]]) -> Tuple[int, int]:
+        length, offset = spec
+        if offset is None:
+            offset = last_range_end.get(url, 0)
+        last_range_end[url] = offset + length
+        return offset, offset + length - 1
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-KEY:"):
+            method = _parse_hls_attributes(line.split(":", 1)[1]).get("METHOD", "NONE")
+            if method.upper() != "NONE":
+                raise RuntimeError(f"暂不支持加密的 HLS 流（METHOD={method}）")
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = _parse_hls_attributes(line.split(":", 1)[1])
+            map_url = urljoin(base_url, attrs.get("URI", ""))
+            map_range = None
+            if attrs.get("BYTERANGE"):
+                map_range = _resolve_range(map_url, _parse_hls_byterange(attrs["BYTERANGE"]))
+            init_segment = Segment(url=map_url, byte_range=map_range)
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            pending_range = _parse_hls_byterange(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-ENDLIST") or line.upper() == "#EXT-X-PLAYLIST-TYPE:VOD":
+            is_vod = True
+        elif line.startswith("#"):
+            continue
+        else:
+            url = urljoin(base_url, line)
+            byte_range = _resolve_range(url, pending_range) if pending_range else None
+            segments.append(Segment(url=url, byte_range=byte_range))
+            pending_range = None
+
+    if not is_vod:
+        raise RuntimeError("暂不支持直播 HLS 流（播放列表缺少 EXT-X-ENDLIST）")
+    if not segments:
+        raise RuntimeError("HLS 播放列表中没有分片")
+
+    container = "mp4" if init_segment else _container_from_url(segments[0].url)
+    return SegmentPlan(segments=segments, init_segment=init_segment, container=container)
+
+
+def _parse_hls_byterange(value: str) -> Tuple[int, Optional[int]]:
+    length, _, offset = value.strip().strip('"').partition("@")
+    return int(length), (int(offset) if offset else None)
+
+
+def _variant_plan(chosen: Rendition, text: str) -> SegmentPlan:
+    """解析选中变体的媒体播放列表，并带上变体的纯音频标记与码率。"""
+    plan = parse_hls_media_playlist(text, chosen.uri)
+    plan.audio_only = chosen.audio_only
+    plan.bandwidth = chosen.bandwidth
+    return plan
+
+
+# ---------------------------------------------------------------------------
+# DASH
+# ---------------------------------------------------------------------------
+
+_ISO_DURATION_RE = re.compile(
+    r"^P(?:(?P<days>\d+(?:\.\d+)?)D)?"
+    r"(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$"
+)
+_TEMPLATE_RE = re.compile(r"\$(RepresentationID|Number|Time|Bandwidth)(%0\d+d)?\$")
+
+
+def parse_iso_duration(value: Optional[str]) -> float:
+    """把 ISO 8601 时长（如 PT1H2M3.5S）转换为秒。"""
+    if not value:
+        return 0.0
+    match = _ISO_DURATION_RE.match(value.strip())
+    if not match:
+        raise RuntimeError(f"无法解析 DASH 时长：{value}")
+    parts = {k: float(v) for k, v in match.groupdict().items() if v}
+    return (
+        parts.get("days", 0.0) * 86400
+        + parts.get("hours", 0.0) * 3600
+        + parts.get("minutes", 0.0) * 60
+        + parts.get("seconds", 0.0)
+    )
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _children(node: ET.Element, name: str) -> List[ET.Element]:
+    return [child for child in node if _local(child.tag) == name]
+
+
+def _child(node: Optional[ET.Element], name: str) -> Optional[ET.Element]:
+    if node is None:
+        return None
+    found = _children(node, name)
+    return found[0] if found else None
+
+
+def _join_base_url(base_url: str, node: ET.Element) -> str:
+    base = _child(node, "BaseURL")
+    if base is not None and base.text and base.text.strip():
+        return urljoin(base_url, base.text.strip())
+    return base_url
+
+
+def _fill_template(template: str, rep_id: str, bandwidth: int, number: int = 0, time_value: int = 0) -> str:
+    def _sub(match: "re.Match[str]") -> str:
+        name, fmt = match.group(1), match.group(2)
+        value = {"RepresentationID": rep_id, "Number": number, "Time": time_value, "Bandwidth": bandwidth}[name]
+        if fmt and name != "RepresentationID":
+            return ("%" + fmt[1:]) % value
+        return str(value)
+
+    return _TEMPLATE_RE.sub(_sub, template).replace("$$", "$")
+
+
+def _template_segments(
+    attrs: Dict[str, str],
+    timeline: Optional[ET.Element],
+    base_url: str,
+    rep_id: str,
+    bandwidth: int,
+    period_seconds: float,
+) -> List[Segment]:
+    media = attrs.get("media")
+    if not media:
+        raise RuntimeError("DASH SegmentTemplate 缺少 media 属性")
+    timescale = int(attrs.get("timescale", "1") or 1)
+    number = int(attrs.get("startNumber", "1") or 1)
+    segments: List[Segment] = []
+
+    if timeline is not None:
+        current_time = 0
+        for entry in _children(timeline, "S"):
+            if entry.get("t") is not None:
+                current_time = int(entry.get("t"))
+            duration = int(entry.get("d", "0"))
+            repeat = int(entry.get("r", "0"))
+            if repeat < 0:
+                # r=-1 表示重复到 Period 结束
+                remaining = period_seconds * timescale - current_time
+                repeat = max(int(math.ceil(remaining / duration)) - 1, 0) if duration else 0
+            for _ in range(repeat + 1):
+                url = _fill_template(media, rep_id, bandwidth, number, current_time)
+                segments.append(Segment(url=urljoin(base_url, url)))
+                current_time += duration
+                number += 1
+        return segments
+
+    duration = int(attrs.get("duration", "0") or 0)
+    if duration <= 0 or period_seconds <= 0:
+        raise RuntimeError("DASH SegmentTemplate 缺少分片时长或总时长")
+    count = int(math.ceil(period_seconds * timescale / duration))
+    for index in range(count):
+        url = _fill_template(media, rep_id, bandwidth, number + index, index * duration)
+        segments.append(Segment(url=urljoin(base_url, url)))
+    return segments
+
+
+def _parse_media_range(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    start, _, end = value.partition("-")
+    return int(start), int(end)
+
+
+def _period_durations(root: ET.Element, periods: List[ET.Element]) -> List[float]:
+    """各 Period 的时长（秒）：优先取 duration，否则由相邻 Period 的 start 或总时长推算，无法推算时为 0。"""
+    total = parse_iso_duration(root.get("mediaPresentationDuration"))
+    starts: List[Optional[float]] = []
+    for index, period in enumerate(periods):
+        if period.get("start"):
+            starts.append(parse_iso_duration(period.get("start")))
+        elif index == 0:
+            starts.append(0.0)
+        else:
+            previous = parse_iso_duration(periods[index - 1].get("duration"))
+            starts.append(starts[-1] + previous if starts[-1] is not None and previous else None)
+
+    durations: List[float] = []
+    for index, period in enumerate(periods):
+        duration = parse_iso_duration(period.get("duration"))
+        start = starts[index]
+        if not duration and start is not None:
+            end = starts[index + 1] if index + 1 < len(periods) else total
+            duration = max(end - start, 0.0) if end else 0.0
+        durations.append(duration)
+    return durations
+
+
+def parse_dash_manifest(text: str, base_url: str) -> List[Rendition]:
+    """解析 DASH MPD，每个 Representation 生成一个带下载计划的轨道。
+
+    有多个 Period（如插播广告）时，在每个 Period 中分别选出码率最低的音频轨并按顺序拼接为一个轨道；
+    各 Period 选出的轨道封装格式或初始化分片不同、无法直接拼接时抛出 RuntimeError。
+    """
+    try:
+        root = ET.fromstring(text)
+    except ET.ParseError as exc:
+        raise RuntimeError(f"DASH 清单解析失败：{exc}") from exc
+    if (root.get("type") or "static") == "dynamic":
+        raise RuntimeError("暂不支持直播 DASH 流")
+
+    periods = _children(root, "Period")
+    if not periods:
+        raise RuntimeError("DASH 清单中没有 Period")
+    root_base = _join_base_url(base_url, root)
+    durations = _period_durations(root, periods)
+    if len(periods) == 1:
+        return _period_renditions(periods[0], root_base, durations[0])
+
+    chosen: List[Rendition] = []
+    for period, period_seconds in zip(periods, durations):
+        renditions = _period_renditions(period, root_base, period_seconds)
+        if renditions:
+            chosen.append(select_rendition(renditions))
+    if not chosen:
+        return []
+    plans = [rendition.plan for rendition in chosen if rendition.plan is not None]
+    first = plans[0]
+    for plan in plans[1:]:
+        if plan.container != first.container or plan.init_segment != first.init_segment:
+            raise RuntimeError("暂不支持各 Period 封装格式或初始化分片不同的多 Period DASH 清单")
+    merged = SegmentPlan(
+        segments=[segment for plan in plans for segment in plan.segments],
+        init_segment=first.init_segment,
+        container=first.container,
+        audio_only=all(plan.audio_only for plan in plans),
+        bandwidth=max(plan.bandwidth for plan in plans),
+    )
+    return [
+        Rendition(
+            uri=chosen[0].uri,
+            bandwidth=merged.bandwidth,
+            codecs=chosen[0].codecs,
+            audio_only=merged.audio_only,
+            plan=merged,
+        )
+    ]
+
+
+def _period_renditions(period: ET.Element, root_base: str, period_seconds: float) -> List[Rendition]:
+    period_base = _join_base_url(root_base, period)
+    renditions: List[Rendition] = []
+    for adaptation in _children(period, "AdaptationSet"):
+        set_base = _join_base_url(period_base, adaptation)
+        set_mime = adaptation.get("mimeType", "")
+        set_is_audio = adaptation.get("contentType") == "audio" or set_mime.startswith("audio/")
+        set_template = _child(adaptation, "SegmentTemplate")
+
+        for rep in _children(adaptation, "Representation"):
+            rep_id = rep.get("id", "")
+            bandwidth = int(rep.get("bandwidth", "0") or 0)
+            codecs = rep.get("codecs") or adaptation.get("codecs") or ""
+            mime = rep.get("mimeType") or set_mime
+            audio_only = set_is_audio or mime.startswith("audio/") or _codecs_are_audio_only(codecs)
+            rep_base = _join_base_url(set_base, rep)
+
+            template_attrs: Dict[str, str] = dict(set_template.attrib) if set_template is not None else {}
+            rep_template = _child(rep, "SegmentTemplate")
+            if rep_template is not None:
+                template_attrs.update(rep_template.attrib)
+            # Element 的真值取决于子节点数量，不能用 `or` 做回退
+            timeline = _child(rep_template, "SegmentTimeline")
+            if timeline is None:
+                timeline = _child(set_template, "SegmentTimeline")
+            segment_list = _child(rep, "SegmentList")
+            if segment_list is None:
+                segment_list = _child(adaptation, "SegmentList")
+
+            init_segment: Optional[Segment] = None
+            if template_attrs:
+                segments = _template_segments(
+                    template_attrs, timeline, rep_base, rep_id, bandwidth, period_seconds
+                )
+                if template_attrs.get("initialization"):
+                    init_url = _fill_template(template_attrs["initialization"], rep_id, bandwidth)
+                    init_segment = Segment(url=urljoin(rep_base, init_url))
+            elif segment_list is not None:
+                init_node = _child(segment_list, "Initialization")
+                if init_node is not None:
+                    init_segment = Segment(
+                        url=urljoin(rep_base, init_node.get("sourceURL", "")),
+                        byte_range=_parse_media_range(init_node.get("range")),
+                    )
+                segments = [
+                    Segment(
+                        url=urljoin(rep_base, item.get("media", "")),
+                        byte_range=_parse_media_range(item.get("mediaRange")),
+                    )
+                    for item in _children(segment_list, "SegmentURL")
+                ]
+            else:
+                # SegmentBase / 仅 BaseURL：整个 Representation 是单个文件
+                segments = [Segment(url=rep_base)]
+
+            if not segments:
+                continue
+            mime_sub = mime.split("/", 1)[-1] if mime else ""
+            container = "mp4" if (init_segment or mime_sub == "mp4") else _container_from_url(
+                segments[0].url, default=mime_sub or "mp4"
+            )
+            renditions.append(
+                Rendition(
+                    uri=rep_base,
+                    bandwidth=bandwidth,
+                    codecs=codecs,
+                    audio_only=audio_only,
+                    plan=SegmentPlan(
+                        segments=segments,
+                        init_segment=init_segment,
+                        container=container,
+                        audio_only=audio_only,
+                        bandwidth=bandwidth,
+                    ),
+                )
+            )
+    return renditions
+
+
+# ---------------------------------------------------------------------------
+# 下载
+# ---------------------------------------------------------------------------
+
+def _plan_from_manifest(
+    manifest_url: str,
+    text: str,
+    manifest_type: Optional[str] = None,
+) -> Tuple[Optional[SegmentPlan], Optional[Rendition]]:
+    """解析已拉取的清单：DASH 与 HLS 媒体播放列表直接得到分片计划；
+    HLS 主播放列表返回选中的变体，需再拉取其媒体播放列表（见 _variant_plan）。"""
+    kind = manifest_type or detect_manifest_type(manifest_url)
+    if kind == MANIFEST_DASH or (kind is None and text.lstrip().startswith("<")):
+        chosen = select_rendition(parse_dash_manifest(text, manifest_url))
+        assert chosen.plan is not None
+        return chosen.plan, None
+    if not text.lstrip().startswith("#EXTM3U"):
+        raise RuntimeError("无法识别的清单格式")
+    if not is_hls_master_playlist(text):
+        return parse_hls_media_playlist(text, manifest_url), None
+    return None, select_rendition(parse_hls_master(text, manifest_url))
+
+
+def resolve_manifest_plan(
+    manifest_url: str,
+    fetch_text: Callable[[str], str],
+    manifest_type: Optional[str] = None,
+) -> SegmentPlan:
+    """拉取并解析清单，选出码率最低的音频轨，返回其分片下载计划。"""
+    plan, variant = _plan_from_manifest(manifest_url, fetch_text(manifest_url), manifest_type)
+    if plan is None:
+        plan = _variant_plan(variant, fetch_text(variant.uri))
+    return plan
+
+
+async def async_resolve_manifest_plan(
+    manifest_url: str,
+    fetch_text: Callable[[str], Awaitable[str]],
+    manifest_type: Optional[str] = None,
+) -> SegmentPlan:
+    """resolve_manifest_plan 的协程版本，fetch_text 为异步函数。"""
+    plan, variant = _plan_from_manifest(manifest_url, await fetch_text(manifest_url), manifest_type)
+    if plan is None:
+        plan = _variant_plan(variant, await fetch_text(variant.uri))
+    return plan
+
+
+def download_segments(
+    plan: SegmentPlan,
+    dest_path: str,
+    fetch_segment: Callable[[Segment], bytes],
+    max_workers: int = DEFAULT_SEGMENT_WORKERS,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """使用有界线程池并发下载分片，并按原顺序拼接写入 dest_path，返回写入字节数。
+
+    同时在途的分片不超过 max_workers * 2 个，内存占用与分片总数无关。
+    """
+    ordered = ([plan.init_segment] if plan.init_segment else []) + list(plan.segments)
+    total = len(ordered)
+    workers = max(1, int(max_workers))
+    window = workers * 2
+    written = 0
+    pending = {}
+    next_submit = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="segment") as pool:
+        try:
+            with open(dest_path, "wb") as out:
+                for index in range(total):
+                    while next_submit < total and next_submit < index + window:
+                        pending[next_submit] = pool.submit(fetch_segment, ordered[next_submit])
+                        next_submit += 1
+                    data = pending.pop(index).result()
+                    out.write(data)
+                    written += len(data)
+                    if on_progress:
+                        on_progress(index + 1, total)
+        except BaseException:
+            for future in pending.values():
+                future.cancel()
+            raise
+    return written
+
+
+async def async_download_segments(
+    plan: SegmentPlan,
+    dest_path: str,
+    fetch_segment: Callable[[Segment], Awaitable[bytes]],
+    max_workers: int = DEFAULT_SEGMENT_WORKERS,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """download_segments 的协程版本：同时请求的分片不超过 max_workers 个，
+    已发起未写入的分片不超过 max_workers * 2 个。"""
+    ordered = ([plan.init_segment] if plan.init_segment else []) + list(plan.segments)
+    total = len(ordered)
+    workers = max(1, int(max_workers))
+    window = workers * 2
+    semaphore = asyncio.Semaphore(workers)
+    written = 0
+    pending: Dict[int, "asyncio.Task[bytes]"] = {}
+    next_submit = 0
+
+    async def _fetch(segment: Segment) -> bytes:
+        async with semaphore:
+            return await fetch_segment(segment)
+
+    try:
+        with open(dest_path, "wb") as out:
+            for index in range(total):
+                while next_submit < total and next_submit < index + window:
+                    pending[next_submit] = asyncio.ensure_future(_fetch(ordered[next_submit]))
+                    next_submit += 1
+                data = await pending.pop(index)
+                out.write(data)
+                written += len(data)
+                if on_progress:
+                    on_progress(index + 1, total)
+    except BaseException:
+        for task in pending.values():
+            task.cancel()
+        raise
+    return written
+
+
+def new_http_session(pool_size: int = DEFAULT_SEGMENT_WORKERS) -> Any:
+    """创建连接池大小与分片并发数匹配的 requests.Session；用完后由调用方关闭（可用 with 语句）。"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size * 2, 4))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def make_http_fetchers(
+    session: Any,
+    proxies: Optional[dict] = None,
+    timeout: float = 30,
+    retries: int = 2,
+) -> Tuple[Callable[[str], str], Callable[[Segment], bytes]]:
+    """基于调用方的 requests.Session（见 new_http_session）构建清单/分片下载函数，分片下载失败时自动重试。"""
+    import requests
+
+    session_proxies = proxies if proxies else None
+
+    def fetch_text(url: str) -> str:
+        resp = session.get(url, timeout=timeout, proxies=session_proxies)
+        resp.raise_for_status()
+        return resp.text
+
+    def fetch_segment(segment: Segment) -> bytes:
+        headers = {}
+        if segment.byte_range:
+            headers["Range"] = f"bytes={segment.byte_range[0]}-{segment.byte_range[1]}"
+        last_error: Optional[Exception] = None
+        for _ in range(retries + 1):
+            try:
+                resp = session.get(segment.url, headers=headers, timeout=timeout, proxies=session_proxies)
+                resp.raise_for_status()
+                return resp.content
+            except requests.RequestException as exc:
+                last_error = exc
+        raise RuntimeError(f"分片下载失败：{segment.url}：{last_error}")
+
+    return fetch_text, fetch_segment
+
+
+def make_async_http_fetchers(
+    client: Any,
+    timeout: float = 30,
+    retries: int = 2,
+) -> Tuple[Callable[[str], Awaitable[str]], Callable[[Segment], Awaitable[bytes]]]:
+    """基于共享的 httpx.AsyncClient 构建异步的清单/分片下载函数，分片下载失败时自动重试。"""
+    import httpx
+
+    async def fetch_text(url: str) -> str:
+        resp = await client.get(url, timeout=timeout)
+        resp.raise_for_status()
+        return resp.text
+
+    async def fetch_segment(segment: Segment) -> bytes:
+        headers = {}
+        if segment.byte_range:
+            headers["Range"] = f"bytes={segment.byte_range[0]}-{segment.byte_range[1]}"
+        last_error: Optional[Exception] = None
+        for _ in range(retries + 1):
+            try:
+                resp = await client.get(segment.url, headers=headers, timeout=timeout)
+                resp.raise_for_status()
+                return resp.content
+            except httpx.HTTPError as exc:
+                last_error = exc
+        raise RuntimeError(f"分片下载失败：{segment.url}：{last_error}")
+
+    return fetch_text, fetch_segment
@@ -0,0 +1,347 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from job_timeline import current_timeline
+
+
+# 阶段耗时直方图的桶边界（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+GaugeCallback = Callable[[], Union[float, Dict[LabelValues, float]]]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback: Optional[GaugeCallback] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def set_function(self, callback: Optional[GaugeCallback]) -> None:
+        """采集时调用 callback 取值：无标签时返回数值，有标签时返回 {标签值元组: 数值}。"""
+        self._callback = callback
+
+    def samples(self) -> List[str]:
+        callback = self._callback
+        if callback is not None:
+            try:
+                result = callback()
+            except Exception:
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_label_str(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 标签值 -> [各桶计数（非累计）, 总和, 总数]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _label_str(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_str(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，render() 输出 Prometheus 文本格式。同名指标只注册一次。"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Web、Bot 与命令行共用的指标
+STAGE_SECONDS = REGISTRY.histogram(
+    "audiototxt_stage_seconds",
+    "Duration of each processing stage (resolve, download, extract, ttft, generate, total).",
+    ["stage"],
+)
+BYTES_TOTAL = REGISTRY.counter(
+    "audiototxt_bytes_total",
+    "Bytes downloaded from sources or uploaded to Gemini.",
+    ["direction"],
+)
+TOKENS_TOTAL = REGISTRY.counter(
+    "audiototxt_tokens_total",
+    "Gemini tokens reported in usage metadata.",
+    ["kind"],
+)
+RETRIES_TOTAL = REGISTRY.counter(
+    "audiototxt_retries_total",
+    "Retries, hedged requests and fallbacks.",
+    ["operation"],
+)
+ACTIVE_JOBS = REGISTRY.gauge("audiototxt_active_jobs", "Jobs currently running.", ["source"])
+ACTIVE_STREAMS = REGISTRY.gauge("audiototxt_gemini_active_streams", "Gemini streaming responses in progress.")
+JOBS_TOTAL = REGISTRY.counter("audiototxt_jobs_total", "Finished jobs by outcome.", ["source", "status"])
+FFMPEG_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "audiototxt_ffmpeg_queue_wait_seconds",
+    "Time ffmpeg runs waited for a transcoding pool slot.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+DEDUPED_TOTAL = REGISTRY.counter(
+    "audiototxt_deduplicated_requests_total",
+    "Submissions attached to an existing job instead of starting a new one.",
+)
+
+
+def observe_stage(stage: str, start: float, end: float) -> None:
+    """记录一个阶段（perf_counter 起止时间）到直方图，并写入当前任务的时间线（如有）。"""
+    STAGE_SECONDS.observe(end - start, stage=stage)
+    timeline = current_timeline()
+    if timeline is not None:
+        timeline.record_stage(stage, start, end)
+
+
+def record_bytes(direction: str, amount: int) -> None:
+    BYTES_TOTAL.inc(amount, direction=direction)
+    timeline = current_timeline()
+    if timeline is not None:
+        timeline.add_bytes(direction, amount)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """记录代码块耗时到 audiototxt_stage_seconds{stage=...}（无论是否抛出异常）。"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, started, time.perf_counter())
+
+
+def job_started(source: str) -> float:
+    """任务开始时调用，返回传给 job_finished 的起始时间。"""
+    ACTIVE_JOBS.inc(source=source)
+    return time.perf_counter()
+
+
+def job_finished(source: str, status: str, started: float) -> None:
+    ACTIVE_JOBS.dec(source=source)
+    JOBS_TOTAL.inc(source=source, status=status)
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+
+
+def register_service_gauges(
+    scheduler_stats: Callable[[], dict],
+    job_usage: Callable[[], dict],
+    delivery_snapshot: Callable[[], dict],
+    registry: Optional[MetricsRegistry] = None,
+    ffmpeg_stats: Optional[Callable[[], dict]] = None,
+) -> None:
+    """注册 Web 服务的回调型指标：调度队列、各阶段并发、任务表内存、事件投递与 ffmpeg 转码池统计。"""
+    registry = registry or REGISTRY
+    registry.gauge("audiototxt_queue_depth", "Jobs waiting in the scheduler queue.").set_function(
+        lambda: scheduler_stats()["queued"]
+    )
+    registry.gauge("audiototxt_stage_running", "Jobs running in each scheduler stage.", ["stage"]).set_function(
+        lambda: {(name,): gate["running"] for name, gate in scheduler_stats()["stages"].items()}
+    )
+    registry.gauge("audiototxt_stage_waiting", "Jobs waiting for a scheduler stage slot.", ["stage"]).set_function(
+        lambda: {(name,): gate["waiting"] for name, gate in scheduler_stats()["stages"].items()}
+    )
+    registry.gauge("audiototxt_job_table_bytes", "Estimated memory held by the in-memory job table.").set_function(
+        lambda: job_usage()["total_bytes"]
+    )
+    registry.gauge("audiototxt_event_loop_lag_ms", "Latest event loop scheduling lag.").set_function(
+        lambda: delivery_snapshot()["loop_lag_ms"]
+    )
+    registry.gauge("audiototxt_event_frames_per_second", "Event frames delivered per second.").set_function(
+        lambda: delivery_snapshot()["frames_per_second"]
+    )
+    if ffmpeg_stats is not None:
+        registry.gauge("audiototxt_ffmpeg_running", "ffmpeg processes running in the transcoding pool.").set_function(
+            lambda: ffmpeg_stats()["running"]
+        )
+        registry.gauge("audiototxt_ffmpeg_waiting", "ffmpeg runs waiting for a transcoding pool slot.").set_function(
+            lambda: ffmpeg_stats()["waiting"]
+        )
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: MetricsRegistry = REGISTRY):
+    """在后台线程中启动只提供 /metrics 的 HTTP 服务（供独立运行的 Telegram Bot 使用）。"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,58 @@
+import contextvars
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """一条进度事件。kind 为 status / warning；stage 为 resolve / download / extract / transcribe 等阶段。"""
+    message: str
+    kind: str = "status"
+    stage: Optional[str] = None
+    percent: Optional[int] = None
+
+
+ProgressReporter = Callable[[ProgressEvent], None]
+
+_current_reporter: contextvars.ContextVar[Optional[ProgressReporter]] = contextvars.ContextVar(
+    "progress_reporter", default=None
+)
+
+
+def report_progress(
+    message: str,
+    kind: str = "status",
+    stage: Optional[str] = None,
+    percent: Optional[int] = None,
+) -> None:
+    """把进度交给当前上下文的 reporter；没有 reporter（命令行）时打印到 stderr。
+
+    reporter 随 contextvars 传递：asyncio 任务与 asyncio.to_thread 会自动继承，
+    自建线程池需用 bind_context 包装任务。reporter 抛出的异常会被忽略，不影响任务本身。
+    """
+    reporter = _current_reporter.get()
+    if reporter is None:
+        print(message, file=sys.stderr)
+        return
+    try:
+        reporter(ProgressEvent(message=message, kind=kind, stage=stage, percent=percent))
+    except Exception:
+        pass
+
+
+@contextmanager
+def progress_reporter(reporter: Optional[ProgressReporter]) -> Iterator[None]:
+    """在当前上下文内把进度事件交给 reporter，退出时恢复之前的 reporter。"""
+    token = _current_reporter.set(reporter)
+    try:
+        yield
+    finally:
+        _current_reporter.reset(token)
+
+
+def bind_context(fn: Callable, *args, **kwargs) -> Callable[[], object]:
+    """捕获当前上下文（含 reporter），返回可交给线程池执行的无参函数。"""
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args, **kwargs)
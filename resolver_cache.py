@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+
+DEFAULT_TTL_SECONDS = float(os.getenv("DOUYIN_CACHE_TTL_SECONDS", "1800"))
+DEFAULT_NEGATIVE_TTL_SECONDS = float(os.getenv("DOUYIN_NEGATIVE_CACHE_TTL_SECONDS", "60"))
+DEFAULT_MAX_ENTRIES = 2000
+
+
+@dataclass
+class CacheEntry:
+    expires_at: float
+    value: Optional[Dict[str, object]] = None
+    error: Optional[str] = None
+    created_at: float = 0.0
+
+    @property
+    def is_negative(self) -> bool:
+        return self.error is not None
+
+
+class ResolverCache:
+    """带过期时间的解析结果缓存，支持短期负缓存，并持久化为 JSON 文件。
+
+    storage_path 为 None 时只保存在内存中。
+    """
+
+    def __init__(
+        self,
+        storage_path: Optional[str] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        negative_ttl_seconds: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock=time.time,
+    ):
+        self.storage_path = storage_path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CacheEntry] = self._load()
+
+    def _load(self) -> Dict[str, CacheEntry]:
+        if not self.storage_path or not os.path.exists(self.storage_path):
+            return {}
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = self._clock()
+            entries = {}
+            for key, raw in (data.get("entries") or {}).items():
+                entry = CacheEntry(**raw)
+                if entry.expires_at > now:
+                    entries[key] = entry
+            return entries
+        except Exception:
+            return {}
+
+    def _save_locked(self) -> None:
+        if not self.storage_path:
+            return
+        tmp_path = f"{self.storage_path}.{os.getpid()}.tmp"
+        payload = {"entries": {key: asdict(entry) for key, entry in self._entries.items()}}
+        try:
+            parent = os.path.dirname(self.storage_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.storage_path)
+        except Exception:
+            # 缓存写盘失败不影响主流程
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+    def _prune_locked(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self._entries, key=lambda k: self._entries[k].created_at)[:overflow]
+            for key in oldest:
+                del self._entries[key]
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del self._entries[key]
+                return None
+            return entry
+
+    def put(self, key: str, value: Dict[str, object], ttl_seconds: Optional[float] = None) -> CacheEntry:
+        return self._store(key, CacheEntry(
+            expires_at=0.0,
+            value=dict(value),
+        ), self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+
+    def put_error(self, key: str, message: str, ttl_seconds: Optional[float] = None) -> CacheEntry:
+        return self._store(key, CacheEntry(
+            expires_at=0.0,
+            error=message,
+        ), self.negative_ttl_seconds if ttl_seconds is None else ttl_seconds)
+
+    def _store(self, key: str, entry: CacheEntry, ttl_seconds: float) -> CacheEntry:
+        now = self._clock()
+        entry.created_at = now
+        entry.expires_at = now + max(ttl_seconds, 0.0)
+        with self._lock:
+            self._entries[key] = entry
+            self._prune_locked(now)
+            self._save_locked()
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save_locked()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -51,12 +51,20 @@ from main import (
     AUTH_MODE_VERTEX_AI_JSON,
     _extract_first_url,
     build_auth_config,
-    download_audio_from_direct_url,
-    download_video_and_extract_audio,
-    fetch_douyin_mp3_via_tiksave,
+    douyin_media_cache_key,
+    fetch_cached_media,
+    release_file,
     transcribe_audio_streaming,
     transcribe_youtube_url_streaming,
 )
+from async_download import (
+    async_download_audio_from_direct_url,
+    async_download_video_and_extract_audio,
+    async_resolve_douyin_audio,
+)
+from job_timeline import begin_timeline, end_timeline, format_timeline, get_timeline_log
+from lazy_imports import warm_imports
+from metrics import job_finished, job_started, start_metrics_server, time_stage
 
 
 ROOT_DIR = Path(__file__).resolve().parent
@@ -67,6 +75,8 @@ DATA_DIR = ROOT_DIR / "data" / "telegram_bot"
 UPLOAD_DIR = DATA_DIR / "uploads"
 OUTPUT_DIR = DATA_DIR / "outputs"
 STATE_FILE = Path(os.getenv("BOT_STATE_FILE", str(DATA_DIR / "state.json")))
+# 独立运行时暴露 /metrics 的端口；为空表示不启动（内嵌在 Web 服务中时使用 Web 的 /metrics）
+METRICS_PORT = os.getenv("METRICS_PORT", "").strip()
 MAX_MESSAGE_LENGTH = 3800
 STREAM_EDIT_INTERVAL_SECONDS = 1.0
 STREAM_MIN_BUFFER = 80
@@ -1028,10 +1038,49 @@ def save_transcript_file(user_id: int, source_type: str, transcript: str, name_h
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     stem = sanitize_name(name_hint or f"{source_type}_{int(time.time())}")
     output_path = OUTPUT_DIR / f"{user_id}_{stem}.txt"
-    output_path.write_text(transcript, encoding="utf-8")
+    with time_stage("save"):
+        output_path.write_text(transcript, encoding="utf-8")
     return output_path
 
 
+def require_auth_config(settings: UserSettings):
+    auth_config = resolve_auth_config(settings)
+    if auth_config.auth_mode == AUTH_MODE_GEMINI_API_KEY and not auth_config.api_key:
+        raise RuntimeError("未设置 Gemini API Key，请先使用 /setkey 设置，或在 .env 里提供 GOOGLE_API_KEY。")
+    if auth_config.auth_mode == AUTH_MODE_VERTEX_AI_JSON and not auth_config.vertex_json:
+        raise RuntimeError(
+            "未设置 Vertex AI JSON，请先使用 /setvertexjson 设置，或在 .env 里提供 GOOGLE_APPLICATION_CREDENTIALS。"
+        )
+    return auth_config
+
+
+async def download_remote_audio(source_type: str, text_input: str, on_status) -> Path:
+    """在事件循环中下载视频直链/抖音音频，返回的文件已登记引用，用完需 release_file。"""
+    if source_type == "video_url":
+        on_status("下载视频并提取音频")
+        return Path(await async_download_video_and_extract_audio(text_input, str(UPLOAD_DIR), lease=True))
+
+    media_key = douyin_media_cache_key(text_input)
+    cached_path = fetch_cached_media(media_key, lease=True)
+    if cached_path is not None:
+        return Path(cached_path)
+
+    on_status("解析抖音分享内容")
+    mp3_url, _, tiktok_id = await async_resolve_douyin_audio(text_input)
+    stem = f"douyin_{tiktok_id}" if tiktok_id else None
+    on_status("下载抖音音频")
+    return Path(
+        await async_download_audio_from_direct_url(
+            mp3_url,
+            output_dir=str(UPLOAD_DIR),
+            preferred_ext="mp3",
+            filename_stem=stem,
+            lease=True,
+            cache_key=media_key,
+        )
+    )
+
+
 def execute_transcription(
     settings: UserSettings,
     source_type: str,
@@ -1042,18 +1091,18 @@ def execute_transcription(
     on_chunk,
     on_status,
 ) -> TranscriptionResult:
-    auth_config = resolve_auth_config(settings)
-    if auth_config.auth_mode == AUTH_MODE_GEMINI_API_KEY and not auth_config.api_key:
-        raise RuntimeError("未设置 Gemini API Key，请先使用 /setkey 设置，或在 .env 里提供 GOOGLE_API_KEY。")
-    if auth_config.auth_mode == AUTH_MODE_VERTEX_AI_JSON and not auth_config.vertex_json:
-        raise RuntimeError(
-            "未设置 Vertex AI JSON，请先使用 /setvertexjson 设置，或在 .env 里提供 GOOGLE_APPLICATION_CREDENTIALS。"
-        )
+    auth_config = require_auth_config(settings)
 
-    if source_type == "audio":
+    if source_type in {"audio", "video_url", "douyin"}:
+        # 视频直链与抖音音频已由 download_remote_audio 下载到本地
         if audio_path is None:
             raise RuntimeError("缺少音频文件。")
-        on_status("开始转写音频")
+        status = {
+            "audio": "开始转写音频",
+            "video_url": "开始转写视频音频",
+            "douyin": "开始转写抖音音频",
+        }[source_type]
+        on_status(status)
         transcript = transcribe_audio_streaming(
             api_key=auth_config.api_key,
             audio_path=str(audio_path),
@@ -1093,56 +1142,6 @@ def execute_transcription(
             output_path=save_transcript_file(settings.user_id, source_type, transcript, name_hint),
         )
 
-    if source_type == "video_url":
-        on_status("下载视频并提取音频")
-        local_audio_path = Path(download_video_and_extract_audio(text_input, str(UPLOAD_DIR)))
-        on_status("开始转写视频音频")
-        transcript = transcribe_audio_streaming(
-            api_key=auth_config.api_key,
-            audio_path=str(local_audio_path),
-            model_name=settings.model_name,
-            promoters=settings.promoters or None,
-            on_chunk=on_chunk,
-            auth_mode=auth_config.auth_mode,
-            vertex_json=auth_config.vertex_json,
-            vertex_project=auth_config.vertex_project,
-            vertex_location=auth_config.vertex_location,
-        )
-        return TranscriptionResult(
-            transcript=transcript,
-            output_path=save_transcript_file(settings.user_id, source_type, transcript, local_audio_path.stem),
-        )
-
-    if source_type == "douyin":
-        on_status("解析抖音分享内容")
-        mp3_url, _, tiktok_id = fetch_douyin_mp3_via_tiksave(text_input)
-        stem = f"douyin_{tiktok_id}" if tiktok_id else f"douyin_{int(time.time())}"
-        on_status("下载抖音音频")
-        local_audio_path = Path(
-            download_audio_from_direct_url(
-                mp3_url,
-                output_dir=str(UPLOAD_DIR),
-                preferred_ext="mp3",
-                filename_stem=stem,
-            )
-        )
-        on_status("开始转写抖音音频")
-        transcript = transcribe_audio_streaming(
-            api_key=auth_config.api_key,
-            audio_path=str(local_audio_path),
-            model_name=settings.model_name,
-            promoters=settings.promoters or None,
-            on_chunk=on_chunk,
-            auth_mode=auth_config.auth_mode,
-            vertex_json=auth_config.vertex_json,
-            vertex_project=auth_config.vertex_project,
-            vertex_location=auth_config.vertex_location,
-        )
-        return TranscriptionResult(
-            transcript=transcript,
-            output_path=save_transcript_file(settings.user_id, source_type, transcript, stem),
-        )
-
     raise RuntimeError(f"不支持的来源类型：{source_type}")
 
 
@@ -1240,8 +1239,20 @@ async def process_transcription(
         loop.call_soon_threadsafe(queue.put_nowait, {"type": "status", "data": text})
 
     stream_task = asyncio.create_task(stream_events(context, chat.id, queue, status_message))
+    downloaded_path: Optional[Path] = None
+    started = job_started("bot")
+    status = "error"
+    # 各阶段耗时（含 to_thread 中的转写）记入本任务的时间线
+    timeline = begin_timeline(f"bot-{settings.user_id}-{int(time.time() * 1000)}", "bot")
 
     try:
+        source_type = settings.source_type
+        if source_type in {"video_url", "douyin"} and audio_path is None:
+            if not text_input:
+                raise RuntimeError("缺少文本输入。")
+            require_auth_config(settings)
+            downloaded_path = await download_remote_audio(source_type, text_input, on_status)
+            audio_path = downloaded_path
         result = await asyncio.to_thread(
             execute_transcription,
             settings,
@@ -1255,20 +1266,36 @@ async def process_transcription(
         await queue.put({"type": "status", "data": "转写完成，正在整理结果"})
         await queue.put(None)
         await stream_task
-        await safe_edit_text(status_message, "状态：转写完成")
         with result.output_path.open("rb") as transcript_file:
             await message.reply_document(
                 document=transcript_file,
                 filename=result.output_path.name,
                 caption="转写完成，已附上 txt 文件。",
             )
+        status = "ok"
     except Exception as exc:
         await queue.put(None)
         await stream_task
         await safe_edit_text(status_message, f"状态：任务失败 - {exc}")
         await message.reply_text(f"转写失败：{exc}")
     finally:
+        if downloaded_path is not None:
+            release_file(str(downloaded_path))
         active_jobs.discard(settings.user_id)
+        job_finished("bot", status, started)
+        # 只在这里结束时间线，记录的状态与耗时包含发送结果文件的步骤
+        record = timeline.finish(status)
+        end_timeline(timeline)
+        logger.info("任务耗时 %s: %s", record["job_id"], format_timeline(record))
+        if status == "ok":
+            try:
+                await safe_edit_text(status_message, f"状态：转写完成\n{format_timeline(record)}")
+            except Exception as exc:
+                logger.warning("更新状态消息失败: %s", exc)
+        try:
+            await asyncio.to_thread(get_timeline_log().append, record)
+        except OSError as exc:
+            logger.warning("写入时间线日志失败: %s", exc)
 
 
 def build_application() -> Application:
@@ -1352,6 +1379,11 @@ def main() -> None:
         level=logging.INFO,
     )
     application = build_application()
+    warm_imports()
+    if METRICS_PORT:
+        # 独立运行时没有 Web 服务，单独在该端口提供 /metrics
+        start_metrics_server(int(METRICS_PORT))
+        logger.info("Metrics 已在端口 %s 的 /metrics 提供", METRICS_PORT)
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+import async_download
+import main
+from media_cache import MediaCache
+from resolver_cache import ResolverCache
+
+
+class AsyncDownloadTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.requests = []
+        self.release = asyncio.Event()
+        patcher = patch("main._media_cache", MediaCache(None, is_pinned=main.FILE_LEASES.is_leased))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, handler):
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True)
+        patcher = patch("async_download.get_async_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_streams_body_through_bounded_buffer(self):
+        body = os.urandom(300 * 1024)
+
+        async def handler(request):
+            self.requests.append(str(request.url))
+            return httpx.Response(200, content=body, headers={"content-length": str(len(body))})
+
+        self._client(handler)
+        with patch("async_download.DOWNLOAD_BUFFER_BYTES", 64 * 1024):
+            path = await async_download.async_download_audio_from_direct_url(
+                "https://cdn.example.com/a.mp3", self.tmp.name, filename_stem="a"
+            )
+
+        self.assertEqual(path, os.path.join(self.tmp.name, "a.mp3"))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), body)
+        self.assertFalse(os.path.exists(path + ".part"))
+        self.assertFalse(main.FILE_LEASES.is_leased(path))
+
+    async def test_cache_index_and_file_writes_run_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+        store = main._store_media_fetch
+
+        def recording_store(*args):
+            threads.append(threading.get_ident())
+            return store(*args)
+
+        real_open = open
+
+        def recording_open(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return real_open(*args, **kwargs)
+
+        async def handler(request):
+            return httpx.Response(200, content=b"audio")
+
+        self._client(handler)
+        with patch("main._store_media_fetch", recording_store), patch("builtins.open", recording_open):
+            await async_download.async_download_audio_from_direct_url(
+                "https://cdn.example.com/a.mp3", self.tmp.name, filename_stem="a"
+            )
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    async def test_concurrent_downloads_share_one_request_and_lease(self):
+        async def handler(request):
+            self.requests.append(str(request.url))
+            await self.release.wait()
+            return httpx.Response(200, content=b"audio")
+
+        self._client(handler)
+        url = "https://cdn.example.com/b.mp3"
+        tasks = [
+            asyncio.create_task(
+                async_download.async_download_audio_from_direct_url(url, self.tmp.name, filename_stem="b", lease=True)
+            )
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        self.release.set()
+        paths = await asyncio.gather(*tasks)
+
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(main.FILE_LEASES.count(paths[0]), 3)
+        for path in paths:
+            main.release_file(path)
+        self.assertFalse(main.FILE_LEASES.is_leased(paths[0]))
+
+    async def test_http_error_removes_partial_file(self):
+        async def handler(request):
+            return httpx.Response(404)
+
+        self._client(handler)
+        with self.assertRaises(RuntimeError):
+            await async_download.async_download_audio_from_direct_url(
+                "https://cdn.example.com/c.mp3", self.tmp.name, filename_stem="c"
+            )
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    async def test_stale_entry_revalidates_with_304(self):
+        async def handler(request):
+            self.requests.append(dict(request.headers))
+            if request.headers.get("if-none-match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, content=b"audio", headers={"etag": '"v1"'})
+
+        self._client(handler)
+        clock = [1000.0]
+        cache = MediaCache(None, fresh_seconds=10, clock=lambda: clock[0])
+        url = "https://cdn.example.com/d.mp3"
+        with patch("main._media_cache", cache):
+            first = await async_download.async_download_audio_from_direct_url(url, self.tmp.name, filename_stem="d")
+            clock[0] += 60
+            second = await async_download.async_download_audio_from_direct_url(url, self.tmp.name, filename_stem="d")
+            video = await async_download.async_download_video_and_extract_audio(url, self.tmp.name)
+            clock[0] += 60
+            revalidated = await async_download.async_download_video_and_extract_audio(url, self.tmp.name)
+
+        self.assertEqual(first, second)
+        self.assertEqual(video, revalidated)
+        self.assertEqual(len(self.requests), 4)
+        self.assertEqual([r.get("if-none-match") for r in self.requests], [None, '"v1"', None, '"v1"'])
+        with open(second, "rb") as f:
+            self.assertEqual(f.read(), b"audio")
+
+    async def test_direct_audio_url_skips_ffmpeg(self):
+        async def handler(request):
+            return httpx.Response(200, content=b"m4a", headers={"content-type": "audio/mp4"})
+
+        self._client(handler)
+        path = await async_download.async_download_video_and_extract_audio(
+            "https://cdn.example.com/song.m4a", self.tmp.name
+        )
+        self.assertRegex(os.path.basename(path), r"^song_[0-9a-f]{12}\.m4a$")
+        # 临时文件已替换为最终文件
+        self.assertEqual(os.listdir(self.tmp.name), [os.path.basename(path)])
+
+
+class AsyncResolveDouyinTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for target, value in (
+            ("main._douyin_cache", ResolverCache(None)),
+            ("async_download._douyin_resolver", None),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = []
+
+    async def test_resolves_via_downcats_and_caches_result(self):
+        async def handler(request):
+            self.calls.append(request.url.host)
+            if request.url.host == "www.downcats.com":
+                self.assertEqual(json.loads(request.content)["locale"], "zh")
+                return httpx.Response(200, json={"code": "OK", "data": {"music": "https://a/1.mp3", "text": " 标题 "}})
+            return httpx.Response(503)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        share = "看看 https://www.douyin.com/video/7301234567890123456 "
+        async with client:
+            with patch("async_download.get_async_client", return_value=client):
+                first = await async_download.async_resolve_douyin_audio(share)
+                second = await async_download.async_resolve_douyin_audio(share)
+
+        self.assertEqual(first, ("https://a/1.mp3", "标题", "7301234567890123456"))
+        self.assertEqual(second, first)
+        self.assertEqual(self.calls.count("www.downcats.com"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import async_download
+import main
+from douyin_resolver import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_OPEN,
+    BackendHealth,
+    HedgedResolver,
+    ResolverBackend,
+)
+from resolver_cache import ResolverCache
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class BackendHealthTest(unittest.TestCase):
+    def test_circuit_opens_after_threshold_and_half_opens_after_cooldown(self):
+        clock = FakeClock()
+        health = BackendHealth("a", failure_threshold=2, cooldown_seconds=10, clock=clock)
+        health.record_failure(0.1)
+        self.assertEqual(health.state, CIRCUIT_CLOSED)
+        health.record_failure(0.1)
+        self.assertEqual(health.state, CIRCUIT_OPEN)
+        self.assertFalse(health.try_acquire())
+
+        clock.now += 11
+        self.assertTrue(health.try_acquire())
+        # 半开状态只放行一个探测请求
+        self.assertFalse(health.try_acquire())
+        health.record_success(0.2)
+        self.assertEqual(health.state, CIRCUIT_CLOSED)
+        self.assertTrue(health.try_acquire())
+
+    def test_score_penalizes_errors_and_latency(self):
+        fast = BackendHealth("fast")
+        slow = BackendHealth("slow")
+        fast.record_success(0.2)
+        slow.record_success(3.0)
+        self.assertLess(fast.score(), slow.score())
+        fast.record_failure(0.2)
+        self.assertGreater(fast.score(), 0.2)
+
+
+class HedgedResolverTest(unittest.TestCase):
+    def test_hedges_to_second_backend_when_primary_is_slow(self):
+        release = threading.Event()
+
+        def slow(arg):
+            release.wait(2)
+            return "slow"
+
+        resolver = HedgedResolver(
+            [ResolverBackend("slow", slow), ResolverBackend("fast", lambda arg: "fast")],
+            hedge_delay=0.05,
+        )
+        start = time.monotonic()
+        result, winner = resolver.resolve("x")
+        release.set()
+        self.assertEqual((result, winner), ("fast", "fast"))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_failure_launches_next_backend_immediately(self):
+        def broken(arg):
+            raise RuntimeError("down")
+
+        resolver = HedgedResolver(
+            [ResolverBackend("broken", broken), ResolverBackend("ok", lambda arg: arg.upper())],
+            hedge_delay=5,
+        )
+        start = time.monotonic()
+        self.assertEqual(resolver.resolve("abc"), ("ABC", "ok"))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_healthiest_backend_goes_first_and_open_circuit_is_skipped(self):
+        calls = []
+
+        def make(name, fail=False):
+            def _resolve(arg):
+                calls.append(name)
+                if fail:
+                    raise RuntimeError(name)
+                return name
+            return _resolve
+
+        resolver = HedgedResolver(
+            [ResolverBackend("a", make("a", fail=True)), ResolverBackend("b", make("b"))],
+            hedge_delay=5,
+            failure_threshold=2,
+        )
+        self.assertEqual(resolver.resolve("x"), ("b", "b"))
+        self.assertEqual(calls, ["a", "b"])
+
+        # 失败后 a 的健康分变差，下一次直接先请求 b
+        calls.clear()
+        self.assertEqual(resolver.resolve("x"), ("b", "b"))
+        self.assertEqual(calls, ["b"])
+
+        # b 变慢也不会让熔断中的 a 被调用
+        resolver.health["a"].record_failure(0.1)
+        self.assertEqual(resolver.health["a"].state, CIRCUIT_OPEN)
+        resolver.health["b"].record_success(50.0)
+        calls.clear()
+        self.assertEqual(resolver.resolve("x"), ("b", "b"))
+        self.assertEqual(calls, ["b"])
+
+    def test_all_failures_raise(self):
+        def broken(arg):
+            raise RuntimeError("boom")
+
+        resolver = HedgedResolver([ResolverBackend("a", broken), ResolverBackend("b", broken)], hedge_delay=5)
+        with self.assertRaises(RuntimeError) as ctx:
+            resolver.resolve("x")
+        self.assertIn("a: boom", str(ctx.exception))
+        self.assertIn("b: boom", str(ctx.exception))
+
+    def test_sync_and_async_resolvers_share_health(self):
+        with patch("main._douyin_resolver", None), patch("async_download._douyin_resolver", None):
+            sync_resolver = main.get_douyin_resolver()
+            async_resolver = async_download.get_async_douyin_resolver()
+            self.assertIs(async_resolver.health, sync_resolver.health)
+            async_resolver.health["downcats"].record_failure(0.1)
+            self.assertEqual(sync_resolver.health_snapshot()[0]["failures"], 1)
+
+
+class AsyncHedgedResolverTest(unittest.IsolatedAsyncioTestCase):
+    async def test_aresolve_hedges_and_shares_health_with_sync_path(self):
+        async def slow(arg):
+            await asyncio.sleep(2)
+            return "slow"
+
+        async def fast(arg):
+            return "fast"
+
+        resolver = HedgedResolver(
+            [ResolverBackend("slow", lambda arg: "slow", slow), ResolverBackend("fast", lambda arg: "fast", fast)],
+            hedge_delay=0.05,
+        )
+        start = time.monotonic()
+        self.assertEqual(await resolver.aresolve("x"), ("fast", "fast"))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(resolver.health["fast"].successes, 1)
+        # 落后的请求仍在后台运行，结束后计入健康度
+        self.assertEqual(len(resolver._background), 1)
+        for task in list(resolver._background):
+            task.cancel()
+
+    async def test_aresolve_failure_launches_next_backend(self):
+        async def broken(arg):
+            raise RuntimeError("down")
+
+        async def ok(arg):
+            return arg.upper()
+
+        resolver = HedgedResolver(
+            [ResolverBackend("broken", broken, broken), ResolverBackend("ok", ok, ok)],
+            hedge_delay=5,
+        )
+        self.assertEqual(await resolver.aresolve("abc"), ("ABC", "ok"))
+        self.assertEqual(resolver.health["broken"].failures, 1)
+
+
+class ResolveDouyinAudioTest(unittest.TestCase):
+    def setUp(self):
+        for target, value in (
+            ("main._douyin_cache", ResolverCache(None)),
+            ("main._douyin_resolver", None),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_results_identical_regardless_of_winning_backend(self):
+        share = "看看 https://www.douyin.com/video/7301234567890123456 "
+        with patch("main._request_downcats", return_value=("https://a/1.mp3", " 标题 ", None)), patch(
+            "main._request_aweme_id", side_effect=RuntimeError("wtf down")
+        ):
+            via_downcats = main._resolve_via_downcats(share)
+        with patch("main._request_aweme_id", return_value="7301234567890123456"), patch(
+            "main._request_douyin_audio_info", return_value={"audio_url": "https://a/1.mp3", "title": "标题"}
+        ):
+            via_wtf = main._resolve_via_douyin_wtf(share)
+
+        self.assertEqual(via_downcats, via_wtf)
+        self.assertEqual(via_wtf["tiktok_id"], "7301234567890123456")
+
+    def test_falls_back_to_douyin_wtf_when_downcats_fails(self):
+        with patch("main._request_downcats", side_effect=RuntimeError("downcats 接口请求失败")), patch(
+            "main._request_aweme_id", return_value="42"
+        ), patch(
+            "main._request_douyin_audio_info", return_value={"audio_url": "https://a/2.mp3", "title": None}
+        ):
+            result = main.resolve_douyin_audio("https://v.douyin.com/xyz/")
+        self.assertEqual(result, ("https://a/2.mp3", None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
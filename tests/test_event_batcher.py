@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import unittest
+
+from event_batcher import DeliveryStats, EventBatcher, batch_frame, iter_frame, monitor_loop_lag
+
+
+def chunk(text):
+    return {"type": "chunk", "data": text}
+
+
+class EventBatcherTest(unittest.TestCase):
+    def _batcher(self, **kwargs):
+        frames = []
+        stats = DeliveryStats()
+        batcher = EventBatcher(lambda events: frames.append(batch_frame(events)), stats=stats, **kwargs)
+        self.addCleanup(batcher.close)
+        return batcher, frames, stats
+
+    def test_deltas_and_status_are_merged_into_one_frame(self):
+        batcher, frames, stats = self._batcher(flush_seconds=60, flush_bytes=1 << 20)
+        batcher.add({"type": "status", "data": "开始转写"})
+        for text in ["你", "好", "，", "世界"]:
+            batcher.add(chunk(text))
+        batcher.add({"type": "status", "data": "分段 2/2"})
+        batcher.add(chunk("!"))
+        self.assertEqual(frames, [])
+
+        batcher.close()
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(iter_frame(frames[0]), [
+            {"type": "status", "data": "开始转写"},
+            chunk("你好，世界"),
+            {"type": "status", "data": "分段 2/2"},
+            chunk("!"),
+        ])
+        self.assertEqual((stats.events, stats.frames), (7, 1))
+
+        # 关闭后的事件直接发布
+        batcher.add({"type": "status", "data": "late"})
+        self.assertEqual(frames[-1], {"type": "status", "data": "late"})
+
+    def test_flushes_on_size_and_after_delay(self):
+        published = threading.Event()
+        frames = []
+
+        def publish(events):
+            frames.append(batch_frame(events))
+            published.set()
+
+        batcher = EventBatcher(publish, flush_seconds=60, flush_bytes=6, stats=None)
+        self.addCleanup(batcher.close)
+        batcher.add(chunk("abc"))
+        batcher.add(chunk("你好"))
+        self.assertTrue(published.wait(2))
+        self.assertEqual(frames, [chunk("abc你好")])
+
+        published.clear()
+        timed = EventBatcher(publish, flush_seconds=0.02, flush_bytes=1 << 20, stats=None)
+        self.addCleanup(timed.close)
+        timed.add(chunk("x"))
+        self.assertTrue(published.wait(2))
+        self.assertEqual(frames[-1], chunk("x"))
+
+    def test_zero_delay_publishes_every_event(self):
+        batcher, frames, stats = self._batcher(flush_seconds=0)
+        batcher.add(chunk("a"))
+        batcher.add(chunk("b"))
+        self.assertEqual(frames, [chunk("a"), chunk("b")])
+        self.assertEqual((stats.events, stats.frames), (2, 2))
+
+
+class LoopLagTest(unittest.IsolatedAsyncioTestCase):
+    async def test_monitor_samples_loop_lag(self):
+        stats = DeliveryStats()
+        task = asyncio.create_task(monitor_loop_lag(stats, interval=0.01))
+        await asyncio.sleep(0.015)
+        # 阻塞事件循环，下一次采样应记录到延迟
+        threading.Event().wait(0.05)
+        await asyncio.sleep(0.03)
+        task.cancel()
+        self.assertGreaterEqual(stats.snapshot()["max_loop_lag_ms"], 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
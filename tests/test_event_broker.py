@@ -0,0 +1,88 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from event_broker import EventBroker
+
+
+class EventBrokerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "jobs.sqlite3")
+
+    def _broker(self, **kwargs):
+        broker = EventBroker(self.db_path, **kwargs)
+        self.addCleanup(broker.close)
+        return broker
+
+    async def test_sequence_numbers_are_per_job(self):
+        broker = self._broker()
+        self.assertEqual(broker.publish("a", {"type": "status", "data": "1"}), 1)
+        self.assertEqual(broker.publish("b", {"type": "status", "data": "1"}), 1)
+        self.assertEqual(broker.publish("a", {"type": "chunk", "data": "你好"}), 2)
+        self.assertEqual(broker.read("a", 1), [(2, {"type": "chunk", "data": "你好"})])
+        self.assertEqual(broker.last_seq("a"), 2)
+
+    async def test_subscriber_in_another_process_receives_events(self):
+        # 两个实例共用同一数据库文件，模拟两个 worker
+        worker_a = self._broker()
+        worker_b = self._broker(poll_seconds=0.02)
+        worker_a.publish("job", {"type": "status", "data": "开始"})
+        received = []
+
+        async def consume():
+            async for seq, event in worker_b.subscribe("job"):
+                received.append((seq, event["type"], time.monotonic()))
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        published_at = time.monotonic()
+        worker_a.publish("job", {"type": "chunk", "data": "hello"})
+        worker_a.publish("job", {"type": "done", "data": {}})
+        await asyncio.wait_for(consumer, 2)
+
+        self.assertEqual([(seq, kind) for seq, kind, _ in received], [(1, "status"), (2, "chunk"), (3, "done")])
+        self.assertLess(received[1][2] - published_at, 0.5)
+
+    async def test_resume_after_seq_and_local_wakeup(self):
+        broker = self._broker(poll_seconds=10)
+        broker.publish("job", {"type": "status", "data": "1"})
+        broker.publish("job", {"type": "status", "data": "2"})
+        received = []
+
+        async def consume():
+            async for seq, event in broker.subscribe("job", after_seq=1):
+                received.append(seq)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        # 轮询间隔很长，本进程发布的事件仍应立即送达
+        await asyncio.to_thread(broker.publish, "job", {"type": "error", "data": "x"})
+        await asyncio.wait_for(consumer, 1)
+        self.assertEqual(received, [2, 3])
+
+    async def test_reset_replaces_events_and_keeps_sequence(self):
+        broker = self._broker()
+        broker.publish("job", {"type": "chunk", "data": "旧"})
+        broker.publish("job", {"type": "chunk", "data": "输出"})
+        seq = broker.reset("job", {"type": "snapshot", "data": {"transcript": ""}})
+        self.assertEqual(seq, 3)
+        self.assertEqual(broker.read("job"), [(3, {"type": "snapshot", "data": {"transcript": ""}})])
+        self.assertEqual(broker.publish("job", {"type": "chunk", "data": "新"}), 4)
+
+    async def test_prune_drops_old_events(self):
+        now = [1000.0]
+        broker = self._broker(clock=lambda: now[0])
+        broker.publish("old", {"type": "done"})
+        now[0] += 7200
+        broker.publish("new", {"type": "done"})
+        self.assertEqual(broker.prune(3600), 1)
+        self.assertEqual(broker.last_seq("old"), 0)
+        self.assertEqual(broker.last_seq("new"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+from event_broker import EventBroker
+from event_log import EventLogHub, JobEventLog
+
+
+def chunk(text):
+    return {"type": "chunk", "data": text}
+
+
+class JobEventLogTest(unittest.TestCase):
+    def test_evicted_events_are_compacted_into_exact_snapshot(self):
+        log = JobEventLog(capacity=3)
+        log.append(1, {"type": "status", "data": "开始转写"})
+        for seq, text in enumerate(["你", "好", "世", "界"], start=2):
+            log.append(seq, chunk(text))
+
+        snapshot, events, _ = log.read(0)
+        self.assertEqual(snapshot["seq"], 2)
+        self.assertEqual(snapshot["data"], {"transcript": "你", "status": {"type": "status", "data": "开始转写"}})
+        self.assertEqual([seq for seq, _ in events], [3, 4, 5])
+        self.assertEqual(snapshot["data"]["transcript"] + "".join(e["data"] for _, e in events), "你好世界")
+
+        # since 仍在缓冲区内时只回放之后的事件，不需要快照
+        snapshot, events, _ = log.read(4)
+        self.assertIsNone(snapshot)
+        self.assertEqual(events, [(5, chunk("界"))])
+        self.assertEqual(log.read(5)[1], [])
+
+    def test_compacted_reset_snapshot_drops_earlier_output(self):
+        log = JobEventLog(capacity=1)
+        log.append(1, chunk("旧"))
+        log.append(2, {"type": "snapshot", "data": {"transcript": ""}})
+        log.append(3, chunk("新"))
+        log.append(4, chunk("的"))
+
+        snapshot, events, _ = log.read(0)
+        self.assertEqual(snapshot["data"]["transcript"], "新")
+        self.assertEqual(events, [(4, chunk("的"))])
+
+
+class EventLogHubTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.broker = EventBroker(None, poll_seconds=0.01)
+        self.hub = EventLogHub(self.broker, capacity=4)
+
+    async def asyncTearDown(self):
+        self.broker.close()
+
+    async def _collect(self, since=0):
+        return [event async for event in self.hub.subscribe("job", since)]
+
+    async def test_multiple_subscribers_share_one_log(self):
+        self.broker.publish("job", {"type": "status", "data": "开始"})
+        first = asyncio.create_task(self._collect())
+        second = asyncio.create_task(self._collect())
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.hub.subscriber_count("job"), 2)
+        self.assertEqual(len(self.hub._tailers), 1)
+
+        self.broker.publish("job", chunk("hello"))
+        self.broker.publish("job", {"type": "done", "data": {"output_filename": "a.txt"}})
+        results = await asyncio.wait_for(asyncio.gather(first, second), 2)
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([e["seq"] for e in results[0]], [1, 2, 3])
+        self.assertEqual(self.hub.subscriber_count("job"), 0)
+        self.assertEqual(self.hub._logs, {})
+
+    async def test_reconnect_with_since_catches_up_exactly(self):
+        for i in range(6):
+            self.broker.publish("job", chunk(str(i)))
+        self.broker.publish("job", {"type": "done", "data": {}})
+
+        events = await asyncio.wait_for(self._collect(since=5), 2)
+        self.assertEqual(events, [{**chunk("5"), "seq": 6}, {"type": "done", "data": {}, "seq": 7}])
+
+        # 早于缓冲区的 since 先收到快照
+        events = await asyncio.wait_for(self._collect(since=1), 2)
+        self.assertEqual(events[0]["type"], "snapshot")
+        self.assertEqual(events[0]["data"]["transcript"], "012")
+        self.assertEqual([e["seq"] for e in events[1:]], [4, 5, 6, 7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from ffmpeg_pool import FFmpegPool
+from metrics import FFMPEG_QUEUE_WAIT_SECONDS
+
+
+class FFmpegPoolCommandTest(unittest.TestCase):
+    def test_threads_option_precedes_output_and_nice_prefix(self):
+        pool = FFmpegPool(max_workers=2, threads=3, nice=10)
+        with patch("ffmpeg_pool.shutil.which", return_value="/usr/bin/nice"):
+            cmd = pool.build_command(["-i", "in.mp4", "-vn", "out.m4a"])
+        self.assertEqual(cmd[:3], ["nice", "-n", "10"])
+        self.assertEqual(cmd[-3:], ["-threads", "3", "out.m4a"])
+        self.assertIn("-nostdin", cmd)
+
+
+class FFmpegPoolConcurrencyTest(unittest.TestCase):
+    def test_sync_runs_are_bounded_and_wait_is_recorded(self):
+        pool = FFmpegPool(max_workers=2, threads=1)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def fake_run(cmd, **kwargs):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.05)
+            with lock:
+                state["running"] -= 1
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        observed = FFMPEG_QUEUE_WAIT_SECONDS.count()
+        with patch("ffmpeg_pool.subprocess.run", side_effect=fake_run):
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                list(executor.map(lambda i: pool.run(["-i", "in", f"out{i}"]), range(6)))
+
+        stats = pool.stats()
+        # 排队等待同时记入 /metrics 的直方图
+        self.assertEqual(FFMPEG_QUEUE_WAIT_SECONDS.count() - observed, 6)
+        self.assertEqual(state["peak"], 2)
+        self.assertEqual(stats["completed"], 6)
+        self.assertEqual(stats["running"], 0)
+        self.assertGreater(stats["queue_wait_seconds_max"], 0.05)
+
+    def test_failed_run_releases_slot(self):
+        pool = FFmpegPool(max_workers=1)
+        error = subprocess.CalledProcessError(1, ["ffmpeg"], "", "boom")
+        with patch("ffmpeg_pool.subprocess.run", side_effect=error):
+            for _ in range(2):
+                with self.assertRaises(subprocess.CalledProcessError):
+                    pool.run(["out"])
+        self.assertEqual(pool.stats()["failed"], 2)
+
+
+class FFmpegPoolAsyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # 用一个只会 sleep 的脚本代替 ffmpeg
+        self.binary = os.path.join(self.tmp.name, "fake-ffmpeg")
+        with open(self.binary, "w") as f:
+            f.write("#!/bin/sh\nsleep 0.2\n")
+        os.chmod(self.binary, os.stat(self.binary).st_mode | stat.S_IEXEC)
+
+    async def test_async_runs_queue_without_blocking_loop(self):
+        pool = FFmpegPool(max_workers=1, threads=1, ffmpeg_binary=self.binary)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        start = time.monotonic()
+        await asyncio.gather(pool.arun(["out1"]), pool.arun(["out2"]))
+        tick_task.cancel()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.38)
+        self.assertGreater(ticks, 10)
+        self.assertEqual(pool.stats()["completed"], 2)
+
+    async def test_cancelled_waiter_gives_slot_back(self):
+        pool = FFmpegPool(max_workers=1, threads=1, ffmpeg_binary=self.binary)
+        first = asyncio.create_task(pool.arun(["out1"]))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.create_task(pool.arun(["out2"]))
+        await asyncio.sleep(0.01)
+        self.assertEqual(pool.stats()["waiting"], 1)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        await first
+        # 名额已全部归还，新的任务可以立即开始
+        await asyncio.wait_for(pool.arun(["out3"]), timeout=1)
+        self.assertEqual(pool.stats()["waiting"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
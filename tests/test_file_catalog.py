@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import main
+from file_catalog import FileCatalog, shard_name
+from media_cache import MediaCache, MediaFetch
+
+
+class FileCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.catalog = FileCatalog(self.tmp.name, os.path.join(self.tmp.name, "cache", "jobs.sqlite3"))
+        self.addCleanup(self.catalog.close)
+
+    def _write(self, path, data=b"x", mtime=None):
+        with open(path, "wb") as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_sharded_writes_are_indexed_and_looked_up(self):
+        path = self.catalog.shard_path("youtube_abc.txt")
+        self.assertEqual(os.path.dirname(path), os.path.join(self.tmp.name, shard_name("youtube_abc.txt")))
+        self._write(path, "你好".encode("utf-8"))
+        entry = self.catalog.record(path, owner="job1")
+        self.assertEqual((entry.kind, entry.size, entry.owner), ("transcript", 6, "job1"))
+        self.assertEqual(self.catalog.lookup("youtube_abc.txt"), path)
+
+        os.remove(path)
+        self.assertIsNone(self.catalog.record(path))
+        self.assertIsNone(self.catalog.lookup("youtube_abc.txt"))
+
+    def test_downloaded_media_is_sharded_recorded_and_cleaned(self):
+        for target, value in (("main._file_catalog", self.catalog), ("main._media_cache", MediaCache())):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        path = main._direct_audio_path("https://cdn.example/a.mp3", self.tmp.name, "mp3", None)
+        self.assertEqual(os.path.dirname(path), self.catalog.shard_dir(os.path.basename(path)))
+        main._store_media_fetch("audio:a", None, MediaFetch(self._write(path)))
+        self.assertEqual(self.catalog.lookup(os.path.basename(path)), path)
+
+        # 过期且不在媒体缓存中的文件被清理时同时移出索引
+        stale = self._write(main._media_path(self.tmp.name, "old.mp3"), mtime=1)
+        self.catalog.record(stale)
+        main.cleanup_old_files(self.tmp.name, 1)
+        self.assertFalse(os.path.exists(stale))
+        self.assertIsNone(self.catalog.lookup("old.mp3"))
+        self.assertTrue(os.path.exists(path))
+
+    def test_scan_reconciles_root_and_shard_directories(self):
+        legacy = self._write(os.path.join(self.tmp.name, "legacy.mp3"))
+        sharded = self._write(self.catalog.shard_path("new.txt"))
+        self._write(os.path.join(self.tmp.name, ".hidden.part"))
+        self.assertEqual(self.catalog.scan(), {"added": 2, "updated": 0, "removed": 0})
+        # 数据库所在的 cache 目录不在索引范围内
+        self.assertIsNone(self.catalog.lookup("jobs.sqlite3"))
+
+        self._write(sharded, b"longer")
+        os.remove(legacy)
+        self.assertEqual(self.catalog.scan(), {"added": 0, "updated": 1, "removed": 1})
+        self.assertEqual(self.catalog.scan(), {"added": 0, "updated": 0, "removed": 0})
+
+    def test_scan_keeps_files_recorded_during_walk(self):
+        walk = self.catalog._walk
+        path = self.catalog.shard_path("late.txt")
+
+        def walk_then_record():
+            found = walk()
+            # 遍历结束后、对账之前写入并登记的新文件
+            self._write(path)
+            self.catalog.record(path, owner="job2")
+            return found
+
+        with patch.object(self.catalog, "_walk", walk_then_record):
+            self.assertEqual(self.catalog.scan(), {"added": 0, "updated": 0, "removed": 0})
+        self.assertEqual(self.catalog.lookup("late.txt"), path)
+
+    def test_cursor_pagination_and_filters(self):
+        now = 1_000_000.0
+        for i in range(5):
+            name = f"t{i}.txt" if i % 2 == 0 else f"a{i}.mp3"
+            path = self._write(self.catalog.shard_path(name), b"x" * (i + 1), mtime=now - i * 3600)
+            self.catalog.record(path, owner="job-even" if i % 2 == 0 else None)
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor, total = self.catalog.list(limit=2, cursor=cursor, now=now)
+            seen.extend(e.name for e in page)
+            if cursor is None:
+                break
+        self.assertEqual(total, 5)
+        self.assertEqual(seen, ["t0.txt", "a1.mp3", "t2.txt", "a3.mp3", "t4.txt"])
+
+        page, _, total = self.catalog.list(kind="transcript", max_age_seconds=2.5 * 3600, now=now)
+        self.assertEqual(([e.name for e in page], total), (["t0.txt", "t2.txt"], 2))
+        page, _, _ = self.catalog.list(owner="job-even", sort="size", descending=False)
+        self.assertEqual([e.name for e in page], ["t0.txt", "t2.txt", "t4.txt"])
+
+        with self.assertRaises(ValueError):
+            self.catalog.list(cursor="not-a-cursor")
+        with self.assertRaises(ValueError):
+            self.catalog.list(sort="owner")
+
+
+if __name__ == "__main__":
+    unittest.main()
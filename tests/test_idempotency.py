@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from idempotency import IdempotencyConflictError, IdempotencyIndex, request_fingerprint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RequestFingerprintTest(unittest.TestCase):
+    def test_ignores_proxies_and_separates_credentials(self):
+        settings = {"model_name": "gemini-2.5-flash", "language_hint": None, "proxy": "http://p:1"}
+        base = request_fingerprint("youtube", "https://youtu.be/a", settings, "key1")
+        self.assertEqual(
+            base,
+            request_fingerprint("youtube", "https://youtu.be/a", {"model_name": "gemini-2.5-flash"}, "key1"),
+        )
+        self.assertNotEqual(base, request_fingerprint("youtube", "https://youtu.be/a", settings, "key2"))
+        self.assertNotEqual(
+            base,
+            request_fingerprint("youtube", "https://youtu.be/a", {"model_name": "gemini-2.5-pro"}, "key1"),
+        )
+
+
+class IdempotencyIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.clock = FakeClock()
+        self.index = IdempotencyIndex(
+            os.path.join(self.tmp.name, "cache", "jobs.sqlite3"),
+            window_seconds=60,
+            key_ttl_seconds=3600,
+            clock=self.clock,
+        )
+        self.addCleanup(self.index.close)
+
+    def test_fingerprint_window(self):
+        self.assertIsNone(self.index.claim("job1", "fp1"))
+        self.assertEqual(self.index.claim("job2", "fp1"), "job1")
+        self.assertIsNone(self.index.claim("job3", "fp2"))
+
+        # 失败的任务不复用，新任务接替
+        self.assertIsNone(self.index.claim("job4", "fp1", is_reusable=lambda job_id: job_id != "job1"))
+        self.assertEqual(self.index.claim("job5", "fp1"), "job4")
+
+        self.clock.now += 61
+        self.assertIsNone(self.index.claim("job6", "fp1"))
+
+    def test_idempotency_key(self):
+        self.assertIsNone(self.index.claim("job1", "fp1", "k1"))
+        self.clock.now += 600
+        # 指纹已过时间窗，key 仍然有效
+        self.assertEqual(self.index.claim("job2", "fp1", "k1"), "job1")
+        with self.assertRaises(IdempotencyConflictError):
+            self.index.claim("job3", "fp2", "k1")
+        with self.assertRaises(ValueError):
+            self.index.claim("job4", "fp1", "k" * 300)
+
+    def test_key_recorded_when_attached_by_fingerprint(self):
+        self.assertIsNone(self.index.claim("job1", "fp1"))
+        self.assertEqual(self.index.claim("job2", "fp1", "k1"), "job1")
+        self.clock.now += 600
+        self.assertEqual(self.index.claim("job3", "fp1", "k1"), "job1")
+        with self.assertRaises(IdempotencyConflictError):
+            self.index.claim("job4", "fp2", "k1")
+
+    def test_forget(self):
+        self.assertIsNone(self.index.claim("job1", "fp1", "k1"))
+        self.index.forget("job1")
+        self.assertIsNone(self.index.claim("job2", "fp1", "k1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import main
+from inflight import AsyncSingleFlight, FileLeases, SingleFlight
+from media_cache import MediaCache, MediaFetch
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(flights.do, "k", work)]
+            started.wait(2)
+            futures += [pool.submit(flights.do, "k", work) for _ in range(4)]
+            time.sleep(0.05)
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r[0] for r in results], ["result"] * 5)
+        self.assertEqual(sum(1 for _, shared in results if shared), 4)
+        self.assertFalse(flights.in_flight("k"))
+
+    def test_errors_propagate_to_waiters_and_next_call_retries(self):
+        flights = SingleFlight()
+
+        def boom():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            flights.do("k", boom)
+        self.assertEqual(flights.do("k", lambda: 42), (42, False))
+
+    def test_on_complete_counts_all_callers(self):
+        flights = SingleFlight()
+        seen = []
+        gate = threading.Event()
+
+        def work():
+            gate.wait(2)
+            return "path"
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [
+                pool.submit(flights.do, "k", work, lambda r, n: seen.append((r, n)))
+                for _ in range(3)
+            ]
+            time.sleep(0.05)
+            gate.set()
+            for f in futures:
+                f.result()
+
+        self.assertEqual(seen, [("path", 3)])
+
+
+class AsyncSingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_caller_does_not_cancel_shared_work(self):
+        flights = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+        completed = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        def on_complete(result, callers):
+            completed.append(callers)
+
+        leader = asyncio.create_task(flights.do("k", work, on_complete=on_complete))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("k", work, on_complete=on_complete))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await follower, ("result", True))
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(calls, [1])
+        # 被取消的调用方不再计入引用
+        self.assertEqual(completed, [1])
+        self.assertFalse(flights.in_flight("k"))
+
+
+class FileLeasesTest(unittest.TestCase):
+    def test_reference_counting(self):
+        leases = FileLeases()
+        leases.acquire("a.mp3", 2)
+        self.assertTrue(leases.is_leased(os.path.abspath("a.mp3")))
+        leases.release("a.mp3")
+        self.assertEqual(leases.count("a.mp3"), 1)
+        leases.release("a.mp3")
+        self.assertFalse(leases.is_leased("a.mp3"))
+
+
+class CoalescedDownloadTest(unittest.TestCase):
+    def test_canonicalize_url(self):
+        self.assertEqual(
+            main.canonicalize_url("HTTPS://V.Douyin.com:443/AbC/?b=2&a=1#frag"),
+            "https://v.douyin.com/AbC?a=1&b=2",
+        )
+
+    def test_concurrent_downloads_share_file_and_cleanup_skips_it(self):
+        cache = MediaCache(None, is_pinned=main.FILE_LEASES.is_leased)
+        with tempfile.TemporaryDirectory() as tmp_dir, patch("main._media_cache", cache):
+            target = os.path.join(tmp_dir, "shared.mp3")
+            calls = []
+
+            def fake_download(audio_url, output_dir, preferred_ext, filename_stem, validators):
+                calls.append(audio_url)
+                time.sleep(0.1)
+                with open(target, "wb") as f:
+                    f.write(b"audio")
+                return MediaFetch(target)
+
+            with patch("main._download_audio_file", side_effect=fake_download):
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    paths = list(
+                        pool.map(
+                            lambda url: main.download_audio_from_direct_url(url, tmp_dir, lease=True),
+                            ["https://cdn.example.com/a.mp3?x=1", "https://CDN.example.com/a.mp3?x=1"] * 2,
+                        )
+                    )
+
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(set(paths), {target})
+            self.assertEqual(main.FILE_LEASES.count(target), 4)
+
+            old = time.time() - 3 * 3600
+            os.utime(target, (old, old))
+            main.cleanup_old_files(tmp_dir, max_age_hours=1)
+            self.assertTrue(os.path.exists(target))
+
+            for path in paths:
+                main.release_file(path)
+            # 媒体缓存中的文件不按时间清理，移出缓存后才会被清理
+            main.cleanup_old_files(tmp_dir, max_age_hours=1)
+            self.assertTrue(os.path.exists(target))
+            cache.invalidate("audio:https://cdn.example.com/a.mp3?x=1")
+            main.cleanup_old_files(tmp_dir, max_age_hours=1)
+            self.assertFalse(os.path.exists(target))
+
+
+if __name__ == "__main__":
+    unittest.main()
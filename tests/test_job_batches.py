@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from job_batches import BatchItem, BatchStore, parse_sources, run_batch, write_batch_zip
+from job_scheduler import QueueFullError
+
+
+class ParseSourcesTest(unittest.TestCase):
+    def test_lines_and_json(self):
+        lines = "https://youtu.be/abc\n\n7.9 复制打开抖音 https://v.douyin.com/xyz/\nhttps://cdn.example.com/a.mp4\n"
+        self.assertEqual(
+            [t for t, _ in parse_sources(lines)],
+            ["youtube", "douyin", "video_url"],
+        )
+        raw = json.dumps(["https://youtu.be/abc", {"source_type": "video_url", "source": "https://x/y.m3u8"}])
+        self.assertEqual(parse_sources(raw), [("youtube", "https://youtu.be/abc"), ("video_url", "https://x/y.m3u8")])
+        self.assertEqual(parse_sources(None), [])
+
+        for bad in ("hello", "[1]", '[{"source_type": "audio", "source": "a.mp3"}]', "[not json"):
+            with self.assertRaises(ValueError):
+                parse_sources(bad)
+
+
+class RunBatchTest(unittest.TestCase):
+    def test_concurrency_cap_queue_retry_and_outcomes(self):
+        items = [BatchItem(i, "youtube", f"https://youtu.be/{i}", f"job{i}") for i in range(6)]
+        running = 0
+        peak = 0
+        rejected = []
+        updates = []
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        async def submit(item):
+            if item.index == 2 and not rejected:
+                rejected.append(item.index)
+                raise QueueFullError(1)
+            if item.index == 4:
+                raise RuntimeError("坏链接")
+            return asyncio.ensure_future(job())
+
+        def outcome(job_id):
+            return ("error", "失败", None) if job_id == "job5" else ("done", "", f"{job_id}.txt")
+
+        async def no_sleep(_):
+            return None
+
+        asyncio.run(run_batch(items, 2, submit, outcome, lambda item: updates.append((item.index, item.status)), no_sleep))
+
+        self.assertLessEqual(peak, 2)
+        self.assertEqual(rejected, [2])
+        self.assertEqual([i.status for i in items], ["done", "done", "done", "done", "error", "error"])
+        self.assertEqual(items[4].message, "坏链接")
+        self.assertEqual(items[0].output_filename, "job0.txt")
+        self.assertIn((3, "running"), updates)
+
+
+class BatchStoreTest(unittest.TestCase):
+    def test_manifest_zip_and_interrupt(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = BatchStore(os.path.join(tmp, "cache", "jobs.sqlite3"))
+            self.addCleanup(store.close)
+            items = [BatchItem(0, "youtube", "https://youtu.be/a", "job0"), BatchItem(1, "audio", "b.mp3", "job1")]
+            store.create("b1", items, 2)
+            items[0].status, items[0].output_filename = "done", "a.txt"
+            items[1].status, items[1].message = "error", "失败"
+            store.update_item("b1", items[0])
+            store.update_item("b1", items[1])
+
+            manifest = store.manifest("b1")
+            self.assertEqual(manifest["status"], "running")
+            self.assertEqual(manifest["counts"], {"pending": 0, "running": 0, "done": 1, "error": 1})
+            self.assertEqual(manifest["items"][1]["message"], "失败")
+            self.assertIsNone(store.manifest("missing"))
+
+            with open(os.path.join(tmp, "a.txt"), "w", encoding="utf-8") as f:
+                f.write("转写")
+            target = os.path.join(tmp, "out.zip")
+            self.assertEqual(write_batch_zip(manifest, lambda name: os.path.join(tmp, name), target), 1)
+            with zipfile.ZipFile(target) as zf:
+                self.assertEqual(sorted(zf.namelist()), ["0000_a.txt", "manifest.json"])
+                self.assertEqual(zf.read("0000_a.txt").decode("utf-8"), "转写")
+
+            self.assertEqual(store.mark_interrupted(), ["b1"])
+            self.assertEqual(store.manifest("b1")["status"], "interrupted")
+            self.assertEqual(store.mark_interrupted(), [])
+
+    def test_mark_interrupted_skips_batches_of_live_workers(self):
+        store = BatchStore()
+        self.addCleanup(store.close)
+        store.create("mine", [], 1)
+        store.create("other", [], 1)
+        store.create("dead", [], 1)
+        store._conn.execute("UPDATE batches SET owner_pid = 1 WHERE batch_id = 'other'")
+        store._conn.execute("UPDATE batches SET owner_pid = 2 WHERE batch_id = 'dead'")
+        with patch("job_batches._pid_alive", side_effect=lambda pid: pid == 1):
+            self.assertEqual(sorted(store.mark_interrupted()), ["dead", "mine"])
+        self.assertEqual(store.manifest("other")["status"], "running")
+
+
+if __name__ == "__main__":
+    unittest.main()
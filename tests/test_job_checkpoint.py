@@ -0,0 +1,206 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import job_checkpoint
+from job_checkpoint import (
+    Checkpoint,
+    CheckpointBusyError,
+    FatalStepError,
+    LocalCheckpointStore,
+    SegmentedTranscription,
+    advance,
+    claim,
+    new_token,
+    next_segment,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CheckpointStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = LocalCheckpointStore(os.path.join(self.tmp.name, "checkpoints"))
+
+    def test_round_trip_and_invalid_token(self):
+        token = new_token()
+        self.store.save(token, Checkpoint("job1", "youtube", params={"youtube_url": "https://youtu.be/a"}, offset=30.0))
+        loaded = self.store.load(token)
+        self.assertEqual((loaded.job_id, loaded.offset, loaded.params["youtube_url"]), ("job1", 30.0, "https://youtu.be/a"))
+        self.assertIsNone(self.store.load("../../etc/passwd"))
+        with self.assertRaises(ValueError):
+            self.store.save("bad token", loaded)
+        self.assertEqual(self.store.prune(-1), 1)
+        self.assertIsNone(self.store.load(token))
+
+    def test_claim_lease(self):
+        token = new_token()
+        self.store.save(token, Checkpoint("job1", "audio"))
+        checkpoint = claim(self.store, token, 60)
+        self.assertGreater(checkpoint.lease_until, 0)
+        with self.assertRaises(CheckpointBusyError):
+            claim(self.store, token, 60)
+        self.assertIsNone(claim(self.store, new_token(), 60))
+
+        async def noop(cp):
+            cp.stage = "done"
+
+        asyncio.run(advance(checkpoint, noop, lambda cp: self.store.save(token, cp)))
+        self.assertEqual(claim(self.store, token, 60).stage, "done")
+
+    def test_claim_is_compare_and_swap(self):
+        token = new_token()
+        self.store.save(token, Checkpoint("job1", "audio"))
+        # 另一个进程正持有锁文件
+        lock_path = os.path.join(self.store.root, f"{token}.json.lock")
+        open(lock_path, "w").close()
+        with self.assertRaises(CheckpointBusyError):
+            claim(self.store, token, 60)
+        os.remove(lock_path)
+
+        # 读取之后、写入之前被另一次调用抢先占用
+        stale = self.store.load(token)
+        self.assertIsNotNone(claim(self.store, token, 60))
+        stale.lease_until = 1.0
+        self.assertFalse(self.store.compare_and_swap(token, stale, 0.0))
+        self.assertFalse(os.path.exists(lock_path))
+
+
+class AdvanceTest(unittest.TestCase):
+    def test_budget_failures_and_interrupted_step(self):
+        clock = FakeClock()
+        saved = []
+
+        async def step(cp):
+            clock.now += 10
+            cp.offset += 10
+            if cp.offset >= 50:
+                cp.stage = "done"
+
+        checkpoint = Checkpoint("job1", "audio", stage="transcribe")
+        steps = asyncio.run(advance(checkpoint, step, saved.append, budget_seconds=25, clock=clock))
+        # 第二步之后剩余 5 秒，不够按 10 秒估计的下一步
+        self.assertEqual((steps, checkpoint.offset, checkpoint.estimates["transcribe"]), (2, 20, 10))
+        self.assertIsNone(checkpoint.running_stage)
+        self.assertEqual(checkpoint.lease_until, 0.0)
+        self.assertTrue(saved)
+
+        # 预算再小也至少推进一步
+        self.assertEqual(asyncio.run(advance(checkpoint, step, saved.append, budget_seconds=1, clock=clock)), 1)
+
+        # 上次调用在转写中途被终止：缩短分段
+        checkpoint.running_stage = "transcribe"
+        checkpoint.segment_seconds = 300
+        asyncio.run(advance(checkpoint, step, saved.append, budget_seconds=100, clock=clock))
+        self.assertEqual(checkpoint.segment_seconds, 150)
+        self.assertEqual(checkpoint.stage, "done")
+
+        # 无法拆小的步骤（如下载）反复被终止时计入失败，不再无限续传
+        async def killed(cp):
+            raise asyncio.CancelledError  # 模拟平台在该步中途终止调用
+
+        checkpoint = Checkpoint("job3", "audio")
+        for _ in range(job_checkpoint.MAX_STEP_FAILURES):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(advance(checkpoint, killed, lambda cp: None, clock=clock))
+        self.assertEqual(asyncio.run(advance(checkpoint, killed, lambda cp: None, clock=clock)), 0)
+        self.assertEqual(checkpoint.stage, "error")
+
+        async def failing(cp):
+            raise RuntimeError("网络错误")
+
+        checkpoint = Checkpoint("job2", "audio")
+        for _ in range(job_checkpoint.MAX_STEP_FAILURES):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(advance(checkpoint, failing, saved.append, clock=clock))
+        self.assertEqual((checkpoint.stage, checkpoint.message), ("error", "网络错误"))
+
+    def test_next_segment(self):
+        checkpoint = Checkpoint("job1", "audio", segment_seconds=300)
+        self.assertIsNone(next_segment(checkpoint))
+        checkpoint.duration = 303
+        self.assertIsNone(next_segment(checkpoint))
+        checkpoint.duration = 903
+        self.assertEqual(next_segment(checkpoint), 300)
+        checkpoint.offset = 600
+        self.assertEqual(next_segment(checkpoint), 303)
+
+
+class SegmentedTranscriptionTest(unittest.TestCase):
+    def test_resume_across_invocations(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = os.path.join(tmp, "talk.mp3")
+            with open(audio, "wb") as f:
+                f.write(b"ID3audio")
+            store = LocalCheckpointStore(os.path.join(tmp, "checkpoints"))
+            token = new_token()
+            store.save(token, Checkpoint("job1", "audio", audio_path=audio, segment_seconds=300))
+
+            async def fake_extract(path, start, length, output_path):
+                shutil.copyfile(path, output_path)
+                return output_path
+
+            transcribed = []
+
+            def fake_transcribe(api_key, path, *args):
+                transcribed.append((api_key, os.path.basename(path)))
+                return f"第{len(transcribed)}段"
+
+            outputs = []
+            segments = []
+            pipeline = SegmentedTranscription(
+                tmp,
+                lambda name: os.path.join(tmp, name),
+                on_output=outputs.append,
+                on_segment=lambda text, start: segments.append(start),
+                api_key="key",
+            )
+            invocations = 0
+            with patch.object(job_checkpoint, "probe_duration", return_value=650.0), patch.object(
+                job_checkpoint, "extract_segment", fake_extract
+            ), patch("main.transcribe_audio_streaming", fake_transcribe), patch(
+                "job_checkpoint.shutil.which", return_value="/usr/bin/ffprobe"
+            ):
+                while True:
+                    checkpoint = claim(store, token, 60)
+                    if checkpoint.finished:
+                        break
+                    invocations += 1
+                    # 每次调用只够执行一步
+                    asyncio.run(advance(checkpoint, pipeline, lambda cp: store.save(token, cp), budget_seconds=0))
+
+            self.assertEqual(invocations, 5)  # fetch + 3 段 + finish
+            self.assertEqual(checkpoint.stage, "done")
+            self.assertEqual(checkpoint.transcript, "第1段\n\n第2段\n\n第3段")
+            self.assertEqual(len(transcribed), 3)
+            self.assertEqual(segments, [0, 3, 8])
+            self.assertNotEqual(transcribed[0][1], "talk.mp3")
+            self.assertEqual(outputs, [os.path.join(tmp, "talk.txt")])
+            with open(outputs[0], encoding="utf-8") as f:
+                self.assertEqual(f.read(), checkpoint.transcript)
+            self.assertEqual(checkpoint.progress()["percent"], 100.0)
+
+    def test_missing_ffprobe_fails_job_immediately(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Checkpoint("job1", "audio", audio_path=os.path.join(tmp, "talk.mp3"))
+            pipeline = SegmentedTranscription(tmp, lambda name: os.path.join(tmp, name))
+            with patch("job_checkpoint.shutil.which", return_value=None):
+                with self.assertRaises(FatalStepError):
+                    asyncio.run(advance(checkpoint, pipeline, lambda cp: None))
+            self.assertEqual(checkpoint.stage, "error")
+            self.assertIn("ffprobe", checkpoint.message)
+
+
+if __name__ == "__main__":
+    unittest.main()
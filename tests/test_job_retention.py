@@ -0,0 +1,88 @@
+import gc
+import tracemalloc
+import unittest
+from dataclasses import dataclass
+from typing import Optional
+
+from job_retention import JobTable
+
+
+@dataclass
+class FakeJob:
+    status: str = "pending"
+    message: str = ""
+    transcript: str = ""
+    output_filename: Optional[str] = None
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class JobTableTest(unittest.TestCase):
+    def test_running_jobs_stay_and_finished_jobs_are_evicted_lru(self):
+        clock = FakeClock()
+        table = JobTable(ttl_seconds=100, max_finished=2, max_bytes=1 << 20, clock=clock)
+        for job_id in ("a", "b", "c"):
+            table[job_id] = FakeJob(status="done", transcript=job_id * 10, output_filename=f"{job_id}.txt")
+        table["running"] = FakeJob(status="running")
+        table.finish("a")
+        table.finish("b")
+        # 访问 a 之后 b 成为最久未使用
+        self.assertIsNotNone(table.get("a"))
+        table.finish("c")
+
+        self.assertNotIn("b", table)
+        self.assertEqual(sorted(table), ["a", "c", "running"])
+        summary = table.summary("b")
+        self.assertEqual((summary.status, summary.output_filename, summary.transcript_length), ("done", "b.txt", 10))
+
+        clock.now = 150
+        self.assertEqual(table.evict_expired(), 2)
+        self.assertEqual(list(table), ["running"])
+        self.assertEqual(table.usage()["finished"], 0)
+
+    def test_byte_budget(self):
+        table = JobTable(ttl_seconds=1e9, max_finished=100, max_bytes=30_000)
+        for i in range(5):
+            table[str(i)] = FakeJob(status="done", transcript="x" * 10_000)
+            table.finish(str(i))
+        usage = table.usage()
+        self.assertLessEqual(usage["finished_bytes"], 30_000)
+        self.assertEqual(usage["finished"] + usage["evicted"], 5)
+        self.assertEqual(list(table), [str(i) for i in range(5 - usage["finished"], 5)])
+
+    def test_memory_stays_flat_across_10k_jobs(self):
+        table = JobTable(ttl_seconds=1e9, max_finished=100, max_bytes=1 << 20, max_summaries=500)
+
+        def run(start, count):
+            for i in range(start, start + count):
+                job_id = f"job-{i}"
+                table[job_id] = FakeJob(status="running")
+                table.get(job_id).transcript = "转写文本" * 500
+                table.get(job_id).status = "done"
+                table.finish(job_id)
+
+        tracemalloc.start()
+        try:
+            run(0, 2_000)
+            gc.collect()
+            warm, _ = tracemalloc.get_traced_memory()
+            run(2_000, 8_000)
+            gc.collect()
+            after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(table), 100)
+        self.assertEqual(table.usage()["summaries"], 500)
+        # 从 2k 到 10k 个任务，内存占用基本不变
+        self.assertLess(after - warm, 256 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
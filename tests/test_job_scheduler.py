@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+from job_scheduler import JobScheduler, QueueFullError
+
+
+class JobSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stage_limits_concurrency_and_reports_positions(self):
+        positions = []
+        scheduler = JobScheduler(
+            {"transcribe": 1},
+            max_queue=10,
+            on_position=lambda job_id, stage, pos: positions.append((job_id, stage, pos)),
+        )
+        release = asyncio.Event()
+        running = []
+        peak = []
+
+        async def job(name):
+            async with scheduler.stage(name, "transcribe"):
+                running.append(name)
+                peak.append(len(running))
+                await release.wait()
+                running.remove(name)
+
+        tasks = [scheduler.submit(name, lambda name=name: job(name)) for name in ("a", "b", "c")]
+        await asyncio.sleep(0.01)
+        self.assertEqual(running, ["a"])
+        self.assertEqual(positions, [("b", "transcribe", 1), ("c", "transcribe", 2)])
+
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(max(peak), 1)
+        # a 完成后 c 前移到第 1 位
+        self.assertIn(("c", "transcribe", 1), positions)
+        self.assertEqual(scheduler.stats()["active"], 0)
+
+    async def test_rejects_when_queue_is_full(self):
+        scheduler = JobScheduler({"download": 1}, max_queue=2)
+        release = asyncio.Event()
+
+        async def job(name):
+            async with scheduler.stage(name, "download"):
+                await release.wait()
+
+        tasks = [scheduler.submit("a", lambda: job("a"))]
+        await asyncio.sleep(0.01)
+        tasks += [scheduler.submit(name, lambda name=name: job(name)) for name in ("b", "c")]
+        await asyncio.sleep(0.01)
+        # a 在运行，b、c 排队
+        self.assertEqual(scheduler.queued, 2)
+        called = []
+        with self.assertRaises(QueueFullError) as ctx:
+            scheduler.submit("d", lambda: called.append(1))
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(called, [])
+
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(scheduler.queued, 0)
+
+    async def test_cancelled_waiter_leaves_queue_and_slot_is_reused(self):
+        scheduler = JobScheduler({"download": 1}, max_queue=10)
+        release = asyncio.Event()
+        order = []
+
+        async def job(name):
+            async with scheduler.stage(name, "download"):
+                order.append(name)
+                await release.wait()
+
+        a = scheduler.submit("a", lambda: job("a"))
+        b = scheduler.submit("b", lambda: job("b"))
+        c = scheduler.submit("c", lambda: job("c"))
+        await asyncio.sleep(0.01)
+        b.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(a, c)
+
+        self.assertEqual(order, ["a", "c"])
+        self.assertEqual(scheduler.stats()["stages"]["download"], {"workers": 1, "running": 0, "waiting": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
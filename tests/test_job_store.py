@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from job_store import JobStore
+
+
+class JobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "cache", "jobs.sqlite3")
+
+    def _store(self, **kwargs):
+        store = JobStore(self.db_path, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_status_params_and_transcript_offsets(self):
+        store = self._store()
+        store.create("j1", "douyin", params={"douyin_text": "分享"}, has_credentials=True)
+        store.update_params("j1", audio_path="/data/a.mp3")
+        self.assertEqual(store.append_transcript("j1", "你好，"), 0)
+        self.assertEqual(store.append_transcript("j1", "世界"), 3)
+        # 按偏移追加：同一段重复提交时只写入一次
+        self.assertEqual(store.append_transcript("j1", "世界", at=3), -1)
+        store.set_status("j1", "done", output_filename="a.txt")
+
+        record = store.get("j1")
+        self.assertEqual(record.status, "done")
+        self.assertEqual(record.params, {"douyin_text": "分享", "audio_path": "/data/a.mp3"})
+        self.assertTrue(record.has_credentials)
+        self.assertEqual(record.output_filename, "a.txt")
+        self.assertEqual(record.transcript_length, 5)
+        self.assertEqual(store.transcript("j1"), "你好，世界")
+        # 偏移落在分片中间时只返回之后的部分
+        self.assertEqual(store.transcript("j1", 4), "界")
+        self.assertEqual(store.transcript("j1", 5), "")
+        self.assertEqual([r.job_id for r in store.list_by_status("done")], ["j1"])
+
+        with open(os.path.join(self.tmp.name, "cache", "jobs.sqlite3"), "rb") as f:
+            self.assertTrue(f.read(16).startswith(b"SQLite format 3"))
+        mode = store._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_claim_interrupted_requeues_jobs_of_dead_processes(self):
+        store = self._store(max_attempts=2)
+        store.create("running", "youtube")
+        store.append_transcript("running", "partial")
+        store.set_status("running", "running")
+        store.create("finished", "youtube")
+        store.set_status("finished", "done")
+        store.create("other", "youtube")
+        store._conn.execute("UPDATE jobs SET owner_pid = 999999 WHERE job_id = 'other'")
+        store.create("alive", "youtube")
+        store._conn.execute("UPDATE jobs SET owner_pid = 1 WHERE job_id = 'alive'")
+
+        reopened = self._store(max_attempts=2)
+        with patch("job_store._pid_alive", side_effect=lambda pid: pid == 1):
+            claimed = reopened.claim_interrupted()
+
+        self.assertEqual(sorted(r.job_id for r in claimed), ["other", "running"])
+        requeued = reopened.get("running")
+        self.assertEqual((requeued.status, requeued.attempts, requeued.transcript_length), ("pending", 2, 0))
+        self.assertEqual(reopened.transcript("running"), "")
+        self.assertEqual(reopened.get("alive").status, "pending")
+
+        # 再次中断后超过重试上限，标记为失败
+        with patch("job_store._pid_alive", return_value=False):
+            self.assertEqual([r.job_id for r in reopened.claim_interrupted()], ["alive"])
+        self.assertEqual(reopened.get("running").status, "error")
+
+
+if __name__ == "__main__":
+    unittest.main()
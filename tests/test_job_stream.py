@@ -0,0 +1,68 @@
+import asyncio
+import json
+import unittest
+
+from job_stream import choose_stream_format, encode_event, stream_events
+
+
+async def _events(*frames, delay=0.0):
+    for frame in frames:
+        if delay:
+            await asyncio.sleep(delay)
+        yield frame
+
+
+class ChooseFormatTest(unittest.TestCase):
+    def test_explicit_parameter_then_accept_header(self):
+        self.assertEqual(choose_stream_format("SSE"), "sse")
+        self.assertEqual(choose_stream_format(None, "application/x-ndjson"), "ndjson")
+        self.assertEqual(choose_stream_format("", "text/event-stream, */*"), "sse")
+        self.assertIsNone(choose_stream_format(None, "application/json"))
+        with self.assertRaises(ValueError):
+            choose_stream_format("xml")
+
+    def test_sse_encoding_carries_seq_as_id(self):
+        data = encode_event({"type": "chunk", "data": "你好", "seq": 3}, "sse").decode("utf-8")
+        self.assertEqual(data, 'id: 3\nevent: chunk\ndata: {"type": "chunk", "data": "你好", "seq": 3}\n\n')
+
+
+class StreamEventsTest(unittest.IsolatedAsyncioTestCase):
+    async def _collect(self, events, fmt="ndjson", **kwargs):
+        return [line async for line in stream_events(events, fmt, **kwargs)]
+
+    async def test_batches_are_expanded_and_heartbeats_sent_while_idle(self):
+        frames = [
+            {"type": "batch", "data": [{"type": "status", "data": "开始"}, {"type": "chunk", "data": "a"}], "seq": 1},
+            {"type": "done", "data": {}, "seq": 2},
+        ]
+        lines = await self._collect(_events(*frames, delay=0.05), heartbeat_seconds=0.02)
+        events = [json.loads(line) for line in lines]
+        self.assertIn({"type": "heartbeat"}, events)
+        self.assertEqual([e for e in events if e["type"] != "heartbeat"], [
+            {"type": "status", "data": "开始", "seq": 1},
+            {"type": "chunk", "data": "a", "seq": 1},
+            {"type": "done", "data": {}, "seq": 2},
+        ])
+
+    async def test_stops_when_client_disconnects(self):
+        closed = asyncio.Event()
+
+        async def endless():
+            try:
+                await asyncio.sleep(10)
+                yield {"type": "chunk", "data": "never"}
+            finally:
+                closed.set()
+
+        async def disconnected():
+            return True
+
+        lines = await asyncio.wait_for(
+            self._collect(endless(), "sse", is_disconnected=disconnected, heartbeat_seconds=0.01), 2
+        )
+        self.assertEqual(lines, [])
+        self.assertTrue(closed.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
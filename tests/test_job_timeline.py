@@ -0,0 +1,102 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import job_timeline as timeline_module
+from job_timeline import JobTimeline, TimelineLog, aggregate, current_timeline, job_timeline, main
+from metrics import record_bytes, time_stage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class JobTimelineTest(unittest.TestCase):
+    def test_record_breakdown(self):
+        clock = FakeClock()
+        timeline = JobTimeline("job1", "web", clock=clock)
+        timeline.record_stage("download", 100.5, 102.5)
+        timeline.record_stage("ttft", 103.0, 104.0)
+        timeline.record_stage("generate", 103.0, 108.0)
+        timeline.add_bytes("download", 2048)
+        timeline.add_chars(500)
+        clock.now = 110.0
+
+        record = timeline.finish("done")
+        self.assertEqual(record["total_ms"], 10_000.0)
+        self.assertEqual(record["ttft_ms"], 1000.0)
+        self.assertEqual(record["chars_per_second"], 100.0)
+        self.assertEqual(record["bytes"], {"download": 2048})
+        self.assertEqual([s["stage"] for s in record["stages"]], ["download", "ttft", "generate"])
+        self.assertEqual(record["stages"][0], {"stage": "download", "start_ms": 500.0, "duration_ms": 2000.0})
+        # 重复结束返回同一记录
+        clock.now = 200.0
+        self.assertIs(timeline.finish("error"), record)
+
+    def test_metrics_helpers_feed_current_timeline_across_threads(self):
+        async def run():
+            with job_timeline("job2", "web") as timeline:
+                def work():
+                    with time_stage("extract"):
+                        record_bytes("upload", 10)
+
+                await asyncio.to_thread(work)
+                return timeline
+
+        timeline = asyncio.run(run())
+        self.assertIsNone(current_timeline())
+        record = timeline.finish("done")
+        self.assertEqual([s["stage"] for s in record["stages"]], ["extract"])
+        self.assertEqual(record["bytes"], {"upload": 10})
+
+    def test_log_and_percentiles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache", "timeline.jsonl")
+            log = TimelineLog(path)
+            for i in range(1, 101):
+                log.append({
+                    "job_id": str(i),
+                    "source": "bot" if i % 2 else "web",
+                    "total_ms": float(i * 10),
+                    "stages": [
+                        {"stage": "download", "duration_ms": float(i)},
+                        {"stage": "download", "duration_ms": 1.0},
+                    ],
+                })
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("not json\n")
+
+            records = log.read()
+            self.assertEqual(len(records), 100)
+            summary = aggregate(records)
+            self.assertEqual(summary["download"], {"count": 100, "p50": 51.0, "p95": 96.0, "p99": 100.0})
+            self.assertEqual(summary["total"]["p99"], 990.0)
+            self.assertEqual(len(log.read(last=10)), 10)
+
+            out = io.StringIO()
+            with redirect_stdout(out):
+                main([path, "--source", "web"])
+            self.assertIn("download", out.getvalue())
+
+    def test_default_path_and_override(self):
+        # 默认路径以项目目录为基准，与当前工作目录无关
+        if "JOB_TIMELINE_PATH" not in os.environ:
+            self.assertTrue(os.path.isabs(timeline_module.DEFAULT_TIMELINE_PATH))
+        previous = timeline_module.get_timeline_log()
+        self.addCleanup(setattr, timeline_module, "_log", previous)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache", "job_timeline.jsonl")
+            timeline_module.set_timeline_path(path)
+            timeline_module.get_timeline_log().append({"job_id": "j1"})
+            self.assertEqual(TimelineLog(path).read(), [{"job_id": "j1"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
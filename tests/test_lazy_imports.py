@@ -0,0 +1,83 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+from lazy_imports import (
+    IMPORT_BUDGET_CHECK,
+    IMPORT_BUDGETS_MS,
+    ImportProfile,
+    check_budget,
+    module_available,
+    parse_importtime,
+    profile_imports,
+    warm_imports,
+)
+
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       452 |     794505 | google.genai
+import time:       751 |       1200 |   google.oauth2
+import time:        30 |         30 |     json
+"""
+
+
+class LazyImportsTest(unittest.TestCase):
+    def test_parse_importtime(self):
+        records = parse_importtime(SAMPLE)
+        self.assertEqual([(r.name, r.depth) for r in records], [("google.genai", 0), ("google.oauth2", 1), ("json", 2)])
+        self.assertEqual(records[0].cumulative_us, 794505)
+
+    def test_check_budget(self):
+        profile = ImportProfile(target="main", total_ms=IMPORT_BUDGETS_MS["main"] * 10)
+        self.assertEqual(check_budget(profile, timed=False), [])
+        self.assertEqual(len(check_budget(profile, timed=True)), 1)
+        profile.records = parse_importtime(SAMPLE)
+        self.assertIn("google.genai", check_budget(profile, timed=False)[0])
+
+    def test_module_available(self):
+        self.assertTrue(module_available("json"))
+        self.assertFalse(module_available("no_such_module_xyz"))
+        self.assertFalse(module_available("no_such_package_xyz.sub"))
+
+    def test_warm_imports_once(self):
+        sys.modules.pop("wave", None)
+        thread = warm_imports(("wave", "no_such_module_xyz"))
+        self.assertIsNotNone(thread)
+        thread.join(10)
+        self.assertIn("wave", sys.modules)
+        self.assertIsNone(warm_imports(("wave",)))
+
+
+class ImportBudgetTest(unittest.TestCase):
+    """各入口加载时不导入重型依赖；IMPORT_BUDGET_CHECK=1 时还检查导入耗时不超过预算（冷启动回退时失败）。"""
+
+    def assert_within_budget(self, target, env=None):
+        profile = profile_imports(target, env=env)
+        self.assertEqual(check_budget(profile, timed=IMPORT_BUDGET_CHECK), [], f"{target}: {profile.total_ms}ms")
+
+    def test_cli_and_download_modules(self):
+        self.assertLess(IMPORT_BUDGETS_MS["main"], IMPORT_BUDGETS_MS["api/index.py"])
+        self.assert_within_budget("main")
+        self.assert_within_budget("async_download")
+
+    @unittest.skipIf(importlib.util.find_spec("telegram") is None, "未安装 python-telegram-bot")
+    def test_telegram_bot(self):
+        self.assert_within_budget("telegram_bot")
+
+    @unittest.skipIf(importlib.util.find_spec("fastapi") is None, "未安装 fastapi")
+    def test_vercel_entry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assert_within_budget(
+                "api/index.py",
+                env={
+                    "DATA_DIR": tmp,
+                    "JOB_STORE_PATH": os.path.join(tmp, "cache", "jobs.sqlite3"),
+                    "JOB_TIMELINE_PATH": "",
+                },
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import main
+from media_cache import EVICTION_GRACE_SECONDS, MediaCache, MediaFetch
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class MediaCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.clock = FakeClock()
+
+    def _file(self, name, size):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_evicts_least_recently_used_over_budget(self):
+        cache = MediaCache(max_bytes=250, clock=self.clock)
+        a = self._file("a.mp3", 100)
+        b = self._file("b.mp3", 100)
+        cache.put("a", a)
+        self.clock.now += 10
+        cache.put("b", b)
+        self.clock.now += EVICTION_GRACE_SECONDS + 1
+        # 访问 a 后，b 成为最久未使用的条目
+        self.assertIsNotNone(cache.lookup("a"))
+        self.clock.now += EVICTION_GRACE_SECONDS + 1
+        cache.put("c", self._file("c.mp3", 100))
+
+        self.assertIsNone(cache.lookup("b"))
+        self.assertFalse(os.path.exists(b))
+        self.assertIsNotNone(cache.lookup("a"))
+        self.assertEqual(cache.total_bytes, 200)
+
+    def test_pinned_and_recent_entries_are_not_evicted(self):
+        pinned = set()
+        cache = MediaCache(max_bytes=150, is_pinned=lambda path: path in pinned, clock=self.clock)
+        a = self._file("a.mp3", 100)
+        cache.put("a", a)
+        pinned.add(os.path.abspath(a))
+        self.clock.now += EVICTION_GRACE_SECONDS + 1
+        cache.put("b", self._file("b.mp3", 100))
+        # a 被任务占用、b 刚写入，暂时允许超出容量
+        self.assertEqual(len(cache), 2)
+
+        pinned.clear()
+        self.clock.now += EVICTION_GRACE_SECONDS + 1
+        cache.put("c", self._file("c.mp3", 10))
+        self.assertIsNone(cache.lookup("a"))
+        self.assertFalse(os.path.exists(a))
+
+    def test_index_persists_and_drops_missing_files(self):
+        index = os.path.join(self.tmp.name, "cache", "index.json")
+        a = self._file("a.mp3", 10)
+        b = self._file("b.mp3", 10)
+        cache = MediaCache(index, clock=self.clock)
+        cache.put("a", a, etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+        cache.put("b", b)
+        os.remove(b)
+
+        reloaded = MediaCache(index, clock=self.clock)
+        self.assertEqual(len(reloaded), 1)
+        self.assertEqual(
+            reloaded.validators(reloaded.lookup("a")),
+            {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"},
+        )
+
+    def test_unwritable_index_keeps_entries_in_memory(self):
+        # 父路径是普通文件，无法创建索引目录（相当于只读的部署目录）
+        blocker = self._file("readonly", 0)
+        cache = MediaCache(os.path.join(blocker, "cache", "index.json"), clock=self.clock)
+        a = self._file("a.mp3", 10)
+        cache.put("a", a)
+        self.assertEqual(cache.lookup("a").path, os.path.abspath(a))
+
+    def test_put_takes_over_path_owned_by_another_key(self):
+        cache = MediaCache(clock=self.clock)
+        a = self._file("a.mp3", 10)
+        cache.put("old", a)
+        cache.put("new", a)
+        self.assertIsNone(cache.lookup("old"))
+        self.assertEqual(cache.lookup("new").path, os.path.abspath(a))
+        self.assertEqual(len(cache), 1)
+
+    def test_same_basename_on_different_hosts_gets_distinct_paths(self):
+        paths = {
+            main._video_download_paths(url, self.tmp.name, "m4a")[3]
+            for url in ("https://a.example/media/clip.mp4", "https://b.example/media/clip.mp4")
+        }
+        self.assertEqual(len(paths), 2)
+        _, is_audio, part_path, audio_path = main._video_download_paths(
+            "https://a.example/song.mp3?sig=1", self.tmp.name, "m4a"
+        )
+        self.assertTrue(is_audio)
+        self.assertNotEqual(part_path, audio_path)
+        self.assertNotEqual(
+            main._direct_audio_path("https://a.example/x", self.tmp.name, "mp3", None),
+            main._direct_audio_path("https://b.example/x", self.tmp.name, "mp3", None),
+        )
+
+
+class CachedMediaDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.clock = FakeClock()
+        self.cache = MediaCache(fresh_seconds=100, clock=self.clock)
+        patcher = patch("main._media_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(self.tmp.name, "a.mp3")
+        with open(self.path, "wb") as f:
+            f.write(b"audio")
+        self.seen_validators = []
+
+    def _fetch(self, result):
+        def fetch(validators):
+            self.seen_validators.append(validators)
+            return result
+        return fetch
+
+    def test_fresh_entry_skips_network(self):
+        main._cached_media_download("k", self._fetch(MediaFetch(self.path, etag='"v1"')))
+        self.clock.now += 50
+        self.assertEqual(main._cached_media_download("k", self._fetch(None)), os.path.abspath(self.path))
+        self.assertEqual(self.seen_validators, [{}])
+        self.assertEqual(main.fetch_cached_media("k"), os.path.abspath(self.path))
+
+    def test_stale_entry_revalidates_and_reuses_on_304(self):
+        main._cached_media_download("k", self._fetch(MediaFetch(self.path, etag='"v1"')))
+        self.clock.now += 200
+        self.assertIsNone(main.fetch_cached_media("k"))
+
+        path = main._cached_media_download("k", self._fetch(MediaFetch(not_modified=True)))
+        self.assertEqual(path, os.path.abspath(self.path))
+        self.assertEqual(self.seen_validators[-1], {"If-None-Match": '"v1"'})
+        # 304 后重新进入新鲜期
+        self.assertEqual(main.fetch_cached_media("k"), os.path.abspath(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
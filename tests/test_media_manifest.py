@@ -0,0 +1,216 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from media_manifest import (
+    MANIFEST_DASH,
+    MANIFEST_HLS,
+    Segment,
+    SegmentPlan,
+    async_resolve_manifest_plan,
+    detect_manifest_type,
+    download_segments,
+    parse_dash_manifest,
+    parse_hls_master,
+    parse_hls_media_playlist,
+    resolve_manifest_plan,
+    select_rendition,
+)
+
+
+MASTER_URL = "https://cdn.example.com/vod/master.m3u8"
+
+HLS_MASTER = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud-lo",NAME="lo",URI="audio/lo.m3u8"
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud-hi",NAME="hi",URI="audio/hi.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=2400000,CODECS="avc1.64001f,mp4a.40.2",RESOLUTION=1280x720,AUDIO="aud-hi"
+video/720.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=800000,CODECS="avc1.4d401e,mp4a.40.2",RESOLUTION=640x360,AUDIO="aud-lo"
+video/360.m3u8
+"""
+
+HLS_MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXTINF:6.0,
+seg0.ts
+#EXTINF:6.0,
+seg1.ts
+#EXTINF:3.0,
+seg2.ts
+#EXT-X-ENDLIST
+"""
+
+DASH_MPD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT10S">
+  <Period>
+    <AdaptationSet contentType="video" mimeType="video/mp4">
+      <SegmentTemplate initialization="$RepresentationID$/init.mp4" media="$RepresentationID$/$Number$.m4s"
+                       timescale="1000" duration="4000" startNumber="1"/>
+      <Representation id="v1" bandwidth="900000" codecs="avc1.4d401e"/>
+    </AdaptationSet>
+    <AdaptationSet contentType="audio" mimeType="audio/mp4">
+      <SegmentTemplate initialization="$RepresentationID$/init.mp4" media="$RepresentationID$/$Number%03d$.m4s"
+                       timescale="1000" duration="4000" startNumber="1"/>
+      <Representation id="a128" bandwidth="128000" codecs="mp4a.40.2"/>
+      <Representation id="a64" bandwidth="64000" codecs="mp4a.40.2"/>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+DASH_MULTI_PERIOD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT12S">
+  <Period id="p1" duration="PT8S">
+    <AdaptationSet contentType="audio" mimeType="audio/mp4">
+      <SegmentTemplate initialization="$RepresentationID$/init.mp4" media="$RepresentationID$/$Number$.m4s"
+                       timescale="1000" duration="4000" startNumber="1"/>
+      <Representation id="a64" bandwidth="64000" codecs="mp4a.40.2"/>
+    </AdaptationSet>
+  </Period>
+  <Period id="p2" start="PT8S">
+    <AdaptationSet contentType="audio" mimeType="audio/mp4">
+      <SegmentTemplate initialization="$RepresentationID$/init.mp4" media="$RepresentationID$/$Number$.m4s"
+                       timescale="1000" duration="4000" startNumber="3"/>
+      <Representation id="{second_id}" bandwidth="64000" codecs="mp4a.40.2"/>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+class ManifestParsingTest(unittest.TestCase):
+    def test_detect_manifest_type(self):
+        self.assertEqual(detect_manifest_type("https://x/y/index.m3u8?token=1"), MANIFEST_HLS)
+        self.assertEqual(detect_manifest_type("https://x/y/stream.mpd"), MANIFEST_DASH)
+        self.assertEqual(detect_manifest_type("https://x/play", "application/dash+xml"), MANIFEST_DASH)
+        self.assertIsNone(detect_manifest_type("https://x/video.mp4", "video/mp4"))
+
+    def test_hls_master_prefers_lowest_audio_rendition(self):
+        chosen = select_rendition(parse_hls_master(HLS_MASTER, MASTER_URL))
+        self.assertTrue(chosen.audio_only)
+        self.assertEqual(chosen.uri, "https://cdn.example.com/vod/audio/lo.m3u8")
+        self.assertEqual(chosen.bandwidth, 800000)
+
+    def test_hls_master_falls_back_to_lowest_variant(self):
+        master = "\n".join(line for line in HLS_MASTER.splitlines() if "EXT-X-MEDIA" not in line)
+        chosen = select_rendition(parse_hls_master(master, MASTER_URL))
+        self.assertFalse(chosen.audio_only)
+        self.assertEqual(chosen.uri, "https://cdn.example.com/vod/video/360.m3u8")
+
+    def test_hls_media_playlist_segments_and_byteranges(self):
+        plan = parse_hls_media_playlist(HLS_MEDIA, "https://cdn.example.com/vod/audio/lo.m3u8")
+        self.assertEqual(plan.container, "ts")
+        self.assertEqual(
+            [s.url for s in plan.segments],
+            [f"https://cdn.example.com/vod/audio/seg{i}.ts" for i in range(3)],
+        )
+
+        ranged = parse_hls_media_playlist(
+            "#EXTM3U\n#EXT-X-MAP:URI=\"main.mp4\",BYTERANGE=\"100@0\"\n"
+            "#EXT-X-BYTERANGE:500@100\nmain.mp4\n#EXT-X-BYTERANGE:400\nmain.mp4\n#EXT-X-ENDLIST\n",
+            "https://cdn.example.com/a/list.m3u8",
+        )
+        self.assertEqual(ranged.container, "mp4")
+        self.assertEqual(ranged.init_segment.byte_range, (0, 99))
+        self.assertEqual([s.byte_range for s in ranged.segments], [(100, 599), (600, 999)])
+
+    def test_hls_rejects_live_and_encrypted_playlists(self):
+        with self.assertRaises(RuntimeError):
+            parse_hls_media_playlist("#EXTM3U\n#EXTINF:6,\nseg.ts\n", MASTER_URL)
+        with self.assertRaises(RuntimeError):
+            parse_hls_media_playlist(
+                "#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI=\"k\"\n#EXTINF:6,\nseg.ts\n#EXT-X-ENDLIST\n",
+                MASTER_URL,
+            )
+
+    def test_dash_selects_lowest_audio_representation(self):
+        chosen = select_rendition(parse_dash_manifest(DASH_MPD, "https://cdn.example.com/d/stream.mpd"))
+        self.assertTrue(chosen.audio_only)
+        self.assertEqual(chosen.bandwidth, 64000)
+        plan = chosen.plan
+        self.assertEqual(plan.container, "mp4")
+        self.assertEqual(plan.init_segment.url, "https://cdn.example.com/d/a64/init.mp4")
+        self.assertEqual(
+            [s.url for s in plan.segments],
+            [f"https://cdn.example.com/d/a64/{n:03d}.m4s" for n in (1, 2, 3)],
+        )
+
+    def test_dash_multi_period_is_concatenated_or_rejected(self):
+        renditions = parse_dash_manifest(DASH_MULTI_PERIOD.format(second_id="a64"), "https://cdn.example.com/d/x.mpd")
+        self.assertEqual(len(renditions), 1)
+        plan = renditions[0].plan
+        self.assertEqual(plan.init_segment.url, "https://cdn.example.com/d/a64/init.mp4")
+        self.assertEqual(
+            [s.url for s in plan.segments],
+            [f"https://cdn.example.com/d/a64/{n}.m4s" for n in (1, 2, 3)],
+        )
+
+        # 各 Period 的初始化分片不同，拼接后的文件无法解析
+        with self.assertRaises(RuntimeError):
+            parse_dash_manifest(DASH_MULTI_PERIOD.format(second_id="ad"), "https://cdn.example.com/d/x.mpd")
+
+    def test_resolve_manifest_plan_follows_master_to_media_playlist(self):
+        pages = {
+            MASTER_URL: HLS_MASTER,
+            "https://cdn.example.com/vod/audio/lo.m3u8": HLS_MEDIA,
+        }
+        plan = resolve_manifest_plan(MASTER_URL, pages.__getitem__)
+        self.assertTrue(plan.audio_only)
+        self.assertEqual(len(plan.segments), 3)
+
+        # 协程版本共用同一套解析与选轨逻辑
+        async def fetch_text(url):
+            return pages[url]
+
+        self.assertEqual(asyncio.run(async_resolve_manifest_plan(MASTER_URL, fetch_text)), plan)
+
+
+class SegmentDownloadTest(unittest.TestCase):
+    def test_download_segments_is_bounded_and_ordered(self):
+        plan = SegmentPlan(
+            segments=[Segment(url=f"s{i}") for i in range(12)],
+            init_segment=Segment(url="init"),
+        )
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def fetch(segment):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            # 让后面的分片先完成，验证输出仍按顺序拼接
+            time.sleep(0.02 if segment.url in {"init", "s0"} else 0.005)
+            with lock:
+                state["active"] -= 1
+            return segment.url.encode() + b"|"
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dest = os.path.join(tmp_dir, "out.ts")
+            written = download_segments(plan, dest, fetch, max_workers=3)
+            with open(dest, "rb") as f:
+                content = f.read()
+
+        expected = b"init|" + b"".join(f"s{i}|".encode() for i in range(12))
+        self.assertEqual(content, expected)
+        self.assertEqual(written, len(expected))
+        self.assertLessEqual(state["peak"], 3)
+        self.assertGreater(state["peak"], 1)
+
+    def test_download_segments_propagates_failures(self):
+        plan = SegmentPlan(segments=[Segment(url="ok"), Segment(url="bad")])
+
+        def fetch(segment):
+            if segment.url == "bad":
+                raise RuntimeError("boom")
+            return b"x"
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.assertRaises(RuntimeError):
+                download_segments(plan, os.path.join(tmp_dir, "out.ts"), fetch, max_workers=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
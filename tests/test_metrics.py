@@ -0,0 +1,77 @@
+import threading
+import unittest
+import urllib.request
+from types import SimpleNamespace
+
+import main
+from metrics import MetricsRegistry, STAGE_SECONDS, TOKENS_TOTAL, start_metrics_server
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_bytes_total", "Bytes.", ["direction"])
+        counter.inc(10, direction="download")
+        counter.inc(5, direction="download")
+        registry.gauge("demo_queue", "Queue.").set_function(lambda: 3)
+        histogram = registry.histogram("demo_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="resolve")
+        histogram.observe(0.5, stage="resolve")
+        histogram.observe(2.0, stage="resolve")
+
+        text = registry.render()
+        self.assertIn("# TYPE demo_bytes_total counter", text)
+        self.assertIn('demo_bytes_total{direction="download"} 15', text)
+        self.assertIn("demo_queue 3", text)
+        self.assertIn('demo_seconds_bucket{stage="resolve",le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{stage="resolve",le="1"} 2', text)
+        self.assertIn('demo_seconds_bucket{stage="resolve",le="+Inf"} 3', text)
+        self.assertIn('demo_seconds_count{stage="resolve"} 3', text)
+        self.assertIn('demo_seconds_sum{stage="resolve"} 2.55', text)
+
+        # 同名指标复用同一实例，类型冲突与标签不匹配时报错
+        self.assertIs(registry.counter("demo_bytes_total", "Bytes.", ["direction"]), counter)
+        with self.assertRaises(ValueError):
+            registry.gauge("demo_bytes_total", "Bytes.")
+        with self.assertRaises(ValueError):
+            counter.inc(1, stage="x")
+
+    def test_concurrent_increments(self):
+        counter = MetricsRegistry().counter("demo_total", "Total.")
+
+        def work():
+            for _ in range(10_000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value(), 40_000)
+
+    def test_stream_collection_records_ttft_and_tokens(self):
+        usage = SimpleNamespace(prompt_token_count=120, candidates_token_count=7)
+        chunks = [SimpleNamespace(text="你好", usage_metadata=None), SimpleNamespace(text="世界", usage_metadata=usage)]
+        ttft_before = STAGE_SECONDS.count(stage="ttft")
+        output_before = TOKENS_TOTAL.value(kind="output")
+
+        text = main._collect_stream_text(iter(chunks), on_chunk=lambda delta: None)
+
+        self.assertEqual(text, "你好世界")
+        self.assertEqual(STAGE_SECONDS.count(stage="ttft"), ttft_before + 1)
+        self.assertEqual(TOKENS_TOTAL.value(kind="output"), output_before + 7)
+
+    def test_standalone_server(self):
+        registry = MetricsRegistry()
+        registry.counter("demo_total", "Total.").inc()
+        server = start_metrics_server(0, host="127.0.0.1", registry=registry)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5) as resp:
+            self.assertTrue(resp.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            self.assertIn("demo_total 1", resp.read().decode("utf-8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import asyncio
+import io
+import threading
+import unittest
+from contextlib import redirect_stderr
+
+from douyin_resolver import HedgedResolver, ResolverBackend
+from progress import ProgressEvent, bind_context, progress_reporter, report_progress
+
+
+class ProgressReporterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_jobs_receive_only_their_own_events(self):
+        events = {"a": [], "b": []}
+        both_started = threading.Barrier(2, timeout=2)
+
+        def work(name):
+            both_started.wait()
+            for pct in (50, 100):
+                report_progress(f"{name} {pct}%", stage="download", percent=pct)
+
+        async def job(name):
+            with progress_reporter(events[name].append):
+                await asyncio.to_thread(work, name)
+
+        await asyncio.gather(job("a"), job("b"))
+
+        self.assertEqual(
+            events["a"],
+            [
+                ProgressEvent("a 50%", stage="download", percent=50),
+                ProgressEvent("a 100%", stage="download", percent=100),
+            ],
+        )
+        self.assertEqual([e.message for e in events["b"]], ["b 50%", "b 100%"])
+
+    def test_falls_back_to_stderr_without_reporter(self):
+        buf = io.StringIO()
+        with redirect_stderr(buf):
+            report_progress("下载完成", stage="download")
+        self.assertEqual(buf.getvalue(), "下载完成\n")
+
+    def test_bind_context_and_resolver_threads_keep_reporter(self):
+        seen = []
+
+        def backend(arg):
+            report_progress(f"解析 {arg}", stage="resolve")
+            return arg
+
+        resolver = HedgedResolver([ResolverBackend("only", backend)])
+        with progress_reporter(seen.append):
+            resolver.resolve("x")
+            bound = bind_context(report_progress, "线程内")
+        thread = threading.Thread(target=bound)
+        thread.start()
+        thread.join()
+
+        self.assertEqual([e.message for e in seen], ["解析 x", "线程内"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import main
+from resolver_cache import ResolverCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+SHARE_TEXT = "7.43 复制打开抖音，看看【测试】 https://v.douyin.com/AbCdEf/ abc@def.com"
+
+
+class ResolverCacheTest(unittest.TestCase):
+    def test_positive_and_negative_entries_expire(self):
+        clock = FakeClock()
+        cache = ResolverCache(ttl_seconds=100, negative_ttl_seconds=10, clock=clock)
+        cache.put("ok", {"mp3_url": "https://cdn/a.mp3"})
+        cache.put_error("bad", "downcats 返回异常")
+
+        self.assertEqual(cache.get("ok").value["mp3_url"], "https://cdn/a.mp3")
+        self.assertTrue(cache.get("bad").is_negative)
+
+        clock.now += 11
+        self.assertIsNone(cache.get("bad"))
+        self.assertIsNotNone(cache.get("ok"))
+        clock.now += 100
+        self.assertIsNone(cache.get("ok"))
+
+    def test_persists_across_instances(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "cache" / "douyin.json")
+            ResolverCache(path, ttl_seconds=600).put("k", {"title": "标题"})
+            reloaded = ResolverCache(path, ttl_seconds=600)
+            self.assertEqual(reloaded.get("k").value, {"title": "标题"})
+
+    def test_unwritable_storage_keeps_entries_in_memory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 父路径是普通文件，无法创建缓存目录（相当于只读的部署目录）
+            blocker = Path(tmp_dir) / "readonly"
+            blocker.write_text("")
+            cache = ResolverCache(str(blocker / "cache" / "douyin.json"))
+            cache.put("k", {"title": "标题"})
+            cache.put_error("bad", "解析失败")
+            self.assertEqual(cache.get("k").value, {"title": "标题"})
+
+    def test_max_entries_evicts_oldest(self):
+        clock = FakeClock()
+        cache = ResolverCache(ttl_seconds=100, max_entries=2, clock=clock)
+        for key in ("a", "b", "c"):
+            cache.put(key, {"v": key})
+            clock.now += 1
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 2)
+
+
+class DouyinResolveCacheTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("main._douyin_cache", ResolverCache(None, ttl_seconds=600, negative_ttl_seconds=60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_share_text_hits_cache(self):
+        with patch(
+            "main._request_downcats",
+            return_value=("https://cdn.example.com/a.mp3", "标题", None),
+        ) as request:
+            first = main.fetch_douyin_mp3_via_tiksave(SHARE_TEXT)
+            # 相同短链的不同分享文案也命中同一条缓存
+            second = main.fetch_douyin_mp3_via_tiksave("https://v.douyin.com/AbCdEf")
+
+        self.assertEqual(first, ("https://cdn.example.com/a.mp3", "标题", None))
+        self.assertEqual(second, first)
+        self.assertEqual(request.call_count, 1)
+
+    def test_failures_are_negatively_cached(self):
+        with patch("main._request_downcats", side_effect=RuntimeError("downcats 接口请求失败")) as request:
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    main.fetch_douyin_mp3_via_tiksave(SHARE_TEXT)
+        self.assertEqual(request.call_count, 1)
+
+    def test_signed_url_ttl_is_capped_by_expiry(self):
+        expires = int(time.time()) + 300
+        ttl = main._signed_url_ttl(f"https://cdn.example.com/a.mp3?x-expires={expires}", 1800)
+        self.assertLessEqual(ttl, 240)
+        self.assertGreater(ttl, 200)
+        self.assertEqual(main._signed_url_ttl("https://cdn.example.com/a.mp3", 1800), 1800)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+
+from transcript_delivery import choose_encoding, parse_range, transcript_response, write_transcript
+
+
+def _body(response):
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(collect())
+
+
+class TranscriptDeliveryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "youtube_abc.txt")
+        self.text = "这是一段很长的转写文本。" * 200
+        write_transcript(self.path, self.text)
+
+    def test_precompressed_variant_is_negotiated(self):
+        self.assertTrue(os.path.isfile(self.path + ".gz"))
+        # 原文件与副本都经临时文件改名写入，不留下 .part
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if name.endswith(".part")])
+        response = transcript_response(self.path, "youtube_abc.txt", {"accept-encoding": "br, gzip;q=0.8"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(_body(response)).decode("utf-8"), self.text)
+
+        plain = transcript_response(self.path, "youtube_abc.txt", {"accept-encoding": "gzip;q=0"})
+        self.assertNotIn("content-encoding", plain.headers)
+        self.assertNotEqual(plain.headers["etag"], response.headers["etag"])
+        self.assertEqual(_body(plain).decode("utf-8"), self.text)
+
+        # 原文件更新后，旧副本不再使用；短文本不生成副本
+        write_transcript(self.path, "短")
+        self.assertEqual(choose_encoding(self.path, "gzip"), (self.path, None))
+        self.assertFalse(os.path.exists(self.path + ".gz"))
+
+    def test_if_none_match_returns_304(self):
+        first = transcript_response(self.path, "youtube_abc.txt", {})
+        etag = first.headers["etag"]
+        self.assertFalse(etag.startswith("W/"))
+        again = transcript_response(self.path, "youtube_abc.txt", {"if-none-match": f'"other", {etag}'})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["etag"], etag)
+
+    def test_byte_ranges(self):
+        data = self.text.encode("utf-8")
+        size = len(data)
+        response = transcript_response(self.path, "youtube_abc.txt", {"range": "bytes=10-19", "accept-encoding": "gzip"})
+        self.assertEqual(response.status_code, 206)
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["content-range"], f"bytes 10-19/{size}")
+        self.assertEqual(_body(response), data[10:20])
+
+        suffix = transcript_response(self.path, "youtube_abc.txt", {"range": "bytes=-5"})
+        self.assertEqual(_body(suffix), data[-5:])
+
+        bad = transcript_response(self.path, "youtube_abc.txt", {"range": f"bytes={size}-"})
+        self.assertEqual((bad.status_code, bad.headers["content-range"]), (416, f"bytes */{size}"))
+
+        # If-Range 不匹配时返回完整内容
+        stale = transcript_response(self.path, "youtube_abc.txt", {"range": "bytes=0-1", "if-range": '"old"'})
+        self.assertEqual(stale.status_code, 200)
+
+        self.assertIsNone(parse_range("bytes=0-1,5-6", size))
+
+
+if __name__ == "__main__":
+    unittest.main()
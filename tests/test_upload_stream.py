@@ -0,0 +1,62 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+from upload_stream import UploadTooLargeError, content_length_exceeds, sniff_audio_format, store_stream
+
+
+class _CountingReader(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.max_read = 0
+
+    def read(self, size=-1):
+        block = super().read(size)
+        self.max_read = max(self.max_read, len(block))
+        return block
+
+
+class StoreStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_streams_in_chunks_with_hash_and_detected_format(self):
+        data = b"\x00\x00\x00\x20ftypM4A " + os.urandom(10_000)
+        source = _CountingReader(data)
+        stored = store_stream(source, self.tmp.name, "voice_job", fallback_ext="", chunk_bytes=1024)
+
+        self.assertEqual(source.max_read, 1024)
+        self.assertEqual(stored.path, os.path.join(self.tmp.name, "voice_job.m4a"))
+        self.assertEqual((stored.size, stored.detected_format), (len(data), "m4a"))
+        self.assertEqual(stored.sha256, hashlib.sha256(data).hexdigest())
+        with open(stored.path, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+        # 文件名自带扩展名时保留原扩展名
+        stored = store_stream(io.BytesIO(b"ID3" + bytes(100)), self.tmp.name, "a_job", fallback_ext=".MP3")
+        self.assertEqual((os.path.basename(stored.path), stored.detected_format), ("a_job.MP3", "mp3"))
+
+    def test_oversized_upload_is_rejected_and_removed(self):
+        with self.assertRaises(UploadTooLargeError):
+            store_stream(io.BytesIO(bytes(5000)), self.tmp.name, "big", max_bytes=4096, chunk_bytes=1024)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+        self.assertTrue(content_length_exceeds(str(10 * 1024 * 1024), max_bytes=1024))
+        self.assertFalse(content_length_exceeds("2048", max_bytes=1024))
+        self.assertFalse(content_length_exceeds(None, max_bytes=1024))
+        self.assertFalse(content_length_exceeds(str(10 * 1024 * 1024), max_bytes=0))
+
+    def test_sniff_audio_format(self):
+        self.assertEqual(sniff_audio_format(b"RIFF\x24\x00\x00\x00WAVEfmt "), "wav")
+        self.assertEqual(sniff_audio_format(b"OggS\x00\x02"), "ogg")
+        self.assertEqual(sniff_audio_format(b"\xff\xf1\x50\x80"), "aac")
+        self.assertEqual(sniff_audio_format(b"\xff\xfb\x90\x64"), "mp3")
+        self.assertEqual(sniff_audio_format(b"\x00\x00\x00\x18ftypisom"), "mp4")
+        self.assertIsNone(sniff_audio_format(b"hello"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 import tempfile
@@ -137,6 +138,132 @@ class YouTubeDirectTest(unittest.TestCase):
             finally:
                 os.chdir(old_cwd)
 
+    def test_cli_youtube_falls_back_to_download_when_direct_fails(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            old_cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                with patch.object(
+                    sys,
+                    "argv",
+                    ["main.py", "--youtube", YOUTUBE_URL, "--api-key", "test-key", "--cleanup-hours", "0"],
+                ), patch("main.ensure_package"), patch(
+                    "main.transcribe_youtube_url_streaming", side_effect=RuntimeError("403")
+                ), patch(
+                    "main.download_audio_from_youtube", return_value="data/clip.m4a"
+                ) as download_audio, patch(
+                    "main.transcribe_audio_streaming", return_value="fallback transcript"
+                ) as transcribe_audio:
+                    main.main()
+
+                download_audio.assert_called_once()
+                self.assertEqual(transcribe_audio.call_args.kwargs["audio_path"], "data/clip.m4a")
+                out_path = Path(tmp_dir) / "data" / "youtube_3KtWfp0UopM.txt"
+                self.assertEqual(out_path.read_text(encoding="utf-8"), "fallback transcript")
+            finally:
+                os.chdir(old_cwd)
+
+    def test_cli_youtube_does_not_fall_back_after_partial_output(self):
+        def partial_then_fail(**kwargs):
+            kwargs["on_chunk"]("前半段")
+            raise RuntimeError("stream reset")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            old_cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                with patch.object(
+                    sys,
+                    "argv",
+                    ["main.py", "--youtube", YOUTUBE_URL, "--api-key", "test-key", "--cleanup-hours", "0"],
+                ), patch("main.ensure_package"), patch(
+                    "main.transcribe_youtube_url_streaming", side_effect=partial_then_fail
+                ), patch(
+                    "main.download_audio_from_youtube"
+                ) as download_audio, patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                    with self.assertRaises(SystemExit):
+                        main.main()
+
+                # 已输出的文本不会被回退路径重复输出
+                self.assertFalse(download_audio.called)
+                self.assertEqual(stdout.getvalue(), "前半段")
+                self.assertFalse((Path(tmp_dir) / "data" / "youtube_3KtWfp0UopM.txt").exists())
+            finally:
+                os.chdir(old_cwd)
+
+
+class FakeYoutubeDL:
+    instances = []
+    ext = "m4a"
+    acodec = "mp4a.40.5"
+
+    def __init__(self, params):
+        self.params = params
+        self.urls = []
+        FakeYoutubeDL.instances.append(self)
+
+    def extract_info(self, url, download=True):
+        self.urls.append(url)
+        out_dir = os.path.dirname(self.params["outtmpl"])
+        path = os.path.join(out_dir, f"clip [{len(self.urls)}].{self.ext}")
+        with open(path, "wb") as f:
+            f.write(b"audio")
+        for hook in self.params["progress_hooks"]:
+            hook({"status": "finished"})
+        return {
+            "id": str(len(self.urls)),
+            "format_id": "139",
+            "abr": 48.0,
+            "acodec": self.acodec,
+            "requested_downloads": [{"filepath": path}],
+        }
+
+
+class YoutubeFallbackDownloadTest(unittest.TestCase):
+    def setUp(self):
+        FakeYoutubeDL.instances = []
+        FakeYoutubeDL.ext = "m4a"
+        FakeYoutubeDL.acodec = "mp4a.40.5"
+        fake_module = ModuleType("yt_dlp")
+        fake_module.YoutubeDL = FakeYoutubeDL
+        for patcher in (
+            patch.dict(sys.modules, {"yt_dlp": fake_module}),
+            patch.dict(main._youtube_dl_instances, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_low_bitrate_format_and_shared_instance_without_postprocessing(self):
+        with patch("main._ffmpeg_extract_audio") as extract:
+            first = main.download_audio_from_youtube(YOUTUBE_URL, output_dir=self.tmp.name)
+            second = main.download_audio_from_youtube(YOUTUBE_URL, output_dir=self.tmp.name)
+
+        self.assertEqual(len(FakeYoutubeDL.instances), 1)
+        params = FakeYoutubeDL.instances[0].params
+        self.assertTrue(params["format"].startswith("bestaudio[ext=m4a][abr<=64]"))
+        self.assertEqual(params["concurrent_fragment_downloads"], main.YTDLP_CONCURRENT_FRAGMENTS)
+        self.assertNotIn("postprocessors", params)
+        self.assertFalse(extract.called)
+        self.assertTrue(first.endswith(".m4a") and os.path.exists(first))
+        self.assertNotEqual(first, second)
+
+    def test_webm_opus_is_remuxed_without_reencoding(self):
+        FakeYoutubeDL.ext = "webm"
+        FakeYoutubeDL.acodec = "opus"
+
+        def fake_extract(input_path, output_path, codec):
+            with open(output_path, "wb") as f:
+                f.write(b"opus")
+
+        with patch("main._ffmpeg_extract_audio", side_effect=fake_extract) as extract:
+            path = main.download_audio_from_youtube(YOUTUBE_URL, output_dir=self.tmp.name)
+
+        self.assertEqual(extract.call_args.args[2], "copy")
+        self.assertTrue(path.endswith(".opus"))
+        self.assertEqual(os.listdir(self.tmp.name), [os.path.basename(path)])
+
 
 if __name__ == "__main__":
     unittest.main()
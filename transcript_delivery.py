@@ -0,0 +1,231 @@
+import functools
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import zstandard
+except Exception:  # pragma: no cover - optional dependency fallback
+    zstandard = None
+
+
+# 小于该大小（字节）的转写结果不生成压缩副本
+MIN_COMPRESS_BYTES = int(os.getenv("TRANSCRIPT_MIN_COMPRESS_BYTES", "1024"))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Content-Encoding -> 预压缩副本的扩展名，按服务端偏好排序
+_VARIANTS: List[Tuple[str, str]] = [("zstd", ".zst"), ("gzip", ".gz")]
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _zstd_compress(data: bytes) -> Optional[bytes]:
+    if zstandard is None:
+        return None
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+def write_transcript(path: str, text: str) -> None:
+    """写入转写结果，并在旁边生成 .gz（以及安装了 zstandard 时的 .zst）预压缩副本。
+
+    原文件与副本都先写临时文件再改名，下载方不会读到写了一半的内容；下载时只使用不早于原文件的副本。
+    """
+    data = text.encode("utf-8")
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+    for encoding, suffix in _VARIANTS:
+        variant = path + suffix
+        compressed: Optional[bytes] = None
+        if len(data) >= MIN_COMPRESS_BYTES:
+            if encoding == "gzip":
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            else:
+                compressed = _zstd_compress(data)
+        if compressed is None or len(compressed) >= len(data):
+            # 文本太短或压缩无收益时删除旧副本，避免提供过期内容
+            try:
+                os.remove(variant)
+            except OSError:
+                pass
+            continue
+        partial = variant + ".part"
+        with open(partial, "wb") as f:
+            f.write(compressed)
+        os.replace(partial, variant)
+
+
+@functools.lru_cache(maxsize=1024)
+def _content_hash(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(STREAM_CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def strong_etag(path: str, encoding: Optional[str] = None) -> str:
+    """按内容计算强 ETag；不同编码的副本带不同后缀。结果按 (路径, 修改时间, 大小) 缓存。"""
+    st = os.stat(path)
+    tag = _content_hash(path, st.st_mtime_ns, st.st_size)
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 编码 -> q 值。"""
+    accepted: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def choose_encoding(path: str, accept_encoding: Optional[str]) -> Tuple[str, Optional[str]]:
+    """按 Accept-Encoding 选择最合适的预压缩副本，返回 (文件路径, Content-Encoding 或 None)。"""
+    accepted = parse_accept_encoding(accept_encoding)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return path, None
+    best: Tuple[float, str, Optional[str]] = (0.0, path, None)
+    for encoding, suffix in _VARIANTS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q <= best[0]:
+            continue
+        variant = path + suffix
+        try:
+            if os.stat(variant).st_mtime_ns < mtime:
+                continue
+        except OSError:
+            continue
+        best = (q, variant, encoding)
+    return best[1], best[2]
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in header.split(",")]
+    # If-None-Match 使用弱比较
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节范围，返回 (起始, 结束)（含两端）；不支持的格式返回 None，无法满足时抛出 ValueError。"""
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        # 多段范围等格式按完整响应处理
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(0, size - length), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(STREAM_CHUNK_BYTES, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def transcript_response(
+    path: str,
+    filename: str,
+    headers: Mapping[str, str],
+) -> Response:
+    """按请求头返回文件：支持 If-None-Match（304）、单段 Range（206 / 416）与预压缩副本协商。
+
+    带 Range 的请求始终返回未压缩的原文件，便于断点续传。
+    首次计算 ETag 需要读完整个文件，协程中应通过 asyncio.to_thread 调用。
+    """
+    if headers.get("range"):
+        served, encoding = path, None
+    else:
+        served, encoding = choose_encoding(path, headers.get("accept-encoding"))
+    st = os.stat(served)
+    etag = strong_etag(served, encoding)
+    media_type = "text/plain; charset=utf-8" if filename.endswith(".txt") else (
+        mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    base_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        # 允许缓存，但每次都用 ETag 重新验证，轮询结果时只需 304
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=base_headers)
+
+    base_headers["Content-Disposition"] = _content_disposition(filename)
+    if encoding:
+        base_headers["Content-Encoding"] = encoding
+
+    size = st.st_size
+    byte_range: Optional[Tuple[int, int]] = None
+    if_range = headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(headers.get("range"), size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**base_headers, "Content-Range": f"bytes */{size}"},
+            )
+
+    if byte_range is None:
+        start, length, status = 0, size, 200
+    else:
+        start, end = byte_range
+        length, status = end - start + 1, 206
+        base_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    base_headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        _iter_file(served, start, length),
+        status_code=status,
+        media_type=media_type,
+        headers=base_headers,
+    )
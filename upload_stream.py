@@ -0,0 +1,107 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+
+# 上传音频的大小上限（MB），超过时返回 413；设为 0 表示不限制
+DEFAULT_MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024)
+# 每次从上传流读取并写入磁盘的块大小
+DEFAULT_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+# 按 Content-Length 预检时给表单其他字段与 multipart 边界留出的余量
+FORM_OVERHEAD_BYTES = 1024 * 1024
+# 识别格式所需的文件头长度
+_SNIFF_BYTES = 64
+
+
+class UploadTooLargeError(RuntimeError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"上传文件超过大小上限（{max_bytes // (1024 * 1024)} MB）")
+        self.max_bytes = max_bytes
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    # 按文件头识别出的扩展名（不含点），无法识别时为 None
+    detected_format: Optional[str] = None
+
+
+def sniff_audio_format(head: bytes) -> Optional[str]:
+    """按文件头识别常见音视频容器，返回扩展名（不含点）。"""
+    if head.startswith(b"ID3"):
+        return "mp3"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"#!AMR"):
+        return "amr"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        return "m4a" if brand in (b"M4A ", b"M4B ") else "mp4"
+    if len(head) >= 2 and head[0] == 0xFF:
+        # ADTS（AAC）同步字的 layer 位为 0，MPEG 音频帧的 layer 位非 0
+        if head[1] & 0xF6 == 0xF0:
+            return "aac"
+        if head[1] & 0xE0 == 0xE0:
+            return "mp3"
+    return None
+
+
+def content_length_exceeds(content_length: Optional[str], max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES) -> bool:
+    """请求体声明的长度已明显超过上传上限时返回 True（用于解析表单前提前拒绝）。"""
+    if max_bytes <= 0 or not content_length or not content_length.isdigit():
+        return False
+    return int(content_length) > max_bytes + FORM_OVERHEAD_BYTES
+
+
+def store_stream(
+    source: BinaryIO,
+    target_dir: str,
+    stem: str,
+    fallback_ext: str = "m4a",
+    max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> StoredUpload:
+    """把上传流按块写入 target_dir/stem.<ext>，同时计算 SHA-256 并识别格式。
+
+    fallback_ext 为上传文件名中的扩展名；文件名没有扩展名时使用识别出的格式。
+    超过 max_bytes 时删除已写入的部分并抛出 UploadTooLargeError，不会把整个文件读入内存。
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    partial = os.path.join(target_dir, f".{stem}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        with open(partial, "wb") as out:
+            while True:
+                block = source.read(chunk_bytes)
+                if not block:
+                    break
+                size += len(block)
+                if max_bytes > 0 and size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                if len(head) < _SNIFF_BYTES:
+                    head += block[:_SNIFF_BYTES - len(head)]
+                digest.update(block)
+                out.write(block)
+        detected = sniff_audio_format(head)
+        ext = (fallback_ext or "").lstrip(".") or detected or "m4a"
+        target = os.path.join(target_dir, f"{stem}.{ext}")
+        os.replace(partial, target)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    return StoredUpload(path=target, size=size, sha256=digest.hexdigest(), detected_format=detected)